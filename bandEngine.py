@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import numpy as np
+
+from pngStream import *
+from vectorEngine import *
+
+# *******************************************
+# Band streaming engine.
+#
+# Embeds / extracts data in PNG images too large to decode into memory at once.
+# The image is decoded, and re-encoded when it is saved, a band of rows at a time,
+# with the number of rows in a band set so that the memory used stays within a budget,
+# whatever the size of the image.
+#
+# As the data layout is plane-major (see picCursor.py), a run of embedded data is held in
+# one or more passes over the image, each pass being one colour bit of one colour plane
+# of a span of pixels. The passes a run of data needs are planned from its bit positions,
+# so only the rows those passes cover are decoded to read it, and only the pixels they cover
+# are changed when the image is saved.
+#
+# Data written is recorded in a temporary file, and only written into the image as it is saved,
+# so the image is only decoded and re-encoded once, however the data was written.
+# Bit positions read and written must be on byte boundaries, as they are for embedded data.
+# *******************************************
+
+# Copies of a band of rows held while decoding / encoding it, to size bands from the memory budget.
+BANDROWCOPIES = 12
+
+# Share of the memory budget used to read embedded data ahead, as data is held as a byte per bit while read.
+BANDREADAHEADSHARE = 32
+
+# *******************************************
+# Band pass class.
+# A span of pixels of one colour bit of one colour plane, holding a run of embedded data.
+# *******************************************
+class BandPass():
+    def __init__(self, bit, plane, startPixel, endPixel, position):
+
+        self.bit = bit
+        self.plane = plane
+        self.startPixel = startPixel
+        self.endPixel = endPixel
+
+        # Bit position of the first pixel of the pass.
+        self.position = position
+
+# *******************************************
+# Plan the passes over an image holding a run of bit positions.
+# Returns list of band passes, in the order of the bit positions.
+# *******************************************
+def planPasses(width, height, position, numBits, planes=3):
+    numPixels = width * height
+    end = min(position + numBits, numPixels * planes * 8)
+    passes = []
+    while position < end:
+        slab, pixel = divmod(position, numPixels)
+        bit, plane = divmod(slab, planes)
+        run = min(numPixels - pixel, end - position)
+        passes.append(BandPass(bit, plane, pixel, pixel + run, position))
+        position += run
+    return passes
+
+# *******************************************
+# Band writes class.
+# Data written to an image, by byte offset of its bit position, kept in a temporary file until saved.
+# *******************************************
+class BandWrites():
+    def __init__(self):
+
+        self.wf = tempfile.TemporaryFile()
+
+        # Byte ranges written, start and end offsets, in order and not overlapping.
+        self.extents = []
+
+    # *******************************************
+    # Close and delete the temporary file.
+    # *******************************************
+    def close(self):
+        self.wf.close()
+
+    # *******************************************
+    # Record data written at a byte offset.
+    # *******************************************
+    def write(self, offset, data):
+        if len(data) == 0:
+            return
+        self.wf.seek(offset)
+        self.wf.write(data)
+
+        # Merge the range written with the ranges it overlaps or touches.
+        start = offset
+        end = offset + len(data)
+        extents = []
+        for extentStart, extentEnd in self.extents:
+            if (extentEnd < start) or (extentStart > end):
+                extents.append((extentStart, extentEnd))
+            else:
+                start = min(start, extentStart)
+                end = max(end, extentEnd)
+        extents.append((start, end))
+        self.extents = sorted(extents)
+
+    # *******************************************
+    # Read data written, from a byte offset.
+    # *******************************************
+    def read(self, offset, length):
+        self.wf.seek(offset)
+        return self.wf.read(length)
+
+    # *******************************************
+    # Replace the parts of data, read from the image at a byte offset, that have been written since.
+    # Returns the data as it is now.
+    # *******************************************
+    def overlay(self, offset, data):
+        end = offset + len(data)
+        merged = None
+        for extentStart, extentEnd in self.extents:
+            start = max(offset, extentStart)
+            stop = min(end, extentEnd)
+            if start < stop:
+                if merged is None:
+                    merged = bytearray(data)
+                merged[start - offset:stop - offset] = self.read(start, stop - start)
+        return data if merged is None else bytes(merged)
+
+    # *******************************************
+    # Read bits of data written, from a bit position.
+    # Returns numpy array of bits (one per byte).
+    # *******************************************
+    def readBits(self, position, numBits):
+        start = position // 8
+        end = (position + numBits + 7) // 8
+        bits = np.unpackbits(np.frombuffer(self.read(start, end - start), dtype=np.uint8))
+        skip = position % 8
+        return bits[skip:skip + numBits]
+
+# *******************************************
+# Band engine class.
+# Reads and writes embedded data as for the vector engine, for a PNG image streamed in bands.
+# *******************************************
+class BandEngine():
+    def __init__(self, pngFile, memoryBudget):
+
+        self.pngFile = pngFile
+        with PngStream(pngFile) as png:
+            if not png.isDecodable():
+                raise PngError(f'Unsupported PNG, bit depth : {png.bitDepth}; colour type : {png.colourType}; interlace : {png.interlace}')
+            self.width = png.width
+            self.height = png.height
+            self.colourType = png.colourType
+            self.channels = png.channels()
+
+        self.numPlanes = 3
+        self.numPixels = self.width * self.height
+
+        # Total number of bit positions, i.e. every pixel, every colour, every bit.
+        self.maxBits = self.numPixels * self.numPlanes * 8
+
+        # Rows decoded at a time, and most data read ahead, from the memory budget.
+        self.bandRows = max(1, memoryBudget // (BANDROWCOPIES * self.width * self.channels))
+        self.readAheadBytes = max(1, memoryBudget // BANDREADAHEADSHARE)
+
+        # Data written since the image was loaded.
+        self.writes = BandWrites()
+
+        # Data read from the image, from its bit position.
+        self.readPosition = 0
+        self.readData = b""
+
+        # Stream being decoded, and the last band decoded, from its first row.
+        self.png = None
+        self.band = None
+        self.bandStart = 0
+
+    # *******************************************
+    # Close the image stream and discard data written that hasn't been saved.
+    # *******************************************
+    def close(self):
+        self.closeStream()
+        self.writes.close()
+
+    # *******************************************
+    # Close the image stream, if it is open.
+    # *******************************************
+    def closeStream(self):
+        if self.png is not None:
+            self.png.close()
+            self.png = None
+        self.band = None
+
+    # *******************************************
+    # Get a band of rows of the image, from its first row.
+    # The stream carries on from the last band decoded if it can, otherwise decodes from the top of the image.
+    # Returns the rows as numpy uint8 array of rows x (width x channels) bytes.
+    # *******************************************
+    def readBand(self, bandStart):
+        if (self.band is not None) and (self.bandStart == bandStart):
+            return self.band
+        if (self.png is None) or (self.png.rowsRead > bandStart):
+            self.closeStream()
+            self.png = PngStream(self.pngFile)
+
+        # Rows before the band have to be decoded, a band at a time, as each row depends on the one before.
+        while self.png.rowsRead < bandStart:
+            self.png.readRows(min(self.bandRows, bandStart - self.png.rowsRead))
+        self.band = self.png.readRows(self.bandRows)
+        self.bandStart = bandStart
+        return self.band
+
+    # *******************************************
+    # Get the colour plane views (R, G, B) of a band of rows.
+    # *******************************************
+    def bandPlanes(self, rows):
+        pixels = rows.reshape(len(rows), self.width, self.channels)
+        return [pixels[:, :, plane] for plane in range(self.numPlanes)]
+
+    # *******************************************
+    # Get the part of a pass in a band of rows.
+    # Returns bit position of the part, its bit position in the band, and its number of bits,
+    # or None if the pass isn't in the band.
+    # *******************************************
+    def passInBand(self, bandPass, bandStart, bandRows):
+        start = max(bandPass.startPixel, bandStart * self.width)
+        end = min(bandPass.endPixel, (bandStart + bandRows) * self.width)
+        if start >= end:
+            return None
+        slab = bandPass.bit * self.numPlanes + bandPass.plane
+        bandPosition = slab * bandRows * self.width + (start - bandStart * self.width)
+        return bandPass.position + (start - bandPass.startPixel), bandPosition, end - start
+
+    # *******************************************
+    # Get the rows covered by passes, first row and row after the last row.
+    # *******************************************
+    def passRows(self, passes):
+        firstRow = min(bandPass.startPixel // self.width for bandPass in passes)
+        endRow = max((bandPass.endPixel + self.width - 1) // self.width for bandPass in passes)
+        return firstRow, endRow
+
+    # *******************************************
+    # Read bits from the image as it was loaded, starting at a bit position.
+    # Only the rows holding the passes of the bits are decoded.
+    # Returns numpy array of bits (one per byte).
+    # *******************************************
+    def readImageBits(self, position, numBits):
+        passes = planPasses(self.width, self.height, position, numBits, self.numPlanes)
+        bits = np.zeros(sum(bandPass.endPixel - bandPass.startPixel for bandPass in passes), dtype=np.uint8)
+        if len(passes) == 0:
+            return bits
+
+        firstRow, endRow = self.passRows(passes)
+        for bandStart in range((firstRow // self.bandRows) * self.bandRows, endRow, self.bandRows):
+            rows = self.readBand(bandStart)
+            engine = VectorEngine(self.bandPlanes(rows))
+            for bandPass in passes:
+                part = self.passInBand(bandPass, bandStart, len(rows))
+                if part is not None:
+                    partPosition, bandPosition, partBits = part
+                    offset = partPosition - position
+                    bits[offset:offset + partBits] = engine.readBits(bandPosition, partBits)
+        return bits
+
+    # *******************************************
+    # Read bytes from the image starting at a bit position, including any data written since it was loaded.
+    # Reading on from the data read last reads further ahead each time, as when extracting a file,
+    # so the image is decoded less often.
+    # Returns the bytes read, which may be short if the end of the image is reached.
+    # *******************************************
+    def readBytes(self, position, bytesToRead):
+        if (position % 8) != 0:
+            raise ValueError(f'Band engine position not on a byte boundary : {position}')
+        bytesToRead = max(0, min(bytesToRead, (self.maxBits - position) // 8))
+
+        offset = (position - self.readPosition) // 8
+        if (position < self.readPosition) or ((offset + bytesToRead) > len(self.readData)):
+            if position == (self.readPosition + len(self.readData) * 8):
+                readSize = max(bytesToRead, min(2 * len(self.readData), self.readAheadBytes))
+            else:
+                readSize = bytesToRead
+            readSize = min(readSize, (self.maxBits - position) // 8)
+            self.readData = np.packbits(self.readImageBits(position, readSize * 8)).tobytes()
+            self.readPosition = position
+            offset = 0
+
+        return self.writes.overlay(position // 8, self.readData[offset:offset + bytesToRead])
+
+    # *******************************************
+    # Write bytes into the image starting at a bit position.
+    # The data is recorded, and written into the image when it is saved.
+    # Returns the number of bits written, which may be short if the image runs out of space.
+    # *******************************************
+    def writeBytes(self, position, data):
+        if (position % 8) != 0:
+            raise ValueError(f'Band engine position not on a byte boundary : {position}')
+        bytesToWrite = max(0, min(len(data), (self.maxBits - position) // 8))
+        self.writes.write(position // 8, bytes(data[:bytesToWrite]))
+        return bytesToWrite * 8
+
+    # *******************************************
+    # Save the image, with the data written, as a PNG image.
+    # The image is decoded and re-encoded a band at a time, and only the bands holding
+    # passes of the data written are changed. The image is written to a temporary file first,
+    # so it can be saved over itself.
+    # *******************************************
+    def save(self, saveToFilename):
+        passes = []
+        for start, end in self.writes.extents:
+            passes += planPasses(self.width, self.height, start * 8, (end - start) * 8, self.numPlanes)
+        endRow = self.passRows(passes)[1] if len(passes) > 0 else 0
+
+        tempFile = saveToFilename + ".tmp"
+        try:
+            with PngWriter(tempFile, self.width, self.height, self.colourType) as writer:
+                for bandStart in range(0, self.height, self.bandRows):
+                    rows = self.readBand(bandStart)
+                    if bandStart < endRow:
+                        # The band decoded is kept as read, so is changed as a copy.
+                        rows = rows.copy()
+                        engine = VectorEngine(self.bandPlanes(rows))
+                        for bandPass in passes:
+                            part = self.passInBand(bandPass, bandStart, len(rows))
+                            if part is not None:
+                                partPosition, bandPosition, partBits = part
+                                engine.writeBits(bandPosition, self.writes.readBits(partPosition, partBits))
+                    writer.writeRows(rows)
+                writer.finish()
+            self.closeStream()
+            os.replace(tempFile, saveToFilename)
+        except Exception:
+            if os.path.exists(tempFile):
+                os.remove(tempFile)
+            raise
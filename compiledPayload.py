@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+from constants import *
+from container import *
+from utils import *
+
+# *******************************************
+# Compiled payloads, for embedding the same file into many cover images.
+#
+# The file is read, and its header and payload are serialized, once. Filling in
+# the compiled payload for an image then only copies the embedded data and patches it,
+# so embedding into each image is just writing the data into its pixels.
+#
+# Slots are declared by name and by a placeholder, text in the file that is replaced in
+# each image by the value of the slot, e.g. a serial number or recipient ID.
+# Values are padded with spaces to the length of the placeholder, so every occurrence of
+# a slot stays where it is in the file, and the header is the same for every image.
+# As slots have to stay where they are, the file is embedded without compression.
+# In a version 2 container only the chunks holding slots are framed again, with new CRCs.
+# *******************************************
+
+# Padding for slot values shorter than their placeholder.
+SLOTPADDING = b" "
+
+# *******************************************
+# Compiled payload error, for a file or slot values that can't be compiled or filled.
+# *******************************************
+class CompiledPayloadError(Exception):
+    pass
+
+# *******************************************
+# Payload slot class.
+# A value filled in for each image, at every occurrence of its placeholder in the file.
+# *******************************************
+class PayloadSlot():
+    def __init__(self, name, placeholder, offsets):
+
+        self.name = name
+        self.placeholder = placeholder
+        self.width = len(placeholder)
+
+        # Offsets of the occurrences of the placeholder in the file.
+        self.offsets = offsets
+
+# *******************************************
+# Find the occurrences of a placeholder in file data.
+# Returns list of offsets.
+# *******************************************
+def findPlaceholder(fileData, placeholder):
+    offsets = []
+    offset = fileData.find(placeholder)
+    while offset >= 0:
+        offsets.append(offset)
+        offset = fileData.find(placeholder, offset + len(placeholder))
+    return offsets
+
+# *******************************************
+# Compiled payload class.
+# The data embedded into every image, with the slots to fill in for each.
+# *******************************************
+class CompiledPayload():
+    def __init__(self, formatVersion, data, headerLen, chunkSize, slots):
+
+        self.formatVersion = formatVersion
+
+        # Data to embed, the header followed by the payload, with the placeholders of the slots.
+        self.data = data
+        self.headerLen = headerLen
+
+        # Size of the chunks of a version 2 container, or 0 for version 1.
+        self.chunkSize = chunkSize
+
+        # Slots by name.
+        self.slots = slots
+
+    # *******************************************
+    # Get offset in the embedded data of an offset in the file.
+    # *******************************************
+    def dataOffset(self, offset):
+        if self.chunkSize == 0:
+            return self.headerLen + offset
+        chunk, chunkOffset = divmod(offset, self.chunkSize)
+        return self.headerLen + chunk * (self.chunkSize + V2CRCBYTES) + chunkOffset
+
+    # *******************************************
+    # Check values for an image can fill in the slots, by slot name.
+    # Returns the values as bytes, padded to the width of their slots.
+    # Raises CompiledPayloadError for an unknown slot, or a value too long for its slot.
+    # *******************************************
+    def checkValues(self, values):
+        valueBytes = {}
+        for name, value in values.items():
+            if name not in self.slots:
+                raise CompiledPayloadError(f'Unknown slot : {name}')
+            width = self.slots[name].width
+            valueBytes[name] = value.encode('utf-8')
+            if len(valueBytes[name]) > width:
+                raise CompiledPayloadError(f'Value for slot : {name}; longer than its placeholder : {width} Bytes; value : {value}')
+            valueBytes[name] = valueBytes[name].ljust(width, SLOTPADDING)
+        return valueBytes
+
+    # *******************************************
+    # Fill in the slots with values for an image, by slot name.
+    # Slots without a value are left as their placeholder.
+    # Returns the data to embed.
+    # Raises CompiledPayloadError for an unknown slot, or a value too long for its slot.
+    # *******************************************
+    def fill(self, values):
+        data = bytearray(self.data)
+        chunks = set()
+        for name, valueBytes in self.checkValues(values).items():
+            slot = self.slots[name]
+
+            # A value may fall across the end of a chunk, so is written a chunk at a time.
+            for offset in slot.offsets:
+                for index in range(slot.width):
+                    data[self.dataOffset(offset + index)] = valueBytes[index]
+                if self.chunkSize > 0:
+                    chunks.update(range(offset // self.chunkSize, (offset + slot.width - 1) // self.chunkSize + 1))
+
+        # Frame the chunks holding the values again, as their CRCs have changed.
+        for chunk in chunks:
+            start = self.dataOffset(chunk * self.chunkSize)
+            end = min(start + self.chunkSize + V2CRCBYTES, len(data))
+            data[start:end] = frameChunk(data[start:end - V2CRCBYTES])
+        return bytes(data)
+
+    # *******************************************
+    # Overriding print() output.
+    # *******************************************
+    def __str__(self):
+        slots = ", ".join(f'{slot.name} ({slot.width} Bytes x {len(slot.offsets)})' for slot in self.slots.values())
+        return(
+            f'Format version : {self.formatVersion}; embedded size : {len(self.data)}; header : {self.headerLen}\n'
+            f'Slots : {slots}\n'
+        )
+
+# *******************************************
+# Compile a file into a payload, with slots to fill in for each image.
+# Slots are given by name, with the placeholder text to replace in the file.
+# The file is embedded by the file path given.
+# Returns the compiled payload.
+# Raises CompiledPayloadError if a placeholder isn't found, or placeholders overlap.
+# *******************************************
+def compilePayload(payloadFile, filePath, slots, formatVersion, passworded=False, pw=""):
+
+    with open(payloadFile, "rb") as cf:
+        fileData = cf.read()
+
+    # Find the slots, checking they don't overlap, as each would overwrite the other.
+    payloadSlots = {}
+    ranges = []
+    for name, placeholder in slots.items():
+        placeholderBytes = placeholder.encode('utf-8')
+        offsets = findPlaceholder(fileData, placeholderBytes) if len(placeholderBytes) > 0 else []
+        if len(offsets) == 0:
+            raise CompiledPayloadError(f'Placeholder for slot : {name}; not found in file : {payloadFile}')
+        payloadSlots[name] = PayloadSlot(name, placeholderBytes, offsets)
+        ranges += [(offset, offset + len(placeholderBytes), name) for offset in offsets]
+    ranges.sort()
+    for (start, end, name), (nextStart, nextEnd, nextName) in zip(ranges, ranges[1:]):
+        if nextStart < end:
+            raise CompiledPayloadError(f'Placeholders for slots overlap : {name}, {nextName}')
+
+    # Serialize the header and payload, as they would be embedded.
+    if formatVersion == V2VERSION:
+        container = ContainerHeader()
+        container.passworded = passworded
+        container.password = pw
+        container.codeType = CodeType.CODETYPE_FILE.value
+        container.dataSize = len(fileData)
+        container.codedSize = len(fileData)
+        container.filePath = filePath
+        hdrBytes = container.pack()
+        framer = ChunkFramer(container.chunkSize)
+        data = hdrBytes + framer.add(fileData) + framer.finish()
+        chunkSize = container.chunkSize
+    else:
+        frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd%%s%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES,  NAMELENBYTES, LENBYTES)
+        picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_FILE.value, blen(filePath), filePath, len(fileData))
+        hdrBytes = bytes(picCodeHdr, encoding='utf-8')
+        data = hdrBytes + fileData
+        chunkSize = 0
+
+    return CompiledPayload(formatVersion, data, len(hdrBytes), chunkSize, payloadSlots)
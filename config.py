@@ -13,7 +13,7 @@ class Config():
         self.cf = configFile
 
         # Version of configuration.
-        self.ConfigVersion = 2
+        self.ConfigVersion = 3
 
         # Logger configuration values
         self.DebugLevel = 10
@@ -51,6 +51,50 @@ class Config():
         self.IncludePasswd = 0
         self.KeepPassword = 1
 
+        # Bit engine used to read and write embedded data, "Vector" or "Scalar".
+        self.BitEngine = "Vector"
+
+        # Size of hunks of file data to embed / extract at a time (Bytes).
+        # Pipelined file I/O, and number of hunks to buffer between file I/O and embedding / extracting.
+        self.ChunkSize = 50000
+        self.PipelineIO = 1
+        self.PipelineDepth = 4
+
+        # Number of processes for parallel embedding / extracting (0 or 1 for none).
+        # Minimum image size (pixels) to embed / extract in parallel, and hunk size (Bytes) when in parallel.
+        self.ParallelProcesses = 0
+        self.ParallelMinPixels = 20000000
+        self.ParallelChunkSize = 8000000
+
+        # Memory budget (MB) for images embedded / extracted from the command line (0 for no limit).
+        # PNG images too large to decode within it are streamed a band of rows at a time.
+        self.StreamMemoryMB = 1024
+
+        # Compression of embedded data, "None", "zlib", "lzma" or "bz2".
+        self.Compression = "None"
+
+        # Format version of embedded data, 1 for the original format, 2 for the binary container.
+        # Images embedded with version 2 can't be read by releases before it, so it has to be chosen.
+        self.FormatVersion = 1
+
+        # Embed again over data already in the image by only rewriting the bytes that have changed.
+        self.DeltaEmbed = 1
+
+        # Memory for cached thumbnails of images (MB), and directory to also cache them on disk ("" for none).
+        self.ThumbnailCacheMB = 64
+        self.ThumbnailDir = ""
+
+        # Database indexing the probe results of images seen ("" for none),
+        # and hash the start and end of images to check they haven't changed, as well as size and modification time.
+        self.ProbeIndexFile = "picCoderIndex.db"
+        self.ProbeIndexHash = 0
+
+        # Number of processes probing images when scanning folders (0 for one per CPU).
+        self.ScanProcesses = 0
+
+        # Database indexing the messages of embedded conversations, for searching ("" for none).
+        self.MessageIndexFile = "picCoderMessages.db"
+
         # Read / update configuration from file.
         self.readConfig()
 
@@ -187,6 +231,108 @@ class Config():
                 except Exception:
                     self.KeepPassword = paramSaved
                     updateConfig = True
+                try:
+                    paramSaved = self.BitEngine
+                    self.BitEngine = config["BitEngine"]
+                except Exception:
+                    self.BitEngine = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ChunkSize
+                    self.ChunkSize = config["ChunkSize"]
+                except Exception:
+                    self.ChunkSize = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.PipelineIO
+                    self.PipelineIO = config["PipelineIO"]
+                except Exception:
+                    self.PipelineIO = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.PipelineDepth
+                    self.PipelineDepth = config["PipelineDepth"]
+                except Exception:
+                    self.PipelineDepth = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ParallelProcesses
+                    self.ParallelProcesses = config["ParallelProcesses"]
+                except Exception:
+                    self.ParallelProcesses = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ParallelMinPixels
+                    self.ParallelMinPixels = config["ParallelMinPixels"]
+                except Exception:
+                    self.ParallelMinPixels = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ParallelChunkSize
+                    self.ParallelChunkSize = config["ParallelChunkSize"]
+                except Exception:
+                    self.ParallelChunkSize = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.StreamMemoryMB
+                    self.StreamMemoryMB = config["StreamMemoryMB"]
+                except Exception:
+                    self.StreamMemoryMB = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.Compression
+                    self.Compression = config["Compression"]
+                except Exception:
+                    self.Compression = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.FormatVersion
+                    self.FormatVersion = config["FormatVersion"]
+                except Exception:
+                    self.FormatVersion = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.DeltaEmbed
+                    self.DeltaEmbed = config["DeltaEmbed"]
+                except Exception:
+                    self.DeltaEmbed = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ThumbnailCacheMB
+                    self.ThumbnailCacheMB = config["ThumbnailCacheMB"]
+                except Exception:
+                    self.ThumbnailCacheMB = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ThumbnailDir
+                    self.ThumbnailDir = config["ThumbnailDir"]
+                except Exception:
+                    self.ThumbnailDir = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ProbeIndexFile
+                    self.ProbeIndexFile = config["ProbeIndexFile"]
+                except Exception:
+                    self.ProbeIndexFile = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ProbeIndexHash
+                    self.ProbeIndexHash = config["ProbeIndexHash"]
+                except Exception:
+                    self.ProbeIndexHash = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.ScanProcesses
+                    self.ScanProcesses = config["ScanProcesses"]
+                except Exception:
+                    self.ScanProcesses = paramSaved
+                    updateConfig = True
+                try:
+                    paramSaved = self.MessageIndexFile
+                    self.MessageIndexFile = config["MessageIndexFile"]
+                except Exception:
+                    self.MessageIndexFile = paramSaved
+                    updateConfig = True
 
                 # If required, i.e. couldn't update all data from user configuration, then save default.
                 if updateConfig:
@@ -216,6 +362,23 @@ class Config():
             "MaxEmbedRatio" : self.MaxEmbedRatio,
             "IncludePasswd" : self.IncludePasswd,
             "KeepPassword" : self.KeepPassword,
+            "BitEngine" : self.BitEngine,
+            "ChunkSize" : self.ChunkSize,
+            "PipelineIO" : self.PipelineIO,
+            "PipelineDepth" : self.PipelineDepth,
+            "ParallelProcesses" : self.ParallelProcesses,
+            "ParallelMinPixels" : self.ParallelMinPixels,
+            "ParallelChunkSize" : self.ParallelChunkSize,
+            "StreamMemoryMB" : self.StreamMemoryMB,
+            "Compression" : self.Compression,
+            "FormatVersion" : self.FormatVersion,
+            "DeltaEmbed" : self.DeltaEmbed,
+            "ThumbnailCacheMB" : self.ThumbnailCacheMB,
+            "ThumbnailDir" : self.ThumbnailDir,
+            "ProbeIndexFile" : self.ProbeIndexFile,
+            "ProbeIndexHash" : self.ProbeIndexHash,
+            "ScanProcesses" : self.ScanProcesses,
+            "MessageIndexFile" : self.MessageIndexFile,
         }
 
         # Open file for writing.
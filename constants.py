@@ -17,18 +17,51 @@ PASSWDYNBYTES = 1
 PASSWDLENBYTES = 2
 NUMSMSBYTES = 3
 SMSLENBYTES = 3
-BYTESTACK = 50000
+CODECBYTES = 1
 
 # Embedded code types.
+# Compressed files and conversations have a codec field after the code type.
+# Archives of files, and parts of files spanning several images, are only embedded in a version 2 container.
 class CodeType(Enum):
     CODETYPE_NONE = 0
     CODETYPE_FILE = 1
     CODETYPE_TEXT = 2
+    CODETYPE_ZFILE = 3
+    CODETYPE_ZTEXT = 4
+    CODETYPE_ARCHIVE = 5
+    CODETYPE_SPAN = 6
+
+# Compression codecs of embedded data.
+class Codec(Enum):
+    CODEC_NONE = 0
+    CODEC_ZLIB = 1
+    CODEC_LZMA = 2
+    CODEC_BZ2 = 3
+
+# Format of message timestamps.
+MSGTIMEFORMAT = "%d-%m-%Y %H:%M:%S"
 
 # Password limits.
 PASSWDMINIMUM = 6
 PASSWDMAXIMUM = 20
 
+# Unchanged bytes between changed bytes that are rewritten anyway when embedding again,
+# so that each write into the image covers more than a few bytes.
+DELTAGAPBYTES = 16
+
+# Number of messages of an embedded conversation read at a time.
+CONVPAGESIZE = 50
+
+# Number of images probed by each task when scanning directories of images.
+SCANBATCHIMAGES = 32
+
+# Maximum number of archive files listed with the image details.
+ARCHIVELISTMAX = 5
+
+# Uncompressed image types, that are memory mapped rather than decoded.
+# Lower case.
+MAPPEDIMAGES = [".bmp", ".ppm", ".pam"]
+
 # Supported image types.
 # Lower case.
-ONLYIMAGES = [".png"]
\ No newline at end of file
+ONLYIMAGES = [".png"] + MAPPEDIMAGES
\ No newline at end of file
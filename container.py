@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import zlib
+
+from constants import *
+
+# *******************************************
+# Version 2 binary container for embedded data.
+#
+# Data embedded into the image:
+# <Magic>       - V2MAGIC, indicates that the image is encoded with a version 2 container.
+# <Version>     - 1 byte, the container version.
+# <HeaderLen>   - 4 bytes, the length of the header body.
+# <Header>      - <HeaderLen> bytes, the header body.
+# <HeaderCrc>   - 4 bytes, CRC32 of the header body.
+# <Chunks>      - The payload, in chunks of <ChunkSize> bytes (the last chunk may be shorter),
+#                 each followed by 4 bytes CRC32 of the chunk.
+#
+# The header body:
+# <Flags>       - 1 byte, V2FLAG_PASSWORD if password protected,
+#                 V2FLAG_INDEXED if the messages of a conversation follow a message offset table.
+# <CodeType>    - 1 byte, CODETYPE_FILE, CODETYPE_TEXT, CODETYPE_ARCHIVE or CODETYPE_SPAN.
+# <Codec>       - 1 byte, the compression codec of the payload.
+# <ChunkSize>   - 4 bytes, the size of payload chunks.
+# <DataSize>    - 8 bytes, the size of the file, messages or archive members, before compression.
+# <CodedSize>   - 8 bytes, the size of the payload, i.e. after compression.
+# <NumTexts>    - 4 bytes, the number of text messages, or of archive members.
+# <Password>    - Varint length, then the password.
+# <FileName>    - Varint length, then the path and filename of the embedded file.
+#
+# For CODETYPE_SPAN the header body continues with where the part fits in the spanned file:
+# <SetId>       - 16 bytes, the same for all parts of the spanned file.
+# <PartIndex>   - 4 bytes, the index of this part, starting from 0.
+# <PartCount>   - 4 bytes, the number of parts.
+# <PartOffset>  - 8 bytes, the offset of this part in the spanned file.
+# <TotalSize>   - 8 bytes, the size of the spanned file.
+# The payload is this part of the spanned file.
+#
+# For CODETYPE_TEXT the payload is the messages, each as varint length then text for
+# the writer name, the message timestamp and the message text.
+# With V2FLAG_INDEXED the messages follow a table of where each message is, so any page
+# of messages can be read without reading the messages before it:
+# <TableSlots>  - 4 bytes, the number of entries reserved in the table.
+# <Offsets>     - <TableSlots> entries of 8 bytes, the offset of each message in the payload,
+#                 unused entries are 0.
+# <Messages>    - The messages, as above.
+# The table has room for more messages than it holds, so adding a message only adds an entry
+# to the table, and the message after the others, without moving the messages already embedded.
+#
+# For CODETYPE_ARCHIVE the payload is an index of the members, followed by the members:
+# <IndexLen>    - 4 bytes, the length of the index entries.
+#               - Repeat the following for each member.
+# <Name>        - Varint length, then the name of the member, a relative path using "/".
+# <Size>        - 8 bytes, the size of the member.
+# <CodedSize>   - 8 bytes, the size of the member after compression.
+# <Offset>      - 8 bytes, the offset of the member in the payload.
+# Each member is compressed on its own, so any member can be read without reading the others.
+#
+# All numbers are unsigned big-endian, text is UTF-8.
+# The header is parsed in one read of the image, and the sizes are fixed width so that
+# the header can be rewritten once they are known, without moving the payload.
+# *******************************************
+
+# Version 2 container constants.
+V2MAGIC = b"\x89PICCODE"
+V2VERSION = 2
+V2PREFIXBYTES = 13
+V2CRCBYTES = 4
+V2CHUNKSIZE = 65536
+V2FLAG_PASSWORD = 0x01
+V2FLAG_INDEXED = 0x02
+
+# Maximum header body length, to reject images that just happen to start with the magic.
+V2MAXHEADERLEN = 65536
+
+# Fixed width fields of the header body.
+V2FIXEDFORMAT = ">BBBIQQI"
+
+# Fixed width fields of message offset table, and the minimum number of entries reserved.
+V2SLOTSFORMAT = ">I"
+V2OFFSETFORMAT = ">Q"
+V2MINTABLESLOTS = 64
+
+# Fixed width fields of span part.
+V2SPANFORMAT = ">16sIIQQ"
+
+# Fixed width fields of archive index.
+V2INDEXLENFORMAT = ">I"
+V2MEMBERFORMAT = ">QQQ"
+
+# *******************************************
+# Exception for container data that can't be read.
+# *******************************************
+class ContainerError(Exception):
+    pass
+
+# *******************************************
+# Pack unsigned number as a varint, 7 bits per byte, least significant first.
+# *******************************************
+def packVarint(value):
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+# *******************************************
+# Unpack varint from data at offset.
+# Returns the value and the offset after the varint.
+# *******************************************
+def unpackVarint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ContainerError("Varint truncated.")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if (byte & 0x80) == 0:
+            return value, offset
+        shift += 7
+
+# *******************************************
+# Pack text as varint length and UTF-8 bytes.
+# *******************************************
+def packText(text):
+    data = text.encode('utf-8')
+    return packVarint(len(data)) + data
+
+# *******************************************
+# Unpack text from data at offset.
+# Returns the text and the offset after the text.
+# *******************************************
+def unpackText(data, offset):
+    length, offset = unpackVarint(data, offset)
+    if (offset + length) > len(data):
+        raise ContainerError("Text truncated.")
+    try:
+        return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+    except UnicodeDecodeError:
+        raise ContainerError("Text is not UTF-8.")
+
+# *******************************************
+# Container header class.
+# *******************************************
+class ContainerHeader():
+    def __init__(self):
+
+        self.passworded = False
+        self.password = ""
+
+        # Messages of a conversation follow a message offset table.
+        self.indexed = False
+
+        self.codeType = CodeType.CODETYPE_NONE.value
+        self.codec = Codec.CODEC_NONE.value
+        self.chunkSize = V2CHUNKSIZE
+        self.dataSize = 0
+        self.codedSize = 0
+        self.numMessages = 0
+        self.filePath = ""
+
+        # Where the payload fits in a spanned file, for CODETYPE_SPAN.
+        self.span = None
+
+        # Length of the packed header, i.e. offset of the first payload chunk.
+        self.headerLen = 0
+
+    # *******************************************
+    # Pack header, including prefix and CRC.
+    # *******************************************
+    def pack(self):
+        flags = (V2FLAG_PASSWORD if self.passworded else 0) | (V2FLAG_INDEXED if self.indexed else 0)
+        body = struct.pack(V2FIXEDFORMAT, flags, self.codeType, self.codec, self.chunkSize, self.dataSize, self.codedSize, self.numMessages)
+        body += packText(self.password) + packText(self.filePath)
+        if self.codeType == CodeType.CODETYPE_SPAN.value:
+            body += self.span.pack()
+        header = V2MAGIC + struct.pack(">BI", V2VERSION, len(body)) + body + struct.pack(">I", zlib.crc32(body))
+        self.headerLen = len(header)
+        return header
+
+    # *******************************************
+    # Get offset in the embedded data of a payload chunk.
+    # *******************************************
+    def chunkOffset(self, chunk):
+        return self.headerLen + chunk * (self.chunkSize + V2CRCBYTES)
+
+    # *******************************************
+    # Get number of payload chunks.
+    # *******************************************
+    def numChunks(self):
+        return -(-self.codedSize // self.chunkSize)
+
+    # *******************************************
+    # Get size of the payload chunks including their CRCs.
+    # *******************************************
+    def framedSize(self):
+        return self.codedSize + self.numChunks() * V2CRCBYTES
+
+    # *******************************************
+    # Overriding print() output.
+    # *******************************************
+    def __str__(self):
+        return(
+            f'Code type : {self.codeType}; codec : {self.codec}; password : {self.passworded}\n'
+            f'Chunk size : {self.chunkSize}; data size : {self.dataSize}; coded size : {self.codedSize}\n'
+            f'Messages : {self.numMessages}; file : {self.filePath}\n'
+        )
+
+# *******************************************
+# Span part class.
+# Where the payload of an image fits in a file spanning several images.
+# *******************************************
+class SpanPart():
+    def __init__(self, setId, partIndex, partCount, partOffset, totalSize):
+
+        self.setId = setId
+        self.partIndex = partIndex
+        self.partCount = partCount
+        self.partOffset = partOffset
+        self.totalSize = totalSize
+
+    # *******************************************
+    # Pack span part for the container header.
+    # *******************************************
+    def pack(self):
+        return struct.pack(V2SPANFORMAT, self.setId, self.partIndex, self.partCount, self.partOffset, self.totalSize)
+
+    # *******************************************
+    # Overriding print() output.
+    # *******************************************
+    def __str__(self):
+        return f'Set : {self.setId.hex()}; part : {self.partIndex + 1} of {self.partCount}; offset : {self.partOffset}; total size : {self.totalSize}'
+
+# *******************************************
+# Unpack span part from the container header body at offset.
+# *******************************************
+def unpackSpan(body, offset):
+    spanLen = struct.calcsize(V2SPANFORMAT)
+    if (offset + spanLen) > len(body):
+        raise ContainerError("Span part truncated.")
+    span = SpanPart(*struct.unpack(V2SPANFORMAT, body[offset:offset + spanLen]))
+    if span.partIndex >= span.partCount:
+        raise ContainerError(f'Invalid span part : {span.partIndex}; of : {span.partCount}')
+    return span
+
+# *******************************************
+# Parse header prefix, following the magic.
+# Returns the number of bytes of the rest of the header, i.e. the body and its CRC.
+# *******************************************
+def parseHeaderPrefix(prefix):
+    if len(prefix) != (V2PREFIXBYTES - len(V2MAGIC)):
+        raise ContainerError("Header prefix truncated.")
+    version, bodyLen = struct.unpack(">BI", prefix)
+    if version != V2VERSION:
+        raise ContainerError(f'Unsupported container version : {version}')
+    if bodyLen > V2MAXHEADERLEN:
+        raise ContainerError(f'Invalid header length : {bodyLen}')
+    return bodyLen + V2CRCBYTES
+
+# *******************************************
+# Parse header body and its CRC.
+# Returns the header.
+# *******************************************
+def parseHeader(data):
+    body = bytes(data[:-V2CRCBYTES])
+    if (len(data) < V2CRCBYTES) or (zlib.crc32(body) != struct.unpack(">I", data[-V2CRCBYTES:])[0]):
+        raise ContainerError("Header CRC error.")
+
+    header = ContainerHeader()
+    fixedLen = struct.calcsize(V2FIXEDFORMAT)
+    if len(body) < fixedLen:
+        raise ContainerError("Header truncated.")
+    flags, header.codeType, header.codec, header.chunkSize, header.dataSize, header.codedSize, header.numMessages = struct.unpack(V2FIXEDFORMAT, body[:fixedLen])
+    if header.chunkSize == 0:
+        raise ContainerError("Invalid chunk size.")
+    header.passworded = bool(flags & V2FLAG_PASSWORD)
+    header.indexed = bool(flags & V2FLAG_INDEXED)
+    header.password, offset = unpackText(body, fixedLen)
+    header.filePath, offset = unpackText(body, offset)
+    if header.codeType == CodeType.CODETYPE_SPAN.value:
+        header.span = unpackSpan(body, offset)
+    header.headerLen = V2PREFIXBYTES + len(data)
+    return header
+
+# *******************************************
+# Read header, following the magic, using a read function.
+# The read function takes the number of bytes to read, and returns the bytes read,
+# which may be short or None if there isn't enough data.
+# The rest of the header is read in one read, once its length is known.
+# Returns the header.
+# *******************************************
+def readHeader(read):
+    prefix = read(V2PREFIXBYTES - len(V2MAGIC)) or b""
+    bytesToRead = parseHeaderPrefix(prefix)
+    data = read(bytesToRead) or b""
+    if len(data) != bytesToRead:
+        raise ContainerError("Header truncated.")
+    return parseHeader(data)
+
+# *******************************************
+# Get size of embedded data in a container, e.g. to check it fits in an image.
+# Only the length of the password matters, as it may not be known yet.
+# *******************************************
+def containerSize(codedSize, passwordLen=0, filePath="", chunkSize=V2CHUNKSIZE):
+    header = ContainerHeader()
+    header.password = " " * passwordLen
+    header.filePath = filePath
+    header.chunkSize = chunkSize
+    header.codedSize = codedSize
+    return len(header.pack()) + header.framedSize()
+
+# *******************************************
+# Largest payload that fits in capacity bytes after a header of headerLen bytes.
+# Each chunk of the payload is followed by its CRC.
+# *******************************************
+def maxPayloadSize(capacity, headerLen, chunkSize=V2CHUNKSIZE):
+    available = capacity - headerLen
+    if available <= V2CRCBYTES:
+        return 0
+    fullChunks, remainder = divmod(available, chunkSize + V2CRCBYTES)
+    return (fullChunks * chunkSize) + max(0, remainder - V2CRCBYTES)
+
+# *******************************************
+# Frame chunk of payload with its CRC.
+# *******************************************
+def frameChunk(data):
+    return bytes(data) + struct.pack(">I", zlib.crc32(data))
+
+# *******************************************
+# Check CRC of framed chunk of payload.
+# Returns the chunk of payload.
+# *******************************************
+def unframeChunk(framed):
+    data = bytes(framed[:-V2CRCBYTES])
+    if (len(framed) <= V2CRCBYTES) or (zlib.crc32(data) != struct.unpack(">I", framed[-V2CRCBYTES:])[0]):
+        raise ContainerError("Payload chunk CRC error.")
+    return data
+
+# *******************************************
+# Chunk framer class.
+# Collects payload data, and frames it into chunks as they are completed.
+# *******************************************
+class ChunkFramer():
+    def __init__(self, chunkSize):
+        self.chunkSize = chunkSize
+        self.pending = bytearray()
+
+    # *******************************************
+    # Add payload data.
+    # Returns the framed chunks completed, which may be empty.
+    # *******************************************
+    def add(self, data):
+        self.pending += data
+        framed = bytearray()
+        numChunks = len(self.pending) // self.chunkSize
+        for chunk in range(numChunks):
+            framed += frameChunk(self.pending[chunk * self.chunkSize:(chunk + 1) * self.chunkSize])
+        del self.pending[:numChunks * self.chunkSize]
+        return bytes(framed)
+
+    # *******************************************
+    # Finish adding payload data.
+    # Returns the last framed chunk, or empty if there is none.
+    # *******************************************
+    def finish(self):
+        if len(self.pending) == 0:
+            return b""
+        framed = frameChunk(self.pending)
+        self.pending = bytearray()
+        return framed
+
+# *******************************************
+# Pack text messages as payload.
+# Messages are (writer, time, text).
+# *******************************************
+def packMessages(messages):
+    data = bytearray()
+    for writer, msgTime, msgText in messages:
+        data += packText(writer) + packText(msgTime) + packText(msgText)
+    return bytes(data)
+
+# *******************************************
+# Unpack text messages from payload.
+# Returns list of (writer, time, text).
+# *******************************************
+def unpackMessages(data, numMessages):
+    messages = []
+    offset = 0
+    for idx in range(numMessages):
+        writer, offset = unpackText(data, offset)
+        msgTime, offset = unpackText(data, offset)
+        msgText, offset = unpackText(data, offset)
+        messages.append((writer, msgTime, msgText))
+    return messages
+
+# *******************************************
+# Number of entries to reserve in a message offset table for a number of messages.
+# Rounded up to a power of two, so the table is only moved as often as the conversation doubles.
+# *******************************************
+def tableSlots(numMessages):
+    slots = V2MINTABLESLOTS
+    while slots < numMessages:
+        slots *= 2
+    return slots
+
+# *******************************************
+# Get length of a message offset table with a number of entries reserved.
+# *******************************************
+def tableLength(slots):
+    return struct.calcsize(V2SLOTSFORMAT) + slots * struct.calcsize(V2OFFSETFORMAT)
+
+# *******************************************
+# Get offset in the payload of an entry of a message offset table.
+# *******************************************
+def tableEntryOffset(idx):
+    return struct.calcsize(V2SLOTSFORMAT) + idx * struct.calcsize(V2OFFSETFORMAT)
+
+# *******************************************
+# Pack text messages from (writer, time, text), after a message offset table.
+# *******************************************
+def packIndexedMessages(messages):
+    records = [packText(writer) + packText(msgTime) + packText(msgText) for writer, msgTime, msgText in messages]
+    slots = tableSlots(len(records))
+    offsets = []
+    offset = tableLength(slots)
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+    offsets += [0] * (slots - len(records))
+    table = struct.pack(V2SLOTSFORMAT, slots) + packOffsets(offsets)
+    return table + b"".join(records)
+
+# *******************************************
+# Pack entries of a message offset table.
+# *******************************************
+def packOffsets(offsets):
+    return struct.pack(f'>{len(offsets)}Q', *offsets)
+
+# *******************************************
+# Get number of entries reserved from the start of a message offset table.
+# *******************************************
+def unpackTableSlots(data):
+    slotsLen = struct.calcsize(V2SLOTSFORMAT)
+    if len(data) < slotsLen:
+        raise ContainerError("Message offset table truncated.")
+    return struct.unpack(V2SLOTSFORMAT, bytes(data[:slotsLen]))[0]
+
+# *******************************************
+# Unpack entries of a message offset table.
+# Returns list of offsets.
+# *******************************************
+def unpackOffsets(data, numOffsets):
+    if len(data) < (numOffsets * struct.calcsize(V2OFFSETFORMAT)):
+        raise ContainerError("Message offset table truncated.")
+    return list(struct.unpack(f'>{numOffsets}Q', bytes(data[:numOffsets * struct.calcsize(V2OFFSETFORMAT)])))
+
+# *******************************************
+# Archive member class.
+# *******************************************
+class ArchiveMember():
+    def __init__(self, name, size=0, codedSize=0, offset=0):
+
+        self.name = name
+        self.size = size
+        self.codedSize = codedSize
+        self.offset = offset
+
+    # *******************************************
+    # Overriding print() output.
+    # *******************************************
+    def __str__(self):
+        return f'{self.name} : size : {self.size}; coded size : {self.codedSize}; offset : {self.offset}'
+
+# *******************************************
+# Pack archive index.
+# The length of the index only depends on the member names, so it can be
+# packed before the sizes and offsets are known, and packed again after.
+# *******************************************
+def packIndex(members):
+    entries = bytearray()
+    for member in members:
+        entries += packText(member.name) + struct.pack(V2MEMBERFORMAT, member.size, member.codedSize, member.offset)
+    return struct.pack(V2INDEXLENFORMAT, len(entries)) + bytes(entries)
+
+# *******************************************
+# Get length of archive index from the start of the payload.
+# If there isn't enough of the payload to tell, returns the length needed to tell.
+# *******************************************
+def indexLength(data):
+    lenBytes = struct.calcsize(V2INDEXLENFORMAT)
+    if len(data) < lenBytes:
+        return lenBytes
+    return lenBytes + struct.unpack(V2INDEXLENFORMAT, bytes(data[:lenBytes]))[0]
+
+# *******************************************
+# Unpack archive index from the start of the payload.
+# Returns list of archive members.
+# *******************************************
+def unpackIndex(data, numMembers):
+    endOffset = indexLength(data)
+    if len(data) < endOffset:
+        raise ContainerError("Archive index truncated.")
+    entries = bytes(data[:endOffset])
+    offset = struct.calcsize(V2INDEXLENFORMAT)
+    memberLen = struct.calcsize(V2MEMBERFORMAT)
+    members = []
+    for idx in range(numMembers):
+        name, offset = unpackText(entries, offset)
+        if (offset + memberLen) > endOffset:
+            raise ContainerError("Archive index truncated.")
+        members.append(ArchiveMember(name, *struct.unpack(V2MEMBERFORMAT, entries[offset:offset + memberLen])))
+        offset += memberLen
+    return members
+
+# *******************************************
+# Get size of embedded data for an archive, e.g. to check it fits in an image.
+# Sizes are of the members, after any compression.
+# *******************************************
+def archiveSize(names, codedSizes, passwordLen=0, chunkSize=V2CHUNKSIZE):
+    indexLen = len(packIndex([ArchiveMember(name) for name in names]))
+    return containerSize(indexLen + sum(codedSizes), passwordLen, "", chunkSize)
+
+# *******************************************
+# Get archive member names for files to embed.
+# Names are relative to the deepest directory holding all of the files.
+# *******************************************
+def archiveMemberNames(filePaths):
+    if len(filePaths) == 0:
+        return []
+    baseDir = os.path.commonpath([os.path.dirname(os.path.abspath(filePath)) for filePath in filePaths])
+    return [os.path.relpath(os.path.abspath(filePath), baseDir).replace(os.sep, "/") for filePath in filePaths]
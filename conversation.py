@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
-from PyQt5.QtWidgets import QDialog, QHBoxLayout, QLabel
+from PyQt5.QtWidgets import QDialog
 from PyQt5 import uic
 from PyQt5 import QtCore, QtGui, QtWidgets
-import datetime
+import collections
 import os
 import sys
 import random
 
+from constants import *
 from popup import *
 from utils import *
 
@@ -23,6 +24,355 @@ def res_path(relative_path):
     resPath = os.path.join(base_path, relative_path)
     return resPath
 
+# *******************************************
+# Message bubble class.
+# What is needed to render a message of the conversation as a bubble.
+# *******************************************
+class MessageBubble():
+    def __init__(self, msgIdx, msg, incWriter, topRadius, botRadius, borderCol, fillCol, mine, highlighted=False):
+
+        # Index of the message in the conversation, and the message.
+        self.msgIdx = msgIdx
+        self.msg = msg
+
+        # Include writer and timestamp, only if not grouped with the previous message.
+        self.incWriter = incWriter
+
+        # Radius of the top and bottom corners, not rounded where grouped with the next or previous message.
+        self.topRadius = topRadius
+        self.botRadius = botRadius
+
+        # Writer colours, and if the message is mine, on the right, rather than others, on the left.
+        self.borderCol = borderCol
+        self.fillCol = fillCol
+        self.mine = mine
+
+        # Highlight the message, e.g. when found by a search.
+        self.highlighted = highlighted
+
+# *******************************************
+# Conversation model class.
+# List model of a window of messages of a conversation, as shown in the conversation dialog.
+# The window is the latest messages, or the pages around a message, e.g. when found by a search.
+# Rows are messages of the conversation from the first message shown, read from the conversation as needed.
+# Older messages are inserted a page at a time, newer messages appended a page at a time,
+# and sent messages are appended, so the view only lays out the messages that are new to it.
+# *******************************************
+class ConversationModel(QtCore.QAbstractListModel):
+
+    # Roles for the message bubble of a row, and the key of its cached layout.
+    BubbleRole = QtCore.Qt.UserRole + 1
+    LayoutKeyRole = QtCore.Qt.UserRole + 2
+
+    def __init__(self, config, conversation):
+        super(ConversationModel, self).__init__()
+
+        # Initialise config and conversation object.
+        self.config = config
+        self.conversation = conversation
+
+        # Index in the conversation of the first message shown, and number of messages shown.
+        self.firstIdx = 0
+        self.numRows = 0
+
+        # Index in the conversation of the message highlighted, -1 for none.
+        self.highlightIdx = -1
+
+        # Writer (handle) colours for rendering, by writer.
+        self.handleColour = {}
+
+    # *******************************************
+    # Number of rows, being the messages shown.
+    # *******************************************
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.numRows
+
+    # *******************************************
+    # Data of a row, the message bubble, the key of its layout, or the message text for display.
+    # The layout of a message only changes with whether the writer is included.
+    # Returns None for messages that couldn't be read.
+    # *******************************************
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if (not index.isValid()) or (index.row() >= self.numRows):
+            return None
+        if role == self.LayoutKeyRole:
+            return (self.firstIdx + index.row(), not self.groupedWithPrevious(index.row()))
+        if role == self.BubbleRole:
+            return self.bubble(index.row())
+        if role == QtCore.Qt.DisplayRole:
+            msg = self.conversation.getMessage(self.firstIdx + index.row())
+            return msg.msgText if msg is not None else None
+        return None
+
+    # *******************************************
+    # Check if a message shown is grouped with the previous message.
+    # The first message shown isn't grouped, as the previous message isn't shown.
+    # *******************************************
+    def groupedWithPrevious(self, row):
+        if (row <= 0) or (row >= self.numRows):
+            return False
+        return self.conversation.groupedWithPrevious(self.firstIdx + row)
+
+    # *******************************************
+    # Get the message bubble of a row.
+    # Grouped messages have cornered outlines where they meet.
+    # *******************************************
+    def bubble(self, row):
+        msg = self.conversation.getMessage(self.firstIdx + row)
+        if msg is None:
+            return None
+        groupedPrev = self.groupedWithPrevious(row)
+        groupedNext = self.groupedWithPrevious(row + 1)
+        borderCol, fillCol = self.writerColours(msg.writer)
+        radius = self.config.SmsRender["BubbleRadius"]
+        return MessageBubble(self.firstIdx + row, msg, not groupedPrev, 0 if groupedPrev else radius, 0 if groupedNext else radius,
+                             borderCol, fillCol, msg.writer == self.config.MyHandle, self.firstIdx + row == self.highlightIdx)
+
+    # *******************************************
+    # Show the latest page of messages of the conversation.
+    # *******************************************
+    def showLatest(self):
+        self.beginResetModel()
+        numMsgs = self.conversation.numMessages()
+        self.firstIdx = max(0, numMsgs - CONVPAGESIZE)
+        self.numRows = numMsgs - self.firstIdx
+        self.highlightIdx = -1
+        self.endResetModel()
+
+    # *******************************************
+    # Show the page of messages holding a message, and the pages before and after it, highlighting the message.
+    # Only these pages are shown, so showing a message costs the same wherever it is in the conversation.
+    # Returns row of the message.
+    # *******************************************
+    def showMessage(self, idx):
+        self.beginResetModel()
+        numMsgs = self.conversation.numMessages()
+        idx = max(0, min(idx, numMsgs - 1))
+        pageStart = idx - (idx % CONVPAGESIZE)
+        self.firstIdx = max(0, pageStart - CONVPAGESIZE)
+        self.numRows = min(numMsgs, pageStart + 2 * CONVPAGESIZE) - self.firstIdx
+        self.highlightIdx = idx
+        self.endResetModel()
+        return idx - self.firstIdx
+
+    # *******************************************
+    # Check if there are older messages to show.
+    # *******************************************
+    def canShowOlder(self):
+        return self.firstIdx > 0
+
+    # *******************************************
+    # Show the next page of older messages, inserted before the messages shown.
+    # Returns number of messages inserted.
+    # *******************************************
+    def showOlder(self):
+        numOlder = min(CONVPAGESIZE, self.firstIdx)
+        if numOlder == 0:
+            return 0
+        self.beginInsertRows(QtCore.QModelIndex(), 0, numOlder - 1)
+        self.firstIdx -= numOlder
+        self.numRows += numOlder
+        self.endInsertRows()
+
+        # The message that was first may now be grouped with the message before it.
+        self.rowChanged(numOlder)
+        return numOlder
+
+    # *******************************************
+    # Check if there are newer messages to show.
+    # *******************************************
+    def canShowNewer(self):
+        return (self.firstIdx + self.numRows) < self.conversation.numMessages()
+
+    # *******************************************
+    # Show the next page of newer messages, appended after the messages shown.
+    # Returns number of messages appended.
+    # *******************************************
+    def showNewer(self):
+        row = self.numRows
+        numNewer = min(CONVPAGESIZE, self.conversation.numMessages() - (self.firstIdx + row))
+        if numNewer <= 0:
+            return 0
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + numNewer - 1)
+        self.numRows += numNewer
+        self.endInsertRows()
+
+        # The message that was last may now be grouped with the message after it.
+        self.rowChanged(row - 1)
+        return numNewer
+
+    # *******************************************
+    # Show a message added to the end of the conversation, appended to the messages shown.
+    # If the messages shown don't run to the end of the conversation, the latest messages are shown instead.
+    # *******************************************
+    def messageAdded(self):
+        row = self.numRows
+        if (self.firstIdx + row + 1) < self.conversation.numMessages():
+            self.showLatest()
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.numRows += 1
+        self.endInsertRows()
+
+        # The message that was last may now be grouped with the added message.
+        self.rowChanged(row - 1)
+
+    # *******************************************
+    # Signal a row has changed, if there is the row.
+    # *******************************************
+    def rowChanged(self, row):
+        if (row >= 0) and (row < self.numRows):
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    # *******************************************
+    # Get colours for a writer handle, assigning a random colour to a new writer.
+    # Colours not guaranteed to be unique but doesn't mattter too much.
+    # *******************************************
+    def writerColours(self, handle):
+        colours = self.handleColour.get(handle)
+        if colours is None:
+            # Use randomly generated colours for border and fill.
+            # Restrict ranges so that borders are darker than fill.
+            bcol = lambda: random.randint(0, self.config.SmsRender["BorderColMax"])
+            fcol = lambda: random.randint(self.config.SmsRender["FillColMin"], 255)
+            colours = (f'#{bcol():02x}{bcol():02x}{bcol():02x}', f'#{fcol():02x}{fcol():02x}{fcol():02x}')
+            self.handleColour[handle] = colours
+        return colours
+
+# *******************************************
+# Conversation delegate class.
+# Paints messages as bubbles, the messages of the writer on the right, others on the left.
+# The height of each message is cached, and so are the text layouts of recently painted messages,
+# so scrolling doesn't lay out text again.
+# *******************************************
+class ConversationDelegate(QtWidgets.QStyledItemDelegate):
+
+    # Bubble border width and padding, spacing between bubbles, and space at the sides of the view.
+    BORDERWIDTH = 3
+    PADDING = 10
+    SPACING = 6
+    MARGIN = 5
+
+    # Maximum number of text layouts cached.
+    MAXLAYOUTS = 500
+
+    def __init__(self, config, parent=None):
+        super(ConversationDelegate, self).__init__(parent)
+
+        # Initialise config.
+        self.config = config
+
+        # Font of message text.
+        self.font = QtGui.QFont()
+        self.font.setPixelSize(self.config.SmsRender["FontSizePx"])
+
+        # Cached heights, and least recently used text layouts, by message index and if the writer is included.
+        self.heights = {}
+        self.layouts = collections.OrderedDict()
+
+    # *******************************************
+    # Clear cached heights and layouts, e.g. for another conversation.
+    # *******************************************
+    def clearCache(self):
+        self.heights = {}
+        self.layouts.clear()
+
+    # *******************************************
+    # Get the text layout of a message bubble, laying out the text if not cached.
+    # *******************************************
+    def textLayout(self, bubble):
+        key = (bubble.msgIdx, bubble.incWriter)
+        layout = self.layouts.get(key)
+        if layout is not None:
+            self.layouts.move_to_end(key)
+            return layout
+
+        # Newline characters in the text aren't rendered in html format, so replace with break tokens.
+        messageText = "<br>".join(bubble.msg.msgText.split("\n"))
+        layout = QtGui.QTextDocument()
+        layout.setDefaultFont(self.font)
+        layout.setDocumentMargin(0)
+        if bubble.incWriter == True:
+            layout.setHtml(f'<b>{bubble.msg.writer} : {bubble.msg.msgTime}</b><br><br>{messageText}')
+        else:
+            layout.setHtml(messageText)
+        layout.setTextWidth(self.config.SmsRender["TextWidth"] - 2 * (self.BORDERWIDTH + self.PADDING))
+
+        self.layouts[key] = layout
+        if len(self.layouts) > self.MAXLAYOUTS:
+            self.layouts.popitem(last=False)
+        self.heights[key] = int(layout.size().height() + 0.5)
+        return layout
+
+    # *******************************************
+    # Size of a message, from its cached height if it has been laid out.
+    # *******************************************
+    def sizeHint(self, option, index):
+        key = index.data(ConversationModel.LayoutKeyRole)
+        if key is None:
+            return QtCore.QSize(0, 0)
+        height = self.heights.get(key)
+        if height is None:
+            self.textLayout(index.data(ConversationModel.BubbleRole))
+            height = self.heights[key]
+        return QtCore.QSize(self.config.SmsRender["TextWidth"] + 2 * self.MARGIN, height + 2 * (self.BORDERWIDTH + self.PADDING) + self.SPACING)
+
+    # *******************************************
+    # Paint a message as a bubble.
+    # *******************************************
+    def paint(self, painter, option, index):
+        bubble = index.data(ConversationModel.BubbleRole)
+        if bubble is None:
+            return
+        layout = self.textLayout(bubble)
+
+        # Bubble rectangle, of the text width, on the right for my messages and on the left for others.
+        width = min(self.config.SmsRender["TextWidth"], option.rect.width() - 2 * self.MARGIN)
+        height = option.rect.height() - self.SPACING
+        if bubble.mine:
+            left = option.rect.right() - self.MARGIN - width
+        else:
+            left = option.rect.left() + self.MARGIN
+        top = option.rect.top() + self.SPACING // 2
+
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+
+        # Outline drawn centred on the border, with the corners of the top and bottom radius.
+        inset = self.BORDERWIDTH / 2
+        rect = QtCore.QRectF(left + inset, top + inset, width - self.BORDERWIDTH, height - self.BORDERWIDTH)
+        borderCol = option.palette.highlight().color() if bubble.highlighted else QtGui.QColor(bubble.borderCol)
+        painter.setPen(QtGui.QPen(borderCol, self.BORDERWIDTH))
+        painter.setBrush(QtGui.QColor(bubble.fillCol))
+        painter.drawPath(self.bubblePath(rect, bubble.topRadius, bubble.botRadius))
+
+        # Text within the border and padding.
+        painter.translate(left + self.BORDERWIDTH + self.PADDING, top + self.BORDERWIDTH + self.PADDING)
+        layout.drawContents(painter)
+        painter.restore()
+
+    # *******************************************
+    # Path of a bubble outline, with the top and bottom corners of different radius.
+    # *******************************************
+    def bubblePath(self, rect, topRadius, botRadius):
+        topRadius = min(topRadius, rect.height() / 2, rect.width() / 2)
+        botRadius = min(botRadius, rect.height() / 2, rect.width() / 2)
+        path = QtGui.QPainterPath()
+        path.moveTo(rect.left() + topRadius, rect.top())
+        path.lineTo(rect.right() - topRadius, rect.top())
+        path.arcTo(QtCore.QRectF(rect.right() - 2 * topRadius, rect.top(), 2 * topRadius, 2 * topRadius), 90, -90)
+        path.lineTo(rect.right(), rect.bottom() - botRadius)
+        path.arcTo(QtCore.QRectF(rect.right() - 2 * botRadius, rect.bottom() - 2 * botRadius, 2 * botRadius, 2 * botRadius), 0, -90)
+        path.lineTo(rect.left() + botRadius, rect.bottom())
+        path.arcTo(QtCore.QRectF(rect.left(), rect.bottom() - 2 * botRadius, 2 * botRadius, 2 * botRadius), 270, -90)
+        path.lineTo(rect.left(), rect.top() + topRadius)
+        path.arcTo(QtCore.QRectF(rect.left(), rect.top(), 2 * topRadius, 2 * topRadius), 180, -90)
+        path.closeSubpath()
+        return path
+
 # *******************************************
 # Conversation dialog class.
 # *******************************************
@@ -38,8 +388,12 @@ class ConversationDialog(QDialog):
         # Initialise class conversation object.
         self.conversation = conversation
 
-        # Writer (handle) colours for rendering.
-        self.handleColour = []
+        # Distance of the scroll position from the bottom to keep when messages are shown.
+        # Or the row to keep in view when showing a message, until the user scrolls, -1 for none.
+        # Or keep the scroll position from the top, as when newer messages are appended below those in view.
+        self.scrollFromBottom = 0
+        self.anchorRow = -1
+        self.keepFromTop = False
 
         # Set dialog window icon.
         icon = QtGui.QIcon()
@@ -60,166 +414,84 @@ class ConversationDialog(QDialog):
         self.clearButton.setEnabled(True)
         self.clearButton.clicked.connect(self.clearClicked)
 
-        # Couple scroll area to layout contents.
-        self.scrollAreaWidgetContents.setLayout(self.verticalLayout)
-        self.scrollArea.setWidget(self.scrollAreaWidgetContents)
-
-    # *******************************************
-    # Populate messages in conversation.
-    # *******************************************
-    def populateMessages(self):
-
-        # Clear the dialog.
-        self.clearConversationLayout()
-
-        # Populate messages in the layout.
-        numSMSes = self.conversation.numMessages()
-        self.logger.debug(f'Populating conversation with messages : {numSMSes}')
-
-        # Get random colour for each different writer.
-        self.updateWriterColours()
-
-        # Add a stretch widget at the top to consume space and push messages to the bottom.
-        self.verticalLayout.addStretch()
-
-        # Loop through messages.
-        for idx, msg in enumerate(self.conversation.messages):
-
-            # Get the message bubble colours for this writer.
-            borderCol, fillCol = self.getWriterColours(msg.writer)
-
-            # Flag to include write and timestamp.
-            incWriter = True
-
-            # Group messages using cornered outlines if messages from the same writer are within a certain time.
-            # Get time and writer of this message.
-            thisTime = datetime.datetime.strptime(msg.msgTime, "%d-%m-%Y %H:%M:%S")
-            thisWriter = msg.writer
-            # Get time and writer of next message.
-            if (idx != (numSMSes - 1)):
-                nextWriter = self.conversation.messages[idx + 1].writer
-                nextTime = datetime.datetime.strptime(self.conversation.messages[idx + 1].msgTime, "%d-%m-%Y %H:%M:%S")
-
-            # Top of top message is rounded.
-            if idx == 0:
-                topRadius = self.config.SmsRender["BubbleRadius"]
-            else:
-                # If this message is by same writer AND within certain time of previous message the top of this message is not rounded.
-                if (thisWriter == prevWriter) and ((thisTime - prevTime).total_seconds() < self.config.SmsRender["SameMsgTime"]):
-                    topRadius = 0
-                    incWriter = False
-                # Else top of this message is rounded.
-                else:
-                    topRadius = self.config.SmsRender["BubbleRadius"]
-            # Bottom of bottom message is rounded.
-            if idx == (numSMSes - 1):
-                botRadius = self.config.SmsRender["BubbleRadius"]
-            else:
-                # If this message is by same writer AND within certain time of next message the bottom of this message is not rounded.
-                if (msg.writer == nextWriter) and ((nextTime - thisTime).total_seconds() < self.config.SmsRender["SameMsgTime"]):
-                    botRadius = 0
-                else:
-                    botRadius = self.config.SmsRender["BubbleRadius"]
-
-            # Update time and writer of this message as the new previous message.
-            prevTime = thisTime
-            prevWriter = thisWriter
-
-            hBox = QHBoxLayout()
-
-            # If there are newline characters in the text string they won't be rendered in the conversation messages
-            # which use html format. Need to replace newlines with break tokens.
-            messageText = "<br>".join(msg.msgText.split("\n"))
-
-            lbl = QLabel("", self)
-            lbl.setTextFormat(QtCore.Qt.RichText)
-            if incWriter == True:
-                lbl.setText(f'<b>{msg.writer} : {msg.msgTime}</b><br><br>{messageText}')
-            else:
-               lbl.setText(f'{messageText}')
-
-            # Set label with and wordwrapping, and restrict expanding to vertical only.
-            lbl.setFixedWidth(self.config.SmsRender["TextWidth"])
-            lbl.setWordWrap(True)
-            lbl.setSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.MinimumExpanding)
-
-            # Add label to horizontal layout.
-            # Pad out so my messages on the right, others on the left.
-            if msg.writer == self.config.MyHandle:
-                hBox.addStretch()
-                lbl.setStyleSheet(f'border : 3px solid {borderCol}; background : {fillCol}; font-size : {self.config.SmsRender["FontSizePx"]}px; padding :10px;'
-                            f'border-top-left-radius : {topRadius}px;'
-                            f'border-top-right-radius : {topRadius}px;'
-                            f'border-bottom-left-radius : {botRadius}px;'
-                            f'border-bottom-right-radius : {botRadius}px'
-                        )
-                hBox.addWidget(lbl)
-            else:
-                lbl.setStyleSheet(f'border : 3px solid {borderCol}; background : {fillCol}; font-size : {self.config.SmsRender["FontSizePx"]}px; padding :10px;'
-                            f'border-top-left-radius : {topRadius}px;'
-                            f'border-top-right-radius : {topRadius}px;'
-                            f'border-bottom-left-radius : {botRadius}px;'
-                            f'border-bottom-right-radius : {botRadius}px'
-                        )
-                hBox.addWidget(lbl)
-                hBox.addStretch()
-            
-            # Add horizontal layout containing the label to vertical layout.
-            self.verticalLayout.addLayout(hBox)
-
-        # Scroll to the bottom of the scroll area.
-        self.scrollArea.verticalScrollBar().rangeChanged.connect(lambda: self.scrollArea.verticalScrollBar().setValue(self.scrollArea.verticalScrollBar().maximum()))
-
-    # *******************************************
-    # Go through conversation and update list of
-    # writer handles and assign them a random colour.
-    # Colours not guaranteed to be unique but doesn't mattter too much.
-    # *******************************************
-    def updateWriterColours(self):
+        # Couple message view to the conversation model, with messages painted by the delegate.
+        # Cached layouts are cleared when the model is reset, as message indexes may be of another conversation.
+        self.model = ConversationModel(config, conversation)
+        self.delegate = ConversationDelegate(config, self.messageView)
+        self.messageView.setModel(self.model)
+        self.messageView.setItemDelegate(self.delegate)
+        self.model.modelReset.connect(self.delegate.clearCache)
+
+        # Keep the scroll position when messages are shown, and show older messages when scrolled to the top.
+        self.messageView.verticalScrollBar().rangeChanged.connect(self.scrollRangeChanged)
+        self.messageView.verticalScrollBar().valueChanged.connect(self.scrollValueChanged)
+        self.messageView.verticalScrollBar().actionTriggered.connect(self.scrollActionTriggered)
 
-        # Use randomly generated colours for border and fill.
-        # Restrict ranges so that borders are darker than fill.
-        bcol = lambda: random.randint(0, self.config.SmsRender["BorderColMax"])
-        fcol = lambda: random.randint(self.config.SmsRender["FillColMin"], 255)
+    # *******************************************
+    # Show the latest page of messages of a conversation, e.g. when it is first shown.
+    # *******************************************
+    def showLatestMessages(self):
+        self.scrollFromBottom = 0
+        self.anchorRow = -1
+        self.keepFromTop = False
+        self.model.showLatest()
+        self.logger.debug(f'Showing conversation with messages : {self.model.rowCount()}')
+        self.messageView.scrollToBottom()
 
-        # Go through messages looking for different writers.
-        for idx, msg in enumerate(self.conversation.messages):
-            # Check if handle already allocated a colour.
-            if next((i for i, v in enumerate(self.handleColour) if v[0] == msg.writer), None) == None:
-                # Find a colour for the handle, border and fill.
-                borderCol = f'#{bcol():02x}{bcol():02x}{bcol():02x}'
-                fillCol = f'#{fcol():02x}{fcol():02x}{fcol():02x}'
-                # Add new handle and colours to list.
-                self.handleColour.append([msg.writer, borderCol, fillCol])
+    # *******************************************
+    # Show the conversation at a message, highlighted, e.g. when found by a search.
+    # *******************************************
+    def showMessage(self, idx):
+        self.keepFromTop = False
+        self.anchorRow = self.model.showMessage(idx)
+        self.logger.debug(f'Showing conversation at message : {idx}')
+        self.scrollToAnchor()
 
     # *******************************************
-    # Get colours for particular writr handle.
+    # Scroll the row to keep in view to the centre of the view.
     # *******************************************
-    def getWriterColours(self, handle):
-        for idx, wdet in enumerate(self.handleColour):
-            if wdet[0] == handle:
-                return wdet[1], wdet[2]
+    def scrollToAnchor(self):
+        self.messageView.scrollTo(self.model.index(self.anchorRow), QtWidgets.QAbstractItemView.PositionAtCenter)
 
     # *******************************************
-    # Clear coversation dialog of messages.
+    # Callback for the scroll range changing, e.g. when messages are shown.
+    # Keeps the row to keep in view in view, or the scroll position from the top after newer messages are shown,
+    # otherwise scrolls to the same distance from the bottom as before, the bottom unless scrolled up.
     # *******************************************
-    def clearConversationLayout(self):
+    def scrollRangeChanged(self, minimum, maximum):
+        if self.anchorRow >= 0:
+            self.scrollToAnchor()
+        elif self.keepFromTop:
+            self.scrollFromBottom = maximum - self.messageView.verticalScrollBar().value()
+        else:
+            self.messageView.verticalScrollBar().setValue(max(minimum, maximum - self.scrollFromBottom))
 
-        self.logger.debug("Clearing conversation dialog of messages...")
+    # *******************************************
+    # Callback for the user scrolling, so the row to keep in view is no longer kept in view.
+    # *******************************************
+    def scrollActionTriggered(self, action):
+        self.anchorRow = -1
 
-        # Iterate through conversation layout and delete.
-        # Deletes layouts and spacers that make up each message bubble.
-        # Delete the message labels themselves.
-        for i in reversed(range(self.verticalLayout.count())):
-            item = self.verticalLayout.itemAt(i)
-            if type(item) == QtWidgets.QHBoxLayout:
-                for j in reversed(range(item.count())):
-                    subItem = item.itemAt(j)
-                    if type(subItem) == QtWidgets.QWidgetItem:
-                        subItem.widget().setParent(None)
-                    elif type(subItem) == QtWidgets.QSpacerItem:
-                        item.layout().removeItem(subItem)
-                self.verticalLayout.removeItem(item)
+    # *******************************************
+    # Callback for the scroll position changing.
+    # When scrolled to the top, show the next page of older messages, if there are any.
+    # When scrolled to the bottom, show the next page of newer messages, if there are any.
+    # *******************************************
+    def scrollValueChanged(self, value):
+        scrollBar = self.messageView.verticalScrollBar()
+        self.scrollFromBottom = scrollBar.maximum() - value
+        if scrollBar.maximum() <= scrollBar.minimum():
+            return
+        if (value == scrollBar.minimum()) and self.model.canShowOlder():
+            self.logger.debug("Showing older messages of conversation.")
+            self.keepFromTop = False
+            numOlder = self.model.showOlder()
+            if self.anchorRow >= 0:
+                self.anchorRow += numOlder
+        elif (value == scrollBar.maximum()) and self.model.canShowNewer():
+            self.logger.debug("Showing newer messages of conversation.")
+            self.keepFromTop = True
+            self.model.showNewer()
 
     # *******************************************
     # User clicked to send new message.
@@ -230,17 +502,19 @@ class ConversationDialog(QDialog):
         self.logger.debug("User selected send message control.")
 
         # Size of conversation is restricted by emedded data ratio as applicable to embedding files.
-        # Have further restriction on number of messages in a conversation,
-        # This restriction is so that application in its current design is responsive.
         # Read contents of text edit box and add as new message to conversation.
         msgText = self.messageEdit.toPlainText().encode('utf-8').decode('utf-8')
         if msgText != "":
             # Message good, add to conversation.
             self.conversation.addMsg(self.config.MyHandle, msgText)
 
-            # Repopulate conversation, now with additional message.
+            # Show the additional message, scrolled to the bottom.
             # Then clear the edit box for the next message.
-            self.populateMessages()
+            self.scrollFromBottom = 0
+            self.anchorRow = -1
+            self.keepFromTop = False
+            self.model.messageAdded()
+            self.messageView.scrollToBottom()
             self.messageEdit.clear()
         else:
             # Message blank, so don't added.
@@ -22,10 +22,13 @@ def res_path(relative_path):
 # Embedded image dialog class.
 # *******************************************
 class EmbeddedImageDialog(QDialog):
-    def __init__(self, imgFile, parent=None):
+    def __init__(self, imgFile, thumbnails, parent=None):
         super(EmbeddedImageDialog, self).__init__()
         uic.loadUi(res_path("embeddedPic.ui"), self)
 
+        # Cache of image thumbnails.
+        self.thumbnails = thumbnails
+
         # Show the embedded image.
         self.showEmbeddedImage(imgFile)
 
@@ -39,11 +42,11 @@ class EmbeddedImageDialog(QDialog):
         icon.addPixmap(QtGui.QPixmap(res_path("./resources/about.png")))
         self.setWindowIcon(icon)
 
-        # Create bitmap for display.
-        bitmap = QtGui.QPixmap(imgFile)
+        # Get bitmap for display, decoded to the display size unless cached.
+        bitmap = self.thumbnails.getThumbnail(imgFile, self.pictureLbl.width(), self.pictureLbl.height())
 
         # Display bitmap.
-        self.pictureLbl.setPixmap(bitmap.scaled(self.pictureLbl.width(), self.pictureLbl.height(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
+        self.pictureLbl.setPixmap(bitmap)
         self.pictureLbl.adjustSize()
         self.pictureLbl.show()
         # Update image file details label.
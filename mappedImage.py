@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import struct
+import numpy as np
+
+from constants import *
+
+# *******************************************
+# Memory mapped uncompressed images.
+#
+# Uncompressed cover images (BMP, binary PPM and PAM) hold their pixels as plain bytes,
+# so rather than being decoded they are mapped straight into memory.
+# The colour planes are strided views of the mapped file, which the vector engine reads
+# and writes in place. Only the pages of the file touched are read, and only the pages
+# written are written back, so images larger than memory can be used as covers.
+#
+# Images are mapped copy on write, so the image file is unchanged until it is saved,
+# or mapped in place, so writes go straight to the image file.
+#
+# Supported formats:
+#   BMP - 24-bit, or 32-bit uncompressed / bit fields in B, G, R, A order, bottom up or top down.
+#   PPM - Binary (P6), 8-bit.
+#   PAM - 8-bit RGB or RGB_ALPHA tuple types.
+# *******************************************
+
+# Rows of pixels converted at a time when writing an image.
+MAPPEDBANDBYTES = 16 * 1024 * 1024
+
+# Size of BMP file header, and of the info headers written.
+BMPFILEHEADERLEN = 14
+BMPINFOHEADERLEN = 40
+BMPV4HEADERLEN = 108
+
+# BMP compression types.
+BMP_RGB = 0
+BMP_BITFIELDS = 3
+
+# BMP colour masks of 32-bit B, G, R, A pixels.
+BMPMASKS = (0x00ff0000, 0x0000ff00, 0x000000ff, 0xff000000)
+
+# *******************************************
+# Exception for images that can't be mapped.
+# *******************************************
+class MappedImageError(Exception):
+    pass
+
+# *******************************************
+# Check if an image file is of a type that is memory mapped.
+# *******************************************
+def isMappedImage(picFile):
+    return os.path.splitext(picFile)[1].lower() in MAPPEDIMAGES
+
+# *******************************************
+# Read the fields of a PPM / PAM header, skipping comments.
+# Returns list of header tokens, and offset of the byte following the last token.
+# For PPM the pixel data follows a single whitespace byte after the last token.
+# *******************************************
+def readNetpbmTokens(header, numTokens):
+    tokens = []
+    pos = 0
+    while len(tokens) < numTokens:
+        while (pos < len(header)) and (header[pos:pos + 1].isspace() or (header[pos:pos + 1] == b"#")):
+            if header[pos:pos + 1] == b"#":
+                end = header.find(b"\n", pos)
+                pos = len(header) if end < 0 else end
+            pos += 1
+        start = pos
+        while (pos < len(header)) and not header[pos:pos + 1].isspace():
+            pos += 1
+        if (start == pos) or (pos >= len(header)):
+            raise MappedImageError("Image header truncated.")
+        tokens.append(header[start:pos])
+    return tokens, pos
+
+# *******************************************
+# Mapped image class.
+# *******************************************
+class MappedImage():
+
+    # Bytes of a file read to parse its header.
+    HEADERREADLEN = 4096
+
+    def __init__(self, picFile, inPlace=False):
+
+        self.picFile = picFile
+        self.inPlace = inPlace
+        self.ext = os.path.splitext(picFile)[1].lower()
+
+        # Parse the header, giving the image size, where the pixels start, the bytes per row,
+        # the order of the channels, and if the rows are stored bottom up.
+        with open(picFile, "rb") as pf:
+            header = pf.read(self.HEADERREADLEN)
+            fileSize = os.fstat(pf.fileno()).st_size
+        if self.ext == ".bmp":
+            self.parseBmp(header)
+        elif self.ext == ".ppm":
+            self.parsePpm(header)
+        elif self.ext == ".pam":
+            self.parsePam(header)
+        else:
+            raise MappedImageError(f'Image type not supported : {self.ext}')
+        if (self.width <= 0) or (self.height <= 0):
+            raise MappedImageError(f'Invalid image size : {self.width} x {self.height}')
+        if self.dataOffset + self.stride * self.height > fileSize:
+            raise MappedImageError("Image file truncated.")
+
+        # Map the file, in place or copy on write.
+        with open(picFile, "r+b" if inPlace else "rb") as pf:
+            self.mm = mmap.mmap(pf.fileno(), 0, access=mmap.ACCESS_WRITE if inPlace else mmap.ACCESS_COPY)
+
+        # Pixels as height x width x bytes per pixel, top row first, in the order stored.
+        rows = np.frombuffer(self.mm, dtype=np.uint8, count=self.stride * self.height, offset=self.dataOffset).reshape(self.height, self.stride)
+        self.pixels = rows[:, :(self.width * self.depth)].reshape(self.height, self.width, self.depth)
+        if self.bottomUp:
+            self.pixels = self.pixels[::-1]
+
+        # Rows read so far, when read in order as for a PNG stream.
+        self.rowsRead = 0
+
+    # *******************************************
+    # Parse a BMP header.
+    # *******************************************
+    def parseBmp(self, header):
+        if (len(header) < BMPFILEHEADERLEN + BMPINFOHEADERLEN) or (header[:2] != b"BM"):
+            raise MappedImageError("Not a BMP file.")
+        self.dataOffset = struct.unpack_from("<I", header, 10)[0]
+        infoLen, width, height, planes, bitCount, compression = struct.unpack_from("<IiiHHI", header, BMPFILEHEADERLEN)
+        if infoLen < BMPINFOHEADERLEN:
+            raise MappedImageError("Unsupported BMP header.")
+        if bitCount not in (24, 32):
+            raise MappedImageError(f'Unsupported BMP bit count : {bitCount}')
+        if compression == BMP_BITFIELDS:
+            # Masks follow a 40 byte header, or are part of a larger header.
+            masks = struct.unpack_from("<III", header, BMPFILEHEADERLEN + BMPINFOHEADERLEN)
+            if (bitCount != 32) or (masks != BMPMASKS[:3]):
+                raise MappedImageError("Unsupported BMP colour masks.")
+        elif compression != BMP_RGB:
+            raise MappedImageError(f'Unsupported BMP compression : {compression}')
+        self.width = width
+        self.height = abs(height)
+        self.bottomUp = height > 0
+        self.depth = bitCount // 8
+        self.stride = ((width * bitCount + 31) // 32) * 4
+        # BMP pixels are stored B, G, R, A.
+        self.order = (2, 1, 0)
+        self.hasAlpha = (self.depth == 4) and (infoLen >= BMPV4HEADERLEN) and (struct.unpack_from("<I", header, BMPFILEHEADERLEN + 52)[0] != 0)
+
+    # *******************************************
+    # Parse a binary PPM header.
+    # *******************************************
+    def parsePpm(self, header):
+        if header[:2] != b"P6":
+            raise MappedImageError("Not a binary PPM file.")
+        tokens, pos = readNetpbmTokens(header[2:], 3)
+        width, height, maxVal = (int(token) for token in tokens)
+        if maxVal != 255:
+            raise MappedImageError(f'Unsupported PPM maximum value : {maxVal}')
+        self.width = width
+        self.height = height
+        self.bottomUp = False
+        self.depth = 3
+        self.stride = width * 3
+        self.dataOffset = 2 + pos + 1
+        self.order = (0, 1, 2)
+        self.hasAlpha = False
+
+    # *******************************************
+    # Parse a PAM header.
+    # *******************************************
+    def parsePam(self, header):
+        if header[:3] != b"P7\n":
+            raise MappedImageError("Not a PAM file.")
+        end = header.find(b"ENDHDR\n")
+        if end < 0:
+            raise MappedImageError("PAM header truncated.")
+        fields = {}
+        for line in header[3:end].split(b"\n"):
+            parts = line.split(None, 1)
+            if (len(parts) == 2) and not parts[0].startswith(b"#"):
+                fields[parts[0].decode('ascii')] = parts[1].strip().decode('ascii')
+        try:
+            self.width = int(fields["WIDTH"])
+            self.height = int(fields["HEIGHT"])
+            self.depth = int(fields["DEPTH"])
+            maxVal = int(fields["MAXVAL"])
+        except (KeyError, ValueError):
+            raise MappedImageError("Invalid PAM header.")
+        if (maxVal != 255) or (self.depth not in (3, 4)):
+            raise MappedImageError(f'Unsupported PAM depth : {self.depth}; maximum value : {maxVal}')
+        self.bottomUp = False
+        self.stride = self.width * self.depth
+        self.dataOffset = end + len(b"ENDHDR\n")
+        self.order = (0, 1, 2)
+        self.hasAlpha = self.depth == 4
+
+    # *******************************************
+    # Close the mapping.
+    # Writes made copy on write are lost unless the image has been saved.
+    # The mapping stays open while views of it are still in use, and is closed when they are freed.
+    # *******************************************
+    def close(self):
+        self.pixels = None
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # *******************************************
+    # Colour plane views (R, G, B) of the pixels, height x width, written in place.
+    # *******************************************
+    def planes(self):
+        return [self.pixels[:, :, channel] for channel in self.order]
+
+    # *******************************************
+    # Alpha plane view of the pixels, or None if there is no alpha channel.
+    # *******************************************
+    def alphaPlane(self):
+        return self.pixels[:, :, 3] if self.hasAlpha else None
+
+    # *******************************************
+    # Number of channels per pixel of rows read, as for a PNG stream.
+    # *******************************************
+    def channels(self):
+        return 4 if self.hasAlpha else 3
+
+    # *******************************************
+    # Check if image data can be read, as for a PNG stream.
+    # Images that can't be read aren't mapped.
+    # *******************************************
+    def isDecodable(self):
+        return True
+
+    # *******************************************
+    # Read the next row of the image, as for a PNG stream, so mapped images can be probed the same way.
+    # Returns row as numpy uint8 array of width x channels bytes, R, G, B (A) order,
+    # or None if there are no more rows.
+    # *******************************************
+    def readRow(self):
+        if self.rowsRead == self.height:
+            return None
+        row = self.pixels[self.rowsRead]
+        self.rowsRead += 1
+        channels = list(self.order) + ([3] if self.hasAlpha else [])
+        return row[:, channels].reshape(-1)
+
+    # *******************************************
+    # Write the image to file.
+    # Saving an image mapped in place to itself only flushes the pages written.
+    # Saving to a file of the same type copies the mapped file, others are converted a band at a time.
+    # *******************************************
+    def save(self, saveToFilename):
+        if self.inPlace and os.path.exists(saveToFilename) and os.path.samefile(saveToFilename, self.picFile):
+            self.mm.flush()
+            return
+        if os.path.splitext(saveToFilename)[1].lower() == self.ext:
+            # Write via a temporary file, in case the file being written is the file mapped.
+            tempFile = saveToFilename + ".tmp"
+            with open(tempFile, "wb") as sf:
+                for start in range(0, len(self.mm), MAPPEDBANDBYTES):
+                    sf.write(self.mm[start:start + MAPPEDBANDBYTES])
+            os.replace(tempFile, saveToFilename)
+            return
+        writeMappedImage(saveToFilename, self.planes(), self.alphaPlane())
+
+# *******************************************
+# Header of an uncompressed image file, by the type of the file.
+# Returns header bytes, bytes per row, channels in order stored (indexes of R, G, B, A) and if stored bottom up.
+# *******************************************
+def mappedHeader(ext, width, height, hasAlpha):
+    if ext == ".bmp":
+        if hasAlpha:
+            stride = width * 4
+            infoHeader = struct.pack("<IiiHHIIiiII", BMPV4HEADERLEN, width, height, 1, 32, BMP_BITFIELDS, stride * height, 2835, 2835, 0, 0)
+            infoHeader += struct.pack("<IIII", *BMPMASKS) + b"BGRs" + bytes(BMPV4HEADERLEN - BMPINFOHEADERLEN - 20)
+            channels = (2, 1, 0, 3)
+        else:
+            stride = ((width * 24 + 31) // 32) * 4
+            infoHeader = struct.pack("<IiiHHIIiiII", BMPINFOHEADERLEN, width, height, 1, 24, BMP_RGB, stride * height, 2835, 2835, 0, 0)
+            channels = (2, 1, 0)
+        dataOffset = BMPFILEHEADERLEN + len(infoHeader)
+        fileHeader = struct.pack("<2sIHHI", b"BM", dataOffset + stride * height, 0, 0, dataOffset)
+        return fileHeader + infoHeader, stride, channels, True
+    if ext == ".ppm":
+        return f'P6\n{width} {height}\n255\n'.encode('ascii'), width * 3, (0, 1, 2), False
+    if ext == ".pam":
+        depth, tupleType = (4, "RGB_ALPHA") if hasAlpha else (3, "RGB")
+        header = f'P7\nWIDTH {width}\nHEIGHT {height}\nDEPTH {depth}\nMAXVAL 255\nTUPLTYPE {tupleType}\nENDHDR\n'.encode('ascii')
+        return header, width * depth, (0, 1, 2, 3) if hasAlpha else (0, 1, 2), False
+    raise MappedImageError(f'Image type not supported : {ext}')
+
+# *******************************************
+# Write colour planes (R, G, B) and optional alpha plane to an uncompressed image file,
+# of the type given by its extension.
+# Planes are converted and written a band of rows at a time, so memory used doesn't depend on the image size.
+# PPM images can't hold an alpha channel, so it is left out.
+# *******************************************
+def writeMappedImage(saveToFilename, planes, alpha=None):
+    ext = os.path.splitext(saveToFilename)[1].lower()
+    height, width = planes[0].shape
+    if ext == ".ppm":
+        alpha = None
+    header, stride, channels, bottomUp = mappedHeader(ext, width, height, alpha is not None)
+    sources = planes + ([alpha] if alpha is not None else [])
+    bandRows = max(1, MAPPEDBANDBYTES // stride)
+    with open(saveToFilename, "wb") as sf:
+        sf.write(header)
+        bandStarts = range(0, height, bandRows)
+        for start in (reversed(bandStarts) if bottomUp else bandStarts):
+            end = min(height, start + bandRows)
+            band = np.zeros((end - start, stride), dtype=np.uint8)
+            for pos, channel in enumerate(channels):
+                band[:, pos:width * len(channels):len(channels)] = sources[channel][start:end]
+            sf.write((band[::-1] if bottomUp else band).tobytes())
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import copy
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+from constants import *
+from probeIndex import *
+from scanner import *
+from steganography import *
+
+# *******************************************
+# Persistent full text index of embedded conversations.
+#
+# The messages of the conversations embedded in images are kept in an SQLite FTS5 table,
+# an inverted index of the words of the messages, so a phrase is found across thousands of
+# images without reading any of them.
+# Each message is stored by a row id made of the id of its image and its message number,
+# so all messages of an image are replaced by a range of row ids when the image changes.
+# An image is only extracted again if its size, modification time (and hash) have changed.
+#
+# Conversations with a password are only indexed when the password is given, and their
+# messages are only found by searches given the same password.
+# Images with a password that wasn't given are recorded as locked, and extracted again
+# when indexed with a password.
+# *******************************************
+
+# Bits of a message row id holding the message number, the image id is held above them.
+MSGNUMBITS = 32
+
+# Maximum number of messages found by a search, by default.
+SEARCHLIMIT = 100
+
+# Status of an image after indexing.
+INDEXSTATUSINDEXED = "indexed"
+INDEXSTATUSCURRENT = "current"
+INDEXSTATUSLOCKED = "locked"
+INDEXSTATUSFAILED = "failed"
+
+# *******************************************
+# Extracted conversation class.
+# The messages of the conversation embedded in an image, as (message number, writer, time, text),
+# or why they couldn't be extracted.
+# *******************************************
+class ExtractedConversation():
+    def __init__(self, picFile):
+
+        self.picFile = picFile
+        self.status = INDEXSTATUSFAILED
+        self.passworded = False
+        self.messages = []
+
+# *******************************************
+# Pool process task to extract the conversation embedded in an image.
+# Messages are read a page at a time, so the message numbers are those of the conversation
+# even if a page couldn't be read in full.
+# Returns extracted conversation.
+# *******************************************
+def extractConversation(picFile, config, password, log):
+    extracted = ExtractedConversation(picFile)
+    stegPic = Steganography(config, log)
+    try:
+        stegPic.loadNewImage(picFile)
+        if (not stegPic.isLoaded()) or (not stegPic.picCoded) or (stegPic.picCodeType != CodeType.CODETYPE_TEXT.value):
+            return extracted
+        extracted.passworded = stegPic.picPassword
+        if stegPic.picPassword and (password != stegPic.password):
+            extracted.status = INDEXSTATUSLOCKED
+            return extracted
+        conversation = stegPic.conversation
+        for start in range(0, conversation.numMessages(), CONVPAGESIZE):
+            for msgNum, msg in enumerate(conversation.getMessages(start, start + CONVPAGESIZE), start):
+                extracted.messages.append((msgNum, msg.writer, msg.msgTime, msg.msgText))
+        extracted.status = INDEXSTATUSINDEXED
+    except Exception as e:
+        log.error(f'Failed to extract conversation : {picFile}; {str(e)}')
+    finally:
+        stegPic.shutdown()
+    return extracted
+
+# *******************************************
+# Convert search text to an FTS5 query.
+# Text in double quotes is a phrase, other words must all be in a message, in any order.
+# A word ending in * matches words starting with it.
+# Returns query, or empty string if there is nothing to search for.
+# *******************************************
+def ftsQuery(text):
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"?|(\S+)', text):
+        if phrase.strip() != "":
+            terms.append('"' + phrase.replace('"', '') + '"')
+        elif word != "":
+            prefix = word.endswith("*")
+            word = word.rstrip("*").replace('"', '')
+            if word != "":
+                terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+# *******************************************
+# Message hit class.
+# A message found by a search, with its image and position in the conversation.
+# *******************************************
+class MessageHit():
+    def __init__(self, picFile, msgNum, writer, msgTime, snippet):
+
+        self.picFile = picFile
+        self.msgNum = msgNum
+        self.writer = writer
+        self.msgTime = msgTime
+        self.snippet = snippet
+
+    # *******************************************
+    # Return message hit as a dictionary, e.g. for reporting.
+    # *******************************************
+    def asDict(self):
+        return {
+            "file" : self.picFile,
+            "message" : self.msgNum,
+            "writer" : self.writer,
+            "time" : self.msgTime,
+            "text" : self.snippet
+        }
+
+# *******************************************
+# Message index class.
+# *******************************************
+class MessageIndex():
+    def __init__(self, log, dbFile, hashContent=False):
+
+        # Initialise logger.
+        self.log = log
+
+        # Hash content of image files, as well as checking size and modification time.
+        self.hashContent = hashContent
+
+        # Open database, creating the index if new.
+        # Salt of password hashes is created with the index.
+        self.db = None
+        self.salt = b""
+        if dbFile == "":
+            return
+        try:
+            self.db = sqlite3.connect(dbFile, timeout=10)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime INTEGER, hash TEXT, "
+                            "numMessages INTEGER, passworded INTEGER, locked INTEGER, passwordHash TEXT, indexed REAL)")
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(text, writer UNINDEXED, msgTime UNINDEXED, tokenize='unicode61 remove_diacritics 2')")
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'salt'").fetchone()
+            if row is None:
+                self.salt = os.urandom(16)
+                self.db.execute("INSERT INTO meta (name, value) VALUES ('salt', ?)", (self.salt,))
+            else:
+                self.salt = bytes(row[0])
+            self.db.commit()
+        except sqlite3.Error as e:
+            self.log.warning(f'Message index not available : {dbFile}; {str(e)}')
+            self.db = None
+
+    # *******************************************
+    # Context manager, so the index is closed when done.
+    # *******************************************
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    # *******************************************
+    # Check if the index can be used.
+    # *******************************************
+    def available(self):
+        return self.db is not None
+
+    # *******************************************
+    # Get the key of an image file, as it is now, in the same way as the probe index.
+    # Returns None if the file can't be read.
+    # *******************************************
+    def fileKey(self, picFile):
+        try:
+            stat = os.stat(picFile)
+            contentHash = fastHash(picFile) if self.hashContent else ""
+        except OSError:
+            return None
+        return FileKey(os.path.abspath(picFile), stat.st_size, stat.st_mtime_ns, contentHash)
+
+    # *******************************************
+    # Hash of a password, to check the password given to a search.
+    # *******************************************
+    def passwordHash(self, password):
+        return hashlib.blake2b(password.encode('utf-8'), key=self.salt, digest_size=16).hexdigest()
+
+    # *******************************************
+    # Get the images in the index, with the key they had when indexed and if they are locked.
+    # Returns (size, modification time, hash, locked), by path.
+    # *******************************************
+    def indexedImages(self):
+        if self.db is None:
+            return {}
+        try:
+            rows = self.db.execute("SELECT path, size, mtime, hash, locked FROM images").fetchall()
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to query message index : {str(e)}')
+            return {}
+        return {row[0] : (row[1], row[2], row[3], bool(row[4])) for row in rows}
+
+    # *******************************************
+    # Check if the entry of an image is current, from the indexed images.
+    # A locked image isn't current if there is a password to try.
+    # *******************************************
+    def isCurrent(self, indexed, key, password):
+        entry = indexed.get(key.path) if key is not None else None
+        if entry is None:
+            return False
+        size, mtime, contentHash, locked = entry
+        if (size != key.size) or (mtime != key.mtime) or (self.hashContent and (contentHash != key.contentHash)):
+            return False
+        return not (locked and (password != ""))
+
+    # *******************************************
+    # Store the conversation extracted from an image, by the key it had when extracted.
+    # Replaces any messages of the image already in the index.
+    # Images without a conversation are removed from the index.
+    # Results are committed by commit, or when the index is closed.
+    # *******************************************
+    def store(self, key, extracted, password):
+        if (self.db is None) or (key is None):
+            return
+        if extracted.status not in (INDEXSTATUSINDEXED, INDEXSTATUSLOCKED):
+            self.remove(key.path)
+            return
+        locked = extracted.status == INDEXSTATUSLOCKED
+        passwordHash = self.passwordHash(password) if (extracted.passworded and not locked) else ""
+        try:
+            row = self.db.execute("SELECT id FROM images WHERE path = ?", (key.path,)).fetchone()
+            values = (key.size, key.mtime, key.contentHash, len(extracted.messages), int(extracted.passworded), int(locked), passwordHash, time.time())
+            if row is None:
+                imageId = self.db.execute("INSERT INTO images (path, size, mtime, hash, numMessages, passworded, locked, passwordHash, indexed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                          (key.path,) + values).lastrowid
+            else:
+                imageId = row[0]
+                self.db.execute("UPDATE images SET size = ?, mtime = ?, hash = ?, numMessages = ?, passworded = ?, locked = ?, passwordHash = ?, indexed = ? WHERE id = ?",
+                                values + (imageId,))
+                self.deleteMessages(imageId)
+            self.db.executemany("INSERT INTO messages (rowid, text, writer, msgTime) VALUES (?, ?, ?, ?)",
+                                (((imageId << MSGNUMBITS) | msgNum, msgText, writer, msgTime) for msgNum, writer, msgTime, msgText in extracted.messages))
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to update message index : {str(e)}')
+
+    # *******************************************
+    # Delete the messages of an image, by the range of their row ids.
+    # *******************************************
+    def deleteMessages(self, imageId):
+        self.db.execute("DELETE FROM messages WHERE rowid BETWEEN ? AND ?", (imageId << MSGNUMBITS, ((imageId + 1) << MSGNUMBITS) - 1))
+
+    # *******************************************
+    # Remove an image, and its messages, from the index.
+    # *******************************************
+    def remove(self, picFile):
+        if self.db is None:
+            return
+        try:
+            row = self.db.execute("SELECT id FROM images WHERE path = ?", (os.path.abspath(picFile),)).fetchone()
+            if row is not None:
+                self.deleteMessages(row[0])
+                self.db.execute("DELETE FROM images WHERE id = ?", (row[0],))
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to update message index : {str(e)}')
+
+    # *******************************************
+    # Remove images that no longer exist from the index.
+    # Returns number of images removed.
+    # *******************************************
+    def prune(self):
+        gone = [path for path in self.indexedImages() if not os.path.isfile(path)]
+        for path in gone:
+            self.remove(path)
+        self.commit()
+        return len(gone)
+
+    # *******************************************
+    # Search the messages of the index for text, see ftsQuery.
+    # Messages of conversations with a password are only found if given the password.
+    # Messages of images that have changed since they were indexed aren't found.
+    # Returns message hits, best match first.
+    # *******************************************
+    def search(self, text, password="", writer=None, limit=SEARCHLIMIT):
+        query = ftsQuery(text)
+        if (self.db is None) or (query == ""):
+            return []
+        sql = ("SELECT images.path, images.size, images.mtime, messages.rowid, messages.writer, messages.msgTime, snippet(messages, 0, '[', ']', '...', 16) "
+               "FROM messages JOIN images ON images.id = (messages.rowid >> ?) "
+               "WHERE messages MATCH ? AND ((images.passworded = 0) OR (images.passwordHash = ?))")
+        params = [MSGNUMBITS, query, self.passwordHash(password) if password != "" else ""]
+        if writer is not None:
+            sql += " AND messages.writer = ?"
+            params.append(writer)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        try:
+            rows = self.db.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to search message index : {str(e)}')
+            return []
+
+        # Check each image found hasn't changed, once.
+        current = {}
+        hits = []
+        for path, size, mtime, rowid, msgWriter, msgTime, snippet in rows:
+            if path not in current:
+                try:
+                    stat = os.stat(path)
+                    current[path] = (stat.st_size == size) and (stat.st_mtime_ns == mtime)
+                except OSError:
+                    current[path] = False
+            if current[path]:
+                hits.append(MessageHit(path, rowid & ((1 << MSGNUMBITS) - 1), msgWriter, msgTime, snippet))
+        return hits
+
+    # *******************************************
+    # Commit stored conversations.
+    # *******************************************
+    def commit(self):
+        if self.db is None:
+            return
+        try:
+            self.db.commit()
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to commit message index : {str(e)}')
+
+    # *******************************************
+    # Close the index, committing stored conversations.
+    # *******************************************
+    def close(self):
+        if self.db is None:
+            return
+        self.commit()
+        self.db.close()
+        self.db = None
+
+# *******************************************
+# Index the conversations embedded in images, and images in directories.
+# Images are found by scanning with the probe index, so only images with a conversation are read.
+# Conversations that haven't changed since they were indexed aren't extracted again,
+# the others are extracted in a pool of processes if given, with up to maxInFlight in progress.
+# Indexing stops early if the stop callable returns True.
+# Yields (image file, status) for each image with a conversation, as it is indexed.
+# *******************************************
+def indexConversations(paths, probeIndex, messageIndex, config, password, log, pool, maxInFlight, stop=None):
+
+    # Images are already extracted in parallel, so don't extract each image in parallel too.
+    if pool is not None:
+        config = copy.copy(config)
+        config.ParallelProcesses = 0
+
+    indexed = messageIndex.indexedImages()
+    pending = {}
+
+    # Store extracted conversations, as they are extracted.
+    def extractedDone(key, extracted):
+        messageIndex.store(key, extracted, password)
+        messageIndex.commit()
+        return extracted.picFile, extracted.status
+
+    # Wait for extractions to finish, until no more than the given number are in progress.
+    def waitExtractions(maxPending):
+        while len(pending) > maxPending:
+            done, notDone = concurrent.futures.wait(pending.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield extractedDone(pending.pop(future), future.result())
+
+    try:
+        for result in scanImages(paths, probeIndex, pool, maxInFlight, stop):
+            if (stop is not None) and stop():
+                return
+            key = messageIndex.fileKey(result.picFile)
+            if (not result.picCoded) or (result.picCodeType != CodeType.CODETYPE_TEXT.value):
+                # Image no longer has a conversation.
+                if (key is not None) and (key.path in indexed):
+                    messageIndex.remove(key.path)
+                continue
+            if messageIndex.isCurrent(indexed, key, password):
+                yield result.picFile, INDEXSTATUSCURRENT
+                continue
+            if pool is None:
+                yield extractedDone(key, extractConversation(result.picFile, config, password, log))
+            else:
+                pending[pool.submit(extractConversation, result.picFile, config, password, log)] = key
+                yield from waitExtractions(maxInFlight - 1)
+        yield from waitExtractions(0)
+    finally:
+        for future in pending:
+            future.cancel()
+        messageIndex.commit()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+from vectorEngine import *
+
+# *******************************************
+# Parallel bit engine.
+#
+# The position of every bit of embedded data is fixed by its offset in the data,
+# so the data can be read or written by several processes at the same time.
+# The image pixels are copied into shared memory once per operation, and the
+# processes of a pool read / write directly into the shared pixels.
+#
+# Reading splits the data into byte ranges, one range per process.
+# Writing splits the image into bands of rows, one band per process, so that no two
+# processes ever write to the same pixel byte, even where their data shares a byte.
+#
+# Does not use any widget code, as it is imported by the pool processes.
+# *******************************************
+
+# *******************************************
+# Attach to shared memory block created by the main process.
+# Pool processes share the resource tracker of the main process, which removes
+# the block if the main process doesn't.
+# *******************************************
+def attachShared(shmName):
+    return shared_memory.SharedMemory(name=shmName)
+
+# *******************************************
+# Get pixels array, height x width x 4 bytes, over shared memory block.
+# *******************************************
+def sharedPixels(shm, height, width):
+    return np.ndarray((height, width, 4), dtype=np.uint8, buffer=shm.buf)
+
+# *******************************************
+# Pool process task to read bytes from the shared pixels.
+# Returns the bytes read.
+# *******************************************
+def readRangeTask(pixelsName, height, width, position, bytesToRead):
+    shm = attachShared(pixelsName)
+    try:
+        pixels = sharedPixels(shm, height, width)
+        data = VectorEngine(planesFromPixels32(pixels)).readBytes(position, bytesToRead)
+        del pixels
+    finally:
+        shm.close()
+    return data
+
+# *******************************************
+# Pool process task to write data into a band of rows of the shared pixels.
+# Data of dataLen bytes is in its own shared memory block, and starts at bit position.
+# Only bits that fall into rows rowStart to rowEnd (exclusive) are written.
+# Returns the number of bits written.
+# *******************************************
+def writeBandTask(pixelsName, height, width, dataName, dataLen, position, rowStart, rowEnd):
+    pixelShm = attachShared(pixelsName)
+    dataShm = attachShared(dataName)
+    try:
+        pixels = sharedPixels(pixelShm, height, width)
+        data = np.ndarray((dataLen,), dtype=np.uint8, buffer=dataShm.buf)
+        engine = VectorEngine(planesFromPixels32(pixels))
+        bitsWritten = 0
+
+        # The band is a run of positions in each slab (colour plane and bit) of the image.
+        slabSize = height * width
+        endPosition = position + dataLen * 8
+        for slab in range(position // slabSize, (endPosition - 1) // slabSize + 1):
+            start = max(position, slab * slabSize + rowStart * width)
+            end = min(endPosition, slab * slabSize + rowEnd * width)
+            if start >= end:
+                continue
+
+            # Unpack only the data bytes holding the bits for this run.
+            bitStart = start - position
+            bitEnd = end - position
+            byteStart = bitStart // 8
+            bits = np.unpackbits(data[byteStart:(bitEnd + 7) // 8])
+            bitsWritten += engine.writeBits(start, bits[bitStart - byteStart * 8:bitEnd - byteStart * 8])
+
+        del data, pixels, engine
+    finally:
+        dataShm.close()
+        pixelShm.close()
+    return bitsWritten
+
+# *******************************************
+# Parallel engine class.
+# Owns the process pool, which is only started when first used.
+# *******************************************
+class ParallelEngine():
+    def __init__(self, processes):
+
+        self.processes = processes
+        self.pool = None
+
+    # *******************************************
+    # Get the process pool, starting it if required.
+    # Processes are spawned so that they don't inherit the state of the GUI.
+    # *******************************************
+    def getPool(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    # *******************************************
+    # Shut down the process pool.
+    # *******************************************
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # *******************************************
+    # Start parallel session over image pixels.
+    # *******************************************
+    def open(self, pixels):
+        return ParallelSession(self, pixels)
+
+# *******************************************
+# Parallel session class.
+# Holds a copy of the image pixels in shared memory for the duration of an operation.
+# Written pixels are only copied back to the image when the session is closed.
+# *******************************************
+class ParallelSession():
+    def __init__(self, engine, pixels):
+
+        self.engine = engine
+        self.height, self.width = pixels.shape[:2]
+
+        # Copy the pixels into shared memory.
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.height * self.width * 4))
+        self.pixels = sharedPixels(self.shm, self.height, self.width)
+        self.pixels[...] = pixels
+        self.written = False
+
+    # *******************************************
+    # Read bytes starting at a bit position.
+    # Returns the bytes read, which may be short if the end of the image is reached.
+    # *******************************************
+    def readBytes(self, position, bytesToRead):
+
+        # Split into a byte range for each process.
+        pool = self.engine.getPool()
+        rangeSize = max(1, -(-bytesToRead // self.engine.processes))
+        futures = []
+        for offset in range(0, bytesToRead, rangeSize):
+            futures.append(pool.submit(readRangeTask, self.shm.name, self.height, self.width,
+                                       position + offset * 8, min(rangeSize, bytesToRead - offset)))
+
+        # Join the ranges, stopping at the first short range.
+        data = bytearray()
+        for future in futures:
+            rangeData = future.result()
+            data += rangeData
+            if len(rangeData) < rangeSize:
+                break
+        return bytes(data)
+
+    # *******************************************
+    # Write bytes starting at a bit position.
+    # Returns the number of bits written, which may be short if the image runs out of space.
+    # *******************************************
+    def writeBytes(self, position, data):
+
+        dataLen = len(data)
+        if dataLen == 0:
+            return 0
+
+        # Share the data with the processes.
+        dataShm = shared_memory.SharedMemory(create=True, size=dataLen)
+        try:
+            dataShm.buf[:dataLen] = bytes(data)
+
+            # Split the rows into a band for each process.
+            pool = self.engine.getPool()
+            bandSize = max(1, -(-self.height // self.engine.processes))
+            futures = []
+            for rowStart in range(0, self.height, bandSize):
+                futures.append(pool.submit(writeBandTask, self.shm.name, self.height, self.width, dataShm.name,
+                                           dataLen, position, rowStart, min(rowStart + bandSize, self.height)))
+
+            # Wait for all bands to be written.
+            bitsWritten = sum(future.result() for future in futures)
+        finally:
+            dataShm.close()
+            dataShm.unlink()
+
+        self.written = True
+        return bitsWritten
+
+    # *******************************************
+    # End the session.
+    # If pixels are given, written pixels are copied back to them.
+    # *******************************************
+    def close(self, pixels=None):
+        if (pixels is not None) and self.written:
+            pixels[...] = self.pixels
+        del self.pixels
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import bz2
+import lzma
+import zlib
+
+from constants import *
+
+# *******************************************
+# Compression of embedded data.
+#
+# Files and conversations can be compressed before they are embedded, so that
+# they use fewer bits of the image, and take less time to embed and extract.
+# Compression is done a hunk at a time, so files of any size can be compressed
+# as they are embedded.
+# *******************************************
+
+# Codec names, as used in configuration.
+CODECNAMES = {
+    "None" : Codec.CODEC_NONE.value,
+    "zlib" : Codec.CODEC_ZLIB.value,
+    "lzma" : Codec.CODEC_LZMA.value,
+    "bz2" : Codec.CODEC_BZ2.value
+}
+
+# Size and number of samples of a file to compress to estimate the compressed size.
+SAMPLESIZE = 65536
+NUMSAMPLES = 16
+
+# *******************************************
+# Get codec from codec name, no compression if the name isn't known.
+# *******************************************
+def codecFromName(name):
+    return CODECNAMES.get(name, Codec.CODEC_NONE.value)
+
+# *******************************************
+# Get codec name from codec.
+# *******************************************
+def codecName(codec):
+    for name, value in CODECNAMES.items():
+        if value == codec:
+            return name
+    return f'Unknown ({codec})'
+
+# *******************************************
+# Check if codec is one that can be decompressed.
+# *******************************************
+def isCodec(codec):
+    return codec in CODECNAMES.values()
+
+# *******************************************
+# Compressor class.
+# Compresses data a hunk at a time, with the codec selected.
+# *******************************************
+class Compressor():
+    def __init__(self, codec):
+        if codec == Codec.CODEC_ZLIB.value:
+            self.cobj = zlib.compressobj()
+        elif codec == Codec.CODEC_LZMA.value:
+            self.cobj = lzma.LZMACompressor()
+        elif codec == Codec.CODEC_BZ2.value:
+            self.cobj = bz2.BZ2Compressor()
+        else:
+            raise ValueError(f'Unsupported codec : {codec}')
+
+    # *******************************************
+    # Compress hunk of data.
+    # Returns compressed data so far, which may be empty.
+    # *******************************************
+    def compress(self, data):
+        return self.cobj.compress(data)
+
+    # *******************************************
+    # Finish compressing.
+    # Returns the rest of the compressed data.
+    # *******************************************
+    def flush(self):
+        return self.cobj.flush()
+
+# *******************************************
+# Decompressor class.
+# Decompresses data a hunk at a time, with the codec selected.
+# *******************************************
+class Decompressor():
+    def __init__(self, codec):
+        self.codec = codec
+        if codec == Codec.CODEC_ZLIB.value:
+            self.dobj = zlib.decompressobj()
+        elif codec == Codec.CODEC_LZMA.value:
+            self.dobj = lzma.LZMADecompressor()
+        elif codec == Codec.CODEC_BZ2.value:
+            self.dobj = bz2.BZ2Decompressor()
+        else:
+            raise ValueError(f'Unsupported codec : {codec}')
+
+    # *******************************************
+    # Decompress hunk of data.
+    # Returns decompressed data so far, which may be empty.
+    # *******************************************
+    def decompress(self, data):
+        return self.dobj.decompress(data)
+
+    # *******************************************
+    # Finish decompressing.
+    # Returns the rest of the decompressed data, only zlib holds any back.
+    # *******************************************
+    def flush(self):
+        if self.codec == Codec.CODEC_ZLIB.value:
+            return self.dobj.flush()
+        return b""
+
+    # *******************************************
+    # Check if the end of the compressed data has been reached.
+    # *******************************************
+    def finished(self):
+        return self.dobj.eof
+
+# *******************************************
+# Compress data all at once.
+# *******************************************
+def compressBytes(codec, data):
+    compressor = Compressor(codec)
+    return compressor.compress(data) + compressor.flush()
+
+# *******************************************
+# Decompress data all at once.
+# *******************************************
+def decompressBytes(codec, data):
+    decompressor = Decompressor(codec)
+    return decompressor.decompress(data) + decompressor.flush()
+
+# *******************************************
+# Estimate compressed size of a file.
+# Small files are compressed completely, otherwise samples spread through the file
+# are compressed on their own, which slightly over estimates the compressed size.
+# *******************************************
+def estimateCompressedSize(filePath, fileSize, codec):
+    with open(filePath, mode='rb') as cf:
+        if fileSize <= (SAMPLESIZE * NUMSAMPLES):
+            return len(compressBytes(codec, cf.read()))
+
+        sampled = 0
+        compressed = 0
+        step = (fileSize - SAMPLESIZE) // (NUMSAMPLES - 1)
+        for idx in range(NUMSAMPLES):
+            cf.seek(idx * step)
+            sample = cf.read(SAMPLESIZE)
+            sampled += len(sample)
+            compressed += len(compressBytes(codec, sample))
+
+    return int(fileSize * compressed / max(1, sampled))
@@ -2,11 +2,12 @@
 
 import logging
 import logging.handlers
+import multiprocessing
 import time
 import os
 import sys
 
-from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog
+from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QInputDialog, QLabel
 from PyQt5 import uic
 from PyQt5 import QtCore, QtGui
 from PIL import Image
@@ -25,6 +26,13 @@ from utils import *
 from changeLog import *
 from userGuide import *
 from about import *
+from workers import *
+from thumbnails import *
+from probeIndex import *
+from scanDialog import *
+from searchDialog import *
+from payloadCodec import *
+from container import *
 
 # *******************************************
 # Program history.
@@ -96,6 +104,12 @@ class UI(QMainWindow):
         self.picDetailsLbl.setHidden(True)
         self.getEmbeddedDataBtn.setHidden(True)
 
+        # Attach to the open folder menu item, to scan for picCoded images.
+        self.actionOpenFolder.triggered.connect(self.openFolder)
+
+        # Attach to the search conversations menu item.
+        self.actionSearchConversations.triggered.connect(self.searchConversations)
+
         # Attach to the save image menu item.
         self.actionSaveCodedImage.triggered.connect(self.saveFile)
         self.haveEmbededPic = False
@@ -139,6 +153,15 @@ class UI(QMainWindow):
 
         # Create progress bar for exports.
         self.progressBar = ProgressBar(config)
+
+        # Create thread pool to run embedding / extracting jobs off the GUI thread.
+        # Only one job runs at a time, and it can be cancelled from the progress bar.
+        self.threadPool = QtCore.QThreadPool()
+        self.job = None
+        self.jobRunning = False
+        self.jobDoneAction = None
+        self.imageBackup = None
+        self.progressBar.rejected.connect(self.cancelJob)
  
         # Setup menu items visibility.
         self.checkMenuItems()
@@ -152,10 +175,24 @@ class UI(QMainWindow):
         # Create picCoded image object.
         self.stegPic = Steganography(config, logger, self)
 
+        # Create cache of image thumbnails, for showing images again without scaling the full size image.
+        self.thumbnails = ThumbnailCache(logger, config.ThumbnailCacheMB * 1024 * 1024, config.ThumbnailDir)
+
+        # Open index of probed images, to record the images seen.
+        self.probeIndex = ProbeIndex(logger, config.ProbeIndexFile, bool(config.ProbeIndexHash))
+
         # Create conversation dialog.
         # This is so that it can be displayed non-modally later.
         self.conversationDlg = ConversationDialog(logger, config, self.stegPic.conversation)
 
+        # Create scan dialog, listing the picCoded images found in folders.
+        # This is so that it can be displayed non-modally later.
+        self.scanDlg = ScanDialog(logger, config, self.openScannedImage)
+
+        # Create search dialog, searching the messages of indexed conversations.
+        # This is so that it can be displayed non-modally later.
+        self.searchDlg = SearchDialog(logger, config, self.openMessage)
+
         # Set application to accept drag and drop files.
         # Can drop image file anywhere on the main window.
         self.setAcceptDrops(True)
@@ -173,14 +210,95 @@ class UI(QMainWindow):
     # Check state of menu items.
     # *******************************************
     def checkMenuItems(self):
-        self.actionEmbedFile.setEnabled(self.haveOpenPic)
-        self.actionStartConversation.setEnabled(self.haveOpenPic)
-        self.actionEmbedConversation.setEnabled(self.haveOpenPic and self.haveOpenConversation)
-        self.actionExportConversation.setEnabled(self.haveEmbeddedConversation)
-        self.actionSaveCodedImage.setEnabled((self.haveOpenPic and self.haveEmbededPic))
-        self.actionPreviewImage.setEnabled((self.haveOpenPic and self.haveEmbededPic))
+        # Image can't be changed or used while a job is running.
+        idle = not self.jobRunning
+        self.actionOpenFile.setEnabled(idle)
+        self.actionEmbedFile.setEnabled(self.haveOpenPic and idle)
+        self.actionStartConversation.setEnabled(self.haveOpenPic and idle)
+        self.actionEmbedConversation.setEnabled(self.haveOpenPic and self.haveOpenConversation and idle)
+        self.actionExportConversation.setEnabled(self.haveEmbeddedConversation and idle)
+        self.actionSaveCodedImage.setEnabled((self.haveOpenPic and self.haveEmbededPic and idle))
+        self.actionPreviewImage.setEnabled((self.haveOpenPic and self.haveEmbededPic and idle))
+        self.getEmbeddedDataBtn.setEnabled(idle)
         self.picDetailsLbl.setHidden(not self.haveOpenPic)
 
+    # *******************************************
+    # Start a job to run an operation off the GUI thread.
+    # Progress is shown in the progress bar, which can be used to cancel the job.
+    # If rollback is set, the image is restored if the job is cancelled or fails.
+    # When the job finishes the done action is called with the job finish status.
+    # *******************************************
+    def startJob(self, note, operation, doneAction, rollback=False, cancellable=True):
+        logger.debug(f'Starting job : {note}')
+
+        # Keep a copy of the image to restore if the job doesn't complete.
+        if rollback:
+            self.imageBackup = self.stegPic.backupPixels()
+        else:
+            self.imageBackup = None
+
+        # Create the job, with operation progress reported through the job.
+        self.job = EngineJob(operation, OperationCancelled)
+        self.job.signals.note.connect(self.progressBar.setNote)
+        self.job.signals.progress.connect(self.progressBar.setProgress)
+        self.job.signals.finished.connect(self.jobFinished)
+        self.stegPic.progress = self.job.progress
+        self.stegPic.cancelRequested = False
+        self.jobDoneAction = doneAction
+
+        # Show the progress bar.
+        self.progressBar.setNote(note)
+        self.progressBar.setProgress(0)
+        self.progressBar.setCancellable(cancellable)
+        self.progressBar.showProgressBar()
+
+        # Disable menu items while the job is running, and start the job.
+        self.jobRunning = True
+        self.checkMenuItems()
+        self.threadPool.start(self.job)
+
+    # *******************************************
+    # Callback for progress bar cancelled.
+    # Requests that the running job is cancelled.
+    # *******************************************
+    def cancelJob(self):
+        if self.jobRunning:
+            logger.debug("User cancelled running job.")
+            self.statusBar.showMessage("Cancelling...", 2000)
+            self.stegPic.requestCancel()
+
+    # *******************************************
+    # Callback for job finished.
+    # *******************************************
+    def jobFinished(self, status, error):
+        logger.debug(f'Job finished with status : {status}')
+
+        self.jobRunning = False
+        self.progressBar.hideProgressBar()
+        self.stegPic.progress = self.progressBar
+
+        if status == JOB_CANCELLED:
+            self.statusBar.showMessage("Cancelled.", 5000)
+        elif status == JOB_FAILED:
+            logger.error(f'Job failed : {error}')
+            showPopup("Warning", "picCoder", "Operation failed.", details=error)
+
+        # Restore the image if the job did not complete.
+        if (status != JOB_DONE) and (self.imageBackup is not None):
+            logger.info("Restoring image after job did not complete.")
+            self.stegPic.restorePixels(self.imageBackup)
+        self.imageBackup = None
+
+        # Do any follow on action for the job.
+        doneAction = self.jobDoneAction
+        self.jobDoneAction = None
+        self.job = None
+        if doneAction is not None:
+            doneAction(status)
+
+        # Update menu item visibility.
+        self.checkMenuItems()
+
     # *******************************************
     # Callback function to include password for embedding action checkbox.
     # *******************************************
@@ -211,11 +329,11 @@ class UI(QMainWindow):
 
         # Configure and launch file selection dialog.
         dialog = QFileDialog(self)
-        dialog.setWindowTitle("Select PNG image file...")
+        dialog.setWindowTitle("Select image file...")
         dialog.setAcceptMode(QFileDialog.AcceptOpen)
         dialog.setFileMode(QFileDialog.ExistingFiles)
         dialog.setViewMode(QFileDialog.Detail)
-        dialog.setNameFilters(["Picture files (*.png)"])
+        dialog.setNameFilters([f'Picture files ({" ".join("*" + ext for ext in ONLYIMAGES)})'])
 
         # If have filename(s) then open.
         if dialog.exec_():
@@ -242,13 +360,21 @@ class UI(QMainWindow):
 
     # *******************************************
     # Overwrite response to accepted dropped file method.
+    # A single image is loaded, several files or any folders are scanned for picCoded images.
     # *******************************************
     def dropEvent(self, event):
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.toLocalFile() != ""]
+        if len(paths) == 0:
+            return
 
-        # If more than one file selected to load only load the first one.
-        filename = event.mimeData().urls()[0].toLocalFile()
+        # Scan several files, or folders.
+        if (len(paths) > 1) or os.path.isdir(paths[0]):
+            logger.debug(f'Files dropped on application: {paths}')
+            self.scanPaths(paths)
+            return
 
         # Only process files.
+        filename = paths[0]
         if os.path.isfile(filename):
             logger.debug(f'File dropped on application: {filename}')
 
@@ -261,6 +387,69 @@ class UI(QMainWindow):
                 logger.warning("Image type not supported.")
                 showPopup("Warning", "picCoder Load Image", f'Image type not supported.\nMust be in {ONLYIMAGES}')
 
+    # *******************************************
+    # Open Folder control selected.
+    # Displays folder browser to select a folder to scan for picCoded images.
+    # *******************************************
+    def openFolder(self):
+        logger.debug("User selected Open Folder menu control.")
+
+        folder = QFileDialog.getExistingDirectory(self, "Select folder to scan for picCoded images...")
+        if folder != "":
+            logger.info(f'Selected folder : {folder}')
+            self.scanPaths([folder])
+        else:
+            logger.debug("No folder selected.")
+
+    # *******************************************
+    # Scan files and folders for picCoded images, listing them in the scan dialog.
+    # *******************************************
+    def scanPaths(self, paths):
+        self.scanDlg.startScan(paths)
+        self.scanDlg.show()
+        self.scanDlg.raise_()
+        self.scanDlg.activateWindow()
+
+    # *******************************************
+    # Open an image chosen from the scan dialog.
+    # The image can't be changed while a job is running.
+    # *******************************************
+    def openScannedImage(self, filename):
+        if self.jobRunning:
+            self.statusBar.showMessage("Can't open image while a job is running.", 5000)
+            return
+        logger.info(f'Selected picture file : {filename}')
+        self.loadFile(filename)
+
+    # *******************************************
+    # Search Conversations control selected.
+    # Displays the search dialog.
+    # *******************************************
+    def searchConversations(self):
+        logger.debug("User selected Search Conversations menu control.")
+
+        self.searchDlg.show()
+        self.searchDlg.raise_()
+        self.searchDlg.activateWindow()
+
+    # *******************************************
+    # Open the image of a message found by a search, and show its conversation at the message.
+    # The password the search was made with is used for a password protected conversation,
+    # otherwise the password is asked for.
+    # *******************************************
+    def openMessage(self, filename, msgIdx, password):
+        if self.jobRunning:
+            self.statusBar.showMessage("Can't open image while a job is running.", 5000)
+            return
+        logger.info(f'Selected message {msgIdx} of picture file : {filename}')
+        self.loadFile(filename)
+
+        if not self.haveEmbeddedConversation:
+            logger.warning("Image no longer has an embedded conversation.")
+            showPopup("Warning", "picCoder Search Conversations", "Image no longer has an embedded conversation.")
+        elif self.unlockConversation(password):
+            self.showEmbeddedConversation(msgIdx)
+
     # *******************************************
     # Load selected image file.
     # Loads file selected from file explorer dialog or drag and drop.
@@ -271,9 +460,16 @@ class UI(QMainWindow):
         # Load new, potentially picCoded image object.
         self.stegPic.loadNewImage(filename)
 
+        # Record the image in the probe index, if it has changed since it was last seen.
+        # The probe result is from the image as loaded, so the image isn't read again,
+        # and is committed when the index is closed, so the database isn't written to on every image.
+        key = self.probeIndex.fileKey(filename)
+        if self.probeIndex.lookup(filename, key) is None:
+            self.probeIndex.store(key, self.stegPic.probeResult())
+
         # Displaying image statusbar message.
         self.statusBar.showMessage(f'Image file: {filename}...', 2000)
-        self.picImageLbl.setPixmap(self.stegPic.bitmap.scaled(self.picImageLbl.width(), self.picImageLbl.height(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
+        self.picImageLbl.setPixmap(self.thumbnails.getThumbnail(filename, self.picImageLbl.width(), self.picImageLbl.height(), self.stegPic.getImage()))
         self.picImageLbl.adjustSize()
         self.picImageLbl.show()
 
@@ -293,8 +489,12 @@ class UI(QMainWindow):
             self.getEmbeddedDataBtn.hide()
         else:
             # Add details of embedded data.
-            if self.stegPic.picCodeType == CodeType.CODETYPE_FILE.value:
+            if self.stegPic.picCodeType in (CodeType.CODETYPE_FILE.value, CodeType.CODETYPE_SPAN.value):
                 fileDetails += (f'\nImage contains embedded file : {self.stegPic.embeddedFileName}')
+                # Only part of a spanned file can be extracted from the image.
+                if self.stegPic.picCodeType == CodeType.CODETYPE_SPAN.value:
+                    span = self.stegPic.container.span
+                    fileDetails += (f'\nPart {span.partIndex + 1} of {span.partCount} of spanned file, join parts with picCoderCli extract-span')
                 # Show the button to extract the embedded file.
                 self.getEmbeddedDataBtn.setText("Extract Embedded File")
                 self.getEmbeddedDataBtn.setStyleSheet(f'background-color: {config.PicRendering["PicCodedFileButton"]};')
@@ -312,6 +512,31 @@ class UI(QMainWindow):
                 # Set flag for embedded file.
                 self.haveEmbededFile = True
 
+            elif self.stegPic.picCodeType == CodeType.CODETYPE_ARCHIVE.value:
+                # List the first few files of the archive, from the archive index.
+                members = self.stegPic.archiveMembers
+                fileDetails += (f'\nImage contains embedded archive of files : {len(members)}')
+                for member in members[:ARCHIVELISTMAX]:
+                    fileDetails += (f'\n    {member.name}')
+                if len(members) > ARCHIVELISTMAX:
+                    fileDetails += (f'\n    ...')
+                # Show the button to extract a file from the archive.
+                self.getEmbeddedDataBtn.setText("Extract Archive File")
+                self.getEmbeddedDataBtn.setStyleSheet(f'background-color: {config.PicRendering["PicCodedFileButton"]};')
+                self.getEmbeddedDataBtn.show()
+                # Attach callback to get archive file button.
+                # Need to disconnect first in case already connected to previous image.
+                try:
+                    self.getEmbeddedDataBtn.clicked.disconnect()
+                except TypeError:
+                    pass
+                self.getEmbeddedDataBtn.clicked.connect(self.getArchiveMember)
+                # Put special border around the picCoded image filename.
+                self.picDetailsLbl.setStyleSheet(f'background-color: {config.PicRendering["PicCodedBgCol"]}; border: 3px solid {config.PicRendering["PicCodedBorderColFileCoded"]};')
+
+                # Set flag for embedded file.
+                self.haveEmbededFile = True
+
             elif self.stegPic.picCodeType == CodeType.CODETYPE_TEXT.value:
                 fileDetails += (f'\nImage contains embedded conversation.')
                 # Show the button to extract the embedded conversation.
@@ -405,20 +630,43 @@ class UI(QMainWindow):
             if dialog.exec_():
                 filenames = dialog.selectedFiles()
 
+                # If more than one file selected then embed them as an archive.
+                if len(filenames) > 1:
+                    self.embedArchive(filenames, protected, password)
+
                 # If have a filename then open.
-                if filenames[0] != "":
+                elif filenames[0] != "":
                     logger.info(f'Selected file to embed : {filenames[0]}')
 
                     # Need to do a quick check of file size, as might not fit or look right.
                     # Size of file to embed.
                     fileSize = os.path.getsize(filenames[0])
                     logger.info(f'Selected file to embed has filesize : {fileSize}')
+
+                    # If compressing, estimate the compressed size by sampling the file.
+                    # Only compress if it makes the file smaller.
+                    codec = codecFromName(config.Compression)
+                    embedSize = fileSize
+                    if codec != Codec.CODEC_NONE.value:
+                        try:
+                            codedSize = estimateCompressedSize(filenames[0], fileSize, codec)
+                        except OSError:
+                            codedSize = fileSize
+                        logger.info(f'Estimated compressed size of file to embed : {codedSize}')
+                        if codedSize < fileSize:
+                            embedSize = codedSize
+                        else:
+                            codec = Codec.CODEC_NONE.value
+
                     # PicCoder embeded data size.
                     # In the case of the password allow for maximum length password at this stage.
-                    extraInfo = len(PROGCODE) + PASSWDYNBYTES + PASSWDLENBYTES + PASSWDMAXIMUM + CODETYPEBYTES + NAMELENBYTES + len(filenames[0]) + LENBYTES
+                    if config.FormatVersion == V2VERSION:
+                        extraInfo = containerSize(embedSize, PASSWDMAXIMUM, filenames[0]) - embedSize
+                    else:
+                        extraInfo = len(PROGCODE) + PASSWDYNBYTES + PASSWDLENBYTES + PASSWDMAXIMUM + CODETYPEBYTES + CODECBYTES + NAMELENBYTES + blen(filenames[0]) + 2 * LENBYTES
                     # Maximum space available from PIL import Image for embedding.
                     maxSpace = self.stegPic.picBytes
-                    embedRatio = (fileSize + extraInfo) / maxSpace
+                    embedRatio = (embedSize + extraInfo) / maxSpace
                     logger.debug(f'Embed ratio for embedded file : {(embedRatio * 100):.3f} %')
                     # Warning if file to embed is more than a certain ratio.
                     if embedRatio > config.MaxEmbedRatio:
@@ -429,17 +677,75 @@ class UI(QMainWindow):
                         # Embed with password as applicable.
                         self.stegPic.toEmbedFilePath = filenames[0]
                         self.stegPic.toEmbedFileSize = fileSize
-                        self.stegPic.embedFileToImage(protected, password)
+                        self.stegPic.toEmbedCodec = codec
 
                         # Embedding file statusbar message.
                         self.statusBar.showMessage("Embedding file...", 5000)
 
-                        # Set flag for image save control.
-                        self.haveEmbededPic = True
+                        # Embed as a job, restoring the image if it doesn't complete.
+                        self.startJob('Embedding file into image...', lambda: self.embedFileJob(protected, password), self.embeddingDone, rollback=True)
 
         # Update menu item visibility.
         self.checkMenuItems()
 
+    # *******************************************
+    # Embed file job.
+    # Fails the job if the file wasn't embedded, e.g. if it compressed less than estimated.
+    # *******************************************
+    def embedFileJob(self, protected, password):
+        if not self.stegPic.embedFileToImage(protected, password):
+            raise OSError("Failed to embed file into image, see log for details.")
+
+    # *******************************************
+    # Embed files selected to embed into the current pic, as an archive.
+    # *******************************************
+    def embedArchive(self, filenames, protected, password):
+        logger.info(f'Selected files to embed as archive : {len(filenames)}')
+
+        # Need to do a quick check of the size of the files, as might not fit.
+        fileSizes = [os.path.getsize(filename) for filename in filenames]
+        logger.info(f'Selected files to embed have total filesize : {sum(fileSizes)}')
+
+        # If compressing, estimate the compressed size of each file by sampling the file.
+        # Only compress if it makes the files smaller.
+        codec = codecFromName(config.Compression)
+        embedSizes = fileSizes
+        if codec != Codec.CODEC_NONE.value:
+            codedSizes = []
+            for filename, fileSize in zip(filenames, fileSizes):
+                try:
+                    codedSizes.append(estimateCompressedSize(filename, fileSize, codec))
+                except OSError:
+                    codedSizes.append(fileSize)
+            logger.info(f'Estimated compressed size of files to embed : {sum(codedSizes)}')
+            if sum(codedSizes) < sum(fileSizes):
+                embedSizes = codedSizes
+            else:
+                codec = Codec.CODEC_NONE.value
+
+        # PicCoder embeded data size.
+        # In the case of the password allow for maximum length password at this stage.
+        embedRatio = archiveSize(archiveMemberNames(filenames), embedSizes, PASSWDMAXIMUM) / self.stegPic.picBytes
+        logger.debug(f'Embed ratio for embedded archive : {(embedRatio * 100):.3f} %')
+        # Warning if files to embed are more than a certain ratio.
+        if embedRatio > config.MaxEmbedRatio:
+            logger.warning(f'Data to embed exceeds maximum ratio : {(config.MaxEmbedRatio * 100):.3f} %')
+            showPopup("Warning", "picCoder Embedding Files", f'Files to embed would exceed allowed embedding ratio of {(config.MaxEmbedRatio * 100):.3f} %.')
+        else:
+            # Embedding files statusbar message.
+            self.statusBar.showMessage("Embedding files...", 5000)
+
+            # Embed as a job, restoring the image if it doesn't complete.
+            self.startJob('Embedding files into image...', lambda: self.embedArchiveJob(filenames, codec, protected, password), self.embeddingDone, rollback=True)
+
+    # *******************************************
+    # Embed archive job.
+    # Fails the job if the files weren't all embedded.
+    # *******************************************
+    def embedArchiveJob(self, filenames, codec, protected, password):
+        if not self.stegPic.embedArchiveToImage(filenames, protected, password, codec):
+            raise OSError("Failed to embed files into image, see log for details.")
+
     # *******************************************
     # Preview image control selected.
     # Displays the image with embedded image or conversation.
@@ -448,7 +754,9 @@ class UI(QMainWindow):
     def previewImage(self):
         logger.debug("User selected preview image menu control.")
 
-        preview = PreviewImageDialog(self.stegPic.image)
+        # Mapped images are got from their file each time, so are cached by the file.
+        picFile = self.stegPic.picFile if self.stegPic.mapped is not None else ""
+        preview = PreviewImageDialog(self.stegPic.getImage(), self.thumbnails, None, picFile)
 
     # *******************************************
     # Start conversation control selected.
@@ -459,7 +767,7 @@ class UI(QMainWindow):
         # Set the new conversation for the conversation dialog.
         # Populate the dialog and display.
         self.stegPic.conversation.clearMessages()
-        self.conversationDlg.populateMessages()
+        self.conversationDlg.showLatestMessages()
         self.conversationDlg.show()
 
         # Showing new / blank conversation statusbar message.
@@ -523,19 +831,15 @@ class UI(QMainWindow):
         if canEmbed == True:
             # Need to do a quick check of conversation size, as might not fit or look right.
             # Size of conversation to embed.
-            convLength = 0
-            for msg in self.stegPic.conversation.messages:
-                convLength += NUMSMSBYTES
-                convLength += NAMELENBYTES
-                convLength += len(msg.writer)
-                convLength += TIMELENBYTES
-                convLength += len(msg.msgTime)
-                convLength += SMSLENBYTES
-                convLength += blen(msg.msgText)
+            # Messages already embedded aren't read from the image to find out.
+            convLength = self.stegPic.conversationLength()
 
             # PicCoder embeded data size.
             # In the case of the password allow for maximum length password at this stage.
             embedData = len(PROGCODE) + PASSWDYNBYTES + PASSWDLENBYTES + PASSWDMAXIMUM + CODETYPEBYTES + NUMSMSBYTES + convLength
+            # A version 2 container also has a message offset table.
+            if config.FormatVersion == V2VERSION:
+                embedData += tableLength(tableSlots(self.stegPic.conversation.numMessages()))
             # Maximum space available from PIL import Image for embedding.
             maxSpace = self.stegPic.picBytes
             embedRatio = embedData / maxSpace
@@ -546,17 +850,27 @@ class UI(QMainWindow):
             else:
                 # Embed conversation.
                 logger.debug(f'Embedding conversation.')
-                self.stegPic.embedConversationIntoImage(protected, password)
 
                 # Embedding conversation statusbar message.
                 self.statusBar.showMessage("Embedding conversation...", 5000)
 
-                # Set flag for image save control.
-                self.haveEmbededPic = True
+                # Embed as a job, restoring the image if it doesn't complete.
+                self.startJob('Embedding conversation into image...', lambda: self.stegPic.embedConversationIntoImage(protected, password), self.embeddingDone, rollback=True)
 
             # Update menu item visibility.
             self.checkMenuItems()
 
+    # *******************************************
+    # Embedding file or conversation job finished.
+    # *******************************************
+    def embeddingDone(self, status):
+        if status == JOB_DONE:
+            # Embedding done statusbar message.
+            self.statusBar.showMessage("Embedding complete.", 5000)
+
+            # Set flag for image save control.
+            self.haveEmbededPic = True
+
     # *******************************************
     # Save File control selected.
     # Displays file browser to safe current (embedded) pic.
@@ -570,7 +884,7 @@ class UI(QMainWindow):
         dialog.setFileMode(QFileDialog.AnyFile)
         dialog.setViewMode(QFileDialog.List)
         dialog.setAcceptMode(QFileDialog.AcceptSave)
-        dialog.setNameFilters(["Picture files (*.png)"])
+        dialog.setNameFilters([f'Picture files ({" ".join("*" + ext for ext in ONLYIMAGES)})'])
 
         # If returned filename then open/create.
         if dialog.exec_():
@@ -580,14 +894,29 @@ class UI(QMainWindow):
             if filenames[0] != "":
                 logger.info(f'Selected file to save to : {filenames[0]}')
 
-                try:
-                    # Saving embedded image statusbar message.
-                    self.statusBar.showMessage("Saving image with embedded data...", 5000)
+                # Saving embedded image statusbar message.
+                self.statusBar.showMessage("Saving image with embedded data...", 5000)
 
-                    # Save the file with the embedded data.
-                    self.stegPic.image.save(filenames[0], 'PNG')
-                except:
-                    logger.error("Failed to save picCoded image to file.")
+                # Save the file with the embedded data as a job.
+                # Saving can't be stopped part way, so can't be cancelled.
+                saveToFilename = filenames[0]
+                self.startJob('Saving picCoded image...', lambda: self.saveImage(saveToFilename), self.saveDone, cancellable=False)
+
+    # *******************************************
+    # Save the image with the embedded data.
+    # Run as a job.
+    # *******************************************
+    def saveImage(self, saveToFilename):
+        if not self.stegPic.saveImage(saveToFilename):
+            logger.error("Failed to save picCoded image to file.")
+            raise OSError(f'Failed to save picCoded image to file : {saveToFilename}')
+
+    # *******************************************
+    # Saving image job finished.
+    # *******************************************
+    def saveDone(self, status):
+        if status == JOB_DONE:
+            self.statusBar.showMessage("Image with embedded data saved.", 5000)
 
     # *******************************************
     # Export conversation control selected.
@@ -711,19 +1040,93 @@ class UI(QMainWindow):
                     # Extracting embedded file statusbar message.
                     self.statusBar.showMessage("Extracting embedded file...", 5000)
 
-                    # Call method to extract embedded file.
-                    self.stegPic.saveEmbeddedFile(filenames[0])
+                    # Extract embedded file as a job.
+                    self.extractFilename = filenames[0]
+                    self.startJob('Extracting file from image...', lambda: self.extractMemberJob(None), self.extractionDone)
 
-                    # If the image is a picture we can display it as well.
-                    try:
-                        eObj = Image.open(filenames[0])
-                        imgType = eObj.format
-                        logger.debug(f'Embedded file is image type : {imgType}')
-                        # Launch dialog box to show the embedded inage.
-                        self.showDisplayedImage(filenames[0])
-                    except:
-                        logger.info("Embedded file is not an image file.")
-                        showPopup("Info", "picCoder File Extraction", "Embedded file saved.\nEmbedded file is not an image, open with associated application.")
+    # *******************************************
+    # Calback for extract archive file button.
+    # Lists the files of the archive to select one to extract.
+    # *******************************************
+    def getArchiveMember(self):
+        logger.debug("User selected control to extract archive file.")
+
+        # If password protected present dialog to get password.
+        if self.stegPic.picPassword == True:
+
+            # Show password dialog.
+            pw = PasswordDialog("Enter password to extract archive file...")
+            # Get user selection.
+            protected, password = pw.getPassword()
+
+            if (protected == True) and (password != self.stegPic.password):
+                # Wrong password entered.
+                logger.warning("Password incorrect.")
+                showPopup("Warning", "picCoder Extracting Archive File", "Incorrect password entered.")
+                return
+
+        # Select the file to extract, from the archive index.
+        members = self.stegPic.archiveMembers
+        items = [f'{member.name}  ({member.size:,} Bytes)' for member in members]
+        item, selected = QInputDialog.getItem(self, "picCoder Extracting Archive File", "Select file to extract:", items, 0, False)
+        if (not selected) or (item not in items):
+            return
+        member = members[items.index(item)]
+
+        # Configure and launch file selection dialog.
+        dialog = QFileDialog(self, directory = os.path.basename(member.name))
+        dialog.setWindowTitle("Select file to save archive file to...")
+        dialog.setFileMode(QFileDialog.AnyFile)
+        dialog.setViewMode(QFileDialog.List)
+        dialog.setAcceptMode(QFileDialog.AcceptSave)
+
+        # If returned filename then open/create.
+        if dialog.exec_():
+            filenames = dialog.selectedFiles()
+
+            # If have a filename then open.
+            if filenames[0] != "":
+                logger.info(f'Selected file to save archive file {member.name} to : {filenames[0]}')
+
+                # Extracting archive file statusbar message.
+                self.statusBar.showMessage("Extracting archive file...", 5000)
+
+                # Extract archive file as a job.
+                self.extractFilename = filenames[0]
+                self.startJob('Extracting file from image...', lambda: self.extractMemberJob(member), self.extractionDone)
+
+    # *******************************************
+    # Extract embedded file, or file of an archive, job.
+    # Fails the job if the file wasn't all extracted, so the partly extracted file is removed.
+    # *******************************************
+    def extractMemberJob(self, member=None):
+        if not self.stegPic.saveEmbeddedFile(self.extractFilename, member):
+            raise OSError("Failed to extract file from image, see log for details.")
+
+    # *******************************************
+    # Extracting embedded file job finished.
+    # *******************************************
+    def extractionDone(self, status):
+
+        # If extraction did not complete remove the partly extracted file.
+        if status != JOB_DONE:
+            try:
+                os.remove(self.extractFilename)
+                logger.info(f'Removed partly extracted file : {self.extractFilename}')
+            except OSError:
+                pass
+            return
+
+        # If the image is a picture we can display it as well.
+        try:
+            eObj = Image.open(self.extractFilename)
+            imgType = eObj.format
+            logger.debug(f'Embedded file is image type : {imgType}')
+            # Launch dialog box to show the embedded inage.
+            self.showDisplayedImage(self.extractFilename)
+        except:
+            logger.info("Embedded file is not an image file.")
+            showPopup("Info", "picCoder File Extraction", "Embedded file saved.\nEmbedded file is not an image, open with associated application.")
 
     # *******************************************
     # Displaying embedded image dialog.
@@ -732,7 +1135,7 @@ class UI(QMainWindow):
         logger.debug(f'Displaying embedded image : {imgFile}')
 
         # Create embedded image dialog.        
-        EmbeddedImageDialog(imgFile)
+        EmbeddedImageDialog(imgFile, self.thumbnails)
 
     # *******************************************
     # Calback for extract embedded conversation button.
@@ -740,11 +1143,21 @@ class UI(QMainWindow):
     def extractEmbeddedConversation(self):
         logger.debug("User selected control to extract embedded conversation.")
 
+        if self.unlockConversation():
+            self.showEmbeddedConversation()
+
+    # *******************************************
+    # Check the embedded conversation can be extracted.
+    # If password protected and not given the password, present dialog to get password.
+    # Returns True if the conversation can be extracted.
+    # *******************************************
+    def unlockConversation(self, password=""):
+
         # Initialise extraction flag.
         canExtract = True
 
         # If password protected present dialog to get password.
-        if self.stegPic.picPassword == True:
+        if (self.stegPic.picPassword == True) and (password != self.stegPic.password):
             # Show password dialog.
             pw = PasswordDialog("Enter password to extract embedded conversation...")
             # Get user selection.
@@ -759,23 +1172,31 @@ class UI(QMainWindow):
                 showPopup("Warning", "picCoder Extracting Embedded Conversation", "Incorrect password entered.")
                 canExtract = False
 
-        # If no password, or password entered correctly then can extract.
-        if canExtract == True:
+        return canExtract
 
-            # Extracting embedded conversation statusbar message.
-            self.statusBar.showMessage("Extracting embedded conversation...", 5000)
+    # *******************************************
+    # Show the embedded conversation in the conversation dialog,
+    # at the latest messages, or at a message if given.
+    # *******************************************
+    def showEmbeddedConversation(self, msgIdx=-1):
 
-            # Set the embedded conversation for the conversation dialog.
-            # Populate the dialog and display.
-            self.conversationDlg.populateMessages()
-            self.conversationDlg.show()
+        # Extracting embedded conversation statusbar message.
+        self.statusBar.showMessage("Extracting embedded conversation...", 5000)
 
-            # Set flag for image save control.
-            self.haveOpenConversation = True
-            self.haveEmbeddedConversation = True
+        # Set the embedded conversation for the conversation dialog.
+        # Populate the dialog and display.
+        if msgIdx >= 0:
+            self.conversationDlg.showMessage(msgIdx)
+        else:
+            self.conversationDlg.showLatestMessages()
+        self.conversationDlg.show()
 
-            # Update menu item visibility.
-            self.checkMenuItems()
+        # Set flag for image save control.
+        self.haveOpenConversation = True
+        self.haveEmbeddedConversation = True
+
+        # Update menu item visibility.
+        self.checkMenuItems()
 
     # *******************************************
     # Show embedding capacity on status bar.
@@ -820,7 +1241,15 @@ class UI(QMainWindow):
         self.userGuideDlg.show()
 
 # *******************************************
-app = QApplication(sys.argv)
-picCoder = UI()
-app.exec_()
+# Only run the application in the main process, not in processes started for
+# parallel embedding / extracting, which import this module.
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    app = QApplication(sys.argv)
+    picCoder = UI()
+    app.exec_()
+    picCoder.scanDlg.stopScan()
+    picCoder.searchDlg.stopIndexing()
+    picCoder.stegPic.shutdown()
+    picCoder.probeIndex.close()
 # *******************************************
@@ -0,0 +1,1369 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+from compiledPayload import *
+from config import *
+from constants import *
+from container import *
+from messageIndex import *
+from payloadCodec import *
+from picProbe import *
+from probeIndex import *
+from scanner import *
+from spanning import *
+from steganography import *
+from utils import *
+
+# *******************************************
+# picCoder command line interface.
+# Does not use any widget code so can be run on headless servers.
+#
+# Commands:
+#   probe               - Report if images are picCoded, and what is embedded,
+#                         reading only the rows of each image holding the header.
+#   find                - Report picCoded images seen before, from the probe index.
+#   scan                - Report picCoded images in directory trees, as they are found,
+#                         probing batches of images in parallel.
+#   index               - Index the messages of conversations embedded in images, for searching,
+#                         only extracting conversations that have changed since they were indexed.
+#   search              - Search the messages of indexed conversations, reporting the image
+#                         and message number of each message found.
+#   capacity            - Report dimensions and embedding capacity of cover images,
+#                         reading only the PNG header, or uncompressed image header, of each image.
+#   embed-file          - Embed a file into cover images.
+#   embed-archive       - Embed files, and files in directories, into cover images as an archive.
+#   embed-conversation  - Embed a conversation, from a JSON file, into cover images.
+#   embed-span          - Embed a file too large for one cover image into several, a part in each.
+#   watermark           - Embed the same file into many cover images, with values such as a serial number
+#                         filled in for each image, compiling the file into the embedded data only once.
+#   list                - List the files in embedded archives, from the archive index.
+#   extract             - Extract embedded files and conversations from images,
+#                         or only the given files of embedded archives.
+#   extract-span        - Find the parts of spanned files amongst images, in any order,
+#                         and join them back into the files.
+#
+# Images can be given as files, directories or glob patterns.
+# Images are processed in a pool of processes if --jobs is more than 1.
+# Probe results are kept in the probe index, so images that haven't changed aren't probed again,
+# unless --no-index is given.
+#
+# Conversations with a password are only indexed, and only found by searches, with the password.
+#
+# Conversation JSON files are a list of messages, each with "writer", "time" and "text".
+#
+# Watermark slots are text in the file to embed, replaced in each image by the value of the slot.
+# Values are from a CSV file, a row for each image in the order the images are found, with a header
+# row of slot names, otherwise from a template for each slot, with {n} the number of the image
+# and {stem} the name of the image without its extension, "{n}" if not given.
+#
+# Cover images can be PNG images, or uncompressed BMP, PPM and PAM images, which are memory mapped
+# rather than decoded. picCoded images are saved as the same type of image as their cover,
+# or with --in-place uncompressed cover images are written to directly, only writing back the pages changed.
+# PNG images too large to decode within StreamMemoryMB of the configuration are decoded and re-encoded
+# a band of rows at a time, and only the rows holding the embedded data are read or changed.
+#
+# Streaming, for payloads of unknown size, with constant memory and no temporary files:
+#   embed-file - cover.png -o out   - Embeds standard input into a single cover image.
+#   extract image.png -o -          - Writes what is embedded in a single image to standard output,
+#                                     results are then written to standard error.
+#   extract-span images -o -        - Writes a single spanned file to standard output.
+#
+# Exit codes:
+#   0 - Success.
+#   1 - One or more images failed.
+#   2 - Invalid command line.
+# *******************************************
+
+# Exit codes.
+EXIT_OK = 0
+EXIT_FAILED = 1
+
+# Logger for the engine, which only reports warnings and errors.
+logger = logging.getLogger('picCoderCli')
+
+# *******************************************
+# Write a result, either as a line of JSON or as text.
+# Results go to standard error if standard output is used for data.
+# *******************************************
+def writeResult(args, resultDict, text):
+    results = sys.stderr if args.dataToStdout else sys.stdout
+    if args.json:
+        results.write(json.dumps(resultDict, ensure_ascii=False) + "\n")
+    else:
+        results.write(text + "\n")
+    results.flush()
+
+# *******************************************
+# Run a task for every image, in a pool of processes if required.
+# Tasks return a success flag, a result dictionary and result text.
+# Results are written in the order of the images, as they become available.
+# Images are found from the paths of the command, unless given.
+# Returns the result dictionaries, and the number of images that failed.
+# *******************************************
+def runImages(args, config, task, options, picFiles=None):
+
+    if picFiles is None:
+        picFiles = list(findImageFiles(args.paths))
+    results = []
+    numFailed = 0
+
+    if (args.jobs > 1) and (len(picFiles) > 1):
+        # Images are already processed in parallel, so don't embed / extract each image in parallel too.
+        config.ParallelProcesses = 0
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn"))
+        taskResults = pool.map(task, picFiles, itertools.repeat(config), itertools.repeat(options))
+    else:
+        pool = None
+        taskResults = (task(picFile, config, options) for picFile in picFiles)
+
+    try:
+        for ok, resultDict, text in taskResults:
+            if not ok:
+                numFailed += 1
+            results.append(resultDict)
+            writeResult(args, resultDict, text)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return results, numFailed
+
+# *******************************************
+# Return exit code for the results of a command.
+# *******************************************
+def exitCode(results, numFailed):
+    if (len(results) == 0) or (numFailed > 0):
+        return EXIT_FAILED
+    return EXIT_OK
+
+# *******************************************
+# Run a task for a single image, streaming to / from a pipe.
+# Returns the exit code.
+# *******************************************
+def runStream(args, config, task, options, stream):
+    picFiles = list(findImageFiles(args.paths))
+    if len(picFiles) != 1:
+        sys.stderr.write("Streaming needs exactly one image.\n")
+        return EXIT_FAILED
+    ok, resultDict, text = task(picFiles[0], config, options, stream)
+    writeResult(args, resultDict, text)
+    return exitCode([resultDict], 0 if ok else 1)
+
+# *******************************************
+# Create result dictionary for a command that changes or extracts from an image.
+# *******************************************
+def newResult(command, picFile):
+    return {
+        "file" : picFile,
+        "command" : command,
+        "ok" : False,
+        "error" : "",
+        "output" : ""
+    }
+
+# *******************************************
+# Return text for the result of a command that changes or extracts from an image.
+# *******************************************
+def resultText(result, doneText):
+    if result["ok"]:
+        return f'{result["file"]} : {doneText} {result["output"]}'
+    return f'{result["file"]} : failed, {result["error"]}'
+
+# *******************************************
+# Load image for embedding / extracting.
+# Uncompressed images can be loaded in place, so embedding writes straight to the image file.
+# PNG images too large to decode within the memory budget are streamed in bands.
+# Returns the steganography object for the image, or None if the image can't be read.
+# *******************************************
+def loadImage(picFile, config, inPlace=False):
+    stegPic = Steganography(config, logger)
+    stegPic.loadNewImage(picFile, inPlace, stream=True)
+    if not stegPic.isLoaded():
+        stegPic.shutdown()
+        return None
+    return stegPic
+
+# *******************************************
+# Get path of image to write to in an output directory.
+# The image is written by its name from the path that found it, so images with the same
+# file name in different directories are written to different images.
+# Uncompressed images are written as the same type of image, others as PNG images.
+# Without an output directory the image is written in place, only possible for uncompressed images.
+# Returns the path, and error text, empty if the path can be written to.
+# *******************************************
+def outputImagePath(picFile, name, outDir):
+    if outDir is None:
+        if not isMappedImage(picFile):
+            return picFile, f'Only {", ".join(MAPPEDIMAGES)} images can be written in place.'
+        return picFile, ""
+    ext = os.path.splitext(picFile)[1].lower() if isMappedImage(picFile) else ".png"
+    outFile = os.path.join(outDir, os.path.splitext(name)[0] + ext)
+    if os.path.abspath(outFile) == os.path.abspath(picFile):
+        return outFile, "Output would overwrite image."
+    return outFile, ""
+
+# *******************************************
+# Find images for a command that writes an output for each image, with the path of the output of each.
+# Output paths are got from the image and its name from the path that found it.
+# Checks no two images would be written to the same output, before any image is.
+# Returns list of images, dictionary of output path and error text by image,
+# and error text, empty if every image has its own output.
+# *******************************************
+def findOutputs(paths, outputPath):
+    picFiles = []
+    outputs = {}
+    outputImages = {}
+    for picFile, name in findImageFileNames(paths):
+        outFile, error = outputPath(picFile, name)
+        key = os.path.normcase(os.path.abspath(outFile))
+        if key in outputImages:
+            return picFiles, outputs, f'Images would be written to the same output : {outputImages[key]}, {picFile}; output : {outFile}'
+        outputImages[key] = picFile
+        picFiles.append(picFile)
+        outputs[picFile] = (outFile, error)
+    return picFiles, outputs, ""
+
+# *******************************************
+# Find images for an embedding command, with the path of the image to write for each.
+# Creates the directories in the output directory the images are written to.
+# Returns list of images and dictionary of output path and error text by image,
+# or None, None if two images would be written to the same image.
+# *******************************************
+def findOutputImages(args):
+    picFiles, outputs, error = findOutputs(args.paths, lambda picFile, name: outputImagePath(picFile, name, args.output))
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return None, None
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+        for outFile, error in outputs.values():
+            if error == "":
+                os.makedirs(os.path.dirname(outFile), exist_ok=True)
+    return picFiles, outputs
+
+# *******************************************
+# Check password to embed.
+# Returns error text, or empty string if the password is OK.
+# *******************************************
+def checkPassword(password):
+    if (password != "") and ((len(password) < PASSWDMINIMUM) or (len(password) > PASSWDMAXIMUM)):
+        return f'Invalid password, must be {PASSWDMINIMUM}-{PASSWDMAXIMUM} characters.'
+    return ""
+
+# Code types to find, by name.
+FINDCODETYPES = {
+    "file" : CodeType.CODETYPE_FILE.value,
+    "conversation" : CodeType.CODETYPE_TEXT.value,
+    "archive" : CodeType.CODETYPE_ARCHIVE.value,
+    "span" : CodeType.CODETYPE_SPAN.value
+}
+
+# *******************************************
+# Open the probe index, or an empty index if not used.
+# *******************************************
+def openProbeIndex(args, config):
+    return ProbeIndex(logger, "" if args.noIndex else config.ProbeIndexFile, bool(config.ProbeIndexHash))
+
+# *******************************************
+# Probe images, from the probe index for images that haven't changed since they were last probed.
+# Other images are probed in a pool of processes if given, a window of images at a time,
+# and added to the index.
+# Yields probe results in the order of the images.
+# *******************************************
+def probeImages(index, picFiles, pool, window):
+    entries = []
+    for picFile in picFiles:
+        key = index.fileKey(picFile)
+        entries.append((picFile, key, index.lookup(picFile, key)))
+    probed = orderedResults(pool, probeImage, [picFile for picFile, key, result in entries if result is None], window)
+    try:
+        for picFile, key, result in entries:
+            if result is None:
+                result = next(probed)
+                index.store(key, result)
+            yield result
+    finally:
+        index.commit()
+
+# *******************************************
+# Return text for a probe result.
+# *******************************************
+def probeText(result):
+    picFile = result.picFile
+    if not result.supported:
+        return f'{picFile} : not supported'
+    if not result.picCoded:
+        return f'{picFile} : not picCoded'
+    if result.picCodeType == CodeType.CODETYPE_FILE.value:
+        return f'{picFile} : embedded file : {result.embeddedFileName}; size : {result.embeddedFileSize:,} Bytes; password : {result.picPassword}'
+    if result.picCodeType == CodeType.CODETYPE_ARCHIVE.value:
+        return f'{picFile} : embedded archive : {result.numMembers} files; password : {result.picPassword}'
+    if result.picCodeType == CodeType.CODETYPE_SPAN.value:
+        return f'{picFile} : spanned file : {result.embeddedFileName}; part : {result.spanIndex + 1} of {result.spanCount}; size : {result.embeddedFileSize:,} Bytes; set : {result.spanSetId}; password : {result.picPassword}'
+    return f'{picFile} : embedded conversation : {result.numMessages} messages; password : {result.picPassword}'
+
+# *******************************************
+# Probe command.
+# Reports if each image is picCoded, and what is embedded.
+# *******************************************
+def probeCmd(args, config):
+
+    picFiles = list(findImageFiles(args.paths))
+    if (args.jobs > 1) and (len(picFiles) > 1):
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = None
+
+    results = []
+    numFailed = 0
+    try:
+        with openProbeIndex(args, config) as index:
+            for result in probeImages(index, picFiles, pool, 4 * args.jobs):
+                if not result.readable:
+                    numFailed += 1
+                results.append(result.asDict())
+                writeResult(args, result.asDict(), probeText(result))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Find command.
+# Reports picCoded images in the probe index, optionally only of a type.
+# Images that have changed since they were probed are probed again, and images that have gone are removed.
+# *******************************************
+def findCmd(args, config):
+
+    results = []
+    with openProbeIndex(args, config) as index:
+        codeType = None if args.type is None else FINDCODETYPES[args.type]
+        for found in index.findCoded(codeType):
+            key = index.fileKey(found.picFile)
+            if key is None:
+                index.remove(found.picFile)
+                continue
+            result = index.lookup(found.picFile, key)
+            if result is None:
+                result = probeImage(found.picFile)
+                index.store(key, result)
+                if (not result.picCoded) or ((codeType is not None) and (result.picCodeType != codeType)):
+                    continue
+            results.append(result.asDict())
+            writeResult(args, result.asDict(), probeText(result))
+
+    if len(results) == 0:
+        sys.stderr.write("No picCoded images found in the probe index.\n")
+    return exitCode(results, 0)
+
+# *******************************************
+# Scan command.
+# Reports picCoded images, or all images, found in directory trees.
+# Results are written as images are probed, so aren't in the order of the images.
+# *******************************************
+def scanCmd(args, config):
+
+    if args.jobs > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = None
+
+    numImages = 0
+    numCoded = 0
+    numFailed = 0
+    try:
+        with openProbeIndex(args, config) as index:
+            for result in scanImages(args.paths, index, pool, 2 * args.jobs):
+                numImages += 1
+                if not result.readable:
+                    numFailed += 1
+                if result.picCoded:
+                    numCoded += 1
+                if result.picCoded or args.all:
+                    writeResult(args, result.asDict(), probeText(result))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    sys.stderr.write(f'Scanned images : {numImages}; picCoded : {numCoded}; unreadable : {numFailed}\n')
+    return EXIT_FAILED if (numImages == 0) or (numFailed > 0) else EXIT_OK
+
+# *******************************************
+# Index command.
+# Indexes the messages of the conversations embedded in images, reporting each image as it is indexed.
+# Images that have gone are removed from the index.
+# *******************************************
+def indexCmd(args, config):
+
+    if args.jobs > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = None
+
+    counts = {INDEXSTATUSINDEXED : 0, INDEXSTATUSCURRENT : 0, INDEXSTATUSLOCKED : 0, INDEXSTATUSFAILED : 0}
+    try:
+        with openProbeIndex(args, config) as probeIndex, MessageIndex(logger, config.MessageIndexFile, bool(config.ProbeIndexHash)) as messageIndex:
+            if not messageIndex.available():
+                sys.stderr.write(f'Message index not available : {config.MessageIndexFile}\n')
+                return EXIT_FAILED
+            for picFile, status in indexConversations(args.paths, probeIndex, messageIndex, config, args.password, logger, pool, 2 * args.jobs):
+                counts[status] += 1
+                if (status != INDEXSTATUSCURRENT) or args.all:
+                    writeResult(args, {"file" : picFile, "status" : status}, f'{picFile} : {status}')
+            numRemoved = messageIndex.prune()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    sys.stderr.write(f'Conversations indexed : {counts[INDEXSTATUSINDEXED]}; unchanged : {counts[INDEXSTATUSCURRENT]}; '
+                     f'locked : {counts[INDEXSTATUSLOCKED]}; failed : {counts[INDEXSTATUSFAILED]}; removed : {numRemoved}\n')
+    return EXIT_FAILED if counts[INDEXSTATUSFAILED] > 0 else EXIT_OK
+
+# *******************************************
+# Search command.
+# Reports the messages of indexed conversations found, best match first.
+# *******************************************
+def searchCmd(args, config):
+
+    with MessageIndex(logger, config.MessageIndexFile, bool(config.ProbeIndexHash)) as messageIndex:
+        if not messageIndex.available():
+            sys.stderr.write(f'Message index not available : {config.MessageIndexFile}\n')
+            return EXIT_FAILED
+        hits = messageIndex.search(args.text, args.password, args.writer, args.limit)
+
+    for hit in hits:
+        writeResult(args, hit.asDict(), f'{hit.picFile} : message {hit.msgNum} : {hit.writer} : {hit.msgTime} : {hit.snippet}')
+    if len(hits) == 0:
+        sys.stderr.write("No messages found.\n")
+        return EXIT_FAILED
+    return EXIT_OK
+
+# *******************************************
+# Capacity task.
+# *******************************************
+def capacityTask(picFile, config, options):
+    result = probeCapacity(picFile, options["ratio"])
+    if result.supported:
+        text = f'{picFile} : {result.width} x {result.height}; capacity : {result.capacity:,} Bytes'
+    else:
+        text = f'{picFile} : not supported, {result.reason}'
+    return result.readable, result.asDict(), text
+
+# *******************************************
+# Capacity command.
+# Reports dimensions, bit depth, colour type and capacity of every image.
+# *******************************************
+def capacityCmd(args, config):
+
+    maxEmbedRatio = config.MaxEmbedRatio if args.ratio is None else args.ratio
+    results, numFailed = runImages(args, config, capacityTask, {"ratio" : maxEmbedRatio})
+
+    if not args.json:
+        supported = [result for result in results if result["supported"]]
+        totalCapacity = sum(result["capacity"] for result in supported)
+        sys.stdout.write(f'Images : {len(results)}; supported : {len(supported)}; total capacity : {totalCapacity:,} Bytes\n')
+
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Size of the embedded data for a file to embed, including the header.
+# *******************************************
+def embeddedDataSize(config, options):
+    password = options["password"]
+    if config.FormatVersion == V2VERSION:
+        return containerSize(options["embedSize"], len(password), options["payload"])
+    extraInfo = len(PROGCODE) + PASSWDYNBYTES + PASSWDLENBYTES + len(password) + CODETYPEBYTES + CODECBYTES + NAMELENBYTES + blen(options["payload"]) + 2 * LENBYTES
+    return options["embedSize"] + extraInfo
+
+# *******************************************
+# Embed file task.
+# If a stream is given the file is read from it, until it ends.
+# *******************************************
+def embedFileTask(picFile, config, options, stream=None):
+
+    result = newResult("embed-file", picFile)
+    outFile, error = options["outputs"][picFile]
+    if error != "":
+        result["error"] = error
+        return False, result, resultText(result, "")
+
+    stegPic = loadImage(picFile, config, options["outDir"] is None)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        # Check the file will fit, as the GUI does.
+        # The size of a stream isn't known, so the embedding stops if it doesn't fit.
+        password = options["password"]
+        if stream is not None:
+            if not stegPic.embedStreamToImage(stream, options["payload"], None, password != "", password, options["codec"]):
+                result["error"] = "Failed to embed stream, or stream exceeds embedding capacity of image."
+            elif not stegPic.saveImage(outFile):
+                result["error"] = "Failed to save image."
+            else:
+                result["ok"] = True
+                result["output"] = outFile
+        elif embeddedDataSize(config, options) / stegPic.picBytes > config.MaxEmbedRatio:
+            result["error"] = f'File to embed would exceed allowed embedding ratio of {(config.MaxEmbedRatio * 100):.3f} %.'
+        else:
+            stegPic.toEmbedFilePath = options["payload"]
+            stegPic.toEmbedFileSize = options["payloadSize"]
+            stegPic.toEmbedCodec = options["codec"]
+            if not stegPic.embedFileToImage(password != "", password):
+                result["error"] = "Failed to embed file."
+            elif not stegPic.saveImage(outFile):
+                result["error"] = "Failed to save image."
+            else:
+                result["ok"] = True
+                result["output"] = outFile
+    finally:
+        stegPic.shutdown()
+
+    return result["ok"], result, resultText(result, "embedded file, saved to")
+
+# *******************************************
+# Embed file command.
+# *******************************************
+def embedFileCmd(args, config):
+
+    error = checkPassword(args.password)
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+    picFiles, outputs = findOutputImages(args)
+    if picFiles is None:
+        return EXIT_FAILED
+
+    # Embed from standard input.
+    if args.payload == "-":
+        options = {
+            "payload" : args.name,
+            "codec" : codecFromName(config.Compression),
+            "password" : args.password,
+            "outDir" : args.output,
+            "outputs" : outputs
+        }
+        return runStream(args, config, embedFileTask, options, sys.stdin.buffer)
+
+    if not os.path.isfile(args.payload):
+        sys.stderr.write(f'File to embed not found : {args.payload}\n')
+        return EXIT_FAILED
+
+    # If compressing, estimate the compressed size by sampling the file.
+    # Only compress if it makes the file smaller.
+    payloadSize = os.path.getsize(args.payload)
+    codec = codecFromName(config.Compression)
+    embedSize = payloadSize
+    if codec != Codec.CODEC_NONE.value:
+        codedSize = estimateCompressedSize(args.payload, payloadSize, codec)
+        if codedSize < payloadSize:
+            embedSize = codedSize
+        else:
+            codec = Codec.CODEC_NONE.value
+
+    options = {
+        "payload" : os.path.abspath(args.payload),
+        "payloadSize" : payloadSize,
+        "embedSize" : embedSize,
+        "codec" : codec,
+        "password" : args.password,
+        "outDir" : args.output,
+        "outputs" : outputs
+    }
+    results, numFailed = runImages(args, config, embedFileTask, options, picFiles)
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Embed archive task.
+# *******************************************
+def embedArchiveTask(picFile, config, options):
+
+    result = newResult("embed-archive", picFile)
+    outFile, error = options["outputs"][picFile]
+    if error != "":
+        result["error"] = error
+        return False, result, resultText(result, "")
+
+    stegPic = loadImage(picFile, config, options["outDir"] is None)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        # Check the files will fit, as for a single file.
+        password = options["password"]
+        embedData = archiveSize(options["names"], options["embedSizes"], len(password))
+        if embedData / stegPic.picBytes > config.MaxEmbedRatio:
+            result["error"] = f'Files to embed would exceed allowed embedding ratio of {(config.MaxEmbedRatio * 100):.3f} %.'
+        elif not stegPic.embedArchiveToImage(options["payloads"], password != "", password, options["codec"], options["names"]):
+            result["error"] = "Failed to embed files."
+        elif not stegPic.saveImage(outFile):
+            result["error"] = "Failed to save image."
+        else:
+            result["ok"] = True
+            result["output"] = outFile
+    finally:
+        stegPic.shutdown()
+
+    return result["ok"], result, resultText(result, "embedded archive, saved to")
+
+# *******************************************
+# Embed archive command.
+# *******************************************
+def embedArchiveCmd(args, config):
+
+    error = checkPassword(args.password)
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+    payloads = []
+    names = []
+    for payload, name in findArchiveFiles(args.files):
+        if not os.path.isfile(payload):
+            sys.stderr.write(f'File to embed not found : {payload}\n')
+            return EXIT_FAILED
+        if name in names:
+            sys.stderr.write(f'More than one file to embed named : {name}\n')
+            return EXIT_FAILED
+        payloads.append(os.path.abspath(payload))
+        names.append(name)
+    if len(payloads) == 0:
+        sys.stderr.write("No files to embed.\n")
+        return EXIT_FAILED
+    picFiles, outputs = findOutputImages(args)
+    if picFiles is None:
+        return EXIT_FAILED
+
+    # If compressing, estimate the compressed size of each file by sampling the file.
+    # Only compress if it makes the files smaller.
+    payloadSizes = [os.path.getsize(payload) for payload in payloads]
+    codec = codecFromName(config.Compression)
+    embedSizes = payloadSizes
+    if codec != Codec.CODEC_NONE.value:
+        codedSizes = [estimateCompressedSize(payload, size, codec) for payload, size in zip(payloads, payloadSizes)]
+        if sum(codedSizes) < sum(payloadSizes):
+            embedSizes = codedSizes
+        else:
+            codec = Codec.CODEC_NONE.value
+
+    options = {
+        "payloads" : payloads,
+        "names" : names,
+        "embedSizes" : embedSizes,
+        "codec" : codec,
+        "password" : args.password,
+        "outDir" : args.output,
+        "outputs" : outputs
+    }
+    results, numFailed = runImages(args, config, embedArchiveTask, options, picFiles)
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Embed conversation task.
+# *******************************************
+def embedConversationTask(picFile, config, options):
+
+    result = newResult("embed-conversation", picFile)
+    outFile, error = options["outputs"][picFile]
+    if error != "":
+        result["error"] = error
+        return False, result, resultText(result, "")
+
+    stegPic = loadImage(picFile, config, options["outDir"] is None)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        # Replace any conversation in the image.
+        stegPic.conversation.clearMessages()
+        for writer, msgText, msgTime in options["messages"]:
+            stegPic.conversation.addMsg(writer, msgText, msgTime)
+
+        # Check the conversation will fit, as the GUI does.
+        password = options["password"]
+        convLength = 0
+        for msg in stegPic.conversation.messages:
+            convLength += NUMSMSBYTES + NAMELENBYTES + blen(msg.writer) + TIMELENBYTES + blen(msg.msgTime) + SMSLENBYTES + blen(msg.msgText)
+        embedData = len(PROGCODE) + PASSWDYNBYTES + PASSWDLENBYTES + len(password) + CODETYPEBYTES + NUMSMSBYTES + convLength
+        if config.FormatVersion == V2VERSION:
+            embedData += tableLength(tableSlots(stegPic.conversation.numMessages()))
+        if embedData / stegPic.picBytes > config.MaxEmbedRatio:
+            result["error"] = "Conversation to embed would exceed allowed embedding ratio."
+        else:
+            stegPic.embedConversationIntoImage(password != "", password)
+            if not stegPic.saveImage(outFile):
+                result["error"] = "Failed to save image."
+            else:
+                result["ok"] = True
+                result["output"] = outFile
+    finally:
+        stegPic.shutdown()
+
+    return result["ok"], result, resultText(result, "embedded conversation, saved to")
+
+# *******************************************
+# Read conversation JSON file.
+# Returns list of (writer, text, time) messages.
+# *******************************************
+def readConversation(convFile):
+    with open(convFile, encoding="utf-8") as cf:
+        conversation = json.load(cf)
+    return [(str(msg["writer"]), str(msg["text"]), msg.get("time")) for msg in conversation]
+
+# *******************************************
+# Embed conversation command.
+# *******************************************
+def embedConversationCmd(args, config):
+
+    error = checkPassword(args.password)
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+    try:
+        messages = readConversation(args.conversation)
+    except Exception as e:
+        sys.stderr.write(f'Failed to read conversation : {args.conversation}; {str(e)}\n')
+        return EXIT_FAILED
+    picFiles, outputs = findOutputImages(args)
+    if picFiles is None:
+        return EXIT_FAILED
+
+    options = {
+        "messages" : messages,
+        "password" : args.password,
+        "outDir" : args.output,
+        "outputs" : outputs
+    }
+    results, numFailed = runImages(args, config, embedConversationTask, options, picFiles)
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Embed span task.
+# Embeds the part of the file planned for the image, read from its offset in the file.
+# *******************************************
+def embedSpanTask(picFile, config, options):
+
+    result = newResult("embed-span", picFile)
+    plan = options["plans"][picFile]
+    result["part"] = plan.span.partIndex + 1
+    outFile, error = options["outputs"][picFile]
+    if error != "":
+        result["error"] = error
+        return False, result, resultText(result, "")
+
+    stegPic = loadImage(picFile, config, options["outDir"] is None)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        password = options["password"]
+        with open(options["payload"], "rb") as cf:
+            cf.seek(plan.span.partOffset)
+            if not stegPic.embedStreamToImage(cf, options["name"], plan.size, password != "", password, Codec.CODEC_NONE.value, plan.span):
+                result["error"] = "Failed to embed part of file."
+            elif not stegPic.saveImage(outFile):
+                result["error"] = "Failed to save image."
+            else:
+                result["ok"] = True
+                result["output"] = outFile
+    except OSError as e:
+        result["error"] = str(e)
+    finally:
+        stegPic.shutdown()
+
+    return result["ok"], result, resultText(result, f'embedded part {result["part"]} of {plan.span.partCount}, saved to')
+
+# *******************************************
+# Embed span command.
+# The file is split into a part for each cover image, in the order the images are found,
+# and each part is embedded by its own task.
+# *******************************************
+def embedSpanCmd(args, config):
+
+    error = checkPassword(args.password)
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+    if not os.path.isfile(args.payload):
+        sys.stderr.write(f'File to embed not found : {args.payload}\n')
+        return EXIT_FAILED
+
+    # Parts are always embedded in a version 2 container, as its header says where the part fits.
+    config.FormatVersion = V2VERSION
+    name = os.path.basename(args.payload)
+    picFiles, outputs = findOutputImages(args)
+    if picFiles is None:
+        return EXIT_FAILED
+    try:
+        plans = planSpan(os.path.getsize(args.payload), picFiles, config.MaxEmbedRatio, len(args.password), name)
+    except SpanError as e:
+        sys.stderr.write(f'Failed to span file : {str(e)}\n')
+        return EXIT_FAILED
+
+    options = {
+        "payload" : os.path.abspath(args.payload),
+        "name" : name,
+        "plans" : {plan.picFile : plan for plan in plans},
+        "password" : args.password,
+        "outDir" : args.output,
+        "outputs" : outputs
+    }
+    results, numFailed = runImages(args, config, embedSpanTask, options, [plan.picFile for plan in plans])
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Watermark task.
+# Fills in the slots of the compiled payload with the values for the image, and embeds it.
+# *******************************************
+def watermarkTask(picFile, config, options):
+
+    result = newResult("watermark", picFile)
+    values = options["values"][picFile]
+    result["values"] = values
+    outFile, error = options["outputs"][picFile]
+    if error != "":
+        result["error"] = error
+        return False, result, resultText(result, "")
+
+    stegPic = loadImage(picFile, config, options["outDir"] is None)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        # Check the payload will fit, as for a file.
+        compiled = options["compiled"]
+        if len(compiled.data) / stegPic.picBytes > config.MaxEmbedRatio:
+            result["error"] = f'File to embed would exceed allowed embedding ratio of {(config.MaxEmbedRatio * 100):.3f} %.'
+        elif not stegPic.embedCompiledToImage(compiled, values):
+            result["error"] = "Failed to embed file."
+        elif not stegPic.saveImage(outFile):
+            result["error"] = "Failed to save image."
+        else:
+            result["ok"] = True
+            result["output"] = outFile
+    finally:
+        stegPic.shutdown()
+
+    return result["ok"], result, resultText(result, "watermarked, saved to")
+
+# *******************************************
+# Parse NAME=TEXT arguments into a dictionary.
+# Returns the dictionary, and error text, empty if all of the arguments could be parsed.
+# *******************************************
+def parseNamed(arguments, what):
+    named = {}
+    for argument in arguments or []:
+        name, sep, text = argument.partition("=")
+        if (sep == "") or (name == ""):
+            return named, f'Invalid {what}, must be NAME=TEXT : {argument}'
+        named[name] = text
+    return named, ""
+
+# *******************************************
+# Get the values of the slots for each image.
+# Values are from the rows of a CSV file if given, in the order of the images, otherwise from the templates.
+# Returns dictionary of values by slot name for each image, by image.
+# Raises ValueError if there are values missing for an image, or a template is invalid.
+# *******************************************
+def watermarkValues(picFiles, slotNames, templates, valuesFile, start):
+    rows = []
+    if valuesFile is not None:
+        with open(valuesFile, newline="", encoding="utf-8") as vf:
+            rows = list(csv.DictReader(vf))
+        if len(rows) < len(picFiles):
+            raise ValueError(f'Values for images : {len(rows)}; images : {len(picFiles)}')
+
+    values = {}
+    for index, picFile in enumerate(picFiles):
+        fields = {"n" : start + index, "stem" : os.path.splitext(os.path.basename(picFile))[0]}
+        imageValues = {}
+        for name in slotNames:
+            if (index < len(rows)) and (rows[index].get(name) is not None):
+                imageValues[name] = rows[index][name]
+            else:
+                try:
+                    imageValues[name] = templates.get(name, "{n}").format(**fields)
+                except (KeyError, IndexError, ValueError) as e:
+                    raise ValueError(f'Invalid template for slot : {name}; {str(e)}')
+        values[picFile] = imageValues
+    return values
+
+# *******************************************
+# Watermark command.
+# The file is compiled into the data to embed once, and each image only fills in its slots
+# and writes the data into its pixels.
+# *******************************************
+def watermarkCmd(args, config):
+
+    error = checkPassword(args.password)
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+    if not os.path.isfile(args.payload):
+        sys.stderr.write(f'File to embed not found : {args.payload}\n')
+        return EXIT_FAILED
+    slots, error = parseNamed(args.slots, "slot")
+    if error == "":
+        templates, error = parseNamed(args.templates, "value")
+    if (error == "") and (len(set(templates) - set(slots)) > 0):
+        error = f'Values given for slots not declared : {", ".join(sorted(set(templates) - set(slots)))}'
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+
+    payload = os.path.abspath(args.payload)
+    try:
+        compiled = compilePayload(payload, payload, slots, config.FormatVersion, args.password != "", args.password)
+    except (CompiledPayloadError, OSError) as e:
+        sys.stderr.write(f'Failed to compile file : {str(e)}\n')
+        return EXIT_FAILED
+    logger.debug(f'Compiled payload : {compiled}')
+
+    picFiles, outputs = findOutputImages(args)
+    if picFiles is None:
+        return EXIT_FAILED
+    try:
+        values = watermarkValues(picFiles, list(slots), templates, args.values, args.start)
+        for imageValues in values.values():
+            compiled.checkValues(imageValues)
+    except (ValueError, OSError, csv.Error, CompiledPayloadError) as e:
+        sys.stderr.write(f'Failed to get values of slots : {str(e)}\n')
+        return EXIT_FAILED
+
+    options = {
+        "compiled" : compiled,
+        "values" : values,
+        "outDir" : args.output,
+        "outputs" : outputs
+    }
+    results, numFailed = runImages(args, config, watermarkTask, options, picFiles)
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Extract task.
+# Embedded files and conversations are saved in a directory for each image, named by the
+# name of the image from the path that found it, conversations as a JSON file that can be embedded again.
+# If a stream is given they are written to it instead.
+# *******************************************
+def extractTask(picFile, config, options, stream=None):
+
+    result = newResult("extract", picFile)
+    stegPic = loadImage(picFile, config)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        outDir = options["outDirs"].get(picFile)
+        if not stegPic.picCoded:
+            result["error"] = "Image is not picCoded."
+        elif stegPic.picPassword and (options["password"] != stegPic.password):
+            result["error"] = "Incorrect password."
+        elif (stream is not None) and (stegPic.picCodeType == CodeType.CODETYPE_FILE.value):
+            if stegPic.writeEmbeddedFile(stream):
+                stream.flush()
+                result["ok"] = True
+                result["output"] = "-"
+            else:
+                result["error"] = "Failed to extract file."
+        elif stegPic.picCodeType == CodeType.CODETYPE_FILE.value:
+            # Only use the name of the embedded file, never its path.
+            fileName = stegPic.embeddedFileName
+            if fileName in ("", ".", ".."):
+                fileName = "embedded.bin"
+            outFile = os.path.join(outDir, fileName)
+            os.makedirs(outDir, exist_ok=True)
+            if stegPic.saveEmbeddedFile(outFile):
+                result["ok"] = True
+                result["output"] = outFile
+            else:
+                result["error"] = "Failed to extract file."
+                if os.path.exists(outFile):
+                    os.remove(outFile)
+        elif stegPic.picCodeType == CodeType.CODETYPE_ARCHIVE.value:
+            extractArchive(stegPic, outDir, options["members"], stream, result)
+        elif stegPic.picCodeType == CodeType.CODETYPE_SPAN.value:
+            result["error"] = "Image holds part of a spanned file, use extract-span."
+        elif stegPic.picCodeType == CodeType.CODETYPE_TEXT.value:
+            conversation = [{"writer" : msg.writer, "time" : msg.msgTime, "text" : msg.msgText} for msg in stegPic.conversation.messages]
+            convText = json.dumps(conversation, indent=4, ensure_ascii=False)
+            if stream is not None:
+                stream.write(convText.encode("utf-8"))
+                stream.flush()
+                outFile = "-"
+            else:
+                outFile = os.path.join(outDir, "conversation.json")
+                os.makedirs(outDir, exist_ok=True)
+                with open(outFile, "w", encoding="utf-8") as cf:
+                    cf.write(convText)
+            result["ok"] = True
+            result["output"] = outFile
+        else:
+            result["error"] = "Unknown embedded data type."
+    except OSError as e:
+        result["error"] = str(e)
+    finally:
+        stegPic.shutdown()
+
+    return result["ok"], result, resultText(result, "extracted to")
+
+# *******************************************
+# Extract files from an embedded archive, all of them or only the given members.
+# Each file is read straight from its offset in the archive.
+# If a stream is given the only member given is written to it.
+# Updates the result.
+# *******************************************
+def extractArchive(stegPic, outDir, memberNames, stream, result):
+
+    # Get the members to extract.
+    if memberNames is None:
+        members = stegPic.archiveMembers
+    else:
+        byName = {member.name : member for member in stegPic.archiveMembers}
+        missing = [name for name in memberNames if name not in byName]
+        if len(missing) > 0:
+            result["error"] = f'Archive has no file : {missing[0]}'
+            return
+        members = [byName[name] for name in memberNames]
+
+    if stream is not None:
+        if len(members) != 1:
+            result["error"] = "Give one archive file (--member) to extract to standard output."
+        elif stegPic.writeEmbeddedFile(stream, members[0]):
+            stream.flush()
+            result["ok"] = True
+            result["output"] = "-"
+        else:
+            result["error"] = f'Failed to extract file : {members[0].name}'
+        return
+
+    outFiles = []
+    for member in members:
+        outFile = safeExtractPath(outDir, member.name)
+        if outFile is None:
+            outFile = os.path.join(outDir, "embedded.bin")
+        os.makedirs(os.path.dirname(outFile), exist_ok=True)
+        if not stegPic.saveEmbeddedFile(outFile, member):
+            result["error"] = f'Failed to extract file : {member.name}'
+            if os.path.exists(outFile):
+                os.remove(outFile)
+            return
+        outFiles.append(outFile)
+    result["ok"] = True
+    result["output"] = outDir
+    result["files"] = outFiles
+
+# *******************************************
+# List task.
+# The archive index is read from the image, none of the files are read.
+# *******************************************
+def listTask(picFile, config, options):
+
+    result = newResult("list", picFile)
+    stegPic = loadImage(picFile, config)
+    if stegPic is None:
+        result["error"] = "Image could not be read."
+        return False, result, resultText(result, "")
+
+    try:
+        if stegPic.picCodeType != CodeType.CODETYPE_ARCHIVE.value:
+            result["error"] = "Image does not have an embedded archive."
+            return False, result, resultText(result, "")
+        result["ok"] = True
+        result["members"] = [{"name" : member.name, "size" : member.size, "codedSize" : member.codedSize} for member in stegPic.archiveMembers]
+    finally:
+        stegPic.shutdown()
+
+    lines = [f'{picFile} : embedded archive : {len(stegPic.archiveMembers)} files']
+    lines += [f'  {member.name} : {member.size:,} Bytes' for member in stegPic.archiveMembers]
+    return True, result, "\n".join(lines)
+
+# *******************************************
+# List command.
+# *******************************************
+def listCmd(args, config):
+    results, numFailed = runImages(args, config, listTask, {})
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Extract command.
+# *******************************************
+def extractCmd(args, config):
+    options = {
+        "password" : args.password,
+        "members" : args.member,
+        "outDirs" : {}
+    }
+
+    # Extract to standard output.
+    if args.dataToStdout:
+        return runStream(args, config, extractTask, options, sys.stdout.buffer)
+
+    # The directory of each image keeps the extension of the image, as images of different types can have the same name.
+    picFiles, outputs, error = findOutputs(args.paths, lambda picFile, name: (os.path.join(args.output, name), ""))
+    if error != "":
+        sys.stderr.write(error + "\n")
+        return EXIT_FAILED
+    options["outDirs"] = {picFile : outDir for picFile, (outDir, error) in outputs.items()}
+    os.makedirs(args.output, exist_ok=True)
+    results, numFailed = runImages(args, config, extractTask, options, picFiles)
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Extract span part task.
+# Reads the part of a spanned file embedded in an image.
+# Returns success flag, and the part or error text.
+# *******************************************
+def extractSpanPartTask(part, config, password):
+
+    stegPic = loadImage(part.picFile, config)
+    if stegPic is None:
+        return False, f'Image could not be read : {part.picFile}'
+
+    try:
+        if (not stegPic.picCoded) or (stegPic.picCodeType != CodeType.CODETYPE_SPAN.value):
+            return False, f'Image does not hold part of a spanned file : {part.picFile}'
+        if stegPic.picPassword and (password != stegPic.password):
+            return False, f'Incorrect password : {part.picFile}'
+        partData = io.BytesIO()
+        if (not stegPic.writeEmbeddedFile(partData)) or (partData.tell() != part.embeddedFileSize):
+            return False, f'Failed to extract part : {part.spanIndex + 1}; from : {part.picFile}'
+        return True, partData.getvalue()
+    finally:
+        stegPic.shutdown()
+
+# *******************************************
+# Join the parts of a spanned file, writing them to a stream in part order.
+# Parts are read in a pool of processes if given, a window of parts at a time.
+# Returns error text, or empty string if all of the file was written.
+# *******************************************
+def joinSpanParts(spanSet, config, password, pool, window, stream):
+    for ok, partData in orderedResults(pool, extractSpanPartTask, spanSet.orderedParts(), window, config, password):
+        if not ok:
+            return partData
+        stream.write(partData)
+    stream.flush()
+    return ""
+
+# *******************************************
+# Extract span command.
+# Images are probed for the parts of spanned files, which are then joined into the files.
+# Each file is saved in the output directory, by the name it was embedded with.
+# *******************************************
+def extractSpanCmd(args, config):
+
+    picFiles = list(findImageFiles(args.paths))
+    if args.jobs > 1:
+        # Parts are already read in parallel, so don't read each image in parallel too.
+        config.ParallelProcesses = 0
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = None
+
+    results = []
+    numFailed = 0
+    try:
+        with openProbeIndex(args, config) as index:
+            spanSets = groupSpanParts(probeImages(index, picFiles, pool, 4 * args.jobs))
+        if args.dataToStdout and (len(spanSets) != 1):
+            sys.stderr.write(f'Extracting to standard output needs exactly one spanned file, found : {len(spanSets)}\n')
+            return EXIT_FAILED
+        if not args.dataToStdout:
+            os.makedirs(args.output, exist_ok=True)
+
+        for spanSet in spanSets.values():
+            result = {
+                "setId" : spanSet.setId,
+                "command" : "extract-span",
+                "ok" : False,
+                "error" : spanSet.checkComplete(),
+                "output" : "",
+                "parts" : []
+            }
+            if result["error"] == "":
+                result["parts"] = [part.picFile for part in spanSet.orderedParts()]
+                if args.dataToStdout:
+                    result["error"] = joinSpanParts(spanSet, config, args.password, pool, 2 * args.jobs, sys.stdout.buffer)
+                    outFile = "-"
+                else:
+                    # Only use the name of the spanned file, never its path.
+                    fileName = spanSet.fileName
+                    if fileName in ("", ".", ".."):
+                        fileName = "embedded.bin"
+                    outFile = os.path.join(args.output, fileName)
+                    try:
+                        with open(outFile, "wb") as cf:
+                            result["error"] = joinSpanParts(spanSet, config, args.password, pool, 2 * args.jobs, cf)
+                    except OSError as e:
+                        result["error"] = str(e)
+                    if (result["error"] != "") and os.path.exists(outFile):
+                        os.remove(outFile)
+                if result["error"] == "":
+                    result["ok"] = True
+                    result["output"] = outFile
+            if not result["ok"]:
+                numFailed += 1
+            results.append(result)
+            if result["ok"]:
+                text = f'{spanSet.fileName} : joined {spanSet.partCount} parts, saved to {result["output"]}'
+            else:
+                text = f'{spanSet.fileName} : failed, {result["error"]}'
+            writeResult(args, result, text)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if len(results) == 0:
+        sys.stderr.write("No parts of spanned files found.\n")
+    return exitCode(results, numFailed)
+
+# *******************************************
+# Create command line parser.
+# *******************************************
+def createParser():
+    parser = argparse.ArgumentParser(prog="picCoderCli", description="picCoder steganography command line.")
+    parser.add_argument("--config", default="picCoder.json", help="configuration file (default: picCoder.json)")
+    parser.add_argument("--json", action="store_true", help="write results as JSON lines")
+    parser.add_argument("--jobs", type=int, default=1, help="number of images to process at a time (default: 1)")
+    parser.add_argument("--no-index", dest="noIndex", action="store_true", help="don't use or update the probe index of images")
+    parser.add_argument("--compression", choices=list(CODECNAMES.keys()), default=None, help="compression of embedded data (default: Compression from configuration)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    probe = commands.add_parser("probe", help="report if images are picCoded, and what is embedded")
+    probe.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    probe.set_defaults(func=probeCmd)
+
+    find = commands.add_parser("find", help="report picCoded images seen before, from the probe index")
+    find.add_argument("--type", choices=list(FINDCODETYPES.keys()), default=None, help="only report images with this type of embedded data")
+    find.set_defaults(func=findCmd)
+
+    scan = commands.add_parser("scan", help="report picCoded images in directory trees, as they are found")
+    scan.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    scan.add_argument("--all", action="store_true", help="report all images, not only picCoded images")
+    scan.set_defaults(func=scanCmd)
+
+    index = commands.add_parser("index", help="index the messages of conversations embedded in images, for searching")
+    index.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    index.add_argument("--password", default="", help="password of password protected conversations")
+    index.add_argument("--all", action="store_true", help="report all conversations, not only those indexed again")
+    index.set_defaults(func=indexCmd)
+
+    search = commands.add_parser("search", help="search the messages of indexed conversations")
+    search.add_argument("text", help="words to find, or a phrase in double quotes, a word ending in * matches words starting with it")
+    search.add_argument("--password", default="", help="password of password protected conversations")
+    search.add_argument("--writer", default=None, help="only find messages by this writer")
+    search.add_argument("--limit", type=int, default=SEARCHLIMIT, help=f'maximum number of messages to report (default: {SEARCHLIMIT})')
+    search.set_defaults(func=searchCmd)
+
+    capacity = commands.add_parser("capacity", help="report dimensions and embedding capacity of cover images")
+    capacity.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    capacity.add_argument("--ratio", type=float, default=None, help="maximum embedding ratio (default: MaxEmbedRatio from configuration)")
+    capacity.set_defaults(func=capacityCmd)
+
+    embedFile = commands.add_parser("embed-file", aliases=["embed"], help="embed a file into cover images")
+    embedFile.add_argument("payload", help="file to embed, or - for standard input")
+    embedFile.add_argument("paths", nargs="+", help="cover image files, directories or glob patterns")
+    addOutputArguments(embedFile)
+    embedFile.add_argument("--password", default="", help=f'password to embed ({PASSWDMINIMUM}-{PASSWDMAXIMUM} characters)')
+    embedFile.add_argument("--name", default="stdin", help="file name to embed for standard input (default: stdin)")
+    embedFile.set_defaults(func=embedFileCmd)
+
+    embedArchive = commands.add_parser("embed-archive", help="embed files into cover images as an archive")
+    embedArchive.add_argument("-f", "--file", dest="files", action="append", required=True, help="file, or directory of files, to embed (can be given more than once)")
+    embedArchive.add_argument("paths", nargs="+", help="cover image files, directories or glob patterns")
+    addOutputArguments(embedArchive)
+    embedArchive.add_argument("--password", default="", help=f'password to embed ({PASSWDMINIMUM}-{PASSWDMAXIMUM} characters)')
+    embedArchive.set_defaults(func=embedArchiveCmd)
+
+    embedConversation = commands.add_parser("embed-conversation", help="embed a conversation into cover images")
+    embedConversation.add_argument("conversation", help="conversation JSON file to embed")
+    embedConversation.add_argument("paths", nargs="+", help="cover image files, directories or glob patterns")
+    addOutputArguments(embedConversation)
+    embedConversation.add_argument("--password", default="", help=f'password to embed ({PASSWDMINIMUM}-{PASSWDMAXIMUM} characters)')
+    embedConversation.set_defaults(func=embedConversationCmd)
+
+    embedSpan = commands.add_parser("embed-span", help="embed a file into several cover images, a part in each")
+    embedSpan.add_argument("payload", help="file to embed")
+    embedSpan.add_argument("paths", nargs="+", help="cover image files, directories or glob patterns, used in order until the file is embedded")
+    addOutputArguments(embedSpan)
+    embedSpan.add_argument("--password", default="", help=f'password to embed ({PASSWDMINIMUM}-{PASSWDMAXIMUM} characters)')
+    embedSpan.set_defaults(func=embedSpanCmd)
+
+    watermark = commands.add_parser("watermark", help="embed a file into cover images, with values such as a serial number filled in for each")
+    watermark.add_argument("payload", help="file to embed")
+    watermark.add_argument("paths", nargs="+", help="cover image files, directories or glob patterns")
+    addOutputArguments(watermark)
+    watermark.add_argument("--password", default="", help=f'password to embed ({PASSWDMINIMUM}-{PASSWDMAXIMUM} characters)')
+    watermark.add_argument("--slot", dest="slots", action="append", required=True, help="NAME=PLACEHOLDER, text in the file to replace in each image (can be given more than once)")
+    watermark.add_argument("--value", dest="templates", action="append", default=None, help="NAME=TEMPLATE, value of a slot, with {n} the number of the image and {stem} its name (default: {n})")
+    watermark.add_argument("--values", default=None, help="CSV file of values, a row for each image in order, with a header row of slot names")
+    watermark.add_argument("--start", type=int, default=1, help="number of the first image, for {n} (default: 1)")
+    watermark.set_defaults(func=watermarkCmd)
+
+    listArchive = commands.add_parser("list", help="list the files in embedded archives")
+    listArchive.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    listArchive.set_defaults(func=listCmd)
+
+    extract = commands.add_parser("extract", help="extract embedded files and conversations from images")
+    extract.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    extract.add_argument("-o", "--output", required=True, help="directory to extract to, a directory is created for each image, by its path from the path that found it, or - for standard output")
+    extract.add_argument("--password", default="", help="password of password protected images")
+    extract.add_argument("--member", action="append", default=None, help="only extract this file of an embedded archive (can be given more than once)")
+    extract.set_defaults(func=extractCmd)
+
+    extractSpan = commands.add_parser("extract-span", help="join the parts of spanned files embedded in images")
+    extractSpan.add_argument("paths", nargs="+", help="image files, directories or glob patterns, in any order")
+    extractSpan.add_argument("-o", "--output", required=True, help="directory to save joined files to, or - for standard output")
+    extractSpan.add_argument("--password", default="", help="password of password protected images")
+    extractSpan.set_defaults(func=extractSpanCmd)
+
+    return parser
+
+# *******************************************
+# Add arguments for where embedding commands write picCoded images.
+# Images are saved to an output directory, or uncompressed images can be written in place.
+# *******************************************
+def addOutputArguments(command):
+    output = command.add_mutually_exclusive_group(required=True)
+    output.add_argument("-o", "--output", help="directory to save picCoded images to, by their paths from the paths that found them")
+    output.add_argument("--in-place", action="store_true", help=f'write straight into the cover images, only {", ".join(MAPPEDIMAGES)} images, '
+                        'an image is left partly written if embedding into it fails')
+
+# *******************************************
+# Main entry point.
+# *******************************************
+def main(argv=None):
+    parser = createParser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    # Standard output is only used for data when extracting to it.
+    args.dataToStdout = (args.command in ("extract", "extract-span")) and (args.output == "-")
+
+    # Configuration reports on stdout, keep it out of the results.
+    with contextlib.redirect_stdout(sys.stderr):
+        config = Config(args.config)
+    if args.compression is not None:
+        config.Compression = args.compression
+
+    return args.func(args, config)
+
+if __name__ == '__main__':
+    sys.exit(main())
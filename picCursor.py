@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# *******************************************
+# Image data cursor.
+#
+# Embedded data is stored bit by bit by ROW, then by COLUMN, then by colour plane,
+# then by colour bit starting with the LSB (see steganography.py).
+# So each bit of embedded data has a linear bit position in the image:
+#
+#   position = ((bit * planes + plane) * height + row) * width + col
+#
+# and each byte of embedded data, at byte offset from the start of the embedded data,
+# starts at bit position (offset * 8).
+#
+# The cursor maps directly between byte offsets, bit positions and image
+# read / write pointers (row, column, colour plane, colour bit),
+# so any part of the embedded data can be read without reading everything before it.
+# *******************************************
+
+# *******************************************
+# Image data cursor class.
+# *******************************************
+class PicCursor():
+    def __init__(self, width, height, planes=3):
+
+        self.width = width
+        self.height = height
+        self.planes = planes
+
+        # Total number of bit positions and whole bytes that can be held in the image.
+        self.maxBits = width * height * planes * 8
+        self.maxBytes = self.maxBits // 8
+
+    # *******************************************
+    # Convert image read / write pointers to a linear bit position.
+    # *******************************************
+    def toPosition(self, row, col, plane, bit):
+        return ((bit * self.planes + plane) * self.height + row) * self.width + col
+
+    # *******************************************
+    # Convert a linear bit position to image read / write pointers.
+    # Returns row, column, colour plane and colour bit.
+    # *******************************************
+    def fromPosition(self, position):
+        rest, col = divmod(position, self.width)
+        rest, row = divmod(rest, self.height)
+        bit, plane = divmod(rest, self.planes)
+        return row, col, plane, bit
+
+    # *******************************************
+    # Convert a byte offset into the embedded data to image read / write pointers.
+    # Returns row, column, colour plane and colour bit.
+    # *******************************************
+    def fromOffset(self, byteOffset):
+        return self.fromPosition(byteOffset * 8)
+
+    # *******************************************
+    # Convert image read / write pointers to a byte offset into the embedded data.
+    # Pointers must be on a byte boundary.
+    # *******************************************
+    def toOffset(self, row, col, plane, bit):
+        byteOffset, extraBits = divmod(self.toPosition(row, col, plane, bit), 8)
+        if extraBits != 0:
+            raise ValueError(f'Image pointers not on a byte boundary, extra bits : {extraBits}')
+        return byteOffset
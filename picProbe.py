@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+
+from constants import *
+from container import *
+from mappedImage import *
+from picCursor import *
+from payloadCodec import *
+from pngStream import *
+from utils import *
+
+# *******************************************
+# Header-only probe of picCoded images.
+#
+# The picCoder header is at the start of the embedded data, so for any image of
+# reasonable size it is held in the least significant bit of the red colour plane
+# of the first few rows of the image.
+# The probe streams the PNG file and only decodes the rows needed to read the header,
+# so takes the same time regardless of the size of the image.
+# Uncompressed images are mapped, so only the pages holding the rows needed are read.
+# *******************************************
+
+# *******************************************
+# Probe result class.
+# *******************************************
+class ProbeResult():
+    def __init__(self, picFile):
+
+        self.picFile = picFile
+
+        # Image details.
+        self.readable = False
+        self.supported = False
+        self.width = 0
+        self.height = 0
+
+        # Embedded data details.
+        self.picCoded = False
+        self.picCodeType = CodeType.CODETYPE_NONE.value
+        self.picPassword = False
+        self.codec = Codec.CODEC_NONE.value
+        self.embeddedFilePath = ""
+        self.embeddedFileName = ""
+        self.embeddedFileSize = 0
+        self.numMessages = 0
+        self.numMembers = 0
+
+        # Part of a file spanning several images.
+        self.spanSetId = ""
+        self.spanIndex = 0
+        self.spanCount = 0
+        self.spanOffset = 0
+        self.spanTotalSize = 0
+
+    # *******************************************
+    # Return probe result as a dictionary, e.g. for reporting.
+    # *******************************************
+    def asDict(self):
+        return {
+            "file" : self.picFile,
+            "readable" : self.readable,
+            "supported" : self.supported,
+            "width" : self.width,
+            "height" : self.height,
+            "coded" : self.picCoded,
+            "codeType" : self.picCodeType,
+            "password" : self.picPassword,
+            "codec" : codecName(self.codec),
+            "embeddedName" : self.embeddedFileName,
+            "embeddedSize" : self.embeddedFileSize,
+            "numMessages" : self.numMessages,
+            "numMembers" : self.numMembers,
+            "spanSetId" : self.spanSetId,
+            "spanIndex" : self.spanIndex,
+            "spanCount" : self.spanCount,
+            "spanOffset" : self.spanOffset,
+            "spanTotalSize" : self.spanTotalSize
+        }
+
+    # *******************************************
+    # Overriding print() output.
+    # *******************************************
+    def __str__(self):
+        return(
+            f'File : {self.picFile}\n'
+            f'Coded : {self.picCoded}; code type : {self.picCodeType}; password : {self.picPassword}\n'
+            f'Embedded file : {self.embeddedFileName}; size : {self.embeddedFileSize}; messages : {self.numMessages}; archive files : {self.numMembers}\n'
+            f'Span set : {self.spanSetId}; part : {self.spanIndex}; of : {self.spanCount}\n'
+        )
+
+# *******************************************
+# Capacity probe result class.
+# *******************************************
+class CapacityResult():
+    def __init__(self, picFile):
+
+        self.picFile = picFile
+
+        # Image details, from the PNG header only.
+        self.readable = False
+        self.supported = False
+        self.reason = ""
+        self.width = 0
+        self.height = 0
+        self.bitDepth = 0
+        self.colourType = 0
+        self.interlace = 0
+
+        # Approximate embedding capacity (Bytes).
+        self.capacity = 0
+
+    # *******************************************
+    # Return capacity result as a dictionary, e.g. for reporting.
+    # *******************************************
+    def asDict(self):
+        return {
+            "file" : self.picFile,
+            "readable" : self.readable,
+            "supported" : self.supported,
+            "reason" : self.reason,
+            "width" : self.width,
+            "height" : self.height,
+            "bitDepth" : self.bitDepth,
+            "colourType" : self.colourType,
+            "interlace" : self.interlace,
+            "capacity" : self.capacity
+        }
+
+# *******************************************
+# Reader of embedded data from the rows of a PNG stream.
+# Rows are decoded as they are needed, and kept in case the data wraps
+# around into the next colour plane (only possible for tiny images).
+# *******************************************
+class ProbeReader():
+    def __init__(self, png):
+
+        self.png = png
+        self.cursor = PicCursor(png.width, png.height, 3)
+        self.rows = []
+        self.offset = 0
+
+    # *******************************************
+    # Get a decoded row of the image.
+    # *******************************************
+    def getRow(self, row):
+        while len(self.rows) <= row:
+            self.rows.append(self.png.readRow())
+        return self.rows[row]
+
+    # *******************************************
+    # Read bytes of embedded data, continuing from where we left off.
+    # Returns the bytes, or None if the image isn't big enough.
+    # *******************************************
+    def read(self, bytesToRead):
+        if (self.offset + bytesToRead) > self.cursor.maxBytes:
+            return None
+        channels = self.png.channels()
+        codeBytes = bytearray()
+        position = self.offset * 8
+        for idx in range(bytesToRead):
+            codeData = 0
+            for bitCnt in range(0, 8):
+                row, col, plane, bit = self.cursor.fromPosition(position)
+                colPart = self.getRow(row)[col * channels + plane]
+                codeData = (codeData << 1) | ((colPart >> bit) & 1)
+                position += 1
+            codeBytes.append(codeData)
+        self.offset += bytesToRead
+        return bytes(codeBytes)
+
+    # *******************************************
+    # Read a zero-padded ASCII decimal field of embedded data.
+    # Returns the value, or None if the field isn't a number.
+    # *******************************************
+    def readNumber(self, bytesToRead):
+        field = self.read(bytesToRead)
+        try:
+            return int(field.decode('utf-8'))
+        except Exception:
+            return None
+
+    # *******************************************
+    # Read a UTF-8 text field of embedded data.
+    # Returns the text, or None if the field isn't text.
+    # *******************************************
+    def readText(self, bytesToRead):
+        field = self.read(bytesToRead)
+        try:
+            return field.decode('utf-8')
+        except Exception:
+            return None
+
+# *******************************************
+# Probe image file for picCoder header.
+# Only decodes the rows of the image needed to read the header.
+# Returns probe result.
+# *******************************************
+def probeImage(picFile):
+
+    result = ProbeResult(picFile)
+
+    # Only PNG and uncompressed images are supported.
+    if os.path.splitext(picFile)[1].lower() not in ONLYIMAGES:
+        return result
+
+    try:
+        with openImageStream(picFile) as png:
+            result.readable = True
+            result.width = png.width
+            result.height = png.height
+            # Any PNG image is supported, as it is converted to 32-bit pixels for embedding.
+            # picCoded images are always saved as 8-bit RGB / RGBA, so images the stream can't decode aren't picCoded.
+            result.supported = True
+            if not png.isDecodable():
+                return result
+
+            reader = ProbeReader(png)
+
+            # Check for the header code.
+            # A version 2 container has its own magic and binary header.
+            progCode = reader.read(len(PROGCODE))
+            if progCode == V2MAGIC:
+                probeContainer(reader, result)
+                return result
+            if (progCode is None) or (progCode != PROGCODE.encode('utf-8')):
+                return result
+            result.picCoded = True
+
+            # Check for password protection, and skip over the password.
+            passworded = reader.readNumber(PASSWDYNBYTES)
+            pwdLen = reader.readNumber(PASSWDLENBYTES)
+            if (passworded is None) or (pwdLen is None) or (reader.read(pwdLen) is None):
+                return result
+            result.picPassword = bool(passworded)
+
+            # Get the embedded data type.
+            codeType = reader.readNumber(CODETYPEBYTES)
+            if codeType is None:
+                return result
+
+            # Compressed data has the codec next, otherwise is the same as uncompressed data.
+            if codeType in (CodeType.CODETYPE_ZFILE.value, CodeType.CODETYPE_ZTEXT.value):
+                codec = reader.readNumber(CODECBYTES)
+                if codec is None:
+                    return result
+                result.codec = codec
+                if codeType == CodeType.CODETYPE_ZFILE.value:
+                    codeType = CodeType.CODETYPE_FILE.value
+                else:
+                    codeType = CodeType.CODETYPE_TEXT.value
+            result.picCodeType = codeType
+
+            # Embedded file, get the file name and size.
+            if codeType == CodeType.CODETYPE_FILE.value:
+                nameLen = reader.readNumber(NAMELENBYTES)
+                if nameLen is not None:
+                    filePath = reader.readText(nameLen)
+                    if filePath is not None:
+                        result.embeddedFilePath = filePath
+                        head, result.embeddedFileName = os.path.split(filePath)
+                        fileSize = reader.readNumber(LENBYTES)
+                        if fileSize is not None:
+                            result.embeddedFileSize = fileSize
+
+            # Embedded conversation, get the number of messages.
+            elif codeType == CodeType.CODETYPE_TEXT.value:
+                numMsgs = reader.readNumber(NUMSMSBYTES)
+                if numMsgs is not None:
+                    result.numMessages = numMsgs
+
+    except (OSError, ValueError, PngError, MappedImageError, zlib.error):
+        # Not a readable image, so can't be picCoded.
+        result.supported = False
+
+    return result
+
+# *******************************************
+# Open image file to read rows from, streamed for PNG images or mapped for uncompressed images.
+# *******************************************
+def openImageStream(picFile):
+    if isMappedImage(picFile):
+        return MappedImage(picFile)
+    return PngStream(picFile)
+
+# *******************************************
+# Probe the header of a version 2 container, following the magic.
+# Updates the probe result.
+# *******************************************
+def probeContainer(reader, result):
+    try:
+        header = readHeader(reader.read)
+    except ContainerError:
+        return
+    result.picCoded = True
+    result.picPassword = header.passworded
+    result.picCodeType = header.codeType
+    result.codec = header.codec
+    if header.codeType in (CodeType.CODETYPE_FILE.value, CodeType.CODETYPE_SPAN.value):
+        result.embeddedFilePath = header.filePath
+        head, result.embeddedFileName = os.path.split(header.filePath)
+        result.embeddedFileSize = header.dataSize
+        if header.span is not None:
+            result.spanSetId = header.span.setId.hex()
+            result.spanIndex = header.span.partIndex
+            result.spanCount = header.span.partCount
+            result.spanOffset = header.span.partOffset
+            result.spanTotalSize = header.span.totalSize
+    elif header.codeType == CodeType.CODETYPE_TEXT.value:
+        result.numMessages = header.numMessages
+    elif header.codeType == CodeType.CODETYPE_ARCHIVE.value:
+        result.numMembers = header.numMessages
+
+# *******************************************
+# Probe image file for dimensions and embedding capacity.
+# Only reads the PNG signature and header chunk, or the header of an uncompressed image, no image data is decoded.
+# Images of any PNG colour type and bit depth are supported as cover images, as they are
+# converted to 32-bit pixels for embedding, so the capacity is that of the converted image.
+# Returns capacity result.
+# *******************************************
+def probeCapacity(picFile, maxEmbedRatio):
+
+    result = CapacityResult(picFile)
+
+    # Only PNG and uncompressed images are supported.
+    if os.path.splitext(picFile)[1].lower() not in ONLYIMAGES:
+        result.reason = "Image type not supported."
+        return result
+
+    # Uncompressed images that can be mapped are always supported, described as the equivalent PNG.
+    if isMappedImage(picFile):
+        try:
+            with MappedImage(picFile) as mapped:
+                result.width = mapped.width
+                result.height = mapped.height
+                result.bitDepth = 8
+                result.colourType = PNGCOLOUR_RGBA if mapped.hasAlpha else PNGCOLOUR_RGB
+                result.interlace = 0
+                result.readable = True
+        except (OSError, ValueError, MappedImageError) as e:
+            result.reason = str(e)
+            return result
+        result.supported = True
+        result.capacity = calcCapacity(result.width, result.height, maxEmbedRatio)
+        return result
+
+    try:
+        with PngStream(picFile) as png:
+            result.width = png.width
+            result.height = png.height
+            result.bitDepth = png.bitDepth
+            result.colourType = png.colourType
+            result.interlace = png.interlace
+            result.readable = True
+            channels = png.channels()
+    except (OSError, PngError) as e:
+        result.reason = str(e)
+        return result
+
+    # Reject colour types that aren't PNG colour types, as the image can't be decoded.
+    if channels == 0:
+        result.reason = f'Unsupported colour type : {result.colourType}; bit depth : {result.bitDepth}'
+        return result
+
+    result.supported = True
+    result.capacity = calcCapacity(result.width, result.height, maxEmbedRatio)
+    return result
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+
+# *******************************************
+# Double buffered file I/O stages.
+#
+# Reading a file to embed and writing an extracted file are run on their own
+# threads, joined to the encode / decode stage by bounded queues, so that
+# disk (or network) I/O is overlapped with the bit encoding / decoding.
+# The queue depth bounds the number of chunks held in memory at a time.
+# *******************************************
+
+# Marker for the end of the chunks in a queue.
+ENDOFCHUNKS = None
+
+# *******************************************
+# Read a file in chunks, without read ahead.
+# Yields chunks of up to chunkSize bytes, until bytesToRead bytes have been read.
+# If bytesToRead is None, e.g. for a pipe, reads until the end of the file.
+# *******************************************
+def readChunks(rf, bytesToRead, chunkSize):
+    while (bytesToRead is None) or (bytesToRead > 0):
+        chunk = rf.read(chunkSize if bytesToRead is None else min(bytesToRead, chunkSize))
+        if len(chunk) == 0:
+            break
+        if bytesToRead is not None:
+            bytesToRead -= len(chunk)
+        yield chunk
+
+# *******************************************
+# Read ahead stage class.
+# Reads chunks of a file on a separate thread, ahead of them being used.
+# Iterate over the object to get the chunks in order.
+# As for readChunks, if bytesToRead is None reads until the end of the file.
+# *******************************************
+class ReadAhead():
+    def __init__(self, rf, bytesToRead, chunkSize, depth):
+
+        self.rf = rf
+        self.bytesToRead = bytesToRead
+        self.chunkSize = chunkSize
+        self.chunks = queue.Queue(maxsize=depth)
+        self.error = None
+        self.stopping = False
+
+        self.thread = threading.Thread(target=self.run, name="ReadAhead", daemon=True)
+        self.thread.start()
+
+    # *******************************************
+    # Read stage thread.
+    # *******************************************
+    def run(self):
+        try:
+            for chunk in readChunks(self.rf, self.bytesToRead, self.chunkSize):
+                if self.stopping:
+                    break
+                self.chunks.put(chunk)
+        except Exception as e:
+            self.error = e
+        self.chunks.put(ENDOFCHUNKS)
+
+    # *******************************************
+    # Get chunks in order.
+    # Any read error is raised when the chunks run out.
+    # *******************************************
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is ENDOFCHUNKS:
+                break
+            yield chunk
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    # *******************************************
+    # Stop reading ahead, e.g. if the chunks are no longer wanted.
+    # *******************************************
+    def stop(self):
+        self.stopping = True
+        # Drain the queue so the read thread isn't blocked.
+        while self.thread.is_alive():
+            try:
+                self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+# *******************************************
+# Write behind stage class.
+# Writes chunks to a file on a separate thread, after they have been produced.
+# *******************************************
+class WriteBehind():
+    def __init__(self, wf, depth):
+
+        self.wf = wf
+        self.chunks = queue.Queue(maxsize=depth)
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, name="WriteBehind", daemon=True)
+        self.thread.start()
+
+    # *******************************************
+    # Write stage thread.
+    # After an error, chunks are discarded so the producer isn't blocked.
+    # *******************************************
+    def run(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is ENDOFCHUNKS:
+                break
+            if self.error is None:
+                try:
+                    self.wf.write(chunk)
+                except Exception as e:
+                    self.error = e
+
+    # *******************************************
+    # Queue chunk to be written.
+    # Any earlier write error is raised.
+    # *******************************************
+    def write(self, chunk):
+        if self.error is not None:
+            raise self.error
+        self.chunks.put(chunk)
+
+    # *******************************************
+    # Wait for all chunks to be written.
+    # Any write error is raised.
+    # *******************************************
+    def close(self):
+        self.chunks.put(ENDOFCHUNKS)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+
+import struct
+import zlib
+import numpy as np
+
+# *******************************************
+# Streaming PNG reader and writer.
+#
+# Reads a PNG file a chunk at a time and decodes image data a row at a time,
+# so that only the rows that are needed are ever decompressed.
+# Only the chunks needed for decoding are interpreted, i.e. IHDR, IDAT and IEND.
+# Rows can also be decoded a band at a time, for images too large to decode at once.
+#
+# Writes a PNG file a band of rows at a time, compressing the image data as it goes,
+# so images of any size can be written in the memory of a band.
+#
+# Supports non-interlaced 8-bit RGB and RGBA images, which are the only images
+# that picCoder writes, i.e. the only images that can be picCoded.
+# *******************************************
+
+# PNG file signature.
+PNGSIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG colour types.
+PNGCOLOUR_GREY = 0
+PNGCOLOUR_RGB = 2
+PNGCOLOUR_PALETTE = 3
+PNGCOLOUR_GREYALPHA = 4
+PNGCOLOUR_RGBA = 6
+
+# Number of channels (samples per pixel) for each PNG colour type.
+PNGCHANNELS = {
+    PNGCOLOUR_GREY : 1,
+    PNGCOLOUR_RGB : 3,
+    PNGCOLOUR_PALETTE : 1,
+    PNGCOLOUR_GREYALPHA : 2,
+    PNGCOLOUR_RGBA : 4
+}
+
+# Size of compressed image data to inflate at a time.
+PNGREADSIZE = 65536
+
+# Size of image data chunks written.
+PNGIDATSIZE = 262144
+
+# *******************************************
+# Exception for PNG files that can't be read.
+# *******************************************
+class PngError(Exception):
+    pass
+
+# *******************************************
+# Reverse the PNG filter for a row of image data.
+# Row and prior row are numpy uint8 arrays, bpp is bytes per complete pixel.
+# Returns the reconstructed row.
+# *******************************************
+def unfilterRow(filterType, row, prior, bpp):
+
+    # None.
+    if filterType == 0:
+        return row
+
+    # Sub, each byte is added to the reconstructed byte one pixel to the left.
+    # This is a running sum for each channel, which wraps in 8 bits.
+    elif filterType == 1:
+        return np.cumsum(row.reshape(-1, bpp), axis=0, dtype=np.uint8).reshape(-1)
+
+    # Up, each byte is added to the byte above.
+    elif filterType == 2:
+        return row + prior
+
+    # Average and Paeth depend on the reconstructed byte to the left, so are done a byte at a time.
+    elif filterType == 3:
+        recon = bytearray(row.tobytes())
+        up = prior.tobytes()
+        for i in range(len(recon)):
+            left = recon[i - bpp] if i >= bpp else 0
+            recon[i] = (recon[i] + ((left + up[i]) >> 1)) & 0xff
+        return np.frombuffer(bytes(recon), dtype=np.uint8)
+
+    elif filterType == 4:
+        recon = bytearray(row.tobytes())
+        up = prior.tobytes()
+        for i in range(len(recon)):
+            if i >= bpp:
+                a = recon[i - bpp]
+                c = up[i - bpp]
+            else:
+                a = 0
+                c = 0
+            b = up[i]
+            p = a + b - c
+            pa = abs(p - a)
+            pb = abs(p - b)
+            pc = abs(p - c)
+            if (pa <= pb) and (pa <= pc):
+                pred = a
+            elif pb <= pc:
+                pred = b
+            else:
+                pred = c
+            recon[i] = (recon[i] + pred) & 0xff
+        return np.frombuffer(bytes(recon), dtype=np.uint8)
+
+    else:
+        raise PngError(f'Invalid PNG row filter type : {filterType}')
+
+# *******************************************
+# Reverse the PNG filters for a band of rows of image data.
+# Rows are a numpy uint8 array of rows x row bytes, prior is the reconstructed row before the band,
+# bpp is bytes per complete pixel.
+# Returns the reconstructed rows.
+# *******************************************
+def unfilterRows(filterTypes, rows, prior, bpp):
+
+    # Rows from the first to the last Average / Paeth row are reconstructed together.
+    # Other rows only depend on the row before, so are reconstructed a row at a time.
+    slowRows = np.flatnonzero(filterTypes >= 3)
+    recon = np.empty_like(rows)
+    row = 0
+    while row < len(rows):
+        if (len(slowRows) > 0) and (row == slowRows[0]):
+            end = slowRows[-1] + 1
+            recon[row:end] = unfilterWavefront(filterTypes[row:end], rows[row:end], prior, bpp)
+            row = end
+        else:
+            recon[row] = unfilterRow(filterTypes[row], rows[row], prior, bpp)
+            row += 1
+        prior = recon[row - 1]
+    return recon
+
+# *******************************************
+# Reverse the PNG filters for a band of rows, any of which may be Average or Paeth filtered.
+# Average and Paeth depend on the reconstructed pixel to the left and the pixels above,
+# so pixels on each anti-diagonal of the band don't depend on each other and are reconstructed together,
+# giving rows + width steps rather than a step for every byte.
+# Returns the reconstructed rows.
+# *******************************************
+def unfilterWavefront(filterTypes, rows, prior, bpp):
+
+    if np.any(filterTypes > 4):
+        raise PngError(f'Invalid PNG row filter type : {filterTypes.max()}')
+    numRows = len(rows)
+    width = rows.shape[1] // bpp
+    raw = rows.reshape(numRows, width, bpp).astype(np.int16)
+
+    # Reconstructed pixels, with the row before the band above and zeros to the left.
+    recon = np.zeros((numRows + 1, width + 1, bpp), dtype=np.int16)
+    recon[0, 1:] = prior.reshape(width, bpp)
+    rowFilters = filterTypes.reshape(-1, 1)
+
+    for diagonal in range(numRows + width - 1):
+        rowIdx = np.arange(max(0, diagonal - width + 1), min(numRows, diagonal + 1))
+        colIdx = diagonal - rowIdx
+        left = recon[rowIdx + 1, colIdx]
+        up = recon[rowIdx, colIdx + 1]
+        upLeft = recon[rowIdx, colIdx]
+
+        # Predictor of each filter type, chosen by the filter type of each row.
+        pa = np.abs(up - upLeft)
+        pb = np.abs(left - upLeft)
+        pc = np.abs(left + up - 2 * upLeft)
+        paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upLeft))
+        filters = rowFilters[rowIdx]
+        pred = np.where(filters == 4, paeth,
+               np.where(filters == 3, (left + up) >> 1,
+               np.where(filters == 2, up,
+               np.where(filters == 1, left, 0))))
+        recon[rowIdx + 1, colIdx + 1] = (raw[rowIdx, colIdx] + pred) & 0xff
+
+    return recon[1:, 1:].reshape(numRows, width * bpp).astype(np.uint8)
+
+# *******************************************
+# Apply PNG filters to a band of rows of image data, for compression.
+# Each row is filtered with whichever of None, Sub or Up gives the smallest sum of absolute differences.
+# Average and Paeth aren't used, so that the rows can be reconstructed a row at a time.
+# Rows are a numpy uint8 array of rows x row bytes, prior is the row before the band,
+# bpp is bytes per complete pixel.
+# Returns the filtered rows, each with its filter type byte first.
+# *******************************************
+def filterRows(rows, prior, bpp):
+
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+    up = np.concatenate((prior.reshape(1, -1), rows[:-1]))
+    candidates = (rows, rows - left, rows - up)
+    del left, up
+
+    # Differences are treated as signed, so small changes either way score low.
+    scores = np.stack([np.abs(candidate.view(np.int8).astype(np.int16)).sum(axis=1) for candidate in candidates])
+    filterTypes = np.argmin(scores, axis=0).astype(np.uint8)
+
+    filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = filterTypes
+    for filterType, candidate in enumerate(candidates):
+        chosen = filterTypes == filterType
+        filtered[chosen, 1:] = candidate[chosen]
+    return filtered
+
+# *******************************************
+# Streaming PNG reader class.
+# *******************************************
+class PngStream():
+    def __init__(self, pngFile):
+
+        self.pngFile = pngFile
+        self.pf = open(pngFile, mode='rb')
+
+        try:
+            # Check PNG signature.
+            if self.pf.read(len(PNGSIGNATURE)) != PNGSIGNATURE:
+                raise PngError("Not a PNG file.")
+
+            # The first chunk must be the header chunk.
+            chunkType, chunkData = self.readChunk()
+            if (chunkType != b"IHDR") or (len(chunkData) != 13):
+                raise PngError("PNG header chunk missing.")
+            self.width, self.height, self.bitDepth, self.colourType, self.compression, self.filterMethod, self.interlace = struct.unpack(">IIBBBBB", chunkData)
+        except Exception:
+            self.pf.close()
+            raise
+
+        # Image data decoding state.
+        self.inflater = zlib.decompressobj()
+        self.pending = bytearray()
+        self.idatLeft = 0
+        self.haveIdat = False
+        self.endOfData = False
+        self.rowsRead = 0
+        self.priorRow = None
+
+    # *******************************************
+    # Close the PNG file.
+    # *******************************************
+    def close(self):
+        self.pf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # *******************************************
+    # Number of channels per pixel.
+    # *******************************************
+    def channels(self):
+        return PNGCHANNELS.get(self.colourType, 0)
+
+    # *******************************************
+    # Check if image data can be decoded by the stream.
+    # *******************************************
+    def isDecodable(self):
+        return (self.bitDepth == 8) and (self.colourType in (PNGCOLOUR_RGB, PNGCOLOUR_RGBA)) and (self.interlace == 0)
+
+    # *******************************************
+    # Read a complete chunk.
+    # Returns chunk type and chunk data.
+    # *******************************************
+    def readChunk(self):
+        chunkLen, chunkType = self.readChunkHeader()
+        chunkData = self.pf.read(chunkLen)
+        crc = self.pf.read(4)
+        if (len(chunkData) != chunkLen) or (len(crc) != 4):
+            raise PngError("PNG file truncated.")
+        if zlib.crc32(chunkData, zlib.crc32(chunkType)) != struct.unpack(">I", crc)[0]:
+            raise PngError(f'PNG chunk CRC error : {chunkType}')
+        return chunkType, chunkData
+
+    # *******************************************
+    # Read a chunk header.
+    # Returns chunk length and chunk type.
+    # *******************************************
+    def readChunkHeader(self):
+        hdr = self.pf.read(8)
+        if len(hdr) != 8:
+            raise PngError("PNG file truncated.")
+        return struct.unpack(">I4s", hdr)
+
+    # *******************************************
+    # Read the next piece of compressed image data.
+    # Skips any chunks that are not image data.
+    # Returns empty bytes when there is no more image data.
+    # *******************************************
+    def readIdat(self):
+        while self.idatLeft == 0:
+            if self.endOfData:
+                return b""
+            chunkLen, chunkType = self.readChunkHeader()
+            if chunkType == b"IDAT":
+                self.haveIdat = True
+                self.idatLeft = chunkLen
+                # Empty chunk, skip its CRC.
+                if chunkLen == 0:
+                    self.pf.seek(4, 1)
+            elif (chunkType == b"IEND") or self.haveIdat:
+                # Image data chunks are consecutive, so done.
+                self.endOfData = True
+            else:
+                # Skip the chunk and its CRC.
+                self.pf.seek(chunkLen + 4, 1)
+
+        # Read a piece of the chunk data.
+        data = self.pf.read(min(self.idatLeft, PNGREADSIZE))
+        if len(data) == 0:
+            raise PngError("PNG file truncated.")
+        self.idatLeft -= len(data)
+        # Skip the CRC at the end of the chunk.
+        # Chunk CRCs aren't checked for image data, zlib checks the image data itself.
+        if self.idatLeft == 0:
+            self.pf.seek(4, 1)
+        return data
+
+    # *******************************************
+    # Read the next row of the image.
+    # Returns the reconstructed row as numpy uint8 array of width x channels bytes,
+    # or None if there are no more rows.
+    # *******************************************
+    def readRow(self):
+        if not self.isDecodable():
+            raise PngError(f'Unsupported PNG, bit depth : {self.bitDepth}; colour type : {self.colourType}; interlace : {self.interlace}')
+        if self.rowsRead == self.height:
+            return None
+
+        # Each row is a filter type byte followed by the filtered row.
+        bpp = self.channels()
+        rowBytes = self.width * bpp + 1
+        self.inflate(rowBytes)
+        filterType = self.pending[0]
+        row = np.frombuffer(bytes(self.pending[1:rowBytes]), dtype=np.uint8)
+        del self.pending[:rowBytes]
+
+        # Reconstruct the row, the row before the first row is zeros.
+        if self.priorRow is None:
+            self.priorRow = np.zeros(rowBytes - 1, dtype=np.uint8)
+        self.priorRow = unfilterRow(filterType, row, self.priorRow, bpp)
+        self.rowsRead += 1
+        return self.priorRow
+
+    # *******************************************
+    # Read the next band of rows of the image.
+    # Returns the reconstructed rows as numpy uint8 array of rows x (width x channels) bytes,
+    # which may be fewer rows than asked for at the end of the image.
+    # *******************************************
+    def readRows(self, numRows):
+        if not self.isDecodable():
+            raise PngError(f'Unsupported PNG, bit depth : {self.bitDepth}; colour type : {self.colourType}; interlace : {self.interlace}')
+        numRows = min(numRows, self.height - self.rowsRead)
+
+        # Each row is a filter type byte followed by the filtered row.
+        bpp = self.channels()
+        rowBytes = self.width * bpp + 1
+        self.inflate(numRows * rowBytes)
+        band = np.frombuffer(bytes(self.pending[:numRows * rowBytes]), dtype=np.uint8).reshape(numRows, rowBytes)
+        del self.pending[:numRows * rowBytes]
+
+        # Reconstruct the rows, the row before the first row is zeros.
+        if self.priorRow is None:
+            self.priorRow = np.zeros(rowBytes - 1, dtype=np.uint8)
+        rows = unfilterRows(band[:, 0], band[:, 1:], self.priorRow, bpp)
+        if numRows > 0:
+            self.priorRow = rows[-1]
+        self.rowsRead += numRows
+        return rows
+
+    # *******************************************
+    # Decompress image data until there are at least the given number of bytes pending.
+    # No more is decompressed than is needed, however well the image data compresses.
+    # *******************************************
+    def inflate(self, numBytes):
+        while len(self.pending) < numBytes:
+            data = self.inflater.unconsumed_tail
+            if len(data) == 0:
+                data = self.readIdat()
+                if len(data) == 0:
+                    raise PngError("PNG image data truncated.")
+            self.pending += self.inflater.decompress(data, max(numBytes - len(self.pending), PNGREADSIZE))
+
+# *******************************************
+# Streaming PNG writer class.
+# Rows are written a band at a time, from the top of the image.
+# *******************************************
+class PngWriter():
+    def __init__(self, pngFile, width, height, colourType):
+
+        self.pngFile = pngFile
+        self.width = width
+        self.height = height
+        self.colourType = colourType
+        self.pf = open(pngFile, mode='wb')
+
+        # Image data compression state.
+        self.deflater = zlib.compressobj()
+        self.pending = bytearray()
+        self.rowsWritten = 0
+        self.priorRow = np.zeros(width * self.channels(), dtype=np.uint8)
+
+        try:
+            self.pf.write(PNGSIGNATURE)
+            self.writeChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, colourType, 0, 0, 0))
+        except Exception:
+            self.pf.close()
+            raise
+
+    # *******************************************
+    # Close the PNG file.
+    # The image is incomplete unless finished.
+    # *******************************************
+    def close(self):
+        self.pf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # *******************************************
+    # Number of channels per pixel.
+    # *******************************************
+    def channels(self):
+        return PNGCHANNELS.get(self.colourType, 0)
+
+    # *******************************************
+    # Write a complete chunk.
+    # *******************************************
+    def writeChunk(self, chunkType, chunkData):
+        self.pf.write(struct.pack(">I4s", len(chunkData), chunkType))
+        self.pf.write(chunkData)
+        self.pf.write(struct.pack(">I", zlib.crc32(chunkData, zlib.crc32(chunkType))))
+
+    # *******************************************
+    # Write the compressed image data pending, in chunks.
+    # Unless all of it is to be written, a part chunk is kept until there is more.
+    # *******************************************
+    def writeIdat(self, writeAll=False):
+        while (len(self.pending) >= PNGIDATSIZE) or (writeAll and (len(self.pending) > 0)):
+            self.writeChunk(b"IDAT", bytes(self.pending[:PNGIDATSIZE]))
+            del self.pending[:PNGIDATSIZE]
+
+    # *******************************************
+    # Write the next band of rows of the image.
+    # Rows are numpy uint8 array of rows x (width x channels) bytes.
+    # *******************************************
+    def writeRows(self, rows):
+        if len(rows) == 0:
+            return
+        if self.rowsWritten + len(rows) > self.height:
+            raise PngError("More PNG rows written than the image height.")
+        filtered = filterRows(rows, self.priorRow, self.channels())
+        self.pending += self.deflater.compress(filtered.tobytes())
+        self.writeIdat()
+        self.priorRow = rows[-1].copy()
+        self.rowsWritten += len(rows)
+
+    # *******************************************
+    # Finish the image, once all of the rows have been written.
+    # *******************************************
+    def finish(self):
+        if self.rowsWritten != self.height:
+            raise PngError(f'PNG rows written : {self.rowsWritten}; image height : {self.height}')
+        self.pending += self.deflater.flush()
+        self.writeIdat(True)
+        self.writeChunk(b"IEND", b"")
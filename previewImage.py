@@ -21,31 +21,36 @@ def res_path(relative_path):
 # *******************************************
 # Preview image dialog class.
 # Displays preview of embedded image.
+# An image got from a file each time it is shown is previewed with its file, to cache its thumbnail by.
 # *******************************************
 class PreviewImageDialog(QDialog):
-    def __init__(self, picImage, parent=None):
+    def __init__(self, picImage, thumbnails, parent=None, picFile=""):
         super(PreviewImageDialog, self).__init__()
         uic.loadUi(res_path("picPreview.ui"), self)
 
+        # Cache of image thumbnails.
+        self.thumbnails = thumbnails
+
         # Show the embedded image.
-        self.showImagePreview(picImage)
+        self.showImagePreview(picImage, picFile)
 
     # *******************************************
     # Displays preview of image with embedded data in dialog box.
     # This is so that user can preview before deciding to save.
     # *******************************************
-    def showImagePreview(self, picImage):
+    def showImagePreview(self, picImage, picFile=""):
 
         # Set dialog window icon.
         icon = QtGui.QIcon()
         icon.addPixmap(QtGui.QPixmap(res_path("./resources/about.png")))
         self.setWindowIcon(icon)
 
-        # Create bitmap for display.
-        bitmap = QtGui.QPixmap.fromImage(picImage)
+        # Get bitmap for display, scaled from the image unless cached since the image last changed.
+        # Scale the image before conversion so that a full size bitmap is not created.
+        bitmap = self.thumbnails.getImageThumbnail(picImage, self.pictureLbl.width(), self.pictureLbl.height(), picFile)
 
         # Display bitmap.
-        self.pictureLbl.setPixmap(bitmap.scaled(self.pictureLbl.width(), self.pictureLbl.height(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
+        self.pictureLbl.setPixmap(bitmap)
         self.pictureLbl.adjustSize()
         self.pictureLbl.show()
 
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import sqlite3
+import time
+
+from constants import *
+from picProbe import *
+
+# *******************************************
+# Persistent index of probed images.
+#
+# The probe result of every image probed is kept in an SQLite database, by the path of the image.
+# An entry is only used while the size and modification time of the image are unchanged,
+# and, if content hashing is on, the hash of the start and end of the image file.
+# Finding coded images is then a query of the index, rather than probing every image again.
+# If the database can't be opened the index is empty, and images are always probed.
+# *******************************************
+
+# Bytes hashed from each of the start and end of an image file, for the fast content hash.
+INDEXHASHBYTES = 65536
+
+# Columns of the index holding the probe result, and the probe result attributes they hold.
+INDEXCOLUMNS = [
+    ("readable", "readable"),
+    ("supported", "supported"),
+    ("width", "width"),
+    ("height", "height"),
+    ("coded", "picCoded"),
+    ("codeType", "picCodeType"),
+    ("password", "picPassword"),
+    ("codec", "codec"),
+    ("embeddedPath", "embeddedFilePath"),
+    ("embeddedName", "embeddedFileName"),
+    ("embeddedSize", "embeddedFileSize"),
+    ("numMessages", "numMessages"),
+    ("numMembers", "numMembers"),
+    ("spanSetId", "spanSetId"),
+    ("spanIndex", "spanIndex"),
+    ("spanCount", "spanCount"),
+    ("spanOffset", "spanOffset"),
+    ("spanTotalSize", "spanTotalSize")
+]
+
+# Columns of boolean probe result attributes.
+INDEXBOOLCOLUMNS = ("readable", "supported", "coded", "password")
+
+# *******************************************
+# Hash the start and end of a file, with its size.
+# Fast for files of any size, but only detects changes to the start or end of the file,
+# which for picCoded images is where the embedded data header is.
+# Returns hash as hex text.
+# *******************************************
+def fastHash(picFile):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(picFile, "rb") as pf:
+        pf.seek(0, os.SEEK_END)
+        fileSize = pf.tell()
+        digest.update(fileSize.to_bytes(8, "big"))
+        pf.seek(0)
+        digest.update(pf.read(INDEXHASHBYTES))
+        if fileSize > INDEXHASHBYTES:
+            pf.seek(max(INDEXHASHBYTES, fileSize - INDEXHASHBYTES))
+            digest.update(pf.read(INDEXHASHBYTES))
+    return digest.hexdigest()
+
+# *******************************************
+# Image file key class.
+# What identifies the content of an image file, for checking an index entry is up to date.
+# *******************************************
+class FileKey():
+    def __init__(self, path, size, mtime, contentHash=""):
+
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.contentHash = contentHash
+
+# *******************************************
+# Probe index class.
+# *******************************************
+class ProbeIndex():
+    def __init__(self, log, dbFile, hashContent=False):
+
+        # Initialise logger.
+        self.log = log
+
+        # Hash content of image files, as well as checking size and modification time.
+        self.hashContent = hashContent
+
+        # Open database, creating the index if new.
+        self.db = None
+        if dbFile == "":
+            return
+        try:
+            self.db = sqlite3.connect(dbFile, timeout=10)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            columns = ", ".join(f'{column} INTEGER' if column not in ("embeddedPath", "embeddedName", "spanSetId") else f'{column} TEXT' for column, attribute in INDEXCOLUMNS)
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS probes (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, probed REAL, {columns})')
+            self.db.execute("CREATE INDEX IF NOT EXISTS probesCoded ON probes (coded, codeType)")
+            self.db.commit()
+        except sqlite3.Error as e:
+            self.log.warning(f'Probe index not available : {dbFile}; {str(e)}')
+            self.db = None
+
+    # *******************************************
+    # Context manager, so the index is closed when done.
+    # *******************************************
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    # *******************************************
+    # Get the key of an image file, as it is now.
+    # Returns None if the file can't be read.
+    # *******************************************
+    def fileKey(self, picFile):
+        try:
+            stat = os.stat(picFile)
+            contentHash = fastHash(picFile) if self.hashContent else ""
+        except OSError:
+            return None
+        return FileKey(os.path.abspath(picFile), stat.st_size, stat.st_mtime_ns, contentHash)
+
+    # *******************************************
+    # Look up the probe result of an image file by its key.
+    # Returns None if the image isn't in the index, or has changed since it was probed.
+    # *******************************************
+    def lookup(self, picFile, key):
+        if (self.db is None) or (key is None):
+            return None
+        try:
+            row = self.db.execute(f'SELECT size, mtime, hash, {self.columnList()} FROM probes WHERE path = ?', (key.path,)).fetchone()
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to look up probe index : {str(e)}')
+            return None
+        if row is None:
+            return None
+        size, mtime, contentHash = row[:3]
+        if (size != key.size) or (mtime != key.mtime) or (self.hashContent and (contentHash != key.contentHash)):
+            return None
+        return self.resultFromRow(picFile, row[3:])
+
+    # *******************************************
+    # Store the probe result of an image file, by the key it had when probed.
+    # Results are committed by commit, or when the index is closed.
+    # *******************************************
+    def store(self, key, result):
+        if (self.db is None) or (key is None):
+            return
+        values = [int(getattr(result, attribute)) if column in INDEXBOOLCOLUMNS else getattr(result, attribute) for column, attribute in INDEXCOLUMNS]
+        try:
+            self.db.execute(f'INSERT OR REPLACE INTO probes (path, size, mtime, hash, probed, {self.columnList()}) VALUES ({", ".join("?" * (len(values) + 5))})',
+                            [key.path, key.size, key.mtime, key.contentHash, time.time()] + values)
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to update probe index : {str(e)}')
+
+    # *******************************************
+    # Probe an image file, from the index if it hasn't changed since it was last probed.
+    # Returns probe result.
+    # *******************************************
+    def probe(self, picFile):
+        key = self.fileKey(picFile)
+        result = self.lookup(picFile, key)
+        if result is None:
+            result = probeImage(picFile)
+            self.store(key, result)
+            self.commit()
+        return result
+
+    # *******************************************
+    # Find coded images in the index, optionally only of a code type.
+    # Entries for images that have changed or gone are only found to be out of date by lookup.
+    # Returns probe results, by path.
+    # *******************************************
+    def findCoded(self, codeType=None):
+        if self.db is None:
+            return []
+        query = f'SELECT path, {self.columnList()} FROM probes WHERE coded = 1'
+        params = ()
+        if codeType is not None:
+            query += ' AND codeType = ?'
+            params = (codeType,)
+        try:
+            rows = self.db.execute(query + ' ORDER BY path', params).fetchall()
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to query probe index : {str(e)}')
+            return []
+        return [self.resultFromRow(row[0], row[1:]) for row in rows]
+
+    # *******************************************
+    # Remove an image from the index.
+    # *******************************************
+    def remove(self, picFile):
+        if self.db is None:
+            return
+        try:
+            self.db.execute("DELETE FROM probes WHERE path = ?", (os.path.abspath(picFile),))
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to update probe index : {str(e)}')
+
+    # *******************************************
+    # Commit stored results.
+    # *******************************************
+    def commit(self):
+        if self.db is None:
+            return
+        try:
+            self.db.commit()
+        except sqlite3.Error as e:
+            self.log.warning(f'Failed to commit probe index : {str(e)}')
+
+    # *******************************************
+    # Close the index, committing stored results.
+    # *******************************************
+    def close(self):
+        if self.db is None:
+            return
+        self.commit()
+        self.db.close()
+        self.db = None
+
+    # *******************************************
+    # List of the probe result columns, for queries.
+    # *******************************************
+    def columnList(self):
+        return ", ".join(column for column, attribute in INDEXCOLUMNS)
+
+    # *******************************************
+    # Create probe result from the probe result columns of an index row.
+    # *******************************************
+    def resultFromRow(self, picFile, row):
+        result = ProbeResult(picFile)
+        for (column, attribute), value in zip(INDEXCOLUMNS, row):
+            setattr(result, attribute, bool(value) if column in INDEXBOOLCOLUMNS else value)
+        return result
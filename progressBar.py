@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from PyQt5.QtWidgets import QApplication, QDialog
+from PyQt5.QtWidgets import QDialog
 from PyQt5 import uic
 from PyQt5 import QtCore, QtGui
 import os
@@ -33,12 +33,16 @@ class ProgressBar(QDialog):
         self.progressBar.setRange(0, 100)
         self.progressBar.setValue(0)
 
+        # Cancel button (or closing the dialog) rejects the dialog.
+        # Users of the progress bar connect to the rejected signal to cancel what is in progress.
+        self.buttonBox.rejected.connect(self.reject)
+
     # *******************************************
     # Method to set note in progress bar.
     # *******************************************
     def setNote(self, note):
 
-        # Process events to make progress bar responsive.
+        # Update the note.
         self.progBarNote.setText(note)
 
         # Show dialog.
@@ -49,14 +53,19 @@ class ProgressBar(QDialog):
     # *******************************************
     def setProgress(self, progress):
 
-        QApplication.processEvents()
-
-        # Process events to make progress bar responsive.
+        # Progress is reported from operations running off the GUI thread,
+        # so the GUI stays responsive without processing events here.
         self.progressBar.setValue(progress)
 
         # Show dialog.
         self.show()
 
+    # *******************************************
+    # Enable or disable cancelling of what is in progress.
+    # *******************************************
+    def setCancellable(self, cancellable):
+        self.buttonBox.setEnabled(cancellable)
+
     # *******************************************
     # Displays the progress bar.
     # *******************************************
@@ -73,4 +82,4 @@ class ProgressBar(QDialog):
     # Hide the progress bar.
     # *******************************************
     def hideProgressBar(self):
-        self.done(0)
+        self.hide()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+from PyQt5.QtWidgets import QDialog
+from PyQt5 import uic
+from PyQt5 import QtCore, QtGui
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from constants import *
+from probeIndex import *
+from scanner import *
+
+# *******************************************
+# Determine resource path being the relative path to the resource file.
+# The resource path changes when built for an executable.
+# *******************************************
+def res_path(relative_path):
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath('.')
+    resPath = os.path.join(base_path, relative_path)
+    return resPath
+
+# *******************************************
+# Scan job signals class.
+# Signals are emitted on the worker thread and delivered on the GUI thread.
+# *******************************************
+class ScanSignals(QtCore.QObject):
+    found = QtCore.pyqtSignal(object, int)
+    finished = QtCore.pyqtSignal(int, str)
+
+# *******************************************
+# Scan job class.
+# Scans for picCoded images on a thread pool thread, reporting the picCoded images found
+# in batches, no more often than every UPDATESECS, with the number of images scanned so far.
+# *******************************************
+class ScanJob(QtCore.QRunnable):
+
+    # Minimum time between reporting images found (seconds).
+    UPDATESECS = 0.25
+
+    def __init__(self, log, config, paths):
+        super(ScanJob, self).__init__()
+
+        self.log = log
+        self.config = config
+        self.paths = paths
+        self.signals = ScanSignals()
+        self.stopEvent = threading.Event()
+
+    # *******************************************
+    # Stop the scan, after the images in progress.
+    # *******************************************
+    def stop(self):
+        self.stopEvent.set()
+
+    # *******************************************
+    # Run the scan and report how it finished.
+    # The probe index is opened on this thread, as it can only be used on the thread that opened it.
+    # *******************************************
+    def run(self):
+        processes = self.config.ScanProcesses if self.config.ScanProcesses > 0 else (os.cpu_count() or 1)
+        pool = None
+        if processes > 1:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+        numImages = 0
+        found = []
+        lastUpdate = time.monotonic()
+        error = ""
+        try:
+            with ProbeIndex(self.log, self.config.ProbeIndexFile, bool(self.config.ProbeIndexHash)) as index:
+                for result in scanImages(self.paths, index, pool, 2 * processes, self.stopEvent.is_set):
+                    numImages += 1
+                    if result.picCoded:
+                        found.append(result)
+                    if (time.monotonic() - lastUpdate) >= self.UPDATESECS:
+                        self.signals.found.emit(found, numImages)
+                        found = []
+                        lastUpdate = time.monotonic()
+        except Exception as e:
+            self.log.error(f'Failed to scan images : {str(e)}')
+            error = str(e)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        self.signals.found.emit(found, numImages)
+        self.signals.finished.emit(numImages, error)
+
+# *******************************************
+# Scan results model class.
+# Table of the picCoded images found, sortable by any column.
+# Images found are added at the end, and sorted when the scan finishes.
+# *******************************************
+class ScanModel(QtCore.QAbstractTableModel):
+
+    # Column headings.
+    COLUMNS = ["Image", "Type", "Embedded", "Size (Bytes)", "Password"]
+
+    def __init__(self):
+        super(ScanModel, self).__init__()
+
+        # Probe results of the images, and the column and order sorted by.
+        self.results = []
+        self.sortColumn = -1
+        self.sortOrder = QtCore.Qt.AscendingOrder
+
+    # *******************************************
+    # Number of rows, being the images found.
+    # *******************************************
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.results)
+
+    # *******************************************
+    # Number of columns.
+    # *******************************************
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    # *******************************************
+    # Column headings.
+    # *******************************************
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if (orientation == QtCore.Qt.Horizontal) and (role == QtCore.Qt.DisplayRole):
+            return self.COLUMNS[section]
+        return None
+
+    # *******************************************
+    # Data of a cell, the text to display.
+    # *******************************************
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if (not index.isValid()) or (index.row() >= len(self.results)):
+            return None
+        result = self.results[index.row()]
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == 0:
+                return result.picFile
+            if column == 1:
+                return codeTypeName(result)
+            if column == 2:
+                return self.embeddedText(result)
+            if column == 3:
+                return f'{result.embeddedFileSize:,}' if result.picCodeType in (CodeType.CODETYPE_FILE.value, CodeType.CODETYPE_SPAN.value) else ""
+            if column == 4:
+                return "Yes" if result.picPassword else "No"
+        elif (role == QtCore.Qt.TextAlignmentRole) and (column == 3):
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        return None
+
+    # *******************************************
+    # Text of what is embedded in an image.
+    # *******************************************
+    def embeddedText(self, result):
+        if result.picCodeType == CodeType.CODETYPE_TEXT.value:
+            return f'{result.numMessages} messages'
+        if result.picCodeType == CodeType.CODETYPE_ARCHIVE.value:
+            return f'{result.numMembers} files'
+        if result.picCodeType == CodeType.CODETYPE_SPAN.value:
+            return f'{result.embeddedFileName} (part {result.spanIndex + 1} of {result.spanCount})'
+        return result.embeddedFileName
+
+    # *******************************************
+    # Key to sort images by a column.
+    # *******************************************
+    def sortKey(self, column):
+        if column == 0:
+            return lambda result: result.picFile.lower()
+        if column == 1:
+            return lambda result: codeTypeName(result)
+        if column == 2:
+            return lambda result: self.embeddedText(result).lower()
+        if column == 3:
+            return lambda result: result.embeddedFileSize
+        return lambda result: result.picPassword
+
+    # *******************************************
+    # Sort images by a column.
+    # *******************************************
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.sortColumn = column
+        self.sortOrder = order
+        if column < 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.results.sort(key=self.sortKey(column), reverse=(order == QtCore.Qt.DescendingOrder))
+        self.layoutChanged.emit()
+
+    # *******************************************
+    # Sort images again by the column sorted by, e.g. after adding images.
+    # *******************************************
+    def resort(self):
+        self.sort(self.sortColumn, self.sortOrder)
+
+    # *******************************************
+    # Add images found, at the end.
+    # *******************************************
+    def addResults(self, results):
+        if len(results) == 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.results), len(self.results) + len(results) - 1)
+        self.results += results
+        self.endInsertRows()
+
+    # *******************************************
+    # Clear images found.
+    # *******************************************
+    def clear(self):
+        self.beginResetModel()
+        self.results = []
+        self.endResetModel()
+
+# *******************************************
+# Scan dialog class.
+# Lists the picCoded images found in folders as they are scanned.
+# Double clicking an image opens it.
+# *******************************************
+class ScanDialog(QDialog):
+    def __init__(self, logger, config, openImage):
+        super(ScanDialog, self).__init__()
+        uic.loadUi(res_path("scanner.ui"), self)
+
+        # Initialise application logger and config.
+        self.logger = logger
+        self.config = config
+
+        # Callback to open an image.
+        self.openImage = openImage
+
+        # Set dialog window icon.
+        icon = QtGui.QIcon()
+        icon.addPixmap(QtGui.QPixmap(res_path("./resources/about.png")))
+        self.setWindowIcon(icon)
+
+        # Couple results view to the model of images found.
+        self.model = ScanModel()
+        self.resultsView.setModel(self.model)
+        self.resultsView.setColumnWidth(0, 350)
+        self.resultsView.doubleClicked.connect(self.resultDoubleClicked)
+
+        # Scans run one at a time, on their own thread so the application isn't held up.
+        self.threadPool = QtCore.QThreadPool()
+        self.threadPool.setMaxThreadCount(1)
+        self.job = None
+
+        # Connect callbacks to buttons.
+        self.stopButton.clicked.connect(self.stopScan)
+        self.stopButton.setEnabled(False)
+        self.closeButton.clicked.connect(self.close)
+
+    # *******************************************
+    # Start scanning paths, files or folders, for picCoded images.
+    # Any scan in progress is stopped.
+    # *******************************************
+    def startScan(self, paths):
+        self.logger.info(f'Scanning for picCoded images : {paths}')
+        self.stopScan()
+        self.model.clear()
+        self.statusLbl.setText("Scanning...")
+        self.stopButton.setEnabled(True)
+
+        self.job = ScanJob(self.logger, self.config, paths)
+        self.job.signals.found.connect(self.scanFound)
+        self.job.signals.finished.connect(self.scanFinished)
+        self.threadPool.start(self.job)
+
+    # *******************************************
+    # Stop the scan in progress, if there is one.
+    # *******************************************
+    def stopScan(self):
+        if self.job is not None:
+            self.logger.debug("Stopping scan for picCoded images.")
+            self.job.signals.found.disconnect(self.scanFound)
+            self.job.signals.finished.disconnect(self.scanFinished)
+            self.job.stop()
+            self.job = None
+            self.stopButton.setEnabled(False)
+            self.statusLbl.setText(f'Stopped, picCoded images : {self.model.rowCount()}')
+            self.model.resort()
+
+    # *******************************************
+    # Callback for images found by the scan.
+    # *******************************************
+    def scanFound(self, results, numImages):
+        self.model.addResults(results)
+        self.statusLbl.setText(f'Scanning... images : {numImages:,}; picCoded : {self.model.rowCount():,}')
+
+    # *******************************************
+    # Callback for the scan finishing.
+    # *******************************************
+    def scanFinished(self, numImages, error):
+        self.job = None
+        self.stopButton.setEnabled(False)
+        self.model.resort()
+        if error != "":
+            self.statusLbl.setText(f'Scan failed : {error}')
+        else:
+            self.logger.info(f'Scanned images : {numImages}; picCoded : {self.model.rowCount()}')
+            self.statusLbl.setText(f'Scanned images : {numImages:,}; picCoded : {self.model.rowCount():,}')
+
+    # *******************************************
+    # Callback for an image being double clicked, to open it.
+    # *******************************************
+    def resultDoubleClicked(self, index):
+        if index.isValid():
+            self.openImage(self.model.results[index.row()].picFile)
+
+    # *******************************************
+    # Stop the scan when the dialog is closed.
+    # *******************************************
+    def closeEvent(self, event):
+        self.stopScan()
+        super(ScanDialog, self).closeEvent(event)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+
+from constants import *
+from picProbe import *
+from probeIndex import *
+from utils import *
+
+# *******************************************
+# Scanning of directory trees for picCoded images.
+#
+# Images are found as the tree is walked, so scanning starts straight away however big the tree.
+# Images that haven't changed since they were last probed are answered from the probe index,
+# the others are probed in a pool of processes, SCANBATCHIMAGES images to a task.
+# Only a bounded number of tasks are in flight at a time, so memory doesn't grow with the tree.
+# Results are yielded as they are found, not in the order of the images.
+# *******************************************
+
+# Names of the types of embedded data.
+CODETYPENAMES = {
+    CodeType.CODETYPE_FILE.value : "File",
+    CodeType.CODETYPE_TEXT.value : "Conversation",
+    CodeType.CODETYPE_ARCHIVE.value : "Archive",
+    CodeType.CODETYPE_SPAN.value : "Spanned file part"
+}
+
+# *******************************************
+# Return name of the type of data embedded in an image, from its probe result.
+# *******************************************
+def codeTypeName(result):
+    if not result.picCoded:
+        return ""
+    return CODETYPENAMES.get(result.picCodeType, f'Type {result.picCodeType}')
+
+# *******************************************
+# Pool process task to probe a batch of images.
+# Returns probe results, in the order of the images.
+# *******************************************
+def probeBatch(picFiles):
+    return [probeImage(picFile) for picFile in picFiles]
+
+# *******************************************
+# Scan images, and images in directories, for picCoder headers.
+# Paths can be files, directories (searched recursively) or glob patterns.
+# Batches of images not in the probe index are probed in a pool of processes if given,
+# with up to maxInFlight batches in progress, otherwise in turn.
+# Scanning stops early if the stop callable returns True.
+# Yields probe results, as they are found.
+# *******************************************
+def scanImages(paths, index, pool, maxInFlight, stop=None):
+
+    # Batches in progress, with the keys of their images.
+    pending = {}
+    batch = []
+
+    # Store the results of a batch in the index, as found.
+    def batchDone(keys, results):
+        for key, result in zip(keys, results):
+            index.store(key, result)
+        index.commit()
+        return results
+
+    # Wait for batches to finish, until no more than the given number are in progress.
+    def waitBatches(maxPending):
+        while len(pending) > maxPending:
+            done, notDone = concurrent.futures.wait(pending.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield from batchDone(pending.pop(future), future.result())
+
+    # Probe a batch, or start probing in the pool.
+    def probeBatchOf(batch):
+        picFiles = [picFile for picFile, key in batch]
+        keys = [key for picFile, key in batch]
+        if pool is None:
+            yield from batchDone(keys, probeBatch(picFiles))
+        else:
+            pending[pool.submit(probeBatch, picFiles)] = keys
+            yield from waitBatches(maxInFlight - 1)
+
+    try:
+        for picFile in findImageFiles(paths):
+            if (stop is not None) and stop():
+                return
+            key = index.fileKey(picFile)
+            result = index.lookup(picFile, key)
+            if result is not None:
+                yield result
+                continue
+            batch.append((picFile, key))
+            if len(batch) >= SCANBATCHIMAGES:
+                yield from probeBatchOf(batch)
+                batch = []
+        if len(batch) > 0:
+            yield from probeBatchOf(batch)
+        yield from waitBatches(0)
+    finally:
+        for future in pending:
+            future.cancel()
+        index.commit()
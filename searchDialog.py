@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+from PyQt5.QtWidgets import QDialog, QFileDialog
+from PyQt5 import uic
+from PyQt5 import QtCore, QtGui
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import threading
+
+from constants import *
+from messageIndex import *
+from probeIndex import *
+
+# *******************************************
+# Determine resource path being the relative path to the resource file.
+# The resource path changes when built for an executable.
+# *******************************************
+def res_path(relative_path):
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath('.')
+    resPath = os.path.join(base_path, relative_path)
+    return resPath
+
+# *******************************************
+# Index job signals class.
+# Signals are emitted on the worker thread and delivered on the GUI thread.
+# *******************************************
+class IndexSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal(int, int, str)
+
+# *******************************************
+# Index job class.
+# Indexes the conversations embedded in images on a thread pool thread, reporting the number of
+# conversations indexed again and the number found so far.
+# *******************************************
+class IndexJob(QtCore.QRunnable):
+    def __init__(self, log, config, paths, password):
+        super(IndexJob, self).__init__()
+
+        self.log = log
+        self.config = config
+        self.paths = paths
+        self.password = password
+        self.signals = IndexSignals()
+        self.stopEvent = threading.Event()
+
+    # *******************************************
+    # Stop indexing, after the images in progress.
+    # *******************************************
+    def stop(self):
+        self.stopEvent.set()
+
+    # *******************************************
+    # Run indexing and report how it finished.
+    # The indexes are opened on this thread, as they can only be used on the thread that opened them.
+    # *******************************************
+    def run(self):
+        processes = self.config.ScanProcesses if self.config.ScanProcesses > 0 else (os.cpu_count() or 1)
+        pool = None
+        if processes > 1:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+        numIndexed = 0
+        numFound = 0
+        error = ""
+        try:
+            with ProbeIndex(self.log, self.config.ProbeIndexFile, bool(self.config.ProbeIndexHash)) as probeIndex, \
+                 MessageIndex(self.log, self.config.MessageIndexFile, bool(self.config.ProbeIndexHash)) as messageIndex:
+                for picFile, status in indexConversations(self.paths, probeIndex, messageIndex, self.config, self.password, self.log,
+                                                          pool, 2 * processes, self.stopEvent.is_set):
+                    numFound += 1
+                    if status == INDEXSTATUSINDEXED:
+                        numIndexed += 1
+                    self.signals.progress.emit(numIndexed, numFound)
+                if not self.stopEvent.is_set():
+                    messageIndex.prune()
+        except Exception as e:
+            self.log.error(f'Failed to index conversations : {str(e)}')
+            error = str(e)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        self.signals.finished.emit(numIndexed, numFound, error)
+
+# *******************************************
+# Search results model class.
+# Table of the messages found, best match first.
+# *******************************************
+class SearchModel(QtCore.QAbstractTableModel):
+
+    # Column headings.
+    COLUMNS = ["Image", "Message", "Writer", "Time", "Text"]
+
+    def __init__(self):
+        super(SearchModel, self).__init__()
+
+        # Message hits of the search.
+        self.hits = []
+
+    # *******************************************
+    # Number of rows, being the messages found.
+    # *******************************************
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.hits)
+
+    # *******************************************
+    # Number of columns.
+    # *******************************************
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    # *******************************************
+    # Column headings.
+    # *******************************************
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if (orientation == QtCore.Qt.Horizontal) and (role == QtCore.Qt.DisplayRole):
+            return self.COLUMNS[section]
+        return None
+
+    # *******************************************
+    # Data of a cell, the text to display.
+    # Messages are numbered from 1 for display.
+    # *******************************************
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if (not index.isValid()) or (index.row() >= len(self.hits)):
+            return None
+        hit = self.hits[index.row()]
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == 0:
+                return hit.picFile
+            if column == 1:
+                return str(hit.msgNum + 1)
+            if column == 2:
+                return hit.writer
+            if column == 3:
+                return hit.msgTime
+            if column == 4:
+                return " ".join(hit.snippet.split())
+        elif (role == QtCore.Qt.TextAlignmentRole) and (column == 1):
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        return None
+
+    # *******************************************
+    # Show the messages found by a search.
+    # *******************************************
+    def setHits(self, hits):
+        self.beginResetModel()
+        self.hits = hits
+        self.endResetModel()
+
+# *******************************************
+# Search dialog class.
+# Searches the message index for messages of conversations embedded in images.
+# Double clicking a message opens its image and shows the conversation at the message.
+# *******************************************
+class SearchDialog(QDialog):
+    def __init__(self, logger, config, openMessage):
+        super(SearchDialog, self).__init__()
+        uic.loadUi(res_path("search.ui"), self)
+
+        # Initialise application logger and config.
+        self.logger = logger
+        self.config = config
+
+        # Callback to open an image at a message.
+        self.openMessage = openMessage
+
+        # Set dialog window icon.
+        icon = QtGui.QIcon()
+        icon.addPixmap(QtGui.QPixmap(res_path("./resources/about.png")))
+        self.setWindowIcon(icon)
+
+        # Open the message index to search, on the GUI thread as searches only take milliseconds.
+        self.messageIndex = MessageIndex(logger, config.MessageIndexFile, bool(config.ProbeIndexHash))
+
+        # Couple results view to the model of messages found.
+        self.model = SearchModel()
+        self.resultsView.setModel(self.model)
+        self.resultsView.setColumnWidth(0, 250)
+        self.resultsView.setColumnWidth(1, 70)
+        self.resultsView.doubleClicked.connect(self.resultDoubleClicked)
+
+        # Indexing runs one at a time, on its own thread so the application isn't held up.
+        self.threadPool = QtCore.QThreadPool()
+        self.threadPool.setMaxThreadCount(1)
+        self.job = None
+
+        # Connect callbacks to controls.
+        self.searchButton.clicked.connect(self.searchClicked)
+        self.queryEdit.returnPressed.connect(self.searchClicked)
+        self.indexButton.clicked.connect(self.indexClicked)
+        self.stopButton.clicked.connect(self.stopIndexing)
+        self.stopButton.setEnabled(False)
+        self.closeButton.clicked.connect(self.close)
+
+        if not self.messageIndex.available():
+            self.searchButton.setEnabled(False)
+            self.indexButton.setEnabled(False)
+            self.statusLbl.setText("Message index not available.")
+
+    # *******************************************
+    # User clicked to search.
+    # *******************************************
+    def searchClicked(self):
+        text = self.queryEdit.text()
+        if text.strip() == "":
+            return
+        self.logger.debug(f'Searching conversations for : {text}')
+        hits = self.messageIndex.search(text, self.passwordEdit.text())
+        self.model.setHits(hits)
+        if len(hits) >= SEARCHLIMIT:
+            self.statusLbl.setText(f'Messages found : first {len(hits)}')
+        else:
+            self.statusLbl.setText(f'Messages found : {len(hits)}')
+
+    # *******************************************
+    # User clicked to index a folder.
+    # Displays folder browser to select the folder to index.
+    # *******************************************
+    def indexClicked(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select folder to index conversations of...")
+        if folder != "":
+            self.startIndexing([folder])
+
+    # *******************************************
+    # Start indexing the conversations of images in paths, files or folders.
+    # Conversations with a password are indexed if they have the password entered.
+    # Any indexing in progress is stopped.
+    # *******************************************
+    def startIndexing(self, paths):
+        self.logger.info(f'Indexing conversations : {paths}')
+        self.stopIndexing()
+        self.statusLbl.setText("Indexing...")
+        self.stopButton.setEnabled(True)
+
+        self.job = IndexJob(self.logger, self.config, paths, self.passwordEdit.text())
+        self.job.signals.progress.connect(self.indexProgress)
+        self.job.signals.finished.connect(self.indexFinished)
+        self.threadPool.start(self.job)
+
+    # *******************************************
+    # Stop indexing in progress, if there is any.
+    # *******************************************
+    def stopIndexing(self):
+        if self.job is not None:
+            self.logger.debug("Stopping indexing of conversations.")
+            self.job.signals.progress.disconnect(self.indexProgress)
+            self.job.signals.finished.disconnect(self.indexFinished)
+            self.job.stop()
+            self.job = None
+            self.stopButton.setEnabled(False)
+            self.statusLbl.setText("Indexing stopped.")
+
+    # *******************************************
+    # Callback for indexing progress.
+    # *******************************************
+    def indexProgress(self, numIndexed, numFound):
+        self.statusLbl.setText(f'Indexing... conversations : {numFound:,}; indexed : {numIndexed:,}')
+
+    # *******************************************
+    # Callback for indexing finishing.
+    # *******************************************
+    def indexFinished(self, numIndexed, numFound, error):
+        self.job = None
+        self.stopButton.setEnabled(False)
+        if error != "":
+            self.statusLbl.setText(f'Indexing failed : {error}')
+        else:
+            self.logger.info(f'Conversations : {numFound}; indexed : {numIndexed}')
+            self.statusLbl.setText(f'Conversations : {numFound:,}; indexed : {numIndexed:,}')
+
+    # *******************************************
+    # Callback for a message being double clicked, to show it in its conversation.
+    # *******************************************
+    def resultDoubleClicked(self, index):
+        if index.isValid():
+            hit = self.model.hits[index.row()]
+            self.openMessage(hit.picFile, hit.msgNum, self.passwordEdit.text())
+
+    # *******************************************
+    # Stop indexing when the dialog is closed.
+    # *******************************************
+    def closeEvent(self, event):
+        self.stopIndexing()
+        super(SearchDialog, self).closeEvent(event)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+import uuid
+
+from constants import *
+from container import *
+from picProbe import *
+from utils import *
+
+# *******************************************
+# Spanning of one file across several cover images.
+#
+# The file is split into parts, one for each cover image, each part as large
+# as the embedding capacity of its image allows.
+# Each part is embedded in a version 2 container of type CODETYPE_SPAN, whose
+# header gives the set the part belongs to, and where the part fits in the file.
+# As each part is in its own image, parts can be embedded and extracted in parallel,
+# and the images can be found in any order, and with other images.
+# Parts are embedded as they are, so the file is not compressed.
+# *******************************************
+
+# *******************************************
+# Span error, for a file that can't be spanned or reassembled.
+# *******************************************
+class SpanError(Exception):
+    pass
+
+# *******************************************
+# Planned part class.
+# The image to embed a part in, and where the part fits in the file.
+# *******************************************
+class SpanPlan():
+    def __init__(self, picFile, span, size):
+
+        self.picFile = picFile
+        self.span = span
+        self.size = size
+
+# *******************************************
+# Plan the parts of a file spanning cover images.
+# Cover images are used in the order given, until all of the file is planned.
+# Returns list of planned parts.
+# Raises SpanError if the images can't hold all of the file.
+# *******************************************
+def planSpan(fileSize, picFiles, maxEmbedRatio, passwordLen, filePath, chunkSize=V2CHUNKSIZE):
+
+    # The header of every part is the same length, as its span fields have a fixed width.
+    header = ContainerHeader()
+    header.password = " " * passwordLen
+    header.filePath = filePath
+    header.chunkSize = chunkSize
+    header.codeType = CodeType.CODETYPE_SPAN.value
+    header.span = SpanPart(bytes(16), 0, 1, 0, 0)
+    headerLen = len(header.pack())
+
+    # Size the parts, from the capacity of each image.
+    sizes = []
+    planned = 0
+    for picFile in picFiles:
+        if planned >= fileSize:
+            break
+        result = probeCapacity(picFile, maxEmbedRatio)
+        if not result.supported:
+            raise SpanError(f'Image not supported : {picFile}; {result.reason}')
+        partSize = min(fileSize - planned, maxPayloadSize(result.capacity, headerLen, chunkSize))
+        if partSize > 0:
+            sizes.append((picFile, partSize))
+            planned += partSize
+
+    if (planned < fileSize) or (len(sizes) == 0):
+        raise SpanError(f'Images can only hold : {planned:,} Bytes; of file size : {fileSize:,} Bytes')
+
+    # Now the number of parts is known, create the span part of each.
+    setId = uuid.uuid4().bytes
+    plans = []
+    offset = 0
+    for partIndex, (picFile, partSize) in enumerate(sizes):
+        plans.append(SpanPlan(picFile, SpanPart(setId, partIndex, len(sizes), offset, fileSize), partSize))
+        offset += partSize
+    return plans
+
+# *******************************************
+# Found set class.
+# The images holding the parts of a spanned file, in part order.
+# *******************************************
+class SpanSet():
+    def __init__(self, setId, fileName, partCount, totalSize):
+
+        self.setId = setId
+        self.fileName = fileName
+        self.partCount = partCount
+        self.totalSize = totalSize
+
+        # Probe results of the parts found, by part index.
+        self.parts = {}
+
+    # *******************************************
+    # Return the missing part indexes.
+    # *******************************************
+    def missingParts(self):
+        return [partIndex for partIndex in range(self.partCount) if partIndex not in self.parts]
+
+    # *******************************************
+    # Check the parts found make up the whole file.
+    # Returns error text, or empty string if the set is complete.
+    # *******************************************
+    def checkComplete(self):
+        missing = self.missingParts()
+        if len(missing) > 0:
+            return f'Missing parts : {", ".join(str(partIndex + 1) for partIndex in missing)}; of : {self.partCount}'
+        offset = 0
+        for partIndex in range(self.partCount):
+            part = self.parts[partIndex]
+            if part.spanOffset != offset:
+                return f'Part : {partIndex + 1}; has offset : {part.spanOffset}; expected : {offset}'
+            offset += part.embeddedFileSize
+        if offset != self.totalSize:
+            return f'Parts have size : {offset}; expected : {self.totalSize}'
+        return ""
+
+    # *******************************************
+    # Return the probe results of the parts, in part order.
+    # *******************************************
+    def orderedParts(self):
+        return [self.parts[partIndex] for partIndex in range(self.partCount)]
+
+# *******************************************
+# Group probe results of images into sets of spanned files.
+# Images that aren't parts of a spanned file are ignored.
+# If a part is found in more than one image, the first is used.
+# Returns dictionary of sets, by set ID, in the order first found.
+# *******************************************
+def groupSpanParts(results):
+    spanSets = collections.OrderedDict()
+    for result in results:
+        if (not result.picCoded) or (result.picCodeType != CodeType.CODETYPE_SPAN.value):
+            continue
+        spanSet = spanSets.get(result.spanSetId)
+        if spanSet is None:
+            spanSet = SpanSet(result.spanSetId, result.embeddedFileName, result.spanCount, result.spanTotalSize)
+            spanSets[result.spanSetId] = spanSet
+        elif (result.spanCount != spanSet.partCount) or (result.spanTotalSize != spanSet.totalSize):
+            continue
+        spanSet.parts.setdefault(result.spanIndex, result)
+    return spanSets
+
+# *******************************************
+# Run a task for each item in a pool, yielding the results in the order of the items.
+# Only a window of items are in progress at a time, so memory is bounded
+# by the size of the window, not the number of items.
+# If there is no pool the task is run for each item in turn.
+# *******************************************
+def orderedResults(pool, task, items, window, *args):
+    if pool is None:
+        for item in items:
+            yield task(item, *args)
+        return
+    pending = collections.deque()
+    items = iter(items)
+    try:
+        for item in items:
+            pending.append(pool.submit(task, item, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 
-from PyQt5 import QtGui
+from PyQt5 import QtCore, QtGui
+import numpy as np
+import array
+import copy
 import datetime
+import itertools
 import os
+import re
+import zlib
 
 from constants import *
 from utils import *
+from vectorEngine import *
+from picCursor import *
+from pipeline import *
+from parallelEngine import *
+from payloadCodec import *
+from container import *
+from mappedImage import *
+from bandEngine import *
+from compiledPayload import *
+from picProbe import *
 
 # *******************************************
 # Consealing and retrieving data in/from image pixel colour.
@@ -25,6 +41,14 @@ from utils import *
 # <FileLength>  - LENBYTES bytes, indicates the length of the embedded file.
 # <File>        - <FileLength> bytes, the actual embedded file.
 #
+# <CodeType> = CODETYPE_ZFILE indicates a compressed file is embedded, with the following format:
+# <Codec>       - CODECBYTES bytes, the compression codec.
+# <NameLength>  - NAMELENBYTES bytes, indicates the length of the file name (including path).
+# <FileName>    - <NameLength> bytes, the path and filename of the embedded file.
+# <FileLength>  - LENBYTES bytes, indicates the length of the embedded file.
+# <CodedLength> - LENBYTES bytes, indicates the length of the compressed file.
+# <File>        - <CodedLength> bytes, the compressed file.
+#
 # <CodeType> = CODETYPE_TEXT indicates a text conversion is embedded, with the following format:
 # <NumTexts>    - NUMSMSBYTES bytes, indicates the number of text messages in the file.
 #               - Repeat the following for each text message.
@@ -36,6 +60,16 @@ from utils import *
 # <MsgLength>   - SMSLENBYTES bytes, indicates the length of the message.
 # <Message>     - <MsgLength> bytes, the actual message text.
 #
+# <CodeType> = CODETYPE_ZTEXT indicates a compressed text conversation is embedded, with the following format:
+# <Codec>       - CODECBYTES bytes, the compression codec.
+# <NumTexts>    - NUMSMSBYTES bytes, indicates the number of text messages in the file.
+# <CodedLength> - LENBYTES bytes, indicates the length of the compressed messages.
+# <Messages>    - <CodedLength> bytes, the compressed messages, each as for CODETYPE_TEXT.
+#
+# Images embedded with FormatVersion 2 start with V2MAGIC instead of "PICCODER", followed by a
+# binary container with fixed width lengths and CRC protected chunks, see container.py.
+# Images embedded with the format above (version 1) can still be read.
+#
 # Data is stored in the RGB colour data of pixels.
 # Bit by bit the data is stored by ROW, then by COLUMN, then by colour bit starting with the LSB.
 # One bit of each pixel for one colour is encoded before encoding in the next colour.
@@ -47,13 +81,15 @@ from utils import *
 # *******************************************
 # Text message class
 # *******************************************
-class TextMessage():   
+class TextMessage():
+    __slots__ = ('writer', 'msgText', 'msgTime')
+
     def __init__(self, writer, msgText, msgTime=None):
 
         self.writer = writer
         self.msgText = msgText
         if msgTime == None:
-            self.msgTime = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+            self.msgTime = datetime.datetime.now().strftime(MSGTIMEFORMAT)
         else:
             self.msgTime = msgTime
     
@@ -67,38 +103,329 @@ class TextMessage():
             f'Message :  {self.msgText}\n'
         )
 
+# *******************************************
+# Convert a message timestamp to seconds since the epoch, or None if not a valid timestamp.
+# Only timestamps exactly in the message time format are converted, so they convert back unchanged.
+# Timestamps have no time zone, so are taken as UTC.
+# *******************************************
+MSGTIMEPATTERN = re.compile(r'(\d\d)-(\d\d)-(\d{4}) (\d\d):(\d\d):(\d\d)', re.ASCII)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def timeToEpoch(msgTime):
+    match = MSGTIMEPATTERN.fullmatch(msgTime) if isinstance(msgTime, str) else None
+    if match is None:
+        return None
+    day, month, year, hour, minute, second = (int(field) for field in match.groups())
+    if year < 1000:
+        return None
+    try:
+        return (datetime.datetime(year, month, day, hour, minute, second) - EPOCH) // datetime.timedelta(seconds=1)
+    except ValueError:
+        return None
+
+# *******************************************
+# Convert seconds since the epoch to a message timestamp.
+# *******************************************
+def epochToTime(seconds):
+    return (EPOCH + datetime.timedelta(seconds=seconds)).strftime(MSGTIMEFORMAT)
+
+# *******************************************
+# Writer table class.
+# Each writer name of a conversation is held once, with messages referring to it by ID.
+# *******************************************
+class WriterTable():
+    def __init__(self):
+
+        self.names = []
+        self.ids = {}
+
+    # *******************************************
+    # Get the ID of a writer name, adding it if it is new.
+    # *******************************************
+    def writerId(self, name):
+        writerId = self.ids.get(name)
+        if writerId is None:
+            writerId = len(self.names)
+            self.names.append(name)
+            self.ids[name] = writerId
+        return writerId
+
+# *******************************************
+# Message columns class.
+# Messages held in columns rather than as objects: writer IDs, timestamps as seconds since the epoch,
+# and texts in one buffer of UTF-8 bytes with the offset of each.
+# Timestamps that aren't valid are kept as they are, by message position.
+# If each message is grouped with the message before it, being by the same writer
+# within a certain time, is found as each message is appended.
+# *******************************************
+class MessageColumns():
+    def __init__(self, writers, sameMsgTime):
+
+        self.writers = writers
+        self.sameMsgTime = sameMsgTime
+
+        self.writerIds = array.array('I')
+        self.times = array.array('q')
+        self.oddTimes = {}
+        self.texts = bytearray()
+        self.textOffsets = array.array('Q', [0])
+        self.grouped = bytearray()
+
+    # *******************************************
+    # Number of messages.
+    # *******************************************
+    def __len__(self):
+        return len(self.writerIds)
+
+    # *******************************************
+    # Append a message.
+    # *******************************************
+    def append(self, writer, msgText, msgTime):
+        pos = len(self.writerIds)
+        writerId = self.writers.writerId(writer)
+        seconds = timeToEpoch(msgTime)
+        if seconds is None:
+            self.oddTimes[pos] = msgTime
+            seconds = 0
+        self.writerIds.append(writerId)
+        self.times.append(seconds)
+        self.texts += msgText.encode('utf-8')
+        self.textOffsets.append(len(self.texts))
+        self.grouped.append((pos > 0) and self.groupedAfter(pos, self.writerIds[pos - 1], self.times[pos - 1], pos - 1 in self.oddTimes))
+
+    # *******************************************
+    # Append messages.
+    # *******************************************
+    def extend(self, messages):
+        for msg in messages:
+            self.append(msg.writer, msg.msgText, msg.msgTime)
+
+    # *******************************************
+    # Check if the message at a position would be grouped after a message with the given writer and time.
+    # Messages with timestamps that aren't valid aren't grouped.
+    # *******************************************
+    def groupedAfter(self, pos, prevWriterId, prevTime, prevOdd=False):
+        if prevOdd or (pos in self.oddTimes):
+            return False
+        return (self.writerIds[pos] == prevWriterId) and ((self.times[pos] - prevTime) < self.sameMsgTime)
+
+    # *******************************************
+    # Get the message at a position.
+    # *******************************************
+    def message(self, pos):
+        msgTime = self.oddTimes.get(pos)
+        if msgTime is None:
+            msgTime = epochToTime(self.times[pos])
+        msgText = self.texts[self.textOffsets[pos]:self.textOffsets[pos + 1]].decode('utf-8')
+        return TextMessage(self.writers.names[self.writerIds[pos]], msgText, msgTime)
+
+    # *******************************************
+    # Get the messages from start position up to end position.
+    # *******************************************
+    def messages(self, start, end):
+        return [self.message(pos) for pos in range(start, end)]
+
 # *******************************************
 # Conversation class
+# Messages embedded in an image come first, and are only read from the image when needed,
+# a page of CONVPAGESIZE messages at a time, by a loader.
+# The loader takes the start and end index of messages to read, and returns the messages.
+# Messages added to the conversation follow the embedded messages.
+# Pages read and added messages are held in columns, see MessageColumns.
 # *******************************************
 class Conversation():   
-    def __init__(self):
+    def __init__(self, sameMsgTime=0):
+
+        # Time within which messages by the same writer are grouped.
+        self.sameMsgTime = sameMsgTime
+
+        # Writer names of the conversation.
+        self.writers = WriterTable()
 
-        self.messages = []
+        # Embedded messages, their loader, and the pages of them read so far.
+        self.numStored = 0
+        self.loader = None
+        self.pages = {}
+
+        # Number of messages, from the start of the conversation, that the image holds,
+        # so embedding the conversation again only has to embed the messages after them.
+        self.numEmbedded = 0
+
+        # Messages added to the conversation.
+        self.added = MessageColumns(self.writers, sameMsgTime)
+
+    # *******************************************
+    # Set the number of messages embedded in an image, and the loader to read them.
+    # *******************************************
+    def setStored(self, numStored, loader):
+        self.numStored = numStored
+        self.loader = loader
+        self.pages = {}
+        self.numEmbedded = numStored
 
     # *******************************************
     # Add another message to the conversation.
     # *******************************************
     def addMsg(self, writer, msgText, msgTime=None):
-        # Create message and add to list of messages.
-        self.messages.append(TextMessage(writer, msgText, msgTime))
+        if msgTime == None:
+            msgTime = datetime.datetime.now().strftime(MSGTIMEFORMAT)
+        self.added.append(writer, msgText, msgTime)
 
     # *******************************************
     # Return number of messages in the conversation.
+    # No messages are read to find out.
     # *******************************************
     def numMessages(self):
-        return (len(self.messages))
+        return (self.numStored + len(self.added))
+
+    # *******************************************
+    # Get messages of the conversation from start index up to end index.
+    # Only the pages of embedded messages needed are read.
+    # Messages that couldn't be read are left out.
+    # *******************************************
+    def getMessages(self, start, end):
+        start = max(0, start)
+        end = min(end, self.numMessages())
+        messages = []
+        storedEnd = min(end, self.numStored)
+        if start < storedEnd:
+            for page in range(start // CONVPAGESIZE, (storedEnd + CONVPAGESIZE - 1) // CONVPAGESIZE):
+                pageStart = page * CONVPAGESIZE
+                columns = self.getPage(page)
+                messages += columns.messages(min(len(columns), max(0, start - pageStart)), min(len(columns), max(0, end - pageStart)))
+        messages += self.added.messages(max(0, start - self.numStored), max(0, end - self.numStored))
+        return messages
+
+    # *******************************************
+    # Get a message of the conversation, or None if it couldn't be read.
+    # *******************************************
+    def getMessage(self, idx):
+        columns, pos = self.locate(idx)
+        return columns.message(pos) if columns is not None else None
+
+    # *******************************************
+    # Check if a message is grouped with the message before it.
+    # The first message of a page is checked against the last message of the page before.
+    # *******************************************
+    def groupedWithPrevious(self, idx):
+        columns, pos = self.locate(idx)
+        if (columns is None) or (idx == 0):
+            return False
+        if pos > 0:
+            return bool(columns.grouped[pos])
+        prevColumns, prevPos = self.locate(idx - 1)
+        if prevColumns is None:
+            return False
+        return columns.groupedAfter(pos, prevColumns.writerIds[prevPos], prevColumns.times[prevPos], prevPos in prevColumns.oddTimes)
+
+    # *******************************************
+    # Find the columns holding a message, and its position in them.
+    # Returns None for the columns if the message couldn't be read.
+    # *******************************************
+    def locate(self, idx):
+        if (idx < 0) or (idx >= self.numMessages()):
+            return None, 0
+        if idx < self.numStored:
+            columns = self.getPage(idx // CONVPAGESIZE)
+            pos = idx % CONVPAGESIZE
+        else:
+            columns = self.added
+            pos = idx - self.numStored
+        return (columns, pos) if pos < len(columns) else (None, 0)
+
+    # *******************************************
+    # Get a page of embedded messages, reading it if it hasn't been read.
+    # *******************************************
+    def getPage(self, page):
+        if page not in self.pages:
+            pageStart = page * CONVPAGESIZE
+            columns = MessageColumns(self.writers, self.sameMsgTime)
+            columns.extend(self.loader(pageStart, min(self.numStored, pageStart + CONVPAGESIZE)))
+            self.pages[page] = columns
+        return self.pages[page]
+
+    # *******************************************
+    # All messages of the conversation.
+    # Reads all of the embedded messages.
+    # *******************************************
+    @property
+    def messages(self):
+        return self.getMessages(0, self.numMessages())
+
+    # *******************************************
+    # Read all of the embedded messages, so the conversation no longer needs the image.
+    # The image still holds the messages, so they are still embedded.
+    # Returns all messages of the conversation.
+    # *******************************************
+    def loadAll(self):
+        messages = self.messages
+        numEmbedded = self.numEmbedded
+        self.added = MessageColumns(self.writers, self.sameMsgTime)
+        self.added.extend(messages)
+        self.setStored(0, None)
+        self.numEmbedded = numEmbedded
+        return messages
 
     # *******************************************
     # Clear all messages in the conversation.
     # *******************************************
     def clearMessages(self):
-        self.messages = []
+        self.setStored(0, None)
+        self.writers = WriterTable()
+        self.added = MessageColumns(self.writers, self.sameMsgTime)
+
+# *******************************************
+# Exception raised when an operation is cancelled.
+# *******************************************
+class OperationCancelled(Exception):
+    pass
+
+# *******************************************
+# Find the ranges of new data that differ from old data.
+# Ranges closer than gap bytes are joined, as each range is a separate write.
+# New data beyond the end of the old data is always changed.
+# Returns list of (start, end) byte ranges of the new data.
+# *******************************************
+def changedRanges(oldData, newData, gap=DELTAGAPBYTES):
+    common = min(len(oldData), len(newData))
+    old = np.frombuffer(oldData, dtype=np.uint8, count=common)
+    new = np.frombuffer(newData, dtype=np.uint8, count=common)
+    changed = np.flatnonzero(old != new)
+    ranges = []
+    if changed.size > 0:
+        breaks = np.flatnonzero(np.diff(changed) > gap)
+        starts = changed[np.concatenate(([0], breaks + 1))]
+        ends = changed[np.concatenate((breaks, [changed.size - 1]))] + 1
+        ranges = [(int(start), int(end)) for start, end in zip(starts, ends)]
+    if len(newData) > common:
+        if (len(ranges) > 0) and ((common - ranges[-1][1]) <= gap):
+            ranges[-1] = (ranges[-1][0], len(newData))
+        else:
+            ranges.append((common, len(newData)))
+    return ranges
+
+# *******************************************
+# Progress class that doesn't report progress.
+# Used when there is no progress bar, e.g. from the command line.
+# *******************************************
+class NullProgress():
+    def setNote(self, note):
+        pass
+
+    def setProgress(self, progress):
+        pass
+
+    def showProgressBar(self):
+        pass
+
+    def hideProgressBar(self):
+        pass
 
 # *******************************************
 # Steganography image class
 # *******************************************
 class Steganography():   
-    def __init__(self, config, log, data):
+    def __init__(self, config, log, data=None):
 
         self.cfg = config
         self.log = log
@@ -106,8 +433,28 @@ class Steganography():
 
         self.log.debug("Steganography class constructor.")
 
-        # Initialise picture file
+        # Progress reporting for long operations.
+        # Defaults to the application progress bar, but can be replaced, e.g. when run as a job.
+        # Without application data, e.g. from the command line, progress isn't reported.
+        if data is not None:
+            self.progress = data.progressBar
+        else:
+            self.progress = NullProgress()
+
+        # Flag to request that the current operation is cancelled.
+        self.cancelRequested = False
+
+        # Parallel engine, only created if parallel processing is configured.
+        # Session over the image pixels while an operation is being done in parallel.
+        self.parallelEngine = None
+        self.parallelSession = None
+
+        # Initialise picture file.
+        # Uncompressed images are memory mapped rather than decoded, and images too large to decode can be streamed.
         self.picFile = ""
+        self.image = QtGui.QImage()
+        self.mapped = None
+        self.streamed = None
 
         # Default image flags.
         self.picCoded = False
@@ -116,18 +463,40 @@ class Steganography():
         self.password = ""
         self.picCodeNameLen = 0
 
+        # Format version of the embedded data, and the header of a version 2 container.
+        self.picVersion = 0
+        self.container = None
+
+        # Members of an embedded archive, from its index.
+        self.archiveMembers = []
+
+        # Data embedded in the image from its start, if known, so embedding again only rewrites what has changed.
+        # Only kept for conversations, as they are small.
+        self.embeddedData = None
+
         # Initialise parameters for embedded file.
         self.embeddedFilePath = ""
         self.embeddedFileName = ""
         self.embeddedFileSize = 0
+        self.embeddedFileOffset = 0
         self.toEmbedFilePath = ""
         self.toEmbedFileSize = 0
 
+        # Compression codec of embedded data, and size of the compressed embedded file.
+        # Compression codec to embed a file with.
+        self.picCodec = Codec.CODEC_NONE.value
+        self.embeddedCodedSize = 0
+        self.toEmbedCodec = Codec.CODEC_NONE.value
+
         # Initialise approximate embedding capacity of image.
         self.capacity = 0
 
         # Initialise conversation to accept embedded conversation.
-        self.conversation = Conversation()
+        # Also offsets to each message in the embedded data, as far as they are known,
+        # and the messages of a conversation that can only be read all at once.
+        self.conversation = Conversation(self.cfg.SmsRender["SameMsgTime"])
+        self.messageOffsets = []
+        self.decodedMessages = None
 
         # Initialise image file read parameters.
         self.row = 0
@@ -140,22 +509,69 @@ class Steganography():
 
     # *******************************************
     # Load an image to analyze.
+    # Uncompressed images are mapped copy on write, or in place so pixels written go straight to the image file.
+    # If streaming is allowed, PNG images too large to decode within the memory budget are streamed in bands.
     # *******************************************
-    def loadNewImage(self, picFile):
+    def loadNewImage(self, picFile, inPlace=False, stream=False):
 
         # Initislise conversation in case image has embedded conversation.
         self.conversation.clearMessages()
+        self.messageOffsets = []
+        self.decodedMessages = None
+        self.picCodec = Codec.CODEC_NONE.value
+        self.embeddedCodedSize = 0
+
+        # Clear image flags from any previous image.
+        self.picCoded = False
+        self.picCodeType = CodeType.CODETYPE_NONE
+        self.picPassword = False
+        self.password = ""
+        self.picVersion = 0
+        self.container = None
+        self.archiveMembers = []
+        self.embeddedData = None
 
         # Image to open and read/store data from/to.
         self.picFile = picFile
         self.log.debug(f'Opening image file for analysis : {self.picFile}')
-        self.bitmap = QtGui.QPixmap(picFile)
-        self.image = QtGui.QImage(picFile)
+
+        # Uncompressed images are mapped, so pixel data is accessed directly in the image file without decoding.
+        # Images too large to decode are streamed, so pixel data is accessed a band of rows at a time.
+        # Otherwise decode the image once, into a fixed 32-bit pixel format so that pixel data can be accessed directly.
+        # The same pixel buffer is used for embedding / extracting data and for display.
+        self.closeImage()
+        self.image = QtGui.QImage()
+        if isMappedImage(picFile):
+            try:
+                self.mapped = MappedImage(picFile, inPlace)
+            except (MappedImageError, OSError, ValueError) as e:
+                self.log.error(f'Failed to map image file : {str(e)}')
+        else:
+            if stream:
+                self.streamed = self.openStreamed(picFile)
+            if self.streamed is None:
+                self.image = QtGui.QImage(picFile)
+                if self.image.hasAlphaChannel():
+                    imageFormat = QtGui.QImage.Format_ARGB32
+                else:
+                    imageFormat = QtGui.QImage.Format_RGB32
+                if self.image.format() != imageFormat:
+                    self.log.debug(f'Converting image from format : {self.image.format()}; to format : {imageFormat}')
+                    self.image.convertTo(imageFormat)
 
         # Get image information.
-        self.picWidth = self.bitmap.width()
-        self.picHeight = self.bitmap.height()
-        self.colCount = self.bitmap.colorCount()
+        if self.mapped is not None:
+            self.picWidth = self.mapped.width
+            self.picHeight = self.mapped.height
+            self.colCount = 0
+        elif self.streamed is not None:
+            self.picWidth = self.streamed.width
+            self.picHeight = self.streamed.height
+            self.colCount = 0
+        else:
+            self.picWidth = self.image.width()
+            self.picHeight = self.image.height()
+            self.colCount = self.image.colorCount()
         # Qt returns 0 for colour count of 32.
         if self.colCount == 0:
             self.colCount = 32
@@ -167,6 +583,9 @@ class Steganography():
         self.picBytes = self.picWidth * self.picHeight * 3
         self.log.debug(f'Absolute maximimum space for embedding (Bytes) : {self.picBytes}')
 
+        # Create cursor to map between embedded data offsets and image read / write pointers.
+        self.cursor = PicCursor(self.picWidth, self.picHeight, self.colPlanes)
+
         # Initialise image file read parameters.
         self.row = 0
         self.col = 0
@@ -186,6 +605,40 @@ class Steganography():
         if self.picCoded:
             self.getpicCodedData()
 
+    # *******************************************
+    # Get the probe result of the loaded image, from what was read from it as it was loaded,
+    # so the image doesn't have to be probed again, e.g. to record it in the probe index.
+    # *******************************************
+    def probeResult(self):
+        result = ProbeResult(self.picFile)
+        result.readable = self.isLoaded()
+        result.supported = result.readable
+        result.width = self.picWidth
+        result.height = self.picHeight
+        if not self.picCoded:
+            return result
+
+        result.picCoded = True
+        result.picCodeType = self.picCodeType
+        result.picPassword = self.picPassword
+        result.codec = self.picCodec
+        if self.picCodeType in (CodeType.CODETYPE_FILE.value, CodeType.CODETYPE_SPAN.value):
+            result.embeddedFilePath = self.embeddedFilePath
+            result.embeddedFileName = self.embeddedFileName
+            result.embeddedFileSize = self.embeddedFileSize
+            span = None if self.container is None else self.container.span
+            if span is not None:
+                result.spanSetId = span.setId.hex()
+                result.spanIndex = span.partIndex
+                result.spanCount = span.partCount
+                result.spanOffset = span.partOffset
+                result.spanTotalSize = span.totalSize
+        elif self.picCodeType == CodeType.CODETYPE_TEXT.value:
+            result.numMessages = self.conversation.numMessages()
+        elif (self.picCodeType == CodeType.CODETYPE_ARCHIVE.value) and (self.container is not None):
+            result.numMembers = self.container.numMessages
+        return result
+
     # *******************************************
     # Check embedding capacity of image.
     # Embedding capacity is approximate as preamble is not fixed.
@@ -194,7 +647,7 @@ class Steganography():
         self.log.info(f'Calculating image embedding capacity for embed ratio : {self.cfg.MaxEmbedRatio}')
 
         # Embedding capacity pixels * colours * colourBits * MaxEmbedRatio / 8 bitsPerByte
-        self.capacity = int(self.picWidth * self.picHeight * 3 * self.cfg.MaxEmbedRatio)
+        self.capacity = calcCapacity(self.picWidth, self.picHeight, self.cfg.MaxEmbedRatio)
         self.log.debug(f'Approximate embedding capacity, including preamble (Bytes) : {self.capacity}')
 
     # *******************************************
@@ -215,6 +668,9 @@ class Steganography():
             # Check if we read the expected number of bytes.
             if (self.bytesRead != bytesToRead):
                 self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+            elif bytes(self.codeBytes) == V2MAGIC:
+                # Version 2 container, the rest of the header is binary.
+                self.checkForContainer()
             else:
                 # Check if the code matches the expected picCoder code.
                 progCode = ""
@@ -253,15 +709,45 @@ class Steganography():
                                 self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
                             else:
                                 self.password = self.codeBytes.decode('utf-8')
+                                self.picVersion = 1
                                 self.log.debug("Image password (or not) read.")
                 else:
                     self.log.debug("Image file did not contain a valid header code.")
 
+    # *******************************************
+    # Read the header of a version 2 container, following the magic.
+    # The header is read in one read, once its length is known, and its CRC checked.
+    # *******************************************
+    def checkForContainer(self):
+        self.log.info("Image file contains version 2 container magic.")
+
+        def readHeaderBytes(bytesToRead):
+            self.readDataFromImage(bytesToRead)
+            return bytes(self.codeBytes)
+
+        try:
+            self.container = readHeader(readHeaderBytes)
+        except ContainerError as e:
+            self.log.error(f'Failed to read container header : {str(e)}')
+            return
+
+        self.log.debug(f'Container header : {self.container}')
+        self.picCoded = True
+        self.picVersion = V2VERSION
+        self.picPassword = self.container.passworded
+        self.password = self.container.password
+        self.log.info(f'Image file has password protection : {self.picPassword}')
+
     # *******************************************
     # Read picCoded data from image.
     # *******************************************
     def getpicCodedData(self):
 
+        # Version 2 container header has already been read.
+        if self.picVersion == V2VERSION:
+            self.getContainerData()
+            return
+
         # Read the data type field.
         bytesToRead = CODETYPEBYTES
         self.readDataFromImage(bytesToRead)
@@ -272,6 +758,24 @@ class Steganography():
             self.picCodeType = int(self.codeBytes.decode('utf-8'))
             self.log.info(f'Image file has embedded data of type : {self.picCodeType}')
 
+            # Compressed data has the codec next, otherwise is the same as uncompressed data.
+            if self.picCodeType in (CodeType.CODETYPE_ZFILE.value, CodeType.CODETYPE_ZTEXT.value):
+                if self.picCodeType == CodeType.CODETYPE_ZFILE.value:
+                    self.picCodeType = CodeType.CODETYPE_FILE.value
+                else:
+                    self.picCodeType = CodeType.CODETYPE_TEXT.value
+                bytesToRead = CODECBYTES
+                self.readDataFromImage(bytesToRead)
+                # Check if we read the expected number of bytes.
+                if (self.bytesRead != bytesToRead):
+                    self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                    return
+                self.picCodec = int(self.codeBytes.decode('utf-8'))
+                self.log.info(f'Embedded data is compressed with codec : {codecName(self.picCodec)}')
+                if not isCodec(self.picCodec):
+                    self.log.error("Unsupported compression codec.")
+                    return
+
             # Get data based on embedded data type:
  
             # ********************************************************
@@ -288,75 +792,12 @@ class Steganography():
                 else:
                     numMsgs = int(self.codeBytes.decode('utf-8'))
                     self.log.info(f'Image file has embedded conversion with number of messages : {numMsgs}')
-                    for idx in range(numMsgs):
-                        # Read the number of this message.
-                        bytesToRead = NUMSMSBYTES
-                        self.readDataFromImage(bytesToRead)
-                        # Check if we read the expected number of bytes.
-                        if (self.bytesRead != bytesToRead):
-                            self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                        else:
-                            msgNum = int(self.codeBytes.decode('utf-8'))
-                            # Check if message number is incrementing correctly.
-                            if msgNum != (idx+1):
-                                self.log.error(f'Message number out of sequence, expected : {idx+1}, read : {msgNum}')
-                                break
-                            else:
-                                self.log.info(f'Processing message number : {msgNum}')
-                                # Read the length of the writers name of this message.
-                                bytesToRead = NAMELENBYTES
-                                self.readDataFromImage(bytesToRead)
-                                # Check if we read the expected number of bytes.
-                                if (self.bytesRead != bytesToRead):
-                                    self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                                else:
-                                    lenWriter = int(self.codeBytes.decode('utf-8'))
-                                    # Read the name of the writer of this message.
-                                    bytesToRead = lenWriter
-                                    self.readDataFromImage(bytesToRead)
-                                    # Check if we read the expected number of bytes.
-                                    if (self.bytesRead != bytesToRead):
-                                        self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                                    else:
-                                        nameWriter = self.codeBytes.decode('utf-8')
-                                        self.log.info(f'Message from writer : {nameWriter}')
-                                        # Read the length of the timestamp of this message.
-                                        bytesToRead = TIMELENBYTES
-                                        self.readDataFromImage(bytesToRead)
-                                        # Check if we read the expected number of bytes.
-                                        if (self.bytesRead != bytesToRead):
-                                            self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                                        else:
-                                            lenTime = int(self.codeBytes.decode('utf-8'))
-                                            # Read the timestamp of this message.
-                                            bytesToRead = lenTime
-                                            self.readDataFromImage(bytesToRead)
-                                            # Check if we read the expected number of bytes.
-                                            if (self.bytesRead != bytesToRead):
-                                                self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                                            else:
-                                                msgTime = self.codeBytes.decode('utf-8')
-                                                self.log.info(f'Message timestamp : {msgTime}')
-                                                # Read the length of this message.
-                                                bytesToRead = SMSLENBYTES
-                                                self.readDataFromImage(bytesToRead)
-                                                # Check if we read the expected number of bytes.
-                                                if (self.bytesRead != bytesToRead):
-                                                    self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                                                else:
-                                                    lenMsg = int(self.codeBytes.decode('utf-8'))
-                                                    # Read the timestamp of this message.
-                                                    bytesToRead = lenMsg
-                                                    self.readDataFromImage(bytesToRead)
-                                                    # Check if we read the expected number of bytes.
-                                                    if (self.bytesRead != bytesToRead):
-                                                        self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
-                                                    else:
-                                                        self.log.debug(f'Message bytes : {self.bytesRead}')
-                                                        msgText = self.codeBytes.decode('utf-8')
-
-                                                        # Add message to conversion object.
-                                                        self.conversation.addMsg(nameWriter, msgText, msgTime)
+                    # Messages are only read when needed, starting from the first message.
+                    self.messageOffsets = [self.tellData()]
+                    if self.picCodec != Codec.CODEC_NONE.value:
+                        self.conversation.setStored(numMsgs, self.loadCompressedMessages)
+                    else:
+                        self.conversation.setStored(numMsgs, self.loadTextMessages)
 
             # ********************************************************
             # Embedded file.
@@ -392,16 +833,687 @@ class Steganography():
                         else:
                             self.embeddedFileSize = int(self.codeBytes.decode('utf-8'))
                             self.log.info(f'Embedded file has file size : {self.embeddedFileSize}')
+                            # Compressed file has the size of the compressed file next.
+                            if self.picCodec != Codec.CODEC_NONE.value:
+                                bytesToRead = LENBYTES
+                                self.readDataFromImage(bytesToRead)
+                                # Check if we read the expected number of bytes.
+                                if (self.bytesRead != bytesToRead):
+                                    self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                                    return
+                                self.embeddedCodedSize = int(self.codeBytes.decode('utf-8'))
+                                self.log.info(f'Embedded file has compressed size : {self.embeddedCodedSize}')
+                            # Embedded file data follows, save where it starts.
+                            self.embeddedFileOffset = self.tellData()
+                            self.log.debug(f'Embedded file data offset : {self.embeddedFileOffset}')
 
             else:
                 # Unsupported embedded data type.
                 self.log.error("Unsupported coded data type.")
 
+    # *******************************************
+    # Get picCoded data from the header of a version 2 container.
+    # A conversation is read, and its chunks checked, all at once.
+    # *******************************************
+    def getContainerData(self):
+
+        header = self.container
+        self.picCodeType = header.codeType
+        self.picCodec = header.codec
+        self.log.info(f'Image file has embedded data of type : {self.picCodeType}')
+        if not isCodec(self.picCodec):
+            self.log.error("Unsupported compression codec.")
+            return
+        self.log.info(f'Embedded data is compressed with codec : {codecName(self.picCodec)}')
+
+        # ********************************************************
+        # Text conversation.
+        # ********************************************************
+        if self.picCodeType == CodeType.CODETYPE_TEXT.value:
+            # Messages are only read when needed.
+            # With a message offset table only the pages of messages needed are read.
+            self.log.info(f'Image file has embedded conversion with number of messages : {header.numMessages}')
+            if header.indexed and (self.picCodec == Codec.CODEC_NONE.value):
+                self.conversation.setStored(header.numMessages, self.loadIndexedMessages)
+            else:
+                self.conversation.setStored(header.numMessages, self.loadContainerMessages)
+
+        # ********************************************************
+        # Embedded file, or part of a file spanning several images.
+        # ********************************************************
+        elif self.picCodeType in (CodeType.CODETYPE_FILE.value, CodeType.CODETYPE_SPAN.value):
+            if header.span is not None:
+                self.log.info(f'Embedded file is part of spanned file : {header.span}')
+            self.embeddedFilePath = header.filePath
+            self.log.info(f'Embedded file full path : {self.embeddedFilePath}')
+            head, self.embeddedFileName = os.path.split(self.embeddedFilePath)
+            self.embeddedFileSize = header.dataSize
+            self.embeddedCodedSize = header.codedSize
+            self.embeddedFileOffset = header.headerLen
+            self.log.info(f'Embedded file has file size : {self.embeddedFileSize}; coded size : {self.embeddedCodedSize}')
+
+        # ********************************************************
+        # Archive of files.
+        # ********************************************************
+        elif self.picCodeType == CodeType.CODETYPE_ARCHIVE.value:
+            # Only the index at the start of the payload is read, members are read when extracted.
+            self.log.info(f'Image file has embedded archive with number of files : {header.numMessages}')
+            try:
+                indexData = bytearray()
+                for piece in self.readContainerChunks(0, self.cfg.ChunkSize):
+                    indexData += piece
+                    if len(indexData) >= indexLength(indexData):
+                        break
+                self.archiveMembers = unpackIndex(indexData, header.numMessages)
+                for member in self.archiveMembers:
+                    self.log.debug(f'Archive member : {member}')
+            except ContainerError as e:
+                self.log.error(f'Failed to read archive index : {str(e)}')
+
+        else:
+            # Unsupported embedded data type.
+            self.log.error("Unsupported coded data type.")
+
+    # *******************************************
+    # Read the payload of a version 2 container from image file, a chunk at a time.
+    # Several chunks are read from the image at once, up to the hunk size, and the CRC
+    # of each chunk is checked as it is read.
+    # Image read / write pointers are left unchanged.
+    # Yields the payload of each chunk, from the first chunk given.
+    # Raises ContainerError if the payload is short or a chunk is corrupt.
+    # *******************************************
+    def readContainerChunks(self, firstChunk, hunkSize):
+
+        header = self.container
+        framedChunkSize = header.chunkSize + V2CRCBYTES
+        chunksPerRead = max(1, hunkSize // framedChunkSize)
+        endOffset = header.headerLen + header.framedSize()
+
+        chunk = firstChunk
+        numChunks = header.numChunks()
+        while chunk < numChunks:
+            offset = header.chunkOffset(chunk)
+            bytesToRead = min(chunksPerRead * framedChunkSize, endOffset - offset)
+            framed = self.readDataAt(offset, bytesToRead)
+            if len(framed) != bytesToRead:
+                raise ContainerError(f'Expected bytes : {bytesToRead}; bytes read : {len(framed)}')
+            for start in range(0, bytesToRead, framedChunkSize):
+                yield unframeChunk(framed[start:start + framedChunkSize])
+                chunk += 1
+
+    # *******************************************
+    # Read range of the payload of a version 2 container from image file.
+    # Reading starts from the chunk holding the start of the range.
+    # Yields the pieces of the range, as they are read.
+    # Raises ContainerError if the payload is short or a chunk is corrupt.
+    # *******************************************
+    def readContainerPayload(self, offset, length, hunkSize):
+
+        if length <= 0:
+            return
+        firstChunk = offset // self.container.chunkSize
+        toSkip = offset - firstChunk * self.container.chunkSize
+        for piece in self.readContainerChunks(firstChunk, hunkSize):
+            piece = piece[toSkip:toSkip + length]
+            toSkip = 0
+            length -= len(piece)
+            yield piece
+            if length <= 0:
+                break
+
+    # *******************************************
+    # Read compressed text messages of a conversation from image file.
+    # Continue reading from where we left off.
+    # Returns the messages read.
+    # *******************************************
+    def readCompressedMessages(self, numMsgs):
+
+        messages = []
+
+        # Read the length of the compressed messages.
+        bytesToRead = LENBYTES
+        self.readDataFromImage(bytesToRead)
+        # Check if we read the expected number of bytes.
+        if (self.bytesRead != bytesToRead):
+            self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+            return messages
+        codedLen = int(self.codeBytes.decode('utf-8'))
+
+        # Read and decompress the messages.
+        bytesToRead = codedLen
+        self.readDataFromImage(bytesToRead)
+        # Check if we read the expected number of bytes.
+        if (self.bytesRead != bytesToRead):
+            self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+            return messages
+        try:
+            msgData = decompressBytes(self.picCodec, bytes(self.codeBytes))
+        except Exception as e:
+            self.log.error(f'Failed to decompress conversation : {str(e)}')
+            return messages
+
+        # Create the messages.
+        offset = 0
+        try:
+            for idx in range(numMsgs):
+                msgNum = int(msgData[offset:offset + NUMSMSBYTES].decode('utf-8'))
+                offset += NUMSMSBYTES
+                if msgNum != (idx+1):
+                    raise ValueError(f'Message number out of sequence, expected : {idx+1}, read : {msgNum}')
+
+                # Writer name, timestamp and message text, each after its length.
+                fields = []
+                for lenBytes in (NAMELENBYTES, TIMELENBYTES, SMSLENBYTES):
+                    fieldLen = int(msgData[offset:offset + lenBytes].decode('utf-8'))
+                    offset += lenBytes
+                    fields.append(msgData[offset:offset + fieldLen].decode('utf-8'))
+                    offset += fieldLen
+                nameWriter, msgTime, msgText = fields
+                messages.append(TextMessage(nameWriter, msgText, msgTime))
+        except Exception as e:
+            self.log.error(f'Failed to read compressed message : {str(e)}')
+
+        return messages
+
+    # *******************************************
+    # Load text messages of a conversation from image file, from start index up to end index.
+    # Each message is read from its offset, if known, otherwise the messages before it are
+    # read to find it, saving the offset of each message read.
+    # Image read / write pointers are left unchanged.
+    # Returns the messages read.
+    # *******************************************
+    def loadTextMessages(self, start, end):
+        messages = []
+        pointersSave = (self.row, self.col, self.plane, self.bit)
+        idx = min(start, len(self.messageOffsets) - 1)
+        self.seekData(self.messageOffsets[idx])
+        while idx < end:
+            message = self.readTextMessage(idx+1)
+            if message == None:
+                break
+            if len(self.messageOffsets) == (idx + 1):
+                self.messageOffsets.append(self.tellData())
+            if idx >= start:
+                messages.append(message)
+            idx += 1
+        self.row, self.col, self.plane, self.bit = pointersSave
+        return messages
+
+    # *******************************************
+    # Load compressed text messages of a conversation from image file, from start index up to end index.
+    # All of the messages are read and decompressed the first time, as they are compressed together.
+    # Image read / write pointers are left unchanged.
+    # Returns the messages read.
+    # *******************************************
+    def loadCompressedMessages(self, start, end):
+        if self.decodedMessages is None:
+            pointersSave = (self.row, self.col, self.plane, self.bit)
+            self.seekData(self.messageOffsets[0])
+            self.decodedMessages = MessageColumns(self.conversation.writers, self.conversation.sameMsgTime)
+            self.decodedMessages.extend(self.readCompressedMessages(self.conversation.numStored))
+            self.row, self.col, self.plane, self.bit = pointersSave
+        return self.decodedMessages.messages(start, min(end, len(self.decodedMessages)))
+
+    # *******************************************
+    # Load text messages of a conversation from a version 2 container, from start index up to end index.
+    # All of the messages are read, and decompressed if compressed, the first time.
+    # Returns the messages read.
+    # *******************************************
+    def loadContainerMessages(self, start, end):
+        if self.decodedMessages is None:
+            self.decodedMessages = MessageColumns(self.conversation.writers, self.conversation.sameMsgTime)
+            try:
+                msgData = b"".join(self.readContainerChunks(0, self.cfg.ChunkSize))
+                if self.picCodec != Codec.CODEC_NONE.value:
+                    msgData = decompressBytes(self.picCodec, msgData)
+                for nameWriter, msgTime, msgText in unpackMessages(msgData, self.container.numMessages):
+                    self.decodedMessages.append(nameWriter, msgText, msgTime)
+            except Exception as e:
+                self.log.error(f'Failed to read conversation : {str(e)}')
+        return self.decodedMessages.messages(start, min(end, len(self.decodedMessages)))
+
+    # *******************************************
+    # Load text messages of a conversation from a version 2 container with a message offset table,
+    # from start index up to end index.
+    # Only the table entries of the messages, and the messages themselves, are read.
+    # Returns the messages read.
+    # *******************************************
+    def loadIndexedMessages(self, start, end):
+        if start >= end:
+            return []
+        try:
+            # The end of the last message is the start of the next, or the end of the payload.
+            numMessages = self.container.numMessages
+            numOffsets = (end - start) + (1 if end < numMessages else 0)
+            tableStart = tableEntryOffset(start)
+            tableData = b"".join(self.readContainerPayload(tableStart, tableEntryOffset(start + numOffsets) - tableStart, self.cfg.ChunkSize))
+            offsets = unpackOffsets(tableData, numOffsets)
+            if end == numMessages:
+                offsets.append(self.container.codedSize)
+            if (offsets != sorted(offsets)) or (offsets[-1] > self.container.codedSize):
+                raise ContainerError("Invalid message offset table.")
+
+            msgData = b"".join(self.readContainerPayload(offsets[0], offsets[-1] - offsets[0], self.cfg.ChunkSize))
+            return [TextMessage(nameWriter, msgText, msgTime) for nameWriter, msgTime, msgText in unpackMessages(msgData, end - start)]
+        except ContainerError as e:
+            self.log.error(f'Failed to read conversation messages : {start} to {end}; {str(e)}')
+            return []
+
+    # *******************************************
+    # Read a text message of a conversation from image file.
+    # Continue reading from where we left off.
+    # Returns the message, or None if it could not be read.
+    # *******************************************
+    def readTextMessage(self, expectedNum):
+
+        message = None
+
+        # Read the number of this message.
+        bytesToRead = NUMSMSBYTES
+        self.readDataFromImage(bytesToRead)
+        # Check if we read the expected number of bytes.
+        if (self.bytesRead != bytesToRead):
+            self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+        else:
+            msgNum = int(self.codeBytes.decode('utf-8'))
+            # Check if message number is incrementing correctly.
+            if msgNum != expectedNum:
+                self.log.error(f'Message number out of sequence, expected : {expectedNum}, read : {msgNum}')
+            else:
+                self.log.info(f'Processing message number : {msgNum}')
+                # Read the length of the writers name of this message.
+                bytesToRead = NAMELENBYTES
+                self.readDataFromImage(bytesToRead)
+                # Check if we read the expected number of bytes.
+                if (self.bytesRead != bytesToRead):
+                    self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                else:
+                    lenWriter = int(self.codeBytes.decode('utf-8'))
+                    # Read the name of the writer of this message.
+                    bytesToRead = lenWriter
+                    self.readDataFromImage(bytesToRead)
+                    # Check if we read the expected number of bytes.
+                    if (self.bytesRead != bytesToRead):
+                        self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                    else:
+                        nameWriter = self.codeBytes.decode('utf-8')
+                        self.log.info(f'Message from writer : {nameWriter}')
+                        # Read the length of the timestamp of this message.
+                        bytesToRead = TIMELENBYTES
+                        self.readDataFromImage(bytesToRead)
+                        # Check if we read the expected number of bytes.
+                        if (self.bytesRead != bytesToRead):
+                            self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                        else:
+                            lenTime = int(self.codeBytes.decode('utf-8'))
+                            # Read the timestamp of this message.
+                            bytesToRead = lenTime
+                            self.readDataFromImage(bytesToRead)
+                            # Check if we read the expected number of bytes.
+                            if (self.bytesRead != bytesToRead):
+                                self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                            else:
+                                msgTime = self.codeBytes.decode('utf-8')
+                                self.log.info(f'Message timestamp : {msgTime}')
+                                # Read the length of this message.
+                                bytesToRead = SMSLENBYTES
+                                self.readDataFromImage(bytesToRead)
+                                # Check if we read the expected number of bytes.
+                                if (self.bytesRead != bytesToRead):
+                                    self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                                else:
+                                    lenMsg = int(self.codeBytes.decode('utf-8'))
+                                    # Read the timestamp of this message.
+                                    bytesToRead = lenMsg
+                                    self.readDataFromImage(bytesToRead)
+                                    # Check if we read the expected number of bytes.
+                                    if (self.bytesRead != bytesToRead):
+                                        self.log.error(f'Expected bytes : {bytesToRead}; bytes read : {self.bytesRead}')
+                                    else:
+                                        self.log.debug(f'Message bytes : {self.bytesRead}')
+                                        msgText = self.codeBytes.decode('utf-8')
+
+                                        # Create message to add to conversation.
+                                        message = TextMessage(nameWriter, msgText, msgTime)
+
+        return message
+
+    # *******************************************
+    # Request that the current operation is cancelled.
+    # Can be called from another thread, the operation stops at the next hunk of data.
+    # *******************************************
+    def requestCancel(self):
+        self.log.info("Cancel of current operation requested.")
+        self.cancelRequested = True
+
+    # *******************************************
+    # Stop the current operation if cancel has been requested.
+    # *******************************************
+    def checkCancel(self):
+        if self.cancelRequested:
+            self.cancelRequested = False
+            raise OperationCancelled()
+
+    # *******************************************
+    # Move image read / write pointers to byte offset in the embedded data.
+    # *******************************************
+    def seekData(self, byteOffset):
+        self.row, self.col, self.plane, self.bit = self.cursor.fromOffset(byteOffset)
+
+    # *******************************************
+    # Return byte offset in the embedded data of the image read / write pointers.
+    # *******************************************
+    def tellData(self):
+        return self.cursor.toOffset(self.row, self.col, self.plane, self.bit)
+
+    # *******************************************
+    # Read data from image file at byte offset in the embedded data.
+    # Image read / write pointers are left unchanged.
+    # With the vector engine nothing is shared between reads, so ranges can be read in parallel.
+    # *******************************************
+    def readDataAt(self, byteOffset, bytesToRead):
+        if self.useScalar():
+            pointersSave = (self.row, self.col, self.plane, self.bit)
+            self.seekData(byteOffset)
+            self.readDataScalar(bytesToRead)
+            self.row, self.col, self.plane, self.bit = pointersSave
+            return bytes(self.codeBytes)
+        elif self.parallelSession is not None:
+            return self.parallelSession.readBytes(byteOffset * 8, bytesToRead)
+        else:
+            return self.getVectorEngine().readBytes(byteOffset * 8, bytesToRead)
+
+    # *******************************************
+    # Read range of the embedded file from image file.
+    # Start is relative to start of embedded file, range is limited to the size of the embedded file.
+    # A compressed file has to be decompressed from its start, up to the end of the range.
+    # An uncompressed file in a version 2 container is read from the chunk holding the start of the range.
+    # *******************************************
+    def readEmbeddedRange(self, start, length):
+        start = max(0, min(start, self.embeddedFileSize))
+        length = max(0, min(length, self.embeddedFileSize - start))
+        self.log.debug(f'Reading embedded file range, start : {start}; length : {length}')
+        if (self.picVersion != V2VERSION) and (self.picCodec == Codec.CODEC_NONE.value):
+            return self.readDataAt(self.embeddedFileOffset + start, length)
+
+        # Get the pieces of the file, and how much of them is before the range.
+        if self.picVersion != V2VERSION:
+            pieces = self.readCodedHunks()
+            toSkip = start
+        elif self.picCodec == Codec.CODEC_NONE.value:
+            firstChunk = start // self.container.chunkSize
+            pieces = self.readContainerChunks(firstChunk, self.cfg.ChunkSize)
+            toSkip = start - firstChunk * self.container.chunkSize
+        else:
+            pieces = self.readContainerChunks(0, self.cfg.ChunkSize)
+            toSkip = start
+        if self.picCodec != Codec.CODEC_NONE.value:
+            decompressor = Decompressor(self.picCodec)
+            pieces = (decompressor.decompress(piece) for piece in pieces)
+
+        data = bytearray()
+        try:
+            for piece in pieces:
+                # Only keep data from the start of the range.
+                skipped = min(toSkip, len(piece))
+                toSkip -= skipped
+                data += piece[skipped:]
+                if len(data) >= length:
+                    break
+        except ContainerError as e:
+            self.log.error(f'Failed to read embedded file range : {str(e)}')
+        return bytes(data[:length])
+
+    # *******************************************
+    # Read the compressed embedded file of a version 1 image from image file, a hunk at a time.
+    # Image read / write pointers are left unchanged.
+    # *******************************************
+    def readCodedHunks(self):
+        codedOffset = 0
+        while codedOffset < self.embeddedCodedSize:
+            bytesToRead = min(self.cfg.ChunkSize, self.embeddedCodedSize - codedOffset)
+            yield self.readDataAt(self.embeddedFileOffset + codedOffset, bytesToRead)
+            codedOffset += bytesToRead
+
+    # *******************************************
+    # Read the first bytes of the embedded file from image file.
+    # *******************************************
+    def peekEmbeddedFile(self, numBytes):
+        return self.readEmbeddedRange(0, numBytes)
+
+    # *******************************************
+    # Read a single text message of the embedded conversation from image file.
+    # Index starts from 0. Only the page of messages holding the message is read.
+    # Returns the message, or None if it could not be read.
+    # *******************************************
+    def readMessageAt(self, idx):
+        if (idx < 0) or (idx >= self.conversation.numStored):
+            self.log.error(f'Message index out of range : {idx}')
+            return None
+        return self.conversation.getMessage(idx)
+
     # *******************************************
     # Read buffer of data from image file.
     # Continue reading from where we left off.
+    # Uses the bit engine selected in configuration.
     # *******************************************
     def readDataFromImage(self, bytesToRead):
+        if self.useScalar():
+            self.readDataScalar(bytesToRead)
+        elif self.parallelSession is not None:
+            self.readDataParallel(bytesToRead)
+        else:
+            self.readDataVector(bytesToRead)
+
+    # *******************************************
+    # Check if the image is loaded, decoded, mapped or streamed.
+    # *******************************************
+    def isLoaded(self):
+        return (self.mapped is not None) or (self.streamed is not None) or (not self.image.isNull())
+
+    # *******************************************
+    # Close the mapping of a mapped image, or the stream of a streamed image, if there is one.
+    # Data written to a streamed image that hasn't been saved is discarded.
+    # *******************************************
+    def closeImage(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        if self.streamed is not None:
+            self.streamed.close()
+            self.streamed = None
+
+    # *******************************************
+    # Open a PNG image to stream in bands, if it is too large to decode within the memory budget.
+    # Decoding and converting an image holds it twice, at 4 bytes a pixel.
+    # Returns the band engine for the image, or None if the image is to be decoded.
+    # *******************************************
+    def openStreamed(self, picFile):
+        budget = self.cfg.StreamMemoryMB * 1024 * 1024
+        if (budget <= 0) or (os.path.splitext(picFile)[1].lower() != ".png"):
+            return None
+        try:
+            with PngStream(picFile) as png:
+                if (2 * png.width * png.height * 4) <= budget:
+                    return None
+            streamed = BandEngine(picFile, budget)
+        except (OSError, PngError) as e:
+            self.log.warning(f'Failed to stream image file, decoding it instead : {str(e)}')
+            return None
+        self.log.info(f'Streaming image in bands of rows : {streamed.bandRows}; memory budget (MB) : {self.cfg.StreamMemoryMB}')
+        return streamed
+
+    # *******************************************
+    # Check if the scalar bit engine is used.
+    # Mapped and streamed images are always accessed with the vector / band engine, as they have no decoded image.
+    # *******************************************
+    def useScalar(self):
+        return (self.cfg.BitEngine == "Scalar") and (self.mapped is None) and (self.streamed is None)
+
+    # *******************************************
+    # Get writable view of the image pixels, height x width x 4 bytes.
+    # This is a zero-copy view of the image pixel buffer.
+    # The pixel buffer is got each time as the image may have been replaced or detached.
+    # *******************************************
+    def getPixels(self):
+        ptr = self.image.bits()
+        ptr.setsize(self.image.sizeInBytes())
+        pixels = np.frombuffer(ptr, dtype=np.uint8).reshape(self.picHeight, self.image.bytesPerLine())
+        return pixels[:, :(self.picWidth * 4)].reshape(self.picHeight, self.picWidth, 4)
+
+    # *******************************************
+    # Create vector engine over the current image pixels.
+    # A streamed image has its own band engine, which reads and writes the same way.
+    # *******************************************
+    def getVectorEngine(self):
+        if self.streamed is not None:
+            return self.streamed
+        return VectorEngine(self.getPlanes())
+
+    # *******************************************
+    # Get writable views of the colour planes (R, G, B) of the image pixels, height x width.
+    # Views of a mapped image are of the mapped file.
+    # *******************************************
+    def getPlanes(self):
+        if self.mapped is not None:
+            return self.mapped.planes()
+        return planesFromPixels32(self.getPixels())
+
+    # *******************************************
+    # Get the image for display.
+    # A mapped image is converted to a new 32-bit image, so is only got when needed.
+    # A streamed image is too large to display, so is a null image.
+    # *******************************************
+    def getImage(self):
+        if self.mapped is None:
+            return self.image
+        pixels = np.empty((self.picHeight, self.picWidth, 4), dtype=np.uint8)
+        for imagePlane, plane in zip(planesFromPixels32(pixels), self.mapped.planes()):
+            imagePlane[:] = plane
+        alpha = self.mapped.alphaPlane()
+        if alpha is None:
+            alphaFromPixels32(pixels)[:] = 255
+            imageFormat = QtGui.QImage.Format_RGB32
+        else:
+            alphaFromPixels32(pixels)[:] = alpha
+            imageFormat = QtGui.QImage.Format_ARGB32
+        return QtGui.QImage(pixels.data, self.picWidth, self.picHeight, self.picWidth * 4, imageFormat).copy()
+
+    # *******************************************
+    # Save the image to file, as PNG or, by its extension, an uncompressed image.
+    # A mapped image saved to itself only has the pages of pixels written flushed.
+    # A streamed image can only be saved as PNG, a band at a time.
+    # Returns True if the image was saved.
+    # *******************************************
+    def saveImage(self, saveToFilename):
+        try:
+            if self.streamed is not None:
+                if isMappedImage(saveToFilename):
+                    raise OSError("Streamed images can only be saved as PNG images.")
+                self.streamed.save(saveToFilename)
+            elif not isMappedImage(saveToFilename):
+                return self.getImage().save(saveToFilename, 'PNG')
+            elif self.mapped is not None:
+                self.mapped.save(saveToFilename)
+            else:
+                pixels = self.getPixels()
+                writeMappedImage(saveToFilename, planesFromPixels32(pixels), alphaFromPixels32(pixels) if self.image.hasAlphaChannel() else None)
+        except (MappedImageError, PngError, OSError, zlib.error) as e:
+            self.log.error(f'Failed to save image file : {str(e)}')
+            return False
+        return True
+
+    # *******************************************
+    # Get a copy of the image pixels, to restore if an operation doesn't complete.
+    # *******************************************
+    def backupPixels(self):
+        if self.mapped is not None:
+            return np.array(self.mapped.pixels)
+        return self.image.copy()
+
+    # *******************************************
+    # Restore the image pixels from a copy.
+    # *******************************************
+    def restorePixels(self, backup):
+        if self.mapped is not None:
+            self.mapped.pixels[...] = backup
+        else:
+            self.image = backup
+
+    # *******************************************
+    # Read buffer of data from image file using the vector engine.
+    # Continue reading from where we left off.
+    # *******************************************
+    def readDataVector(self, bytesToRead):
+
+        engine = self.getVectorEngine()
+        position = self.cursor.toPosition(self.row, self.col, self.plane, self.bit)
+
+        # Read the data and move on the read pointers.
+        self.codeBytes = bytearray(engine.readBytes(position, bytesToRead))
+        self.bytesRead = len(self.codeBytes)
+        position += self.bytesRead * 8
+        self.row, self.col, self.plane, self.bit = self.cursor.fromPosition(position)
+
+    # *******************************************
+    # Read buffer of data from image file using the parallel engine.
+    # Continue reading from where we left off.
+    # *******************************************
+    def readDataParallel(self, bytesToRead):
+
+        position = self.cursor.toPosition(self.row, self.col, self.plane, self.bit)
+
+        # Read the data and move on the read pointers.
+        self.codeBytes = bytearray(self.parallelSession.readBytes(position, bytesToRead))
+        self.bytesRead = len(self.codeBytes)
+        position += self.bytesRead * 8
+        self.row, self.col, self.plane, self.bit = self.cursor.fromPosition(position)
+
+    # *******************************************
+    # Check if embedding / extracting should be done in parallel.
+    # Only worth it for large images, as the pixels are copied to shared memory.
+    # Mapped and streamed images aren't copied, so are always done in this process.
+    # *******************************************
+    def useParallel(self):
+        return ((self.cfg.BitEngine != "Scalar") and (self.mapped is None) and (self.streamed is None) and (self.cfg.ParallelProcesses > 1) and
+                ((self.picWidth * self.picHeight) >= self.cfg.ParallelMinPixels))
+
+    # *******************************************
+    # Start doing an operation in parallel, if it should be.
+    # Returns the hunk size to use for the operation.
+    # *******************************************
+    def startParallel(self):
+        if not self.useParallel():
+            return self.cfg.ChunkSize
+        if self.parallelEngine is None:
+            self.parallelEngine = ParallelEngine(self.cfg.ParallelProcesses)
+        self.log.info(f'Using parallel engine, processes : {self.cfg.ParallelProcesses}')
+        self.parallelSession = self.parallelEngine.open(self.getPixels())
+        return self.cfg.ParallelChunkSize
+
+    # *******************************************
+    # End doing an operation in parallel.
+    # If the operation completed, written pixels are copied back to the image.
+    # *******************************************
+    def endParallel(self, completed):
+        if self.parallelSession is not None:
+            self.parallelSession.close(self.getPixels() if completed else None)
+            self.parallelSession = None
+
+    # *******************************************
+    # Shut down any processes used for parallel embedding / extracting, and close a mapped or streamed image.
+    # *******************************************
+    def shutdown(self):
+        if self.parallelEngine is not None:
+            self.parallelEngine.shutdown()
+            self.parallelEngine = None
+        self.closeImage()
+
+    # *******************************************
+    # Read buffer of data from image file a bit at a time.
+    # Continue reading from where we left off.
+    # *******************************************
+    def readDataScalar(self, bytesToRead):
 
         # Initialise loop counters counters.
         bytesRead = 0
@@ -459,84 +1571,229 @@ class Steganography():
     # *******************************************
     # Image has embedded file.
     # Read the file data and save as file.
+    # If an archive member is given, only that member is saved.
+    # Returns True if all of the file was saved.
     # *******************************************
-    def saveEmbeddedFile(self, saveToFilename):
+    def saveEmbeddedFile(self, saveToFilename, member=None):
 
         self.log.info(f'Saving embedded image to : {saveToFilename}')
 
-        # Save the file data pointers so that they can be restored.
+        # Open file to extract code to.
+        try:
+            self.log.info(f'Opening file to save to : {saveToFilename}')
+            with open(saveToFilename, mode='wb') as cf:
+                return self.writeEmbeddedFile(cf, member)
+
+        # Failed to open / close the file.
+        except OSError as e:
+            self.log.error(f'Failed to save embedded file to : {saveToFilename}')
+            self.log.error(f'Exception returned : {str(e)}')
+            return False
+
+    # *******************************************
+    # Image has embedded file.
+    # Read the file data and write to an open file, e.g. a pipe.
+    # If an archive member is given, only that member is written, read straight from its offset.
+    # Returns True if all of the file was written.
+    # *******************************************
+    def writeEmbeddedFile(self, cf, member=None):
+
+        # Go straight to the start of the embedded file data.
         # Need to do this so that we can save again if we have to.
-        rowCntSave = self.row
-        colCntSave = self.col
-        colPlaneSave = self.plane
-        bitCntSave = self.bit
+        self.seekData(self.embeddedFileOffset)
 
         # Create progress bar and initialise.
-        self.data.progressBar.setNote('Extracting file from image...')
-        self.data.progressBar.showProgressBar()
-        loopProgress = BYTESTACK / self.embeddedFileSize * 100.0
+        self.progress.setNote('Extracting file from image...')
+        self.progress.showProgressBar()
+        chunkSize = self.startParallel()
         codeProgress = 0.0
+        saved = False
 
-        self.data.progressBar.setProgress(int(codeProgress))
+        self.progress.setProgress(int(codeProgress))
 
-        # Open file to extract code to.
         try:
-            self.log.info(f'Opening file to save to : {saveToFilename}')
-            with open(saveToFilename, mode='wb') as cf:
-
-                # Have the size of the embedded file, so can read the contents of the file.
-                bytesToRead = self.embeddedFileSize
+            # If pipelined, write to the file behind extracting from the image.
+            if self.cfg.PipelineIO:
+                writer = WriteBehind(cf, self.cfg.PipelineDepth)
+            else:
+                writer = cf
+
+            # Have the size of the embedded file, so can read the contents of the file.
+            # A compressed file is decompressed as it is read.
+            if member is not None:
+                fileSize = member.size
+                codedSize = member.codedSize
+                payloadOffset = member.offset
+            else:
+                fileSize = self.embeddedFileSize
+                codedSize = self.embeddedCodedSize
+                payloadOffset = 0
+            if self.picCodec != Codec.CODEC_NONE.value:
+                decompressor = Decompressor(self.picCodec)
+                bytesToRead = codedSize
+            else:
+                decompressor = None
+                bytesToRead = fileSize
+            bytesWritten = 0
+            shortHunk = False
+
+            # A version 2 container is read a chunk at a time, checking each chunk as it is read.
+            # The size of the payload of the container is always in its header.
+            if self.picVersion == V2VERSION:
+                bytesToRead = codedSize
+                hunks = self.readContainerPayload(payloadOffset, codedSize, chunkSize)
+            else:
+                hunks = None
+            totalToRead = max(1, bytesToRead)
 
-                # Read and write a hung of data at a time.
+            try:
+                # Read and write a hunk of data at a time.
                 # Update the progress as we go.
                 while bytesToRead > 0:
-                    if bytesToRead > BYTESTACK:
-                        bytesThisRead = BYTESTACK
-                        bytesToRead -= BYTESTACK
-                    else:
-                        bytesThisRead = bytesToRead
-                        bytesToRead = 0
+                    self.checkCancel()
 
                     # Read the hunk of data.
-                    self.readDataFromImage(bytesThisRead)
+                    # Container chunks that are short or corrupt raise ContainerError.
+                    if hunks is not None:
+                        hunk = next(hunks, None)
+                        if hunk is None:
+                            raise ContainerError(f'Payload truncated, expected bytes : {bytesToRead}')
+                        bytesThisRead = len(hunk)
+                        self.bytesRead = bytesThisRead
+                    else:
+                        bytesThisRead = min(bytesToRead, chunkSize)
+                        self.readDataFromImage(bytesThisRead)
+                        hunk = bytes(self.codeBytes)
+                    bytesToRead -= bytesThisRead
 
                     # Check if we read the expected number of bytes.
                     if (self.bytesRead != bytesThisRead):
                         self.log.error(f'Expected byte hunk : {bytesThisRead}; bytes read : {self.bytesRead}')
+                        shortHunk = True
+                        break
                     else:
                         self.log.debug("Writing embedded data hunk to file...")
-                        # Open the file and write data to it.
-                        try:
-                            cf.write(self.codeBytes)
-
-                            # Update the progress bar as we go along.
-                            codeProgress += loopProgress
-                            if codeProgress > 100.0:
-                                codeProgress = 100.0
-                            self.data.progressBar.setProgress(int(codeProgress))
-                        except:
-                            self.log.error(f'Failed to write code hunk to file.')
-                            self.log.error(f'Exception returned : {str(e)}')       
+                        if decompressor is not None:
+                            hunk = decompressor.decompress(hunk)
+                        writer.write(hunk)
+                        bytesWritten += len(hunk)
+
+                        # Update the progress bar as we go along.
+                        codeProgress = min(100.0, (totalToRead - bytesToRead) / totalToRead * 100.0)
+                        self.progress.setProgress(int(codeProgress))
+
+                # Write the rest of a compressed file.
+                if (decompressor is not None) and (not shortHunk):
+                    hunk = decompressor.flush()
+                    writer.write(hunk)
+                    bytesWritten += len(hunk)
+            finally:
+                # Wait for all of the file to be written.
+                if self.cfg.PipelineIO:
+                    writer.close()
+
+            # Short hunk means the rest of the file isn't in the image.
+            if (not shortHunk) and (bytesWritten != fileSize):
+                self.log.error(f'Expected file size : {fileSize}; bytes written : {bytesWritten}')
+            saved = (not shortHunk) and (bytesWritten == fileSize)
 
             # Done so can hide the progress bar.
-            self.data.progressBar.hideProgressBar()
+            self.progress.hideProgressBar()
+
+        # Cancelled, let the caller tidy up.
+        except OperationCancelled:
+            self.log.info("Saving embedded file cancelled.")
+            raise
 
-        # Failed to open the file for writing.
+        # Failed to write the file.
         except Exception as e:
-            self.log.error(f'Failed to open file to save to : {saveToFilename}')
-            self.log.error(f'Exception returned : {str(e)}')       
+            self.log.error("Failed to write embedded file.")
+            self.log.error(f'Exception returned : {str(e)}')
+
+        # Image is only read, so nothing to copy back.
+        finally:
+            self.endParallel(False)
 
-        # Restore the file data pointers, so that we can save again if we have to.
-        self.row = rowCntSave
-        self.col = colCntSave
-        self.plane = colPlaneSave
-        self.bit = bitCntSave
+        return saved
 
     # *******************************************
     # Write data to image.
     # Continue writing from where we left off.
+    # Uses the bit engine selected in configuration.
     # *******************************************
     def writeDataToImage(self, bytesToWrite):
+        if self.useScalar():
+            self.writeDataScalar(bytesToWrite)
+        elif self.parallelSession is not None:
+            self.writeDataParallel(bytesToWrite)
+        else:
+            self.writeDataVector(bytesToWrite)
+
+    # *******************************************
+    # Write data to image, only rewriting the bytes that differ from what the image already holds.
+    # Old data is the data already embedded from where we are, if known, otherwise it is read from the image.
+    # Continue writing from where we left off, as for writeDataToImage.
+    # *******************************************
+    def writeDataDelta(self, bytesToWrite, oldData=None):
+
+        start = self.tellData()
+        if oldData is None:
+            oldData = self.readDataAt(start, len(bytesToWrite))
+
+        # Write each changed range, stopping if the image runs out of space.
+        bytesWritten = len(bytesToWrite)
+        bytesChanged = 0
+        for rangeStart, rangeEnd in changedRanges(oldData, bytesToWrite):
+            self.seekData(start + rangeStart)
+            self.writeDataToImage(bytesToWrite[rangeStart:rangeEnd])
+            bytesChanged += self.bytesWritten
+            if self.bytesWritten != (rangeEnd - rangeStart):
+                bytesWritten = rangeStart + self.bytesWritten
+                break
+        self.log.debug(f'Delta write of bytes : {len(bytesToWrite)}; bytes rewritten : {bytesChanged}')
+
+        # Move on the write pointers as if all of the data was written.
+        self.seekData(start + bytesWritten)
+        self.bytesWritten = bytesWritten
+
+    # *******************************************
+    # Write data to image using the vector engine.
+    # Continue writing from where we left off.
+    # *******************************************
+    def writeDataVector(self, bytesToWrite):
+
+        engine = self.getVectorEngine()
+        position = self.cursor.toPosition(self.row, self.col, self.plane, self.bit)
+
+        # Write the data and move on the write pointers.
+        bitsWritten = engine.writeBytes(position, bytesToWrite)
+        if bitsWritten != (len(bytesToWrite) * 8):
+            self.log.warning(f'No more space in image to write data, bits written : {bitsWritten}')
+        self.bytesWritten = bitsWritten // 8
+        position += bitsWritten
+        self.row, self.col, self.plane, self.bit = self.cursor.fromPosition(position)
+
+    # *******************************************
+    # Write data to image using the parallel engine.
+    # Continue writing from where we left off.
+    # *******************************************
+    def writeDataParallel(self, bytesToWrite):
+
+        position = self.cursor.toPosition(self.row, self.col, self.plane, self.bit)
+
+        # Write the data and move on the write pointers.
+        bitsWritten = self.parallelSession.writeBytes(position, bytesToWrite)
+        if bitsWritten != (len(bytesToWrite) * 8):
+            self.log.warning(f'No more space in image to write data, bits written : {bitsWritten}')
+        self.bytesWritten = bitsWritten // 8
+        position += bitsWritten
+        self.row, self.col, self.plane, self.bit = self.cursor.fromPosition(position)
+
+    # *******************************************
+    # Write data to image a bit at a time.
+    # Continue writing from where we left off.
+    # *******************************************
+    def writeDataScalar(self, bytesToWrite):
 
         # Initialise loop counters counters.
         bytesWritten = 0
@@ -619,18 +1876,84 @@ class Steganography():
     # *******************************************
     # Read file and embed into the current image.
     # Embed password if required.
+    # Returns True if all of the file was embedded.
     # *******************************************
     def embedFileToImage(self, passworded=False, pw=""):
 
         self.log.info(f'Embedding into image from file : {self.toEmbedFilePath}')
 
+        # Open file to be embedded.
+        try:
+            self.log.info(f'Opening file to embed : {self.toEmbedFilePath}')
+            with open(self.toEmbedFilePath, mode='rb') as cf:
+                return self.embedStreamToImage(cf, self.toEmbedFilePath, self.toEmbedFileSize, passworded, pw, self.toEmbedCodec)
+
+        # Failed to open the file.
+        except OSError as e:
+            self.log.error(f'Failed to embed file from : {self.toEmbedFilePath}')
+            self.log.error(f'Exception returned : {str(e)}')
+            return False
+
+    # *******************************************
+    # Read open file, e.g. a pipe, and embed into the current image as a file of the given path.
+    # If the file size is None, the file is read until it ends, and the file length in
+    # the header is written once the size is known.
+    # If a codec is given the file is compressed as it is embedded, and the compressed length
+    # in the header is written once it is known.
+    # With FormatVersion 2 the file is embedded in a version 2 container, framed into CRC
+    # protected chunks as it is embedded, and the whole header is written once the sizes are known.
+    # If a span part is given the file is embedded as that part of a file spanning several images,
+    # which is only supported in a version 2 container.
+    # If the image is already picCoded, only the bytes that differ from what it holds are written.
+    # Embed password if required.
+    # Returns True if all of the file was embedded.
+    # *******************************************
+    def embedStreamToImage(self, cf, filePath, fileSize=None, passworded=False, pw="", codec=Codec.CODEC_NONE.value, span=None):
+
+        # Need to add picCoder encoding to image first.
+        # If the size isn't known yet, the file length is written as zero for now.
+        container = None
+        framer = None
+        if self.cfg.FormatVersion == V2VERSION:
+            container = ContainerHeader()
+            container.passworded = passworded
+            container.password = pw
+            container.codeType = CodeType.CODETYPE_FILE.value if span is None else CodeType.CODETYPE_SPAN.value
+            container.span = span
+            container.codec = codec
+            container.dataSize = 0 if fileSize is None else fileSize
+            container.filePath = filePath
+            hdrBytes = container.pack()
+            picCodeHdr = str(container)
+            compressor = None if codec == Codec.CODEC_NONE.value else Compressor(codec)
+            framer = ChunkFramer(container.chunkSize)
+        elif codec == Codec.CODEC_NONE.value:
+            frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd%%s%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES,  NAMELENBYTES, LENBYTES)
+            picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_FILE.value, blen(filePath), filePath, 0 if fileSize is None else fileSize)
+            compressor = None
+            lengthFields = 1
+        else:
+            frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd%%0%dd%%s%%0%dd%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES, CODECBYTES, NAMELENBYTES, LENBYTES, LENBYTES)
+            picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_ZFILE.value, codec, blen(filePath), filePath, 0 if fileSize is None else fileSize, 0)
+            compressor = Compressor(codec)
+            lengthFields = 2
+        if container is None:
+            hdrBytes = bytearray(picCodeHdr, encoding='utf-8')
+
+        # If the size of the data to embed isn't known, limit it to the embedding capacity of the image.
+        # The size of the data in a container includes the chunk CRCs, so is only known once framed.
+        maxFileSize = max(0, self.capacity - len(hdrBytes))
+        sizeKnown = (fileSize is not None) and (compressor is None) and (framer is None)
+
         # Create progress bar and initialise.
-        self.data.progressBar.setNote('Embedding file into image...')
-        self.data.progressBar.showProgressBar()
-        loopProgress = BYTESTACK / self.toEmbedFileSize * 100.0
+        self.progress.setNote('Embedding file into image...')
+        self.progress.showProgressBar()
+        chunkSize = self.startParallel()
+        completed = False
+        embedded = False
         codeProgress = 0.0
 
-        self.data.progressBar.setProgress(int(codeProgress))
+        self.progress.setProgress(int(codeProgress))
 
         # Initialise image file read parameters.
         self.row = 0
@@ -640,64 +1963,389 @@ class Steganography():
         self.bytesWritten = 0
         self.codeBytes = []
 
-        # Open file to be embedded.
-        try:
-            self.log.info(f'Opening file to embed : {self.toEmbedFilePath}')
-            with open(self.toEmbedFilePath, mode='rb') as cf:
+        # If replacing data already embedded in the image, only rewrite the bytes that have changed.
+        self.embeddedData = None
+        if self.cfg.DeltaEmbed and self.picCoded:
+            writeData = self.writeDataDelta
+        else:
+            writeData = self.writeDataToImage
 
-                # Need to add picCoder encoding to image first.
-                frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd%%s%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES,  NAMELENBYTES, LENBYTES)
-                picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_FILE.value, len(self.toEmbedFilePath), self.toEmbedFilePath, self.toEmbedFileSize)
+        try:
+            self.log.info(f'Composed piCoder code to insert into image : {picCodeHdr}')
+            self.log.info('Embedding picCoder encoding information into start of image.')
+            writeData(hdrBytes)
 
-                self.log.info(f'Composed piCoder code to insert into image : {picCodeHdr}')
-                self.log.info('Embedding picCoder encoding information into start of image.')
-                self.writeDataToImage(bytearray(picCodeHdr, encoding='utf-8'))
+            # Need to embed the actual file into the image.
+            self.log.info('Embedding file into the image.')
 
-                # Need to embed the actual file into the image.
-                self.log.info('Embedding file into the image.')
+            # Read the contents of the file a hunk at a time, until the file size or the end of the file.
+            # If pipelined, read from the file ahead of embedding into the image.
+            if self.cfg.PipelineIO:
+                hunks = ReadAhead(cf, fileSize, chunkSize, self.cfg.PipelineDepth)
+            else:
+                hunks = readChunks(cf, fileSize, chunkSize)
 
-                # Have the size of the file to embed, so can write the contents of the file.
-                bytesToWrite = self.toEmbedFileSize
+            shortHunk = (self.bytesWritten != len(hdrBytes))
+            bytesRead = 0
+            bytesCoded = 0
+            bytesEmbedded = 0
 
-                # Read and write a hung of data at a time.
+            try:
+                # Write a hunk of data into the image at a time.
+                # A compressed file is written when the compressor has data, and when compression is finished.
+                # A file in a container is written as chunks are completed, and when the last chunk is finished.
                 # Update the progress as we go.
-                while bytesToWrite > 0:
-                    if bytesToWrite > BYTESTACK:
-                        bytesThisWrite = BYTESTACK
-                        bytesToWrite -= BYTESTACK
+                for byteBuffer in itertools.chain(hunks, [None]):
+                    self.checkCancel()
+                    if byteBuffer is None:
+                        if (compressor is None) and (framer is None):
+                            break
+                        byteBuffer = b"" if compressor is None else compressor.flush()
+                        bytesCoded += len(byteBuffer)
+                        if framer is not None:
+                            byteBuffer = framer.add(byteBuffer) + framer.finish()
+                    else:
+                        bytesRead += len(byteBuffer)
+                        if compressor is not None:
+                            byteBuffer = compressor.compress(byteBuffer)
+                        bytesCoded += len(byteBuffer)
+                        if framer is not None:
+                            byteBuffer = framer.add(byteBuffer)
+
+                    # Check data of unknown size still fits.
+                    if (not sizeKnown) and ((bytesEmbedded + len(byteBuffer)) > maxFileSize):
+                        self.log.error(f'File to embed exceeds embedding capacity of image : {self.capacity}')
+                        shortHunk = True
+                        break
+
+                    writeData(byteBuffer)
+                    bytesEmbedded += self.bytesWritten
+
+                    # Check if we wrote the expected number of bytes.
+                    if (self.bytesWritten != len(byteBuffer)):
+                        self.log.error(f'Expected byte hunk : {len(byteBuffer)}; bytes written : {self.bytesWritten}')
+                        shortHunk = True
+                    else:
+                        # Update the progress bar as we go along.
+                        codeProgress = min(100.0, bytesRead / max(1, maxFileSize if fileSize is None else fileSize) * 100.0)
+                        self.progress.setProgress(int(codeProgress))
+            finally:
+                # Stop reading ahead if embedding didn't complete.
+                if self.cfg.PipelineIO:
+                    hunks.stop()
+
+            # Now the sizes are known, go back and write the file length (and compressed length) into the header.
+            # The header of a container is written again, as its CRC covers the sizes.
+            if (container is not None) and (not shortHunk):
+                container.dataSize = bytesRead
+                container.codedSize = bytesCoded
+                self.log.info(f'Writing embedded file sizes into container header : {bytesRead}, {bytesCoded}')
+                self.seekData(0)
+                writeData(container.pack())
+                self.seekData(len(hdrBytes) + bytesEmbedded)
+            elif (not sizeKnown) and (not shortHunk):
+                lengths = [bytesRead, bytesEmbedded][:lengthFields]
+                self.log.info(f'Writing embedded file length(s) into header : {lengths}')
+                self.seekData(len(hdrBytes) - LENBYTES * lengthFields)
+                writeData(bytearray(''.join(('%%0%dd' % LENBYTES) % length for length in lengths), encoding='utf-8'))
+                self.seekData(len(hdrBytes) + bytesEmbedded)
+
+            # Done so can hide the progress bar.
+            self.progress.hideProgressBar()
+            completed = True
+
+            # Check all of the file was read, and there was space for all of it.
+            embedded = (not shortHunk) and ((fileSize is None) or (bytesRead == fileSize))
+
+        # Cancelled, let the caller tidy up.
+        except OperationCancelled:
+            self.log.info("Embedding file cancelled.")
+            raise
+
+        # Failed to read the file.
+        except Exception as e:
+            self.log.error(f'Failed to embed file : {filePath}')
+            self.log.error(f'Exception returned : {str(e)}')
+
+        # If embedded in parallel, update the image with what has been embedded.
+        # If not completed then the image is left as it was.
+        finally:
+            self.endParallel(completed)
+
+        return embedded
+
+    # *******************************************
+    # Embed a compiled payload into the current image, with the values of its slots for the image.
+    # The payload is already serialized, so this only fills in the slots and writes the data into the image.
+    # If the image is already picCoded, only the bytes that differ from what it holds are written.
+    # Returns True if all of the payload was embedded.
+    # *******************************************
+    def embedCompiledToImage(self, compiled, values):
+
+        self.log.info(f'Embedding compiled payload into image, slot values : {values}')
+        try:
+            data = compiled.fill(values)
+        except CompiledPayloadError as e:
+            self.log.error(f'Failed to fill in compiled payload : {str(e)}')
+            return False
+        if len(data) > self.capacity:
+            self.log.error(f'Compiled payload exceeds embedding capacity of image : {self.capacity}')
+            return False
+
+        self.progress.setNote('Embedding compiled payload into image...')
+        self.progress.showProgressBar()
+        self.startParallel()
+        completed = False
+
+        # Initialise image file write parameters.
+        self.row = 0
+        self.col = 0
+        self.plane = 0
+        self.bit = 0
+        self.bytesWritten = 0
+
+        try:
+            self.embeddedData = None
+            if self.cfg.DeltaEmbed and self.picCoded:
+                self.writeDataDelta(data)
+            else:
+                self.writeDataToImage(data)
+            self.progress.hideProgressBar()
+            completed = (self.bytesWritten == len(data))
+            if not completed:
+                self.log.error(f'Expected compiled payload : {len(data)}; bytes written : {self.bytesWritten}')
+
+        # Failed to write into the image.
+        except Exception as e:
+            self.log.error('Failed to embed compiled payload.')
+            self.log.error(f'Exception returned : {str(e)}')
+
+        # If embedded in parallel, update the image with what has been embedded.
+        # If not completed then the image is left as it was.
+        finally:
+            self.endParallel(completed)
+
+        return completed
+
+    # *******************************************
+    # Read files and embed into the current image as an archive.
+    # Archives are always embedded in a version 2 container, as the index holds offsets into its payload.
+    # The index is written first, with the sizes unknown, and written again once they are known.
+    # If a codec is given each file is compressed on its own, so it can be extracted on its own.
+    # Files are named in the archive by the names given, or by their paths from the directory holding all of them.
+    # Embed password if required.
+    # Returns True if all of the files were embedded.
+    # *******************************************
+    def embedArchiveToImage(self, filePaths, passworded=False, pw="", codec=Codec.CODEC_NONE.value, memberNames=None):
+
+        self.log.info(f'Embedding into image archive of number of files : {len(filePaths)}')
+
+        # Need to add picCoder encoding to image first.
+        if memberNames is None:
+            memberNames = archiveMemberNames(filePaths)
+        members = [ArchiveMember(name) for name in memberNames]
+        container = ContainerHeader()
+        container.passworded = passworded
+        container.password = pw
+        container.codeType = CodeType.CODETYPE_ARCHIVE.value
+        container.codec = codec
+        container.numMessages = len(members)
+        hdrBytes = container.pack()
+        indexBytes = packIndex(members)
+        framer = ChunkFramer(container.chunkSize)
+
+        # Limit the archive to the embedding capacity of the image.
+        maxFileSize = max(0, self.capacity - len(hdrBytes))
+
+        # Create progress bar and initialise.
+        self.progress.setNote('Embedding files into image...')
+        self.progress.showProgressBar()
+        chunkSize = self.startParallel()
+        completed = False
+        embedded = False
+
+        self.progress.setProgress(0)
+
+        # Initialise image file read parameters.
+        self.row = 0
+        self.col = 0
+        self.plane = 0
+        self.bit = 0
+        self.bytesWritten = 0
+        self.codeBytes = []
+        self.embeddedData = None
+
+        try:
+            self.log.info(f'Composed container header to insert into image : {container}')
+            self.writeDataToImage(hdrBytes)
+            totalSize = max(1, sum(os.path.getsize(filePath) for filePath in filePaths))
+
+            # Write the index, then each file after the other.
+            shortHunk = (self.bytesWritten != len(hdrBytes))
+            bytesRead = 0
+            bytesEmbedded = 0
+            payloadOffset = len(indexBytes)
+            if not shortHunk:
+                shortHunk = not self.writeEmbeddedHunk(framer.add(indexBytes), bytesEmbedded, maxFileSize)
+                bytesEmbedded += self.bytesWritten
+
+            for member, filePath in zip(members, filePaths):
+                if shortHunk:
+                    break
+                self.log.info(f'Embedding archive member : {member.name}')
+                member.offset = payloadOffset
+                compressor = None if codec == Codec.CODEC_NONE.value else Compressor(codec)
+
+                with open(filePath, mode='rb') as cf:
+                    # If pipelined, read from the file ahead of embedding into the image.
+                    if self.cfg.PipelineIO:
+                        hunks = ReadAhead(cf, None, chunkSize, self.cfg.PipelineDepth)
                     else:
-                        bytesThisWrite = bytesToWrite
-                        bytesToWrite = 0
+                        hunks = readChunks(cf, None, chunkSize)
 
                     try:
-                        # Read the hunk of data from the file.
-                        byteBuffer = cf.read(bytesThisWrite)
-                        # And write the hunk into the image
-                        self.writeDataToImage(byteBuffer)
-
-                        # Check if we wrote the expected number of bytes.
-                        if (self.bytesWritten != bytesThisWrite):
-                            self.log.error(f'Expected byte hunk : {bytesThisWrite}; bytes written : {self.bytesWritten}')
-                        else:
+                        # Write a hunk of data into the image at a time, as chunks are completed.
+                        for byteBuffer in itertools.chain(hunks, [None]):
+                            self.checkCancel()
+                            if byteBuffer is None:
+                                if compressor is None:
+                                    break
+                                byteBuffer = compressor.flush()
+                            else:
+                                bytesRead += len(byteBuffer)
+                                member.size += len(byteBuffer)
+                                if compressor is not None:
+                                    byteBuffer = compressor.compress(byteBuffer)
+                            member.codedSize += len(byteBuffer)
+                            payloadOffset += len(byteBuffer)
+
+                            if not self.writeEmbeddedHunk(framer.add(byteBuffer), bytesEmbedded, maxFileSize):
+                                shortHunk = True
+                                break
+                            bytesEmbedded += self.bytesWritten
+
                             # Update the progress bar as we go along.
-                            codeProgress += loopProgress
-                            if codeProgress > 100.0:
-                                codeProgress = 100.0
-                            self.data.progressBar.setProgress(int(codeProgress))
-                    except:
-                        self.log.error(f'Failed to write code hunk to image.')
-                        self.log.error(f'Exception returned : {str(e)}')       
-
-                # Done so can hide the progress bar.
-                self.data.progressBar.hideProgressBar()
-
-        # Failed to open the file for reading.
+                            self.progress.setProgress(int(min(100.0, bytesRead / totalSize * 100.0)))
+                    finally:
+                        # Stop reading ahead if embedding didn't complete.
+                        if self.cfg.PipelineIO:
+                            hunks.stop()
+
+            # Write the last chunk.
+            if not shortHunk:
+                shortHunk = not self.writeEmbeddedHunk(framer.finish(), bytesEmbedded, maxFileSize)
+                bytesEmbedded += self.bytesWritten
+
+            # Now the sizes are known, go back and write the index and the header.
+            if not shortHunk:
+                container.dataSize = bytesRead
+                container.codedSize = payloadOffset
+                self.log.info(f'Writing archive index and sizes into container : {bytesRead}, {payloadOffset}')
+                self.patchContainerPayload(container, 0, packIndex(members))
+                self.seekData(0)
+                self.writeDataToImage(container.pack())
+                self.seekData(len(hdrBytes) + bytesEmbedded)
+
+            # Done so can hide the progress bar.
+            self.progress.hideProgressBar()
+            completed = True
+            embedded = not shortHunk
+
+        # Cancelled, let the caller tidy up.
+        except OperationCancelled:
+            self.log.info("Embedding archive cancelled.")
+            raise
+
+        # Failed to read a file.
         except Exception as e:
-            self.log.error(f'Failed to open file to read from : {self.toEmbedFilePath}')
+            self.log.error("Failed to embed archive.")
             self.log.error(f'Exception returned : {str(e)}')
 
+        # If embedded in parallel, update the image with what has been embedded.
+        # If not completed then the image is left as it was.
+        finally:
+            self.endParallel(completed)
+
+        return embedded
+
+    # *******************************************
+    # Write hunk of embedded data to image, if it fits within the maximum size.
+    # Continue writing from where we left off.
+    # Returns True if all of the hunk was written.
+    # *******************************************
+    def writeEmbeddedHunk(self, byteBuffer, bytesEmbedded, maxSize):
+        self.bytesWritten = 0
+        if len(byteBuffer) == 0:
+            return True
+        if (bytesEmbedded + len(byteBuffer)) > maxSize:
+            self.log.error(f'Data to embed exceeds embedding capacity of image : {self.capacity}')
+            return False
+        self.writeDataToImage(byteBuffer)
+        if (self.bytesWritten != len(byteBuffer)):
+            self.log.error(f'Expected byte hunk : {len(byteBuffer)}; bytes written : {self.bytesWritten}')
+            return False
+        return True
+
+    # *******************************************
+    # Overwrite part of the payload of a version 2 container already written to image.
+    # The chunks holding the part are read back, updated, and written again with new CRCs.
+    # *******************************************
+    def patchContainerPayload(self, header, offset, data):
+        self.patchContainerChunks(header, header.codedSize, [(offset, data)])
+
+    # *******************************************
+    # Write parts of the payload of a version 2 container already written to image, growing the payload
+    # to a new coded size, e.g. to append to it. Parts are (offset, data) in the payload.
+    # Only the chunks holding the parts are read back, updated, and written again with new CRCs,
+    # and chunks past the end of the payload in the image are written new.
+    # All of the chunks are read before any are written, so nothing is written if one is corrupt.
+    # Raises ContainerError if a chunk read back is corrupt.
+    # *******************************************
+    def patchContainerChunks(self, header, codedSize, parts):
+        chunkSize = header.chunkSize
+        chunks = set()
+        for offset, data in parts:
+            if len(data) > 0:
+                chunks.update(range(offset // chunkSize, (offset + len(data) - 1) // chunkSize + 1))
+
+        payloads = {}
+        for chunk in sorted(chunks):
+            chunkStart = chunk * chunkSize
+            chunkLen = min(chunkSize, codedSize - chunkStart)
+            oldLen = max(0, min(chunkSize, header.codedSize - chunkStart))
+            payload = bytearray()
+            if oldLen > 0:
+                payload += unframeChunk(self.readDataAt(header.chunkOffset(chunk), oldLen + V2CRCBYTES))
+            payload += bytes(chunkLen - len(payload))
+            for offset, data in parts:
+                start = max(offset, chunkStart)
+                end = min(offset + len(data), chunkStart + chunkLen)
+                if start < end:
+                    payload[start - chunkStart:end - chunkStart] = data[start - offset:end - offset]
+            payloads[chunk] = payload
+
+        for chunk, payload in payloads.items():
+            self.seekData(header.chunkOffset(chunk))
+            self.writeDataToImage(frameChunk(payload))
+
+    # *******************************************
+    # Compose the embedded data for a text message of a conversation.
+    # Index starts from 0.
+    # *******************************************
+    def composeMessage(self, idx, msg):
+        # Use byte lengths of encoded strings so that full strings are encoded in image.
+        frmtString = ('%%0%dd%%0%dd%%s%%0%dd%%s%%0%dd%%s') % (NUMSMSBYTES, NAMELENBYTES, TIMELENBYTES, SMSLENBYTES)
+        msgDetail = frmtString % ((idx+1), blen(msg.writer), msg.writer, blen(msg.msgTime), msg.msgTime, blen(msg.msgText), msg.msgText)
+        self.log.info(f'Composed code for message  : {msgDetail}')
+        return bytearray(msgDetail, encoding='utf-8')
+
+
     # *******************************************
     # Embed conversantion into the current image.
+    # If the image holds the conversation in a version 2 container with a message offset table,
+    # only the messages added since are embedded, appended to the container.
+    # Otherwise the whole conversation is composed, then only the bytes that differ from what the image
+    # already holds are written, e.g. a new message and the number of messages.
     # Embed password if required.
     # *******************************************
     def embedConversationIntoImage(self, passworded=False, pw=""):
@@ -705,13 +2353,23 @@ class Steganography():
         self.log.info(f'Embedding conversation into image.')
 
         # Create progress bar and initialise.
-        msg = 0
-        self.data.progressBar.setNote('Embedding conversation into image...')
-        self.data.progressBar.showProgressBar()
-        loopProgress = msg / len(self.conversation.messages) * 100.0
-        codeProgress = 0.0
-
-        self.data.progressBar.setProgress(int(codeProgress))
+        self.progress.setNote('Embedding conversation into image...')
+        self.progress.showProgressBar()
+        self.progress.setProgress(0)
+        self.checkCancel()
+
+        # Append only the messages added, if they can be.
+        numMsgs = self.conversation.numMessages()
+        if self.appendConversation(passworded, pw):
+            self.conversation.numEmbedded = numMsgs
+            self.embeddedData = None
+            self.progress.setProgress(100)
+            self.progress.hideProgressBar()
+            return
+
+        # Take the messages to embed now, in case the conversation changes while embedding.
+        # Any messages not read from the image yet are read now, as the image is about to change.
+        messages = self.conversation.loadAll()
 
         # Initialise image file read parameters.
         self.row = 0
@@ -720,28 +2378,178 @@ class Steganography():
         self.bit = 0
         self.bytesWritten = 0
 
-        # Need to add picCoder encoding to image first.
-        frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES,  NUMSMSBYTES)
-        picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_TEXT.value, len(self.conversation.messages))
+        # With FormatVersion 2 embed in a version 2 container.
+        if self.cfg.FormatVersion == V2VERSION:
+            container, convData = self.composeConversationContainer(messages, passworded, pw)
+        else:
+            container = None
+            convData = self.composeConversation(messages, passworded, pw)
+
+        # The data already embedded is only known until the image is written again.
+        # If it isn't known, and the image is picCoded, compare with what the image holds.
+        oldData = self.embeddedData
+        self.embeddedData = None
+        self.checkCancel()
+        if self.cfg.DeltaEmbed and ((oldData is not None) or self.picCoded):
+            self.writeDataDelta(convData, oldData)
+        else:
+            self.writeDataToImage(convData)
+        self.embeddedData = bytes(convData)
 
-        self.log.info(f'Composed piCoder code to insert into image : {picCodeHdr}')
-        self.log.info('Embedding picCoder encoding information into start of image.')
-        self.writeDataToImage(bytearray(picCodeHdr, encoding='utf-8'))
-
-        for idx, msg in enumerate(self.conversation.messages):
-            # Construct the message.
-            # Use byte length of encoded string message so that full string is encoded in image.
-            frmtString = ('%%0%dd%%0%dd%%s%%0%dd%%s%%0%dd%%s') % (NUMSMSBYTES, NAMELENBYTES, TIMELENBYTES, SMSLENBYTES)
-            msgDetail = frmtString % ((idx+1), len(msg.writer), msg.writer, len(msg.msgTime), msg.msgTime, blen(msg.msgText), msg.msgText)
-            self.log.info(f'Composed code for message  : {msgDetail}')
-            self.log.info('Embedding message encoding data into image.')
-            self.writeDataToImage(bytearray(msgDetail, encoding='utf-8'))
-
-            # Update the progress bar as we go along.
-            codeProgress += loopProgress
-            if codeProgress > 100.0:
-                codeProgress = 100.0
-            self.data.progressBar.setProgress(int(codeProgress))
+        # The image now holds all of the messages, in the container if there is one, so they can be appended to.
+        self.container = container
+        self.conversation.numEmbedded = len(messages)
 
         # Done so can hide the progress bar.
-        self.data.progressBar.hideProgressBar()
+        self.progress.setProgress(100)
+        self.progress.hideProgressBar()
+
+    # *******************************************
+    # Append the messages added to the conversation since it was embedded, to the version 2 container
+    # holding it in the image, so only the new messages are composed and written.
+    # Each message is written after the others, with its entry in the message offset table,
+    # then the header is written again with the new sizes. Only the chunks changed are written.
+    # Only possible for uncompressed messages with a message offset table with room for the messages,
+    # and the same password, as then nothing already embedded moves.
+    # Returns True if appended, False if the whole conversation needs to be embedded.
+    # *******************************************
+    def appendConversation(self, passworded, pw):
+
+        header = self.container
+        numEmbedded = self.conversation.numEmbedded
+        numMsgs = self.conversation.numMessages()
+        if ((self.cfg.FormatVersion != V2VERSION) or (header is None) or (header.codeType != CodeType.CODETYPE_TEXT.value) or
+            (not header.indexed) or (header.codec != Codec.CODEC_NONE.value) or (header.numMessages != numEmbedded) or
+            (numMsgs < numEmbedded) or (header.passworded != bool(passworded)) or (header.password != pw)):
+            return False
+
+        # The image has to still hold the container, e.g. not a file embedded since.
+        if self.readDataAt(0, header.headerLen) != header.pack():
+            return False
+
+        try:
+            slotsLen = tableEntryOffset(0)
+            slots = unpackTableSlots(b"".join(self.readContainerPayload(0, slotsLen, slotsLen)))
+        except ContainerError as e:
+            self.log.warning(f'Failed to read message offset table : {str(e)}')
+            return False
+        if numMsgs > slots:
+            self.log.info(f'Message offset table full, slots : {slots}; messages : {numMsgs}')
+            return False
+
+        # Compose the messages added, and where each goes in the payload.
+        messages = self.conversation.getMessages(numEmbedded, numMsgs)
+        if len(messages) != (numMsgs - numEmbedded):
+            return False
+        records = [packMessages([(msg.writer, msg.msgTime, msg.msgText)]) for msg in messages]
+        offsets = []
+        offset = header.codedSize
+        for record in records:
+            offsets.append(offset)
+            offset += len(record)
+
+        newHeader = copy.copy(header)
+        newHeader.numMessages = numMsgs
+        newHeader.dataSize = header.dataSize + (offset - header.codedSize)
+        newHeader.codedSize = offset
+        hdrBytes = newHeader.pack()
+        if len(hdrBytes) != header.headerLen:
+            return False
+        if (newHeader.headerLen + newHeader.framedSize()) > self.capacity:
+            self.log.error(f'Conversation exceeds embedding capacity of image : {self.capacity}')
+            return False
+
+        self.log.info(f'Appending messages to embedded conversation : {len(records)}; payload offset : {header.codedSize}')
+        try:
+            self.patchContainerChunks(header, newHeader.codedSize, [(tableEntryOffset(numEmbedded), packOffsets(offsets)),
+                                                                    (header.codedSize, b"".join(records))])
+        except ContainerError as e:
+            self.log.warning(f'Failed to append to embedded conversation : {str(e)}')
+            return False
+        self.seekData(0)
+        self.writeDataToImage(hdrBytes)
+        self.container = newHeader
+        return True
+
+    # *******************************************
+    # Get length of the messages of the conversation, e.g. to check it fits in the image.
+    # The length of the messages the image holds in a container is known from its header,
+    # so only the messages added since are composed.
+    # *******************************************
+    def conversationLength(self):
+        numEmbedded = 0
+        convLength = 0
+        header = self.container
+        if ((header is not None) and (header.codeType == CodeType.CODETYPE_TEXT.value) and
+            (header.numMessages == self.conversation.numEmbedded)):
+            numEmbedded = header.numMessages
+            convLength = header.dataSize
+        for msg in self.conversation.getMessages(numEmbedded, self.conversation.numMessages()):
+            convLength += NUMSMSBYTES + NAMELENBYTES + blen(msg.writer) + TIMELENBYTES + blen(msg.msgTime) + SMSLENBYTES + blen(msg.msgText)
+        return convLength
+
+    # *******************************************
+    # Compose the embedded data for a conversation, in the original format.
+    # If configured, the messages are compressed, as long as that makes them smaller.
+    # Messages are small, so are compressed all at once.
+    # *******************************************
+    def composeConversation(self, messages, passworded, pw):
+
+        msgData = bytearray()
+        for idx, msg in enumerate(messages):
+            msgData += self.composeMessage(idx, msg)
+
+        codec = codecFromName(self.cfg.Compression)
+        if codec != Codec.CODEC_NONE.value:
+            codedData = compressBytes(codec, bytes(msgData))
+            self.log.info(f'Conversation length : {len(msgData)}; compressed length : {len(codedData)}')
+            if len(codedData) >= len(msgData):
+                codec = Codec.CODEC_NONE.value
+
+        # Compressed messages.
+        if codec != Codec.CODEC_NONE.value:
+            frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd%%0%dd%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES, CODECBYTES, NUMSMSBYTES, LENBYTES)
+            picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_ZTEXT.value, codec, len(messages), len(codedData))
+            self.log.info(f'Composed piCoder code to insert into image : {picCodeHdr}')
+            return bytearray(picCodeHdr, encoding='utf-8') + codedData
+
+        frmtString = ('%%s%%0%dd%%0%dd%%s%%0%dd%%0%dd') % (PASSWDYNBYTES, PASSWDLENBYTES, CODETYPEBYTES,  NUMSMSBYTES)
+        picCodeHdr = frmtString % (PROGCODE, int(passworded), len(pw), pw, CodeType.CODETYPE_TEXT.value, len(messages))
+        self.log.info(f'Composed piCoder code to insert into image : {picCodeHdr}')
+        return bytearray(picCodeHdr, encoding='utf-8') + msgData
+
+    # *******************************************
+    # Compose the embedded data for a conversation in a version 2 container.
+    # Messages are small, so are packed, compressed if configured, and framed all at once.
+    # Uncompressed messages follow a message offset table, so they can be read a page at a time.
+    # Returns the container header, and the embedded data.
+    # *******************************************
+    def composeConversationContainer(self, messages, passworded, pw):
+
+        # If configured, compress the messages, as long as that makes them smaller.
+        # Compressed messages can only be read all at once, so don't need a message offset table.
+        codec = codecFromName(self.cfg.Compression)
+        indexed = True
+        if codec != Codec.CODEC_NONE.value:
+            msgData = packMessages((msg.writer, msg.msgTime, msg.msgText) for msg in messages)
+            codedData = compressBytes(codec, msgData)
+            self.log.info(f'Conversation length : {len(msgData)}; compressed length : {len(codedData)}')
+            indexed = (len(codedData) >= len(msgData))
+        if indexed:
+            codec = Codec.CODEC_NONE.value
+            msgData = packIndexedMessages((msg.writer, msg.msgTime, msg.msgText) for msg in messages)
+            codedData = msgData
+
+        container = ContainerHeader()
+        container.passworded = passworded
+        container.password = pw
+        container.indexed = indexed
+        container.codeType = CodeType.CODETYPE_TEXT.value
+        container.codec = codec
+        container.dataSize = len(msgData)
+        container.codedSize = len(codedData)
+        container.numMessages = len(messages)
+        self.log.info(f'Composed container header to insert into image : {container}')
+
+        framer = ChunkFramer(container.chunkSize)
+        return container, container.pack() + framer.add(codedData) + framer.finish()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+# *******************************************
+# Round trip checks of embedding and extracting.
+# Every way of writing embedded data has to write the same bits, so images embedded
+# through each bit engine are compared pixel for pixel, as well as the data extracted
+# with the data embedded.
+# *******************************************
+
+import logging
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtGui
+
+from config import Config
+from steganography import *
+
+# Pixmaps need a GUI application, though nothing is shown.
+app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+logger = logging.getLogger("tests")
+
+ENGINES = ["Scalar", "Vector"]
+
+# *******************************************
+# Progress bar that doesn't show progress.
+# *******************************************
+class NoProgressBar():
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+# *******************************************
+# Application data with a progress bar.
+# *******************************************
+class AppData():
+    def __init__(self):
+        self.progressBar = NoProgressBar()
+
+# *******************************************
+# Make a cover image of random pixels.
+# *******************************************
+def makeCover(path, width=160, height=120, seed=1):
+    rng = np.random.default_rng(seed)
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    ptr = image.bits()
+    ptr.setsize(image.sizeInBytes())
+    pixels = np.frombuffer(ptr, dtype=np.uint8)
+    pixels[:] = rng.integers(0, 256, pixels.size, dtype=np.uint8)
+    pixels[3::4] = 255
+    assert image.save(str(path), "PNG")
+    return str(path)
+
+# *******************************************
+# Make a file of random bytes.
+# *******************************************
+def makePayload(path, size, seed=2):
+    data = np.random.default_rng(seed).integers(0, 256, size, dtype=np.uint8).tobytes()
+    with open(path, "wb") as pf:
+        pf.write(data)
+    return str(path), data
+
+# *******************************************
+# Messages of a test conversation.
+# *******************************************
+def conversationMessages(count):
+    return [(f'writer{idx % 3}', f'Message {idx} ' + "x" * (idx % 23), f'01-01-2024 10:{idx % 60:02d}:00') for idx in range(count)]
+
+# *******************************************
+# Configuration and steganography objects for the tests, with the configuration
+# in the test directory.
+# Every test is run embedding in each format version.
+# *******************************************
+@pytest.fixture(params=[1, 2])
+def steg(tmp_path, request):
+    def makeSteg(**settings):
+        config = Config(str(tmp_path / "picCoder.json"))
+        config.FormatVersion = request.param
+        for name, value in settings.items():
+            setattr(config, name, value)
+        return Steganography(config, logger, AppData())
+    return makeSteg
+
+# *******************************************
+# Bytes of the pixels of an image, as displayed.
+# *******************************************
+def pixelsOf(stegPic):
+    image = stegPic.getImage()
+    return bytes(image.constBits().asarray(image.sizeInBytes()))
+
+# *******************************************
+# Save image, as PNG or, by its extension, an uncompressed image.
+# *******************************************
+def saveImage(stegPic, path):
+    assert stegPic.saveImage(str(path))
+    return str(path)
+
+# *******************************************
+# Embed a file into a cover image, compressed as set by the configuration.
+# Returns the steganography object holding the image.
+# *******************************************
+def embedFile(steg, cover, payload, settings, password=""):
+    stegPic = steg(**settings)
+    stegPic.loadNewImage(cover)
+    stegPic.toEmbedFilePath = payload
+    stegPic.toEmbedFileSize = os.path.getsize(payload)
+    stegPic.toEmbedCodec = codecFromName(stegPic.cfg.Compression)
+    stegPic.embedFileToImage(password != "", password)
+    return stegPic
+
+# *******************************************
+# Extract the embedded file of an image, read by the given bit engine.
+# Returns the extracted data.
+# *******************************************
+def extractFile(steg, picFile, outFile, settings):
+    stegPic = steg(**settings)
+    stegPic.loadNewImage(picFile)
+    assert stegPic.picCoded
+    stegPic.saveEmbeddedFile(str(outFile))
+    stegPic.shutdown()
+    with open(outFile, "rb") as of:
+        return of.read()
+
+# *******************************************
+# Embed a conversation into a cover image.
+# Returns the steganography object holding the image.
+# *******************************************
+def embedConversation(steg, cover, messages, settings, password=""):
+    stegPic = steg(**settings)
+    stegPic.loadNewImage(cover)
+    for writer, msgText, msgTime in messages:
+        stegPic.conversation.addMsg(writer, msgText, msgTime)
+    stegPic.embedConversationIntoImage(password != "", password)
+    return stegPic
+
+# *******************************************
+# Read the embedded conversation of an image.
+# Returns the messages as (writer, text, time).
+# *******************************************
+def readConversation(steg, picFile, settings):
+    stegPic = steg(**settings)
+    stegPic.loadNewImage(picFile)
+    assert stegPic.picCoded
+    return [(msg.writer, msg.msgText, msg.msgTime) for msg in stegPic.conversation.messages]
+
+# *******************************************
+# Files embedded by each bit engine are the same bits, and read back the same by each.
+# *******************************************
+@pytest.mark.parametrize("password", ["", "secret1"])
+def test_file_engines(steg, tmp_path, password):
+    cover = makeCover(tmp_path / "cover.png")
+    payload, data = makePayload(tmp_path / "payload.bin", 5000)
+
+    images = {}
+    for engine in ENGINES:
+        stegPic = embedFile(steg, cover, payload, {"BitEngine" : engine}, password)
+        images[engine] = pixelsOf(stegPic)
+        saveImage(stegPic, tmp_path / f'{engine}.png')
+    assert images["Scalar"] == images["Vector"]
+
+    for engine in ENGINES:
+        assert extractFile(steg, str(tmp_path / "Scalar.png"), tmp_path / f'{engine}.bin', {"BitEngine" : engine}) == data
+
+# *******************************************
+# Conversations embedded by each bit engine are the same bits, and read back the same by each.
+# *******************************************
+def test_conversation_engines(steg, tmp_path):
+    cover = makeCover(tmp_path / "cover.png")
+    messages = conversationMessages(40)
+
+    images = {}
+    for engine in ENGINES:
+        stegPic = embedConversation(steg, cover, messages, {"BitEngine" : engine})
+        images[engine] = pixelsOf(stegPic)
+        saveImage(stegPic, tmp_path / f'{engine}.png')
+    assert images["Scalar"] == images["Vector"]
+
+    for engine in ENGINES:
+        assert readConversation(steg, str(tmp_path / "Scalar.png"), {"BitEngine" : engine}) == messages
+
+# *******************************************
+# Files embedded and extracted a chunk at a time, with file I/O pipelined or not,
+# are the same bits as embedded in one chunk.
+# *******************************************
+@pytest.mark.parametrize("pipelineIO", [0, 1])
+def test_file_chunks(steg, tmp_path, pipelineIO):
+    cover = makeCover(tmp_path / "cover.png")
+    payload, data = makePayload(tmp_path / "payload.bin", 20000)
+    reference = pixelsOf(embedFile(steg, cover, payload, {"ChunkSize" : 1000000, "PipelineIO" : 0}))
+
+    settings = {"ChunkSize" : 1500, "PipelineIO" : pipelineIO}
+    stegPic = embedFile(steg, cover, payload, settings)
+    assert pixelsOf(stegPic) == reference
+    picFile = saveImage(stegPic, tmp_path / "coded.png")
+    assert extractFile(steg, picFile, tmp_path / "payload.out", settings) == data
+
+# *******************************************
+# Files embedded and extracted in parallel processes are the same bits as embedded in one process.
+# *******************************************
+def test_file_parallel(steg, tmp_path):
+    cover = makeCover(tmp_path / "cover.png")
+    payload, data = makePayload(tmp_path / "payload.bin", 20000)
+    reference = pixelsOf(embedFile(steg, cover, payload, {}))
+
+    settings = {"ParallelProcesses" : 2, "ParallelMinPixels" : 0, "ParallelChunkSize" : 3000}
+    stegPic = embedFile(steg, cover, payload, settings)
+    stegPic.shutdown()
+    assert pixelsOf(stegPic) == reference
+    picFile = saveImage(stegPic, tmp_path / "coded.png")
+    assert extractFile(steg, picFile, tmp_path / "payload.out", settings) == data
+
+# *******************************************
+# Compressed files and conversations embedded by each bit engine are the same bits,
+# and read back the same as embedded.
+# *******************************************
+@pytest.mark.parametrize("compression", ["zlib", "lzma", "bz2"])
+def test_compressed(steg, tmp_path, compression):
+    cover = makeCover(tmp_path / "cover.png")
+    data = b"".join(b"Line %d of a file that compresses well.\n" % idx for idx in range(400))
+    payload = str(tmp_path / "payload.txt")
+    with open(payload, "wb") as pf:
+        pf.write(data)
+    messages = conversationMessages(60)
+
+    for embedder, content in ((embedFile, payload), (embedConversation, messages)):
+        images = {}
+        for engine in ENGINES:
+            stegPic = embedder(steg, cover, content, {"BitEngine" : engine, "Compression" : compression})
+            images[engine] = pixelsOf(stegPic)
+            saveImage(stegPic, tmp_path / f'{engine}.png')
+        assert images["Scalar"] == images["Vector"]
+
+        for engine in ENGINES:
+            settings = {"BitEngine" : engine}
+            if embedder is embedFile:
+                assert extractFile(steg, str(tmp_path / "Scalar.png"), tmp_path / f'{engine}.out', settings) == data
+            else:
+                assert readConversation(steg, str(tmp_path / "Scalar.png"), settings) == messages
+            stegPic = steg()
+            stegPic.loadNewImage(str(tmp_path / "Scalar.png"))
+            assert stegPic.picCodec == codecFromName(compression)
+
+# *******************************************
+# Conversations embedded again with messages added, by writing only what changed or appending
+# the messages added, are the same bits as the whole conversation embedded at once.
+# Messages are added both to the conversation just embedded, and to one loaded from the image.
+# *******************************************
+@pytest.mark.parametrize("compression", ["None", "zlib"])
+@pytest.mark.parametrize("deltaEmbed", [0, 1])
+def test_conversation_added(steg, tmp_path, compression, deltaEmbed):
+    cover = makeCover(tmp_path / "cover.png")
+    messages = conversationMessages(45)
+    settings = {"Compression" : compression, "DeltaEmbed" : deltaEmbed}
+    reference = pixelsOf(embedConversation(steg, cover, messages, settings))
+
+    stegPic = embedConversation(steg, cover, messages[:30], settings)
+    picFile = saveImage(stegPic, tmp_path / "coded.png")
+    for writer, msgText, msgTime in messages[30:]:
+        stegPic.conversation.addMsg(writer, msgText, msgTime)
+        stegPic.embedConversationIntoImage()
+    assert pixelsOf(stegPic) == reference
+
+    stegPic = embedConversation(steg, picFile, messages[30:], settings)
+    assert pixelsOf(stegPic) == reference
+    assert readConversation(steg, saveImage(stegPic, tmp_path / "added.png"), {}) == messages
+
+# *******************************************
+# Files embedded into an image already holding a file, by writing only what changed,
+# are the same bits as the whole file written again.
+# *******************************************
+def test_file_replaced(steg, tmp_path):
+    cover = makeCover(tmp_path / "cover.png")
+    payload, data = makePayload(tmp_path / "payload.bin", 8000)
+    picFile = saveImage(embedFile(steg, cover, payload, {}), tmp_path / "coded.png")
+
+    with open(payload, "r+b") as pf:
+        pf.seek(3000)
+        pf.write(b"changed")
+    reference = pixelsOf(embedFile(steg, picFile, payload, {"DeltaEmbed" : 0}))
+    stegPic = embedFile(steg, picFile, payload, {"DeltaEmbed" : 1})
+    assert pixelsOf(stegPic) == reference
+
+# *******************************************
+# Files embedded into memory mapped uncompressed images are the same bits as embedded
+# into the same pixels decoded from a PNG image, and read back the same by each bit engine.
+# *******************************************
+@pytest.mark.parametrize("ext", [".bmp", ".ppm"])
+def test_file_mapped(steg, tmp_path, ext):
+    cover = makeCover(tmp_path / "cover.png")
+    mappedCover = str(tmp_path / f'cover{ext}')
+    assert QtGui.QImage(cover).save(mappedCover)
+    payload, data = makePayload(tmp_path / "payload.bin", 5000)
+    reference = pixelsOf(embedFile(steg, cover, payload, {}))
+
+    for engine in ENGINES:
+        stegPic = embedFile(steg, mappedCover, payload, {"BitEngine" : engine})
+        assert stegPic.mapped is not None
+        assert pixelsOf(stegPic) == reference
+        picFile = saveImage(stegPic, tmp_path / f'{engine}{ext}')
+        stegPic.shutdown()
+        for readEngine in ENGINES:
+            assert extractFile(steg, picFile, tmp_path / f'{engine}{readEngine}.bin', {"BitEngine" : readEngine}) == data
+
+# *******************************************
+# Files and conversations embedded into PNG images streamed a band of rows at a time
+# are the same bits as embedded into the decoded image, and read back the same streamed or decoded.
+# *******************************************
+@pytest.mark.parametrize("codeType", ["file", "conversation"])
+def test_streamed(steg, tmp_path, codeType):
+    cover = makeCover(tmp_path / "cover.png", 400, 400)
+    payload, data = makePayload(tmp_path / "payload.bin", 30000)
+    messages = conversationMessages(40)
+    settings = {"StreamMemoryMB" : 1}
+
+    images = {}
+    for stream in (False, True):
+        stegPic = steg(**settings)
+        stegPic.loadNewImage(cover, stream=stream)
+        assert (stegPic.streamed is not None) == stream
+        if codeType == "file":
+            stegPic.toEmbedFilePath = payload
+            stegPic.toEmbedFileSize = len(data)
+            stegPic.embedFileToImage()
+        else:
+            for writer, msgText, msgTime in messages:
+                stegPic.conversation.addMsg(writer, msgText, msgTime)
+            stegPic.embedConversationIntoImage()
+        picFile = saveImage(stegPic, tmp_path / f'coded{stream}.png')
+        stegPic.shutdown()
+
+        stegPic = steg()
+        stegPic.loadNewImage(picFile)
+        images[stream] = pixelsOf(stegPic)
+    assert images[True] == images[False]
+
+    for stream in (False, True):
+        stegPic = steg(**settings)
+        stegPic.loadNewImage(picFile, stream=stream)
+        assert stegPic.picCoded
+        if codeType == "file":
+            outFile = str(tmp_path / f'payload{stream}.out')
+            assert stegPic.saveEmbeddedFile(outFile)
+            with open(outFile, "rb") as of:
+                assert of.read() == data
+        else:
+            assert [(msg.writer, msg.msgText, msg.msgTime) for msg in stegPic.conversation.messages] == messages
+        stegPic.shutdown()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+from PyQt5 import QtCore, QtGui
+import collections
+import hashlib
+import os
+
+# *******************************************
+# Thumbnail cache class.
+# Bitmaps of images scaled to fit a display size, kept so that showing an image again
+# doesn't decode and scale the full size image again.
+# Images from file are decoded straight to the display size where the image format allows,
+# and are cached by path, modification time and size of the file, so a changed file isn't shown from the cache.
+# Images in memory are cached by their cache key, which changes when the image is changed.
+# Images got from a file each time they are shown, such as mapped images, have a new cache key
+# each time, so are cached by their file instead.
+# The least recently used thumbnails are dropped when the cache uses more than its memory.
+# Thumbnails of images from file are also saved in a cache directory if there is one.
+# *******************************************
+class ThumbnailCache():
+    def __init__(self, log, maxBytes, cacheDir=""):
+
+        # Initialise logger.
+        self.log = log
+
+        # Thumbnails by key, least recently used first, and the memory they use.
+        self.maxBytes = maxBytes
+        self.thumbnails = collections.OrderedDict()
+        self.usedBytes = 0
+
+        # Directory to cache thumbnails on disk.
+        self.cacheDir = cacheDir
+        if self.cacheDir != "":
+            try:
+                os.makedirs(self.cacheDir, exist_ok=True)
+            except OSError as e:
+                self.log.warning(f'Thumbnail cache directory not available : {self.cacheDir}; {str(e)}')
+                self.cacheDir = ""
+
+    # *******************************************
+    # Get bitmap of an image file scaled to fit the given size.
+    # If the image has already been decoded it can be given, to scale rather than decode the file again.
+    # Returns null bitmap if the image couldn't be read.
+    # *******************************************
+    def getThumbnail(self, picFile, width, height, image=None):
+        fileKey = self.fileKey(picFile)
+        if fileKey is None:
+            return QtGui.QPixmap()
+        key = ("file",) + fileKey + (width, height)
+        thumbnail = self.lookup(key)
+        if thumbnail is not None:
+            return thumbnail
+
+        # Not in memory, so from disk, scaled from the decoded image, or decoded to size from file.
+        cacheFile = self.cacheFile(key)
+        scaled = QtGui.QImage()
+        if cacheFile != "" and os.path.isfile(cacheFile):
+            scaled = QtGui.QImage(cacheFile)
+        if scaled.isNull():
+            if image is not None:
+                scaled = image.scaled(width, height, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+            else:
+                scaled = self.readScaled(picFile, width, height)
+            if scaled.isNull():
+                return QtGui.QPixmap()
+            if cacheFile != "" and not scaled.save(cacheFile, "PNG"):
+                self.log.warning(f'Failed to save thumbnail to cache : {cacheFile}')
+        return self.store(key, QtGui.QPixmap.fromImage(scaled))
+
+    # *******************************************
+    # Get bitmap of an image in memory scaled to fit the given size.
+    # If the image is got from a file each time it is shown, the file is given to cache it by.
+    # The image only differs from the file by embedded data, which can't be seen at thumbnail size.
+    # Thumbnails of images in memory aren't saved on disk, as the image may not be saved.
+    # *******************************************
+    def getImageThumbnail(self, image, width, height, picFile=""):
+        if picFile != "":
+            fileKey = self.fileKey(picFile)
+            if fileKey is None:
+                return QtGui.QPixmap()
+            key = ("fileImage",) + fileKey + (width, height)
+        else:
+            key = ("image", image.cacheKey(), width, height)
+        thumbnail = self.lookup(key)
+        if thumbnail is not None:
+            return thumbnail
+        return self.store(key, QtGui.QPixmap.fromImage(image.scaled(width, height, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)))
+
+    # *******************************************
+    # Key of an image file, its path, modification time and size, so a changed file has a new key.
+    # Returns None if the file details couldn't be got.
+    # *******************************************
+    def fileKey(self, picFile):
+        try:
+            stat = os.stat(picFile)
+        except OSError as e:
+            self.log.error(f'Failed to get image file details : {picFile}; {str(e)}')
+            return None
+        return (os.path.abspath(picFile), stat.st_mtime_ns, stat.st_size)
+
+    # *******************************************
+    # Read image from file, decoded straight to the size that fits the given size.
+    # Returns null image if the image couldn't be read.
+    # *******************************************
+    def readScaled(self, picFile, width, height):
+        reader = QtGui.QImageReader(picFile)
+        size = reader.size()
+        if size.isValid():
+            reader.setScaledSize(size.scaled(width, height, QtCore.Qt.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            self.log.error(f'Failed to read image : {picFile}; {reader.errorString()}')
+        elif (image.width() > width) or (image.height() > height):
+            # Image format doesn't report its size before reading, so scale after.
+            image = image.scaled(width, height, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+        return image
+
+    # *******************************************
+    # Look up a thumbnail by key, making it the most recently used.
+    # Returns None if not cached.
+    # *******************************************
+    def lookup(self, key):
+        thumbnail = self.thumbnails.get(key)
+        if thumbnail is not None:
+            self.thumbnails.move_to_end(key)
+        return thumbnail
+
+    # *******************************************
+    # Store a thumbnail by key, dropping the least recently used thumbnails to keep within the memory.
+    # Returns the thumbnail.
+    # *******************************************
+    def store(self, key, thumbnail):
+        self.thumbnails[key] = thumbnail
+        self.usedBytes += self.thumbnailBytes(thumbnail)
+        while (self.usedBytes > self.maxBytes) and (len(self.thumbnails) > 1):
+            _, dropped = self.thumbnails.popitem(last=False)
+            self.usedBytes -= self.thumbnailBytes(dropped)
+        return thumbnail
+
+    # *******************************************
+    # Memory used by a thumbnail.
+    # *******************************************
+    def thumbnailBytes(self, thumbnail):
+        return thumbnail.width() * thumbnail.height() * max(1, thumbnail.depth() // 8)
+
+    # *******************************************
+    # Path of the file caching a thumbnail on disk, or empty string if there is no cache directory.
+    # *******************************************
+    def cacheFile(self, key):
+        if self.cacheDir == "":
+            return ""
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDir, f'{name}.png')
+
+    # *******************************************
+    # Clear thumbnails cached in memory.
+    # *******************************************
+    def clear(self):
+        self.thumbnails.clear()
+        self.usedBytes = 0
@@ -1,8 +1,90 @@
 #!/usr/bin/env python3
 
+import glob
+import os
+
+from constants import *
+
 # *******************************************
 # Return byte length of encoded string.
 # *******************************************
 def blen(s):
     # Return byte length of string with utf-8 encoding.
     return len(s.encode('utf-8'))
+
+# *******************************************
+# Return approximate embedding capacity of an image (Bytes).
+# Embedding capacity pixels * colours * colourBits * MaxEmbedRatio / 8 bitsPerByte
+# *******************************************
+def calcCapacity(width, height, maxEmbedRatio):
+    return int(width * height * 3 * maxEmbedRatio)
+
+# *******************************************
+# Find supported image files.
+# Paths can be files, directories (searched recursively) or glob patterns.
+# Yields image file paths in sorted order for each path.
+# *******************************************
+def findImageFiles(paths):
+    for picFile, name in findImageFileNames(paths):
+        yield picFile
+
+# *******************************************
+# Find supported image files, with the name of each from the path that found it.
+# Images in a directory are named by their path from the directory, images found by a glob
+# pattern by their path from the directory the pattern starts in, other images by their file name.
+# Yields image file path and name, in sorted order for each path.
+# *******************************************
+def findImageFileNames(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in ONLYIMAGES:
+                        picFile = os.path.join(root, name)
+                        yield picFile, os.path.relpath(picFile, path)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+        else:
+            # The directory the pattern starts in is its path up to the first part with a wildcard.
+            parts = os.path.normpath(path).split(os.sep)
+            numFixed = 0
+            while (numFixed < len(parts) - 1) and not glob.has_magic(parts[numFixed]):
+                numFixed += 1
+            baseDir = os.sep.join(parts[:numFixed])
+            if baseDir == "":
+                baseDir = os.sep if os.path.isabs(path) else os.curdir
+            for match in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(match) and (os.path.splitext(match)[1].lower() in ONLYIMAGES):
+                    yield match, os.path.relpath(match, baseDir)
+
+# *******************************************
+# Find files of any type to embed as an archive.
+# Paths can be files or directories (searched recursively).
+# Files are named by their file name, files in a directory by their path from
+# the directory, starting with the name of the directory.
+# Yields file path and name, in sorted order for each path.
+# *******************************************
+def findArchiveFiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            baseDir = os.path.dirname(os.path.abspath(path))
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    filePath = os.path.join(root, name)
+                    yield filePath, os.path.relpath(os.path.abspath(filePath), baseDir).replace(os.sep, "/")
+        else:
+            yield path, os.path.basename(path)
+
+# *******************************************
+# Get path to extract an embedded file to, within an output directory.
+# Only the parts of the name that can't leave the output directory are used.
+# Returns the path, or None if the name has no usable parts.
+# *******************************************
+def safeExtractPath(outDir, name):
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    if len(parts) == 0:
+        return None
+    return os.path.join(outDir, *parts)
+
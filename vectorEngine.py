@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import sys
+import numpy as np
+
+# *******************************************
+# Vectorised bit plane engine.
+#
+# Reads and writes embedded data using array operations over whole runs of a
+# colour plane, rather than one bit of one pixel at a time.
+#
+# The data layout is the same as for the scalar engine in steganography.py.
+# Bits are stored by ROW, then by COLUMN, then by colour plane, then by colour bit
+# starting with the LSB, with the MSB of each data byte stored first.
+# This gives each bit of embedded data a linear bit position in the image (see picCursor.py).
+# A run of consecutive positions within one (bit, plane) slab is a span of
+# consecutive pixels of a colour plane, which maps to a handful of row slices.
+# *******************************************
+
+# *******************************************
+# Return the colour plane views (R, G, B) of a 32-bit pixel buffer.
+# Pixel buffer is height x width x 4 bytes as used by QImage Format_RGB32 / Format_ARGB32,
+# which is stored as B, G, R, A on little endian machines and A, R, G, B on big endian machines.
+# *******************************************
+def planesFromPixels32(pixels):
+    if sys.byteorder == "little":
+        return [pixels[:, :, 2], pixels[:, :, 1], pixels[:, :, 0]]
+    else:
+        return [pixels[:, :, 1], pixels[:, :, 2], pixels[:, :, 3]]
+
+# *******************************************
+# Return the alpha plane view of a 32-bit pixel buffer, stored as for the colour planes.
+# *******************************************
+def alphaFromPixels32(pixels):
+    if sys.byteorder == "little":
+        return pixels[:, :, 3]
+    else:
+        return pixels[:, :, 0]
+
+# *******************************************
+# Vector engine class.
+# Operates on a list of 2D (height x width) colour plane views.
+# Views can be strided (e.g. one channel of an interleaved buffer),
+# all updates are made in place.
+# *******************************************
+class VectorEngine():
+    def __init__(self, planes):
+
+        self.planes = planes
+        self.numPlanes = len(planes)
+        self.height, self.width = planes[0].shape
+        self.numPixels = self.width * self.height
+
+        # Total number of bit positions, i.e. every pixel, every colour, every bit.
+        self.maxBits = self.numPixels * self.numPlanes * 8
+
+    # *******************************************
+    # Split a run of bit positions into runs within each (bit, plane) slab.
+    # Yields colour plane view, colour bit, start and end pixel, and offset into the run.
+    # *******************************************
+    def slabRuns(self, position, numBits):
+        done = 0
+        while (done < numBits) and (position < self.maxBits):
+            slab, pixel = divmod(position, self.numPixels)
+            bit, plane = divmod(slab, self.numPlanes)
+            run = min(self.numPixels - pixel, numBits - done)
+            yield self.planes[plane], bit, pixel, pixel + run, done
+            done += run
+            position += run
+
+    # *******************************************
+    # Split a span of pixels of a colour plane into row slices.
+    # A span is a partial first row, a block of full rows, and a partial last row.
+    # *******************************************
+    def rowSlices(self, view, start, end):
+        startRow, startCol = divmod(start, self.width)
+        endRow, endCol = divmod(end, self.width)
+        if startRow == endRow:
+            yield view[startRow, startCol:endCol]
+            return
+        if startCol != 0:
+            yield view[startRow, startCol:]
+            startRow += 1
+        if endRow > startRow:
+            yield view[startRow:endRow]
+        if endCol != 0:
+            yield view[endRow, :endCol]
+
+    # *******************************************
+    # Read bits from the image starting at a bit position.
+    # Returns numpy array of bits (one per byte), which may be short if the end of the image is reached.
+    # *******************************************
+    def readBits(self, position, numBits):
+
+        # Gather the data bits a slice at a time.
+        bitRuns = []
+        for view, bit, start, end, offset in self.slabRuns(position, numBits):
+            for part in self.rowSlices(view, start, end):
+                bitRuns.append(((part >> bit) & 1).reshape(-1))
+
+        if len(bitRuns) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.concatenate(bitRuns)
+
+    # *******************************************
+    # Read bytes from the image starting at a bit position.
+    # Returns the bytes read, which may be short if the end of the image is reached.
+    # *******************************************
+    def readBytes(self, position, bytesToRead):
+
+        bits = self.readBits(position, bytesToRead * 8)
+
+        # Only return complete bytes.
+        bits = bits[:(bits.size // 8) * 8]
+        return np.packbits(bits).tobytes()
+
+    # *******************************************
+    # Write bits into the image starting at a bit position.
+    # Bits are a numpy array of bits (one per byte).
+    # Returns the number of bits written, which may be short if the image runs out of space.
+    # *******************************************
+    def writeBits(self, position, bits):
+
+        bitsWritten = 0
+        for view, bit, start, end, offset in self.slabRuns(position, bits.size):
+            keepMask = np.uint8(0xff ^ (1 << bit))
+            for part in self.rowSlices(view, start, end):
+                partBits = bits[offset:offset + part.size].reshape(part.shape)
+                part[...] = (part & keepMask) | (partBits << np.uint8(bit))
+                offset += part.size
+            bitsWritten += end - start
+
+        return bitsWritten
+
+    # *******************************************
+    # Write bytes into the image starting at a bit position.
+    # Returns the number of bits written, which may be short if the image runs out of space.
+    # *******************************************
+    def writeBytes(self, position, data):
+
+        # Convert the data to an array of bits, MSB first.
+        bits = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+        return self.writeBits(position, bits)
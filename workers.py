@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+from PyQt5 import QtCore
+
+# *******************************************
+# Worker jobs to run embedding / extracting operations off the GUI thread.
+#
+# A job runs an operation on a thread pool thread, and reports the progress
+# and the result back to the GUI thread using signals.
+# *******************************************
+
+# Job finish status.
+JOB_DONE = "Done"
+JOB_CANCELLED = "Cancelled"
+JOB_FAILED = "Failed"
+
+# *******************************************
+# Job signals class.
+# Signals are emitted on the worker thread and delivered on the GUI thread.
+# *******************************************
+class JobSignals(QtCore.QObject):
+    note = QtCore.pyqtSignal(str)
+    progress = QtCore.pyqtSignal(int)
+    finished = QtCore.pyqtSignal(str, str)
+
+# *******************************************
+# Job progress class.
+# Has the same methods as the progress bar, so can be used in its place by
+# operations, but forwards progress using signals.
+# Showing and hiding of the progress bar is done by the GUI when the job
+# starts and finishes.
+# *******************************************
+class JobProgress():
+    def __init__(self, signals):
+        self.signals = signals
+
+    def setNote(self, note):
+        self.signals.note.emit(note)
+
+    def setProgress(self, progress):
+        self.signals.progress.emit(progress)
+
+    def showProgressBar(self):
+        pass
+
+    def hideProgressBar(self):
+        pass
+
+# *******************************************
+# Engine job class.
+# Runs an operation (a callable taking no arguments) on a thread pool thread.
+# Operations stop by raising the given cancelled exception type.
+# *******************************************
+class EngineJob(QtCore.QRunnable):
+    def __init__(self, operation, cancelledType):
+        super(EngineJob, self).__init__()
+
+        self.operation = operation
+        self.cancelledType = cancelledType
+        self.signals = JobSignals()
+        self.progress = JobProgress(self.signals)
+
+    # *******************************************
+    # Run the operation and report how it finished.
+    # *******************************************
+    def run(self):
+        try:
+            self.operation()
+        except self.cancelledType:
+            self.signals.finished.emit(JOB_CANCELLED, "")
+        except Exception as e:
+            self.signals.finished.emit(JOB_FAILED, str(e))
+        else:
+            self.signals.finished.emit(JOB_DONE, "")